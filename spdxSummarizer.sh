@@ -20,4 +20,4 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-PYTHONPATH=./ python3 spdxSummarizer/mainshell.py $1
+PYTHONPATH=./ python3 spdxSummarizer/mainshell.py "$@"
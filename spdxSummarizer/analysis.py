@@ -24,6 +24,23 @@
 
 import os.path
 
+# Compute the path attributes stored alongside each file, so that reports
+# and the analysis functions below can filter on them in the database
+# rather than re-parsing every filename.
+# arguments:
+#   1) file path
+# returns: tuple of (extension, is_git, is_vendor, depth), where:
+#   extension: file extension including the dot (e.g. ".c"), or ""
+#   is_git: True if the file is in any /.git/ subdirectory
+#   is_vendor: True if the file's path contains "vendor/"
+#   depth: number of "/" separators in the path
+def getPathAttributes(filename):
+  extension = os.path.splitext(filename)[1]
+  is_git = "/.git/" in filename
+  is_vendor = "vendor/" in filename
+  depth = filename.count("/")
+  return (extension, is_git, is_vendor, depth)
+
 # Modify a category/license/filename dict so that "No license found" files
 # with extensions in the "ignore_extensions" list are separately designated.
 # Keep the category the same, but change the license to "No license found -
@@ -33,8 +50,10 @@ import os.path
 #   2) dict of category =>
 #       (category_name, {filename => license}, {license => count})
 #      typically created by dbtools.getCategoryFilesForScan()
+#   3) (optional) ID of the scan the dict was created from; if given, the
+#      matching files are found using the extensions stored in the database
 # returns: True if successfully modified category dict, False on error
-def analyzeFileExtensions(db, cats):
+def analyzeFileExtensions(db, cats, scan_id=None):
   old_license_title = "No license found"
   new_license_title = "No license found - excluded file extension"
 
@@ -65,12 +84,20 @@ def analyzeFileExtensions(db, cats):
   # from old_license_title (b/c they've probably already been put into
   # a separate category).
   count_changed = 0
-  for filename, license in category_filenames.items():
-    ext_t = os.path.splitext(filename)
-    extension = ext_t[1]
-    if license == old_license_title and extension in ignored_extensions:
-      count_changed += 1
-      category_filenames[filename] = new_license_title
+  if scan_id is not None:
+    filenames = db.getFilenamesByAttributes(scan_id, old_license_title,
+      extensions=ignored_extensions)
+    for filename in filenames:
+      if category_filenames.get(filename, None) == old_license_title:
+        count_changed += 1
+        category_filenames[filename] = new_license_title
+  else:
+    for filename, license in category_filenames.items():
+      ext_t = os.path.splitext(filename)
+      extension = ext_t[1]
+      if license == old_license_title and extension in ignored_extensions:
+        count_changed += 1
+        category_filenames[filename] = new_license_title
 
   # finally, update the license counts
   if count_changed > 0:
@@ -85,8 +112,10 @@ def analyzeFileExtensions(db, cats):
 #   1) SPDatabase
 #   2) dict of filename => license
 #      typically created by dbtools.getLicenseAndFilesForScan()
+#   3) (optional) ID of the scan the dict was created from; if given, the
+#      matching files are found using the extensions stored in the database
 # returns: True if successfully modified dict, False on error
-def analyzeFileExtensionsForFlatDict(db, records):
+def analyzeFileExtensionsForFlatDict(db, records, scan_id=None):
   old_license_title = "No license found"
   new_license_title = "No license found - excluded file extension"
 
@@ -101,11 +130,18 @@ def analyzeFileExtensionsForFlatDict(db, records):
   # list of ignored extensions. ignore any licenses that are different
   # from old_license_title (b/c they've probably already been put into
   # a separate category).
-  for filename, license in records.items():
-    ext_t = os.path.splitext(filename)
-    extension = ext_t[1]
-    if license == old_license_title and extension in ignored_extensions:
-      records[filename] = new_license_title
+  if scan_id is not None:
+    filenames = db.getFilenamesByAttributes(scan_id, old_license_title,
+      extensions=ignored_extensions)
+    for filename in filenames:
+      if records.get(filename, None) == old_license_title:
+        records[filename] = new_license_title
+  else:
+    for filename, license in records.items():
+      ext_t = os.path.splitext(filename)
+      extension = ext_t[1]
+      if license == old_license_title and extension in ignored_extensions:
+        records[filename] = new_license_title
 
   return True
 
@@ -118,8 +154,10 @@ def analyzeFileExtensionsForFlatDict(db, records):
 #   2) dict of category =>
 #       (category_name, {filename => license}, {license => count})
 #      typically created by dbtools.getCategoryFilesForScan()
+#   3) (optional) ID of the scan the dict was created from; if given, the
+#      matching files are found using the vendor flags stored in the database
 # returns: True if successfully modified category dict, False on error
-def analyzeVendorFiles(db, cats):
+def analyzeVendorFiles(db, cats, scan_id=None):
   old_license_title = "No license found"
   new_license_title = "No license found - in vendor directory"
 
@@ -142,10 +180,18 @@ def analyzeVendorFiles(db, cats):
   # ignore any licenses that are different from old_license_title (b/c 
   # they've probably already been put into a separate category).
   count_changed = 0
-  for filename, license in category_filenames.items():
-    if license == old_license_title and "vendor/" in filename:
-      count_changed += 1
-      category_filenames[filename] = new_license_title
+  if scan_id is not None:
+    filenames = db.getFilenamesByAttributes(scan_id, old_license_title,
+      is_vendor=True)
+    for filename in filenames:
+      if category_filenames.get(filename, None) == old_license_title:
+        count_changed += 1
+        category_filenames[filename] = new_license_title
+  else:
+    for filename, license in category_filenames.items():
+      if license == old_license_title and "vendor/" in filename:
+        count_changed += 1
+        category_filenames[filename] = new_license_title
 
   # finally, update the license counts
   if count_changed > 0:
@@ -160,8 +206,10 @@ def analyzeVendorFiles(db, cats):
 #   1) SPDatabase
 #   2) dict of filename => license
 #      typically created by dbtools.getLicenseAndFilesForScan()
+#   3) (optional) ID of the scan the dict was created from; if given, the
+#      matching files are found using the vendor flags stored in the database
 # returns: True if successfully modified dict, False on error
-def analyzeVendorFilesForFlatDict(db, records):
+def analyzeVendorFilesForFlatDict(db, records, scan_id=None):
   old_license_title = "No license found"
   new_license_title = "No license found - in vendor directory"
 
@@ -169,8 +217,15 @@ def analyzeVendorFilesForFlatDict(db, records):
   # ignore any licenses that are different
   # from old_license_title (b/c they've probably already been put into
   # a separate category).
-  for filename, license in records.items():
-    if license == old_license_title and "vendor/" in filename:
-      records[filename] = new_license_title
+  if scan_id is not None:
+    filenames = db.getFilenamesByAttributes(scan_id, old_license_title,
+      is_vendor=True)
+    for filename in filenames:
+      if records.get(filename, None) == old_license_title:
+        records[filename] = new_license_title
+  else:
+    for filename, license in records.items():
+      if license == old_license_title and "vendor/" in filename:
+        records[filename] = new_license_title
 
   return True
@@ -0,0 +1,177 @@
+# asyncdb.py
+#
+# This module contains the AsyncSPDatabase class, which provides the
+# SPDatabase API as coroutines for use from asyncio-based programs.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+from spdxSummarizer.dbtools import SPDatabase
+
+# SPDatabase functions starting with these prefixes only read from the
+# database, and are run on the reader connection. None of them write, even
+# when derived data such as directory counts is missing; they fall back to
+# reading the scans' files instead.
+READ_PREFIXES = ("get", "is")
+
+# The SPDatabase functions are run on worker threads, so that they don't
+# block the event loop. Each of the two SPDatabase objects below has its own
+# single-threaded executor, so that its SQLite connection is only ever used
+# from one thread:
+#   - the writer runs all imports and other changes, one at a time;
+#   - the reader runs all get* and is* queries on a separate connection.
+# The database is switched to WAL journal mode, so that reads can run
+# concurrently with an import, seeing the last committed data.
+#
+# For an in-memory database there is no second connection to read from,
+# so reads and writes are all run by the writer.
+class AsyncSPDatabase(object):
+  def __init__(self):
+    super(AsyncSPDatabase, self).__init__()
+    self.writer = SPDatabase()
+    self.reader = None
+    self.writeExecutor = ThreadPoolExecutor(max_workers=1)
+    self.readExecutor = ThreadPoolExecutor(max_workers=1)
+
+  ########## HELPER FUNCTIONS ##########
+
+  # Run a function on the given executor.
+  # arguments:
+  #   1) executor to run the function on
+  #   2) function to run
+  #   3) arguments for the function
+  # returns: function's return value
+  async def _run(self, executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor,
+      functools.partial(func, *args, **kwargs))
+
+  # Call a reader function on the reader's thread. Generators are read
+  # in full on that thread, and the reader's session is ended afterwards
+  # so that the next read sees any newly-committed changes.
+  # arguments:
+  #   1) SPDatabase to call the function on: the reader, or the writer for
+  #      an in-memory database
+  #   2) name of the function
+  #   3) arguments for the function
+  # returns: function's return value, with generators read into a list
+  def _callReader(self, db, name, *args, **kwargs):
+    try:
+      result = getattr(db, name)(*args, **kwargs)
+      if inspect.isgenerator(result):
+        result = list(result)
+      return result
+    finally:
+      if db is self.reader and db.session is not None:
+        db.session.rollback()
+
+  # Open the reader's connection to the same database as the writer, and
+  # switch the database to WAL mode. Run on the reader's thread.
+  # arguments:
+  #   1) db_filename: string with path to database file
+  # returns: True on success, False on failure
+  def _openReader(self, db_filename):
+    reader = SPDatabase()
+    if not reader.openDatabase(db_filename):
+      return False
+    reader.session.rollback()
+    reader.engine.execute("PRAGMA journal_mode=WAL")
+    self.reader = reader
+    return True
+
+  # Close the reader's connection, if it is open.
+  # arguments: N/A
+  # returns: N/A
+  async def _closeReader(self):
+    if self.reader is not None:
+      await self._run(self.readExecutor, self.reader.closeDatabase)
+      self.reader = None
+
+  ########## DATABASE FUNCTIONS ##########
+
+  # Create new uninitialized spdxSummarizer database.
+  # WARNING: will delete the specified DB file if it already exists
+  # arguments:
+  #   1) db_filename: string with path to database file
+  # returns: True on success, False on failure
+  async def createDatabase(self, db_filename):
+    await self._closeReader()
+    retval = await self._run(self.writeExecutor, self.writer.createDatabase,
+      db_filename)
+    if not retval or db_filename == ":memory:":
+      return retval
+    return await self._run(self.readExecutor, self._openReader, db_filename)
+
+  # Open connections to existing spdxSummarizer database, and confirm that
+  # it is a valid spdxSummarizer database.
+  # arguments:
+  #   1) db_filename: string with path to database file
+  # returns: True on success, None or False on failure
+  async def openDatabase(self, db_filename):
+    await self._closeReader()
+    retval = await self._run(self.writeExecutor, self.writer.openDatabase,
+      db_filename)
+    if not retval:
+      return retval
+    return await self._run(self.readExecutor, self._openReader, db_filename)
+
+  # Close the database connections.
+  # arguments: N/A
+  # returns: N/A
+  async def closeDatabase(self):
+    await self._closeReader()
+    await self._run(self.writeExecutor, self.writer.closeDatabase)
+
+  # Close the database connections and shut down the worker threads. The
+  # AsyncSPDatabase can't be used after this.
+  # arguments: N/A
+  # returns: N/A
+  async def shutdown(self):
+    await self.closeDatabase()
+    self.readExecutor.shutdown()
+    self.writeExecutor.shutdown()
+
+  # Every other public SPDatabase function is available as a coroutine
+  # function with the same name and arguments. Functions that return
+  # generators return lists instead.
+  def __getattr__(self, name):
+    if name.startswith("_") or not inspect.isfunction(
+      getattr(SPDatabase, name, None)):
+      raise AttributeError(name)
+
+    if name.startswith(READ_PREFIXES):
+      async def reader_func(*args, **kwargs):
+        if self.reader is None:
+          return await self._run(self.writeExecutor, self._callReader,
+            self.writer, name, *args, **kwargs)
+        return await self._run(self.readExecutor, self._callReader,
+          self.reader, name, *args, **kwargs)
+      reader_func.__name__ = name
+      return reader_func
+
+    async def writer_func(*args, **kwargs):
+      result = await self._run(self.writeExecutor, getattr(self.writer, name),
+        *args, **kwargs)
+      if self.reader is not None:
+        await self._run(self.readExecutor, self.reader.invalidateCache)
+      return result
+    writer_func.__name__ = name
+    return writer_func
@@ -0,0 +1,104 @@
+# benchmarks.py
+#
+# Measures the per-call latency of frequently-called SPDatabase lookup
+# functions, compared with building and running the equivalent ORM query
+# from scratch on every call, as those functions used to do.
+#
+# Usage: PYTHONPATH=./ python3 spdxSummarizer/benchmarks.py [calls]
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import timeit
+
+from spdxSummarizer.dbtools import SPDatabase
+from spdxSummarizer.datatypes import Scan, License, Conversion, File
+
+# default number of calls to time for each function
+DEFAULT_CALLS = 2000
+
+# number of scans and files per scan in the benchmark database
+NUM_SCANS = 20
+NUM_FILES = 100
+
+# Create an in-memory database with some scans to look up.
+# arguments: N/A
+# returns: SPDatabase
+def createBenchmarkDatabase():
+  db = SPDatabase()
+  db.createDatabase(":memory:")
+  db.initializeDatabaseTables("spdxSummarizer/config.json")
+  for i in range(NUM_SCANS):
+    scan_id = db.addNewScan("2017-01-01", f"scan {i}")
+    db.addBulkNewFiles(scan_id, [(f"/dir/file{j}.c", 1, f"sha1-{j}", "", "")
+      for j in range(NUM_FILES)])
+  return db
+
+# Get the (name, function, function as it used to be) pairs to time.
+# arguments:
+#   1) db: SPDatabase
+# returns: list of tuples
+def getBenchmarks(db):
+  session = db.session
+  def oldGetScansIDList():
+    return [scan.id for scan in session.query(Scan.id).order_by(Scan.id)]
+  def oldGetScansData():
+    return [scan.asTuple() for scan in session.query(Scan).order_by(Scan.id)]
+  def oldGetScanData():
+    return session.query(Scan).filter(Scan.id == 5).first().asTuple()
+  def oldGetLicenseData():
+    return session.query(License).filter(License.id == 5).first().asTuple()
+  def oldGetConversionData():
+    return session.query(Conversion).filter(Conversion.id == 2).first().\
+      asTuple()
+  def oldGetFileData():
+    return session.query(File).filter(File.id == 50).first().asTuple()
+
+  return [
+    ("getScansIDList", db.getScansIDList, oldGetScansIDList),
+    ("getScansData", db.getScansData, oldGetScansData),
+    ("getScanData", lambda: db.getScanData(5), oldGetScanData),
+    ("getLicenseData", lambda: db.getLicenseData(5), oldGetLicenseData),
+    ("getConversionData", lambda: db.getConversionData(2),
+      oldGetConversionData),
+    ("getFileData", lambda: db.getFileData(50), oldGetFileData),
+  ]
+
+# Time each benchmark, and print the results.
+# arguments:
+#   1) calls: number of calls to time for each function
+# returns: list of (name, microseconds per call now, microseconds per call
+#   with the old query)
+def runBenchmarks(calls=DEFAULT_CALLS):
+  db = createBenchmarkDatabase()
+  results = []
+  print(f"{'function':<20} {'old (us/call)':>14} {'new (us/call)':>14} {'speedup':>8}")
+  for (name, func, old_func) in getBenchmarks(db):
+    if func() != old_func():
+      print(f"Error: {name} returned different results from the old query")
+    old_us = min(timeit.repeat(old_func, number=calls, repeat=3)) / calls * 1e6
+    new_us = min(timeit.repeat(func, number=calls, repeat=3)) / calls * 1e6
+    print(f"{name:<20} {old_us:>14.1f} {new_us:>14.1f} {old_us / new_us:>7.1f}x")
+    results.append((name, new_us, old_us))
+  db.closeDatabase()
+  return results
+
+########## initial entry point ##########
+
+if __name__ == "__main__":
+  calls = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CALLS
+  runBenchmarks(calls)
@@ -0,0 +1,115 @@
+# bloom.py
+#
+# This module contains the SPBloomFilter class, a compact probabilistic set
+# of file paths used to quickly rule out scans that can't contain a path.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+
+# number of bits per path, and number of bit positions set for each path;
+# together these give a false positive rate of about 1%
+BLOOM_BITS_PER_PATH = 10
+BLOOM_NUM_HASHES = 7
+
+# Get the pair of hash values used to find a path's bit positions in any
+# SPBloomFilter. When checking a path against many filters, this can be
+# called once and passed to mightContainHashes() for each filter.
+# arguments:
+#   1) path
+# returns: tuple of (first hash, second hash) integers
+def getPathHashes(path):
+  digest = hashlib.blake2b(path.encode('utf-8'), digest_size=16).digest()
+  # the second hash is made odd, so that it is never 0 and the positions
+  # don't all coincide
+  return (int.from_bytes(digest[:8], 'little'),
+    int.from_bytes(digest[8:], 'little') | 1)
+
+class SPBloomFilter(object):
+  # arguments:
+  #   1) num_bits: size of the filter in bits
+  #   2) (optional) num_hashes: number of bit positions set for each path
+  #   3) (optional) bits: bytes holding the filter's bits, as returned by
+  #      getBytes(); if not given, the filter starts out empty
+  def __init__(self, num_bits, num_hashes=BLOOM_NUM_HASHES, bits=None):
+    super(SPBloomFilter, self).__init__()
+    self.num_bits = num_bits
+    self.num_hashes = num_hashes
+    if bits is None:
+      self.bits = bytearray((num_bits + 7) // 8)
+    else:
+      self.bits = bytearray(bits)
+
+  # Create an empty filter sized for a number of paths.
+  # arguments:
+  #   1) number of paths that will be added
+  # returns: SPBloomFilter
+  @classmethod
+  def forPathCount(cls, num_paths):
+    return cls(max(num_paths * BLOOM_BITS_PER_PATH, 64))
+
+  # Create a filter containing a list of paths.
+  # arguments:
+  #   1) list of paths
+  # returns: SPBloomFilter
+  @classmethod
+  def fromPaths(cls, paths):
+    bloom = cls.forPathCount(len(paths))
+    for path in paths:
+      bloom.add(path)
+    return bloom
+
+  # Get the bytes holding the filter's bits, for storing in the database.
+  # arguments: N/A
+  # returns: bytes
+  def getBytes(self):
+    return bytes(self.bits)
+
+  # Add a path to the filter.
+  # arguments:
+  #   1) path
+  # returns: N/A
+  def add(self, path):
+    (h1, h2) = getPathHashes(path)
+    bits = self.bits
+    m = self.num_bits
+    for i in range(self.num_hashes):
+      pos = (h1 + i * h2) % m
+      bits[pos >> 3] |= 1 << (pos & 7)
+
+  # Check whether a path might have been added to the filter. A False
+  # result is always correct; a True result may be a false positive.
+  # arguments:
+  #   1) path
+  # returns: True if the path might be in the filter, False if it isn't
+  def mightContain(self, path):
+    return self.mightContainHashes(getPathHashes(path))
+
+  # Check whether a path might have been added to the filter, given its
+  # hash values from getPathHashes().
+  # arguments:
+  #   1) tuple of (first hash, second hash)
+  # returns: True if the path might be in the filter, False if it isn't
+  def mightContainHashes(self, hashes):
+    (h1, h2) = hashes
+    bits = self.bits
+    m = self.num_bits
+    for i in range(self.num_hashes):
+      pos = (h1 + i * h2) % m
+      if not bits[pos >> 3] & (1 << (pos & 7)):
+        return False
+    return True
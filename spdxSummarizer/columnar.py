@@ -0,0 +1,314 @@
+# columnar.py
+#
+# This module contains functions for exporting scans from an spdxSummarizer
+# database into columnar Parquet and Arrow files, and for importing those
+# files back into a database.
+#
+# These functions require the pyarrow package, which is an optional
+# dependency of spdxSummarizer. The rest of spdxSummarizer can be used
+# without it.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+try:
+  import pyarrow as pa
+  import pyarrow.ipc
+  import pyarrow.parquet
+except ImportError:
+  pa = None
+
+# number of file records to write in each record batch
+RECORD_BATCH_SIZE = 65536
+
+# columns in exported files, in the same order as the tuples returned by
+# SPDatabase.getFileRecordsForScans()
+COLUMN_NAMES = ["scan_id", "scan_dt", "desc", "filename", "license",
+  "category", "sha1", "md5", "sha256"]
+
+# columns which are dictionary-encoded in exported files
+DICTIONARY_COLUMNS = ["scan_dt", "desc", "license", "category"]
+
+########## HELPER FUNCTIONS ##########
+
+# Check whether pyarrow is available, and print an error if it isn't.
+# arguments: N/A
+# returns: True if pyarrow is available, False otherwise
+def _checkForPyarrow():
+  if pa is None:
+    print("Error: the pyarrow package is required for Parquet and Arrow files.")
+    return False
+  return True
+
+# Build the Arrow schema for exported files.
+# arguments: N/A
+# returns: pyarrow Schema
+def _getSchema():
+  fields = []
+  for name in COLUMN_NAMES:
+    if name == "scan_id":
+      fields.append(pa.field(name, pa.int32()))
+    elif name in DICTIONARY_COLUMNS:
+      fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+    else:
+      fields.append(pa.field(name, pa.string()))
+  return pa.schema(fields)
+
+# Build the dictionaries used to encode the dictionary columns. These are
+# built once from the (small) scans, licenses and categories tables, so that
+# every record batch in a file shares the same dictionaries. Missing values,
+# such as a scan without a description, are left out of the dictionaries
+# and written as nulls.
+# arguments:
+#   1) db: SPDatabase
+#   2) scan_ids: list of scan IDs being exported, or None for all scans
+# returns: dict of column name => (value => index dict, pyarrow dictionary)
+def _buildDictionaries(db, scan_ids):
+  values = {
+    "scan_dt": set(),
+    "desc": set(),
+    "license": set(),
+    "category": set(),
+  }
+  for (scan_id, scan_dt, desc) in db.getScansData():
+    if scan_ids is None or scan_id in scan_ids:
+      values["scan_dt"].add(scan_dt)
+      values["desc"].add(desc)
+  for (id, short_name, category_id) in db.getLicensesData():
+    values["license"].add(short_name)
+  for (id, name) in db.getCategoriesData():
+    values["category"].add(name)
+
+  dicts = {}
+  for name, vals in values.items():
+    dictionary = sorted(v for v in vals if v is not None)
+    index_map = {v: i for i, v in enumerate(dictionary)}
+    dicts[name] = (index_map, pa.array(dictionary, type=pa.string()))
+  return dicts
+
+# Convert a list of file record tuples into an Arrow record batch.
+# arguments:
+#   1) schema: pyarrow Schema from _getSchema()
+#   2) dicts: dictionaries from _buildDictionaries()
+#   3) rows: list of tuples from SPDatabase.getFileRecordsForScans()
+# returns: pyarrow RecordBatch
+def _buildRecordBatch(schema, dicts, rows):
+  columns = list(zip(*rows))
+  arrays = []
+  for i, name in enumerate(COLUMN_NAMES):
+    if name in DICTIONARY_COLUMNS:
+      index_map, dictionary = dicts[name]
+      indices = pa.array([None if v is None else index_map[v]
+        for v in columns[i]], type=pa.int32())
+      arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+    else:
+      arrays.append(pa.array(columns[i], type=schema.field(name).type))
+  return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+# Stream file records for the requested scans out of the database and
+# into a Parquet or Arrow writer, one record batch at a time.
+# arguments:
+#   1) db: SPDatabase
+#   2) writer: pyarrow ParquetWriter or RecordBatchFileWriter
+#   3) schema: pyarrow Schema from _getSchema()
+#   4) scan_ids: list of scan IDs to export, or None for all scans
+# returns: number of file records written
+def _writeRecords(db, writer, schema, scan_ids):
+  dicts = _buildDictionaries(db, scan_ids)
+  count = 0
+  rows = []
+  for record in db.getFileRecordsForScans(scan_ids):
+    rows.append(record)
+    if len(rows) >= RECORD_BATCH_SIZE:
+      batch = _buildRecordBatch(schema, dicts, rows)
+      writer.write_table(pa.Table.from_batches([batch]))
+      count += len(rows)
+      rows = []
+  if rows:
+    batch = _buildRecordBatch(schema, dicts, rows)
+    writer.write_table(pa.Table.from_batches([batch]))
+    count += len(rows)
+  return count
+
+# Submit pending file tuples for a scan to the database in bulk, rolling
+# back if they can't be added.
+# arguments:
+#   1) db: SPDatabase
+#   2) scan_id: ID of scan in the database, or None if no scan is pending
+#   3) file_tuples: list of file tuples for SPDatabase.addBulkNewFiles()
+# returns: True if successful or nothing to submit, False otherwise
+def _submitFiles(db, scan_id, file_tuples):
+  if scan_id is None or not file_tuples:
+    return True
+  retval = db.addBulkNewFiles(scan_id, file_tuples, False)
+  if not retval:
+    print(f"Error: couldn't add files for scan {scan_id}; rolling back.")
+    db.rollbackChanges()
+    return False
+  return True
+
+# Load file records from a sequence of record batches into the database,
+# creating a new scan for each distinct scan ID found in the records.
+# License names are matched against licenses already in the database; any
+# unknown license is added to the category with the same name, if there
+# is one.
+# arguments:
+#   1) db: SPDatabase
+#   2) batches: iterable of pyarrow RecordBatches
+# returns: list of new scan IDs if successful, None otherwise
+def _importRecords(db, batches):
+  lic_ids = {}
+  for (id, short_name, category_id) in db.getLicensesData():
+    lic_ids.setdefault(short_name, id)
+  cat_ids = {}
+  for (id, name) in db.getCategoriesData():
+    cat_ids.setdefault(name, id)
+
+  # exported files are sorted by scan, so file tuples are submitted in
+  # bulk each time the scan changes, rather than holding every scan in
+  # memory at once
+  # map of scan ID in file => new scan ID
+  scans = {}
+  new_scan_ids = []
+  current_src_scan_id = None
+  current_scan_id = None
+  file_tuples = []
+  for batch in batches:
+    cols = batch.to_pydict()
+    records = zip(*[cols[name] for name in COLUMN_NAMES])
+    for (src_scan_id, scan_dt, desc, filename, license, category,
+      sha1, md5, sha256) in records:
+      if src_scan_id != current_src_scan_id:
+        if not _submitFiles(db, current_scan_id, file_tuples):
+          return None
+        file_tuples = []
+        current_src_scan_id = src_scan_id
+        current_scan_id = scans.get(src_scan_id, None)
+        if current_scan_id is None:
+          current_scan_id = db.addNewScan(scan_dt, desc, False)
+          if current_scan_id == -1:
+            print(f"Error: couldn't create new scan for scan {src_scan_id}; rolling back.")
+            db.rollbackChanges()
+            return None
+          scans[src_scan_id] = current_scan_id
+          new_scan_ids.append(current_scan_id)
+
+      lic_id = lic_ids.get(license, None)
+      if lic_id is None:
+        cat_id = cat_ids.get(category, None)
+        if cat_id is None:
+          print(f"Error: unknown license {license} in unknown category {category}; rolling back.")
+          db.rollbackChanges()
+          return None
+        lic_id = db.addNewLicense(license, cat_id, False)
+        if lic_id == -1:
+          print(f"Error: couldn't create new license {license}; rolling back.")
+          db.rollbackChanges()
+          return None
+        lic_ids[license] = lic_id
+
+      file_tuples.append((filename, lic_id, sha1, md5, sha256))
+
+  if not _submitFiles(db, current_scan_id, file_tuples):
+    return None
+
+  db.commitChanges()
+  return new_scan_ids
+
+########## EXPORT FUNCTIONS ##########
+
+# Export scans to a Parquet file. License, category, scan date and scan
+# description columns are dictionary-encoded.
+# arguments:
+#   1) db: SPDatabase
+#   2) parquet_filename: filename for Parquet output file to be created
+#   3) (optional) scan_ids: list of scan IDs to export; if None, export the
+#      whole database
+# returns: True if successfully created file, False otherwise
+def exportScansToParquet(db, parquet_filename, scan_ids=None):
+  if not _checkForPyarrow():
+    return False
+  try:
+    schema = _getSchema()
+    with pa.parquet.ParquetWriter(parquet_filename, schema) as writer:
+      count = _writeRecords(db, writer, schema, scan_ids)
+    print(f"Exported {count} file records to {parquet_filename}.")
+    return True
+
+  except Exception as e:
+    print(f"Couldn't export scans to Parquet file {parquet_filename}: {str(e)}")
+    return False
+
+# Export scans to an Arrow IPC file. License, category, scan date and scan
+# description columns are dictionary-encoded.
+# arguments:
+#   1) db: SPDatabase
+#   2) arrow_filename: filename for Arrow output file to be created
+#   3) (optional) scan_ids: list of scan IDs to export; if None, export the
+#      whole database
+# returns: True if successfully created file, False otherwise
+def exportScansToArrow(db, arrow_filename, scan_ids=None):
+  if not _checkForPyarrow():
+    return False
+  try:
+    schema = _getSchema()
+    with pa.ipc.new_file(arrow_filename, schema) as writer:
+      count = _writeRecords(db, writer, schema, scan_ids)
+    print(f"Exported {count} file records to {arrow_filename}.")
+    return True
+
+  except Exception as e:
+    print(f"Couldn't export scans to Arrow file {arrow_filename}: {str(e)}")
+    return False
+
+########## IMPORT FUNCTIONS ##########
+
+# Import scans from a Parquet file created by exportScansToParquet().
+# arguments:
+#   1) db: SPDatabase
+#   2) parquet_filename: filename for Parquet file to be imported
+# returns: list of new scan IDs if successful, None otherwise
+def importScansFromParquet(db, parquet_filename):
+  if not _checkForPyarrow():
+    return None
+  try:
+    pf = pa.parquet.ParquetFile(parquet_filename)
+    batches = pf.iter_batches(batch_size=RECORD_BATCH_SIZE)
+    return _importRecords(db, batches)
+
+  except Exception as e:
+    print(f"Couldn't import scans from Parquet file {parquet_filename}: {str(e)}")
+    db.rollbackChanges()
+    return None
+
+# Import scans from an Arrow IPC file created by exportScansToArrow().
+# arguments:
+#   1) db: SPDatabase
+#   2) arrow_filename: filename for Arrow file to be imported
+# returns: list of new scan IDs if successful, None otherwise
+def importScansFromArrow(db, arrow_filename):
+  if not _checkForPyarrow():
+    return None
+  try:
+    with pa.ipc.open_file(arrow_filename) as reader:
+      batches = (reader.get_batch(i)
+        for i in range(reader.num_record_batches))
+      return _importRecords(db, batches)
+
+  except Exception as e:
+    print(f"Couldn't import scans from Arrow file {arrow_filename}: {str(e)}")
+    db.rollbackChanges()
+    return None
@@ -18,8 +18,10 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-from sqlalchemy import create_engine
-from sqlalchemy import Table, Column, Integer, String, Date, ForeignKey
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy import Table, Column, Integer, String, Date, ForeignKey, Index, \
+  Boolean, LargeBinary
 from sqlalchemy.orm import sessionmaker, relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -35,9 +37,23 @@ class Config(Base):
 
 class Scan(Base):
   __tablename__ = 'scans'
+  __table_args__ = (
+    Index('ix_scans_doc_digest', 'doc_digest'),
+    Index('ix_scans_content_digest', 'content_digest'),
+  )
   id = Column(Integer(), primary_key=True)
   scan_dt = Column(Date())
   desc = Column(String())
+  # if set, this scan's files are stored as a delta against this scan
+  parent_scan_id = Column(Integer(), ForeignKey('scans.id'))
+  # SHA256 hex digest of the SPDX document the scan was imported from
+  doc_digest = Column(String())
+  # the scan's fingerprint, i.e. the hash of its top-level directory in
+  # dir_hashes; NULL until the scan's files have been hashed
+  content_digest = Column(String())
+  # if set, this scan was imported with the same content as this scan, and
+  # has no files of its own; its parent_scan_id is also set to this scan
+  alias_of_scan_id = Column(Integer(), ForeignKey('scans.id'))
 
   def __repr__(self):
     return f"Scan {self.id}: {self.scan_dt}, {self.desc}"
@@ -64,7 +80,14 @@ class License(Base):
   short_name = Column(String())
   category_id = Column(Integer(), ForeignKey('categories.id'))
   # relationships
-  category = relationship("Category", backref=backref('licenses', order_by=id))
+  # License.category, File.license and Conversion.new_license point at the
+  # small categories and licenses tables, and are used by __repr__, so they
+  # are loaded with a join in the same query as the objects referring to
+  # them. The one-to-many backrefs can be very large (e.g. all of a
+  # license's files across every scan), so they are only loaded when
+  # accessed.
+  category = relationship("Category", lazy="joined",
+    backref=backref('licenses', order_by=id))
 
   def __repr__(self):
     return f"License {self.id}: {self.short_name}, category {self.category.name}"
@@ -74,6 +97,13 @@ class License(Base):
 
 class File(Base):
   __tablename__ = 'files'
+  __table_args__ = (
+    Index('ix_files_scan_id_filename', 'scan_id', 'filename'),
+    Index('ix_files_scan_id_is_git_extension', 'scan_id', 'is_git',
+      'extension'),
+    Index('ix_files_scan_id_is_git_is_vendor', 'scan_id', 'is_git',
+      'is_vendor'),
+  )
   # columns
   id = Column(Integer(), primary_key=True)
   scan_id = Column(Integer(), ForeignKey('scans.id'))
@@ -82,9 +112,20 @@ class File(Base):
   sha1 = Column(String())
   md5 = Column(String())
   sha256 = Column(String())
+  # True for rows in delta scans marking files removed since the parent scan
+  removed = Column(Boolean(), nullable=False, default=False,
+    server_default='0')
+  # path attributes, from analysis.getPathAttributes()
+  extension = Column(String())
+  is_git = Column(Boolean(), nullable=False, default=False,
+    server_default='0')
+  is_vendor = Column(Boolean(), nullable=False, default=False,
+    server_default='0')
+  depth = Column(Integer())
   # relationships
   scan = relationship("Scan", backref=backref('files', order_by=id))
-  license = relationship("License", backref=backref('files', order_by=id))
+  license = relationship("License", lazy="joined",
+    backref=backref('files', order_by=id))
 
   def __repr__(self):
     return f"File {self.filename}, license: {self.license.short_name}"
@@ -93,6 +134,269 @@ class File(Base):
     return (self.id, self.scan_id, self.filename, self.license_id,
       self.sha1, self.md5, self.sha256)
 
+# Full-text index over file paths, using SQLite's FTS5 trigram tokenizer so
+# that substring and GLOB searches on filenames can use an index. It is an
+# external-content table, so it stores only the index. Deleted and renamed
+# files are removed from the index by triggers. New files are added to the
+# index in bulk by SPDatabase after they are inserted, because indexing each
+# row from an insert trigger makes imports several times slower.
+FILES_FTS_DDL = [
+  """CREATE VIRTUAL TABLE files_fts USING fts5(
+    filename, content='files', content_rowid='id', tokenize='trigram')""",
+  """CREATE TRIGGER files_fts_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, filename)
+      VALUES ('delete', old.id, old.filename);
+  END""",
+  """CREATE TRIGGER files_fts_update AFTER UPDATE OF filename ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, filename)
+      VALUES ('delete', old.id, old.filename);
+    INSERT INTO files_fts(rowid, filename) VALUES (new.id, new.filename);
+  END""",
+]
+
+# Create the files_fts index along with the files table. If this SQLite
+# library doesn't have FTS5 or the trigram tokenizer, the index is left out
+# and path searches fall back to scanning the files table.
+@event.listens_for(File.__table__, "after_create")
+def createFilesFTS(target, connection, **kw):
+  try:
+    connection.execute(FILES_FTS_DDL[0])
+  except OperationalError:
+    return
+  for ddl in FILES_FTS_DDL[1:]:
+    connection.execute(ddl)
+
+class Snippet(Base):
+  __tablename__ = 'snippets'
+  __table_args__ = (
+    Index('ix_snippets_scan_id_filename', 'scan_id', 'filename'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  # snippets are stored against their file's scan and path, rather than the
+  # file's row, which may be in a parent scan or a shard, or be rewritten
+  # when a delta scan is stored in full
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  filename = Column(String())
+  # 32-bit hash of the filename, for the snippets_rtree index
+  file_key = Column(Integer())
+  spdx_id = Column(String())
+  # byte and line ranges, including both ends; the line range is NULL if
+  # the SPDX document didn't give one
+  byte_start = Column(Integer())
+  byte_end = Column(Integer())
+  line_start = Column(Integer())
+  line_end = Column(Integer())
+  license_id = Column(Integer(), ForeignKey('licenses.id'))
+
+  def __repr__(self):
+    return f"Snippet {self.spdx_id}: {self.filename} bytes {self.byte_start}-{self.byte_end}, license {self.license_id}"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.filename, self.spdx_id,
+      self.byte_start, self.byte_end, self.line_start, self.line_end,
+      self.license_id)
+
+# Interval index over snippets, using SQLite's R*Tree module, so that the
+# snippets overlapping a range of a file can be found without reading all
+# of the file's snippets. Each snippet is a box over its scan ID, file key,
+# byte range and line range (0 to 0 if it has no line range). Rows are kept
+# in step with the snippets table by triggers.
+SNIPPETS_RTREE_DDL = [
+  """CREATE VIRTUAL TABLE snippets_rtree USING rtree_i32(id,
+    min_scan_id, max_scan_id, min_file_key, max_file_key,
+    min_byte, max_byte, min_line, max_line)""",
+  """CREATE TRIGGER snippets_rtree_insert AFTER INSERT ON snippets BEGIN
+    INSERT INTO snippets_rtree VALUES (new.id, new.scan_id, new.scan_id,
+      new.file_key, new.file_key, new.byte_start, new.byte_end,
+      coalesce(new.line_start, 0), coalesce(new.line_end, 0));
+  END""",
+  """CREATE TRIGGER snippets_rtree_delete AFTER DELETE ON snippets BEGIN
+    DELETE FROM snippets_rtree WHERE id = old.id;
+  END""",
+]
+
+# Create the snippets_rtree index along with the snippets table. If this
+# SQLite library doesn't have the R*Tree module, the index is left out and
+# range queries fall back to reading each file's snippets.
+@event.listens_for(Snippet.__table__, "after_create")
+def createSnippetsRtree(target, connection, **kw):
+  try:
+    connection.execute(SNIPPETS_RTREE_DDL[0])
+  except OperationalError:
+    return
+  for ddl in SNIPPETS_RTREE_DDL[1:]:
+    connection.execute(ddl)
+
+class SPDXElement(Base):
+  __tablename__ = 'spdx_elements'
+  __table_args__ = (
+    Index('ix_spdx_elements_scan_id_spdx_id', 'scan_id', 'spdx_id'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  # as with snippets, elements are stored against their scan rather than
+  # against file rows
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  spdx_id = Column(String())
+  # "DOCUMENT", "PACKAGE" or "FILE"
+  element_type = Column(String())
+  # document or package name, or filename
+  name = Column(String())
+  # concluded license, for files only
+  license_id = Column(Integer(), ForeignKey('licenses.id'))
+
+  def __repr__(self):
+    return f"SPDXElement {self.spdx_id}: {self.element_type} {self.name}"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.spdx_id, self.element_type,
+      self.name, self.license_id)
+
+class Relationship(Base):
+  __tablename__ = 'relationships'
+  __table_args__ = (
+    Index('ix_relationships_scan_id_from_spdx_id', 'scan_id', 'from_spdx_id'),
+    Index('ix_relationships_scan_id_to_spdx_id', 'scan_id', 'to_spdx_id'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  # relationship as given in the SPDX document, e.g. "SPDXRef-Package"
+  # "CONTAINS" "SPDXRef-File1"
+  from_spdx_id = Column(String())
+  relationship_type = Column(String())
+  to_spdx_id = Column(String())
+
+  def __repr__(self):
+    return f"Relationship scan {self.scan_id}: {self.from_spdx_id} {self.relationship_type} {self.to_spdx_id}"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.from_spdx_id, self.relationship_type,
+      self.to_spdx_id)
+
+class RelationshipClosure(Base):
+  __tablename__ = 'relationship_closure'
+  __table_args__ = (
+    Index('ix_relationship_closure_scan_id_ancestor_descendant', 'scan_id',
+      'ancestor_spdx_id', 'descendant_spdx_id', unique=True),
+    Index('ix_relationship_closure_scan_id_descendant', 'scan_id',
+      'descendant_spdx_id'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  # one row for each pair of elements where the descendant can be reached
+  # from the ancestor by following containment, dependency and link
+  # relationships; elements aren't paired with themselves
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  ancestor_spdx_id = Column(String())
+  descendant_spdx_id = Column(String())
+  # length of the shortest path from the ancestor to the descendant
+  depth = Column(Integer())
+
+  def __repr__(self):
+    return f"RelationshipClosure scan {self.scan_id}: {self.ancestor_spdx_id} => {self.descendant_spdx_id} ({self.depth})"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.ancestor_spdx_id,
+      self.descendant_spdx_id, self.depth)
+
+class DirLicenseCount(Base):
+  __tablename__ = 'dir_license_counts'
+  __table_args__ = (
+    Index('ix_dir_license_counts_scan_id_directory', 'scan_id', 'directory'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  # directory path with trailing slash, e.g. "drivers/net/"; the empty
+  # string is the top level of the scan, with depth 0
+  directory = Column(String())
+  depth = Column(Integer())
+  license_id = Column(Integer(), ForeignKey('licenses.id'))
+  # number of files with this license in the directory and its descendants
+  file_count = Column(Integer())
+
+  def __repr__(self):
+    return f"DirLicenseCount scan {self.scan_id}: {self.directory}, license {self.license_id} => {self.file_count}"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.directory, self.depth,
+      self.license_id, self.file_count)
+
+class DirHash(Base):
+  __tablename__ = 'dir_hashes'
+  __table_args__ = (
+    Index('ix_dir_hashes_scan_id_directory', 'scan_id', 'directory'),
+    Index('ix_dir_hashes_scan_id_parent_directory', 'scan_id',
+      'parent_directory'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  # directory path with trailing slash, as in dir_license_counts; the
+  # parent directory is NULL for the top level of the scan
+  directory = Column(String())
+  parent_directory = Column(String())
+  depth = Column(Integer())
+  # SHA1 hex digest over the directory's files (name, license ID and SHA1)
+  # and subdirectories (name and hash), in sorted order
+  hash = Column(String())
+  # SHA1 hex digest over just the directory's own files
+  files_hash = Column(String())
+
+  def __repr__(self):
+    return f"DirHash scan {self.scan_id}: {self.directory} => {self.hash}"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.directory, self.parent_directory,
+      self.depth, self.hash, self.files_hash)
+
+class ScanBloom(Base):
+  __tablename__ = 'scan_blooms'
+  __table_args__ = (
+    Index('ix_scan_blooms_scan_id', 'scan_id', unique=True),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  # number of paths in the scan, and the filter's parameters and bits; see
+  # bloom.SPBloomFilter
+  num_paths = Column(Integer())
+  num_bits = Column(Integer())
+  num_hashes = Column(Integer())
+  bits = Column(LargeBinary())
+
+  def __repr__(self):
+    return f"ScanBloom scan {self.scan_id}: {self.num_paths} paths, {self.num_bits} bits"
+
+  def asTuple(self):
+    return (self.id, self.scan_id, self.num_paths, self.num_bits,
+      self.num_hashes)
+
+class PathHistory(Base):
+  __tablename__ = 'path_history'
+  __table_args__ = (
+    Index('ix_path_history_filename_scan_id', 'filename', 'scan_id'),
+    Index('ix_path_history_scan_id', 'scan_id'),
+  )
+  # columns
+  id = Column(Integer(), primary_key=True)
+  # a row is only recorded for a scan where the path's license or SHA1
+  # differs from the previous scan with files, or where the path was added
+  # or removed
+  filename = Column(String())
+  scan_id = Column(Integer(), ForeignKey('scans.id'))
+  # license ID and SHA1 are NULL when the path was removed in this scan
+  license_id = Column(Integer(), ForeignKey('licenses.id'))
+  sha1 = Column(String())
+
+  def __repr__(self):
+    return f"PathHistory {self.filename}: scan {self.scan_id}, license {self.license_id}"
+
+  def asTuple(self):
+    return (self.id, self.filename, self.scan_id, self.license_id, self.sha1)
+
 class Conversion(Base):
   __tablename__ = 'conversions'
   # columns
@@ -102,6 +406,7 @@ class Conversion(Base):
   # relationships
   new_license = relationship(
     "License",
+    lazy="joined",
     backref=backref('conversions', order_by=id)
   )
 
@@ -22,27 +22,463 @@
 import json
 import os
 import datetime
+import hashlib
+import inspect
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager, nullcontext
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, and_, or_, case, exists, func, \
+  literal, literal_column, null, select, Table, Column, Index, Integer, \
+  String, Boolean, MetaData, table, column, text
+from sqlalchemy import bindparam, event
+from sqlalchemy.ext import baked
+from sqlalchemy.schema import CreateTable, CreateIndex
+from sqlalchemy.orm import sessionmaker, scoped_session, aliased, joinedload
 
 from spdxSummarizer.spconfig import SPVERSION
+from spdxSummarizer.analysis import getPathAttributes
+from spdxSummarizer.instrumentation import SPQueryInstrumentation
+from spdxSummarizer.querycontrol import QUERY_PROGRESS_STEPS
+from spdxSummarizer.bloom import SPBloomFilter, getPathHashes
 from spdxSummarizer.datatypes import Base
 from spdxSummarizer.datatypes import Config, Scan, Category, License, File, \
-  Conversion
+  Conversion, Snippet, SPDXElement, Relationship, RelationshipClosure, \
+  DirLicenseCount, DirHash, ScanBloom, PathHistory
+
+# number of rows to pull from the database at a time, for queries that
+# stream their results back rather than loading them all into memory
+STREAM_BATCH_SIZE = 1000
+
+# number of rows to delete in each statement when deleting a scan
+DELETE_CHUNK_SIZE = 10000
+
+# names of tables holding data derived from a scan's files, keyed by a
+# scan_id column; rows for a scan are deleted along with the scan
+SCAN_DERIVED_TABLES = ["dir_license_counts", "dir_hashes", "scan_blooms",
+  "path_history"]
+
+# names of tables holding data imported from a scan's SPDX document other
+# than its files, keyed by a scan_id column; an alias scan has no rows of
+# its own, and uses those of the scan it is an alias of
+SCAN_DOCUMENT_TABLES = ["snippets", "spdx_elements", "relationships",
+  "relationship_closure"]
+
+# relationship types followed when building the relationship closure, so
+# that everything an element describes, contains, depends on or links to
+# can be found in one query; each maps to True if the relationship points
+# from the containing or depending element to the other one, or False if
+# it points the other way (e.g. "A CONTAINED_BY B")
+CLOSURE_RELATIONSHIP_TYPES = {
+  "DESCRIBES": True,
+  "DESCRIBED_BY": False,
+  "CONTAINS": True,
+  "CONTAINED_BY": False,
+  "DEPENDS_ON": True,
+  "DEPENDENCY_OF": False,
+  "BUILD_DEPENDENCY_OF": False,
+  "DEV_DEPENDENCY_OF": False,
+  "OPTIONAL_DEPENDENCY_OF": False,
+  "PROVIDED_DEPENDENCY_OF": False,
+  "RUNTIME_DEPENDENCY_OF": False,
+  "TEST_DEPENDENCY_OF": False,
+  "HAS_PREREQUISITE": True,
+  "PREREQUISITE_FOR": False,
+  "DYNAMIC_LINK": True,
+  "STATIC_LINK": True,
+}
+
+# fingerprint of a scan with no files
+EMPTY_SCAN_FINGERPRINT = hashlib.sha1().hexdigest()
+
+# if more than this many directories differ between two scans, comparisons
+# read all files in both scans rather than only those in the changed
+# directories
+COMPARISON_PRUNE_MAX_DIRECTORIES = 500
+
+# compiled statement cache for the frequently-called lookup functions below.
+# A baked query is built and compiled to SQL once, the first time it is
+# used, and is keyed on the code of the lambdas that build it; later calls
+# only bind parameters and run the cached SQL. The lookups query columns
+# rather than entities, so no ORM objects are created for their results.
+QUERY_BAKERY = baked.bakery()
+
+# magic value and format version recorded in scan bundle files
+BUNDLE_MAGIC = "spdxSummarizerBundle"
+BUNDLE_FORMAT_VERSION = "2"
+
+# bundle format versions that can still be imported; version 1 bundles
+# only hold files, without snippets, elements or relationships
+BUNDLE_IMPORT_VERSIONS = ["1", "2"]
+
+# schema name that a scan bundle file is attached as while it is being
+# exported or imported
+BUNDLE_SCHEMA = "bundle"
+
+# config key holding the number of scans whose files are stored in each
+# files shard, for databases using the sharded layout
+SHARD_SIZE_CONFIG_KEY = "files_shard_size"
+
+# prefix for the schema names that files shards are attached as
+SHARD_SCHEMA_PREFIX = "files_shard_"
+
+# file IDs in each files shard start after a multiple of this, so that they
+# are unique across shards
+SHARD_FILE_ID_SPAN = 2 ** 40
+
+# columns of the files table that are copied when file rows are copied
+# between scans, i.e. all but the ID, scan ID and removal marker
+FILE_DATA_COLUMNS = ['filename', 'license_id', 'sha1', 'md5', 'sha256',
+  'extension', 'is_git', 'is_vendor', 'depth']
+
+# Get the index of the files shard holding a scan's files, in a database
+# using the sharded layout. See "FILES SHARD FUNCTIONS" in SPDatabase below.
+# arguments:
+#   1) ID of scan
+#   2) number of scans in each shard
+# returns: shard index
+def getFileShardIndex(scan_id, shard_size):
+  return (scan_id - 1) // shard_size
+
+# Get the path to a files shard's database file.
+# arguments:
+#   1) path to the main database file
+#   2) shard index
+# returns: path to shard file
+def getFileShardFilename(db_filename, shard_index):
+  base = os.path.splitext(db_filename)[0]
+  return f"{base}-files-{shard_index:04d}.db"
+
+# Get a select statement for the effective file rows of a scan, given the
+# scan's delta chain. See SPDatabase._selectScanFiles(). This is separate
+# from SPDatabase so that it can also be used with the files table of an
+# attached database.
+# arguments:
+#   1) files table, which must have at least the filename, scan_id and
+#      removed columns
+#   2) ID of scan
+#   3) chain of scan IDs, as returned by SPDatabase._getScanChain()
+# returns: select statement with the same columns as the files table, with
+#   scan_id set to the requested scan
+def selectScanChainFiles(files, scan_id, chain):
+  columns = []
+  for c in files.c:
+    if c.name == 'scan_id':
+      columns.append(literal(scan_id, Integer()).label('scan_id'))
+    else:
+      columns.append(c)
+
+  if len(chain) == 1:
+    sel = select(columns).where(files.c.scan_id == scan_id)
+  else:
+    newer = files.alias('newer_files')
+    def depth(table):
+      return case([(table.c.scan_id == sid, d) for d, sid in enumerate(chain)])
+    shadowed = exists().where(and_(
+      newer.c.filename == files.c.filename,
+      newer.c.scan_id.in_(chain),
+      depth(newer) < depth(files)
+    ))
+    sel = select(columns).\
+      where(files.c.scan_id.in_(chain)).\
+      where(~shadowed)
+  return sel.where(files.c.removed == False)
+
+# Compute the Merkle hashes for each directory in a list of files; see
+# "DIRECTORY HASH FUNCTIONS" in SPDatabase below. The files are read in one
+# pass, with a stack holding hashes for each of the directories containing
+# the current file; each directory's hashes are returned, and its full hash
+# added to its parent's, once the pass moves past it.
+# arguments:
+#   1) iterable of (filename, license ID, SHA1) tuples, sorted
+# returns: generator of (directory, parent directory, depth, hash, files
+#   hash) tuples, with the top-level directory last
+def hashDirectories(file_rows):
+  # list of (directory, full hash object, files hash object) for the open
+  # directories
+  stack = []
+  def closeDirectory():
+    directory, dir_hash, files_hash = stack.pop()
+    digest = dir_hash.hexdigest()
+    parent = stack[-1][0] if stack else None
+    if stack:
+      name = directory[len(parent):]
+      stack[-1][1].update(f"D\0{name}\0{digest}\n".encode('utf-8'))
+    return (directory, parent, len(stack), digest, files_hash.hexdigest())
+
+  for (filename, license_id, sha1) in file_rows:
+    directories = [""] + [filename[:i+1]
+      for i, c in enumerate(filename) if c == "/"]
+    common = 0
+    while (common < len(stack) and common < len(directories) and
+      stack[common][0] == directories[common]):
+      common += 1
+    while len(stack) > common:
+      yield closeDirectory()
+    for directory in directories[common:]:
+      stack.append((directory, hashlib.sha1(), hashlib.sha1()))
+    name = filename[len(directories[-1]):]
+    entry = f"F\0{name}\0{license_id}\0{sha1 or ''}\n".encode('utf-8')
+    stack[-1][1].update(entry)
+    stack[-1][2].update(entry)
+  while stack:
+    yield closeDirectory()
+
+# Get the content digest for a list of files about to be imported as a scan.
+# This is the same as the fingerprint the scan would have once imported
+# (see SPDatabase.getScanFingerprint()), so it can be used to find an
+# existing scan with the same content before importing.
+# arguments:
+#   1) list of tuples in format:
+#      (filename, ID of license, SHA1 string, MD5 string, SHA256 string)
+# returns: digest string
+def getContentDigest(file_tuples):
+  rows = sorted((ft[0], ft[1], ft[2] or '') for ft in file_tuples)
+  digest = EMPTY_SCAN_FINGERPRINT
+  for (directory, parent, depth, dir_hash, files_hash) in \
+    hashDirectories(rows):
+    if directory == "":
+      digest = dir_hash
+  return digest
+
+# Get the key for a filename used in the snippets_rtree index: a hash of
+# the filename, as a signed 32-bit integer.
+# arguments:
+#   1) filename
+# returns: integer
+def getFileKey(filename):
+  key = zlib.crc32(filename.encode('utf-8'))
+  return key - (1 << 32) if key >= (1 << 31) else key
+
+# Get a sort key for a snippet or element tuple, in the formats used by
+# SPDatabase.addBulkNewSnippets() and addBulkNewRelationships(), with
+# missing line ranges or license IDs sorted first.
+# arguments:
+#   1) snippet or element tuple
+# returns: tuple
+def nullsFirstSortKey(data_tuple):
+  return tuple(-1 if v is None else v for v in data_tuple)
+
+# Get the edge of the relationship closure for a relationship, if its type
+# is followed by the closure.
+# arguments:
+#   1) relationship tuple, in the format used by
+#      SPDatabase.addBulkNewRelationships()
+# returns: tuple of (ancestor SPDX ID, descendant SPDX ID), or None if the
+#   relationship isn't followed
+def getClosureEdge(relationship_tuple):
+  (from_spdx_id, relationship_type, to_spdx_id) = relationship_tuple
+  forward = CLOSURE_RELATIONSHIP_TYPES.get(relationship_type, None)
+  if forward is None or from_spdx_id == to_spdx_id:
+    return None
+  if forward:
+    return (from_spdx_id, to_spdx_id)
+  return (to_spdx_id, from_spdx_id)
+
+# Get the transitive closure of a list of relationships: every pair of
+# elements where the second can be reached from the first, with the length
+# of the shortest path between them. Cycles are allowed; elements aren't
+# paired with themselves.
+# arguments:
+#   1) list of relationship tuples, in the format used by
+#      SPDatabase.addBulkNewRelationships()
+# returns: generator of tuples in format:
+#   (ancestor SPDX ID, descendant SPDX ID, depth)
+def getRelationshipClosure(relationship_tuples):
+  children = {}
+  for rt in relationship_tuples:
+    edge = getClosureEdge(rt)
+    if edge is not None:
+      children.setdefault(edge[0], set()).add(edge[1])
+  # breadth-first search from each element with children
+  for ancestor in sorted(children.keys()):
+    seen = {ancestor}
+    level = [ancestor]
+    depth = 0
+    while level:
+      depth += 1
+      next_level = []
+      for spdx_id in level:
+        for child in children.get(spdx_id, ()):
+          if child not in seen:
+            seen.add(child)
+            next_level.append(child)
+            yield (ancestor, child, depth)
+      level = next_level
+
+# snippets_rtree index, for use in queries
+SNIPPETS_RTREE = table('snippets_rtree', column('id'),
+  column('min_scan_id'), column('max_scan_id'), column('min_file_key'),
+  column('max_file_key'), column('min_byte'), column('max_byte'),
+  column('min_line'), column('max_line'))
 
 class SPDatabase(object):
-  def __init__(self):
+  # arguments:
+  #   1) (optional) thread_safe: if True, the SPDatabase can be used from
+  #      several threads at once; see "THREAD SAFETY FUNCTIONS" below
+  def __init__(self, thread_safe=False):
     super(SPDatabase, self).__init__()
     self.engine = None
     self.session = None
-    self.internal_configs = ["magic", "initialized", "version"]
+    self.threadSafe = thread_safe
+    # held by the thread running a transaction() block
+    self.writeLock = threading.RLock()
+    self.internal_configs = ["magic", "initialized", "version",
+      SHARD_SIZE_CONFIG_KEY]
+    # path to database file, or ":memory:"
+    self.dbFilename = None
+    # files shard index => Table for the shard's files table
+    self.shardTables = {}
+    # in-process cache of config, category, license and conversion data.
+    # entries are tagged with the cache generation they were loaded in, and
+    # any function that changes those tables bumps the generation, so stale
+    # entries are never returned.
+    self.cache = {}
+    self.cacheGeneration = 0
+    # in thread-safe mode, held while reading or changing the cache, since
+    # any thread's commit can invalidate it; see _cacheLock()
+    self.cacheLock = threading.Lock()
+    # SPQueryInstrumentation, if instrumentation has been enabled
+    self.instrumentation = None
+    # SPQueryControl for each thread's runCancellable() call, if any
+    self.queryControls = threading.local()
 
   def closeDatabase(self):
+    if self.instrumentation is not None:
+      self.instrumentation.disable()
     if self.session is not None:
-      self.session.close()
+      if self.threadSafe:
+        self.session.remove()
+      else:
+        self.session.close()
       self.session = None
     self.engine = None
+    self.invalidateCache()
+
+  ########## INSTRUMENTATION FUNCTIONS ##########
+
+  # Start recording statement counts, rows and timings for each SPDatabase
+  # function, along with a log of slow queries and their query plans.
+  # Must be called after the database is opened or created; recording
+  # stops when the database is closed, but the recorded data is kept.
+  # arguments:
+  #   1) (optional) slow_query_seconds: statements taking at least this
+  #      many seconds are added to the slow query log
+  # returns: SPQueryInstrumentation if enabled, None otherwise
+  def enableInstrumentation(self, slow_query_seconds=0.5):
+    if self.instrumentation is not None:
+      self.instrumentation.disable()
+    instrumentation = SPQueryInstrumentation(self, slow_query_seconds)
+    if not instrumentation.enable():
+      return None
+    self.instrumentation = instrumentation
+    return instrumentation
+
+  # Stop recording instrumentation data. The data recorded so far remains
+  # available from self.instrumentation.
+  # arguments: N/A
+  # returns: N/A
+  def disableInstrumentation(self):
+    if self.instrumentation is not None:
+      self.instrumentation.disable()
+
+  ########## QUERY CANCELLATION FUNCTIONS ##########
+
+  # Run an SPDatabase function (or any function using this SPDatabase),
+  # stopping its queries if the SPQueryControl is cancelled or its deadline
+  # passes. If a query is stopped, any changes made since the last commit
+  # are rolled back. A generator returned by the function is read in full
+  # while the control is in effect, and returned as a list.
+  # For example, calling control.cancel() from another thread or a signal
+  # handler stops this comparison:
+  #   control = SPQueryControl(timeout=60)
+  #   changed = db.runCancellable(control, db.getChangedLicensesForScans,
+  #     first_scan_id, second_scan_id)
+  # arguments:
+  #   1) control: SPQueryControl
+  #   2) function to call
+  #   3) any other arguments are passed to the function
+  # returns: function's return value, or None if its queries were stopped
+  def runCancellable(self, control, func, *args, **kwargs):
+    if self.session is None:
+      print("Error: can't run queries before the database is opened")
+      return None
+    previous = getattr(self.queryControls, "control", None)
+    self.queryControls.control = control
+    try:
+      result = func(*args, **kwargs)
+      if inspect.isgenerator(result):
+        result = list(result)
+    except Exception:
+      # the stopped query raises an "interrupted" error, which may surface
+      # as some other error further up
+      if not control.interrupted:
+        raise
+    finally:
+      self.queryControls.control = previous
+    # the function may have caught the error itself, so check the control
+    # rather than relying on an exception
+    if control.interrupted:
+      self.rollbackChanges()
+      print(f"Query {control.getReason()} after {control.getElapsedSeconds():.1f} seconds; changes were rolled back.")
+      return None
+    return result
+
+  # Install the progress handler on a new SQLite connection. It checks the
+  # calling thread's SPQueryControl, while runCancellable() is running.
+  # arguments:
+  #   1) SQLite DB-API connection
+  #   2) SQLAlchemy connection record
+  # returns: N/A
+  def _installProgressHandler(self, dbapi_conn, connection_record):
+    dbapi_conn.set_progress_handler(self._onQueryProgress,
+      QUERY_PROGRESS_STEPS)
+
+  # Progress handler for all connections; see SPQueryControl.onProgress().
+  # arguments: N/A
+  # returns: nonzero to stop the running query, 0 to let it continue
+  def _onQueryProgress(self):
+    control = getattr(self.queryControls, "control", None)
+    if control is None:
+      return 0
+    return control.onProgress()
+
+  ########## CACHE FUNCTIONS ##########
+
+  # Invalidate all cached config, category, license and conversion data,
+  # by bumping the cache generation.
+  # arguments: N/A
+  # returns: N/A
+  def invalidateCache(self):
+    with self._cacheLock():
+      self.cacheGeneration += 1
+      self.cache = {}
+
+  # Get the context manager guarding the cache: the cache lock in
+  # thread-safe mode, or one that does nothing otherwise. It isn't held
+  # while loading values, which may run queries that use the cache too.
+  # arguments: N/A
+  # returns: context manager
+  def _cacheLock(self):
+    return self.cacheLock if self.threadSafe else nullcontext()
+
+  # Get a cached value, loading it from the database if it isn't cached or
+  # was cached in an earlier generation.
+  # arguments:
+  #   1) key for cached value
+  #   2) loader: function with no arguments that loads the value
+  # returns: cached or newly-loaded value
+  def _getCached(self, key, loader):
+    with self._cacheLock():
+      entry = self.cache.get(key, None)
+      generation = self.cacheGeneration
+    if entry is not None and entry[0] == generation:
+      return entry[1]
+    value = loader()
+    with self._cacheLock():
+      self.cache[key] = (generation, value)
+    return value
 
   # create new uninitialized spdxSummarizer database
   # WARNING: will delete the specified DB file if it already exists
@@ -50,6 +486,9 @@ class SPDatabase(object):
   #   1) db_filename: string with path to database file
   # returns: True on success, False on failure
   def createDatabase(self, db_filename):
+    if self.threadSafe and db_filename == ":memory:":
+      print("Error: thread-safe mode can only be used with a database file")
+      return False
     if db_filename != ":memory:":
       # delete file if it already exists
       if os.path.exists(db_filename):
@@ -60,15 +499,24 @@ class SPDatabase(object):
           print(f"{db_filename} exists and can't be deleted: {errstr}")
           return False
     engine_str = "sqlite:///" + db_filename
+    self.invalidateCache()
 
     # connect to (e.g. create) database
     self.engine = create_engine(engine_str)
+    self.dbFilename = db_filename
+    event.listen(self.engine, "connect", self._attachFileShards)
+    event.listen(self.engine, "connect", self._installProgressHandler)
     # FIXME check for errors
-    Session = sessionmaker(bind=self.engine)
-    self.session = Session()
+    self._createSession()
+
+    # let space freed by deleting scans be reclaimed with reclaimSpace(),
+    # without a full VACUUM; this must be set before any tables are created
+    self.session.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
     # create tables
-    Base.metadata.create_all(self.engine)
+    Base.metadata.create_all(self.session.connection())
+    if self.threadSafe:
+      self.session.execute("PRAGMA journal_mode=WAL")
 
     # insert basic beginner config values
     c1 = Config(key="magic", value="spdxSummarizer")
@@ -87,16 +535,22 @@ class SPDatabase(object):
     if os.path.exists(db_filename):
       # connect to (e.g. create) database
       engine_str = "sqlite:///" + db_filename
+      self.invalidateCache()
       self.engine = create_engine(engine_str)
+      self.dbFilename = db_filename
+      event.listen(self.engine, "connect", self._attachFileShards)
+      event.listen(self.engine, "connect", self._installProgressHandler)
       # FIXME check for errors
-      Session = sessionmaker(bind=self.engine)
-      self.session = Session()
+      self._createSession()
 
       # query for config magic value
       try:
         query = self.session.query(Config).filter_by(key="magic").first()
         if query.value == "spdxSummarizer":
           # we're good
+          if self.threadSafe:
+            self.session.commit()
+            self.engine.execute("PRAGMA journal_mode=WAL")
           return True
       except Exception as e:
         print(f'Error checking magic number: {str(e)}')
@@ -107,6 +561,80 @@ class SPDatabase(object):
       print(f"No file found at {db_filename}.")
       return None
 
+  # Create the session for the newly-created engine: a single session, or
+  # in thread-safe mode, a scoped session that gives each thread its own
+  # session and connection.
+  # arguments: N/A
+  # returns: N/A
+  def _createSession(self):
+    Session = sessionmaker(bind=self.engine)
+    if not self.threadSafe:
+      self.session = Session()
+      return
+    self.session = scoped_session(Session)
+    # another thread's session may have loaded data into the cache that
+    # this commit has made stale
+    event.listen(Session, "after_commit",
+      lambda session: self.invalidateCache())
+
+  ########## THREAD SAFETY FUNCTIONS ##########
+
+  # In thread-safe mode, self.session is a scoped session, so each thread
+  # using the SPDatabase has its own session and its own connection to the
+  # database, which is switched to SQLite's WAL journal mode so that reads
+  # don't block, or get blocked by, a write. A thread sees the data as of
+  # the start of its current transaction, until it commits, rolls back or
+  # calls endThreadSession().
+  #
+  # SQLite only allows one write transaction at a time, so changes made in
+  # thread-safe mode should be made inside a transaction() block, which
+  # only one thread at a time can be in. The get* and is* functions only
+  # read; where data derived from a scan's files hasn't been built, they
+  # read the scan's files instead.
+
+  # Context manager for making a set of changes as one transaction. Any
+  # pending changes are committed first. The changes made in the block are
+  # committed at the end of it, or rolled back if it raises an exception;
+  # functions called in the block should be passed commit=False, and their
+  # return values checked, raising an exception to roll back.
+  # For example:
+  #   with db.transaction():
+  #     scan_id = db.addNewScan("2017-10-01", "new scan", False)
+  #     if not db.addBulkNewFiles(scan_id, file_tuples, False):
+  #       raise RuntimeError("import failed")
+  # arguments: N/A
+  # returns: N/A
+  @contextmanager
+  def transaction(self):
+    with self.writeLock:
+      self.session.commit()
+      try:
+        yield
+        self.session.commit()
+      except Exception:
+        self.rollbackChanges()
+        raise
+
+  # Get the calling thread's session, for APIs that need the Session object
+  # itself rather than the scoped session in thread-safe mode (e.g. baked
+  # queries).
+  # arguments: N/A
+  # returns: Session
+  def _getSession(self):
+    if self.threadSafe:
+      return self.session()
+    return self.session
+
+  # End the calling thread's session, releasing its connection; its next
+  # query starts a new session, which sees the latest committed data. In
+  # thread-safe mode, worker threads should call this when they are done
+  # with the database. Does nothing otherwise.
+  # arguments: N/A
+  # returns: N/A
+  def endThreadSession(self):
+    if self.threadSafe and self.session is not None:
+      self.session.remove()
+
   # Commit changes to database.  Typically called when calling something
   # like addNewScan() and addNewFile() repeatedly, but when wanting to
   # finish all before committing.
@@ -121,6 +649,33 @@ class SPDatabase(object):
   # returns: N/A
   def rollbackChanges(self):
     self.session.rollback()
+    # anything added since the last commit may have been cached
+    self.invalidateCache()
+
+  # Copy the database to a file, using SQLite's online backup API. This is
+  # mainly for saving a database built in memory with
+  # createDatabase(":memory:"). Any pending changes are committed first.
+  # WARNING: will delete the specified DB file if it already exists
+  # arguments:
+  #   1) db_filename: string with path to database file to be created
+  # returns: True on success, False on failure
+  def backupDatabase(self, db_filename):
+    if self.session is None:
+      print("Error: can't back up database before it is opened")
+      return False
+    try:
+      self.session.commit()
+      if os.path.exists(db_filename):
+        os.remove(db_filename)
+      dest = sqlite3.connect(db_filename)
+      try:
+        self.session.connection().connection.backup(dest)
+      finally:
+        dest.close()
+      return True
+    except Exception as e:
+      print(f"Couldn't back up database to {db_filename}: {str(e)}")
+      return False
 
   # Initialize config table based on dict already read from JSON file.
   # arguments:
@@ -133,6 +688,7 @@ class SPDatabase(object):
       configs.append(c)
     self.session.bulk_save_objects(configs)
     self.session.commit()
+    self.invalidateCache()
     return True
 
   # Initialize categories and licenses tables based on dict already read 
@@ -162,6 +718,7 @@ class SPDatabase(object):
         self.session.add(lic)
 
     self.session.commit()
+    self.invalidateCache()
     return True
 
   # Initialize conversions tables based on dict already read from JSON file.
@@ -181,6 +738,7 @@ class SPDatabase(object):
         return False
 
     self.session.commit()
+    self.invalidateCache()
     return True
 
 
@@ -228,6 +786,7 @@ class SPDatabase(object):
         self.session.add(c)
 
         self.session.commit()
+        self.invalidateCache()
         return True
 
     # FIXME check for file not found as separate exception?
@@ -244,8 +803,7 @@ class SPDatabase(object):
     if not self.engine or not self.session:
       return False
 
-    query = self.session.query(Config).filter(Config.key == "initialized").first()
-    return (query is not None and query.value == "yes")
+    return self.getConfigForKey("initialized") == "yes"
 
   ########## SCAN DATA FUNCTIONS ##########
 
@@ -253,8 +811,8 @@ class SPDatabase(object):
   # arguments: N/A
   # returns: list of IDs from all scans in database
   def getScansIDList(self):
-    scans = self.session.query(Scan.id).order_by(Scan.id)
-    return [scan.id for scan in scans]
+    query = QUERY_BAKERY(lambda s: s.query(Scan.id).order_by(Scan.id))
+    return [scan_id for (scan_id,) in query(self._getSession())]
 
   ##### FIXME HERE AND BELOW -- for now, keep as tuples.
   ##### FIXME will make sure transition to SQLAlchemy works as expected,
@@ -266,11 +824,11 @@ class SPDatabase(object):
   # returns: list of data tuples from all scans in database
   #   tuple format: (id, scan_dt, desc)
   def getScansData(self):
-    scans = self.session.query(Scan).order_by(Scan.id)
-    scanList = []
-    for scan in scans:
-      scanList.append(scan.asTuple())
-    return scanList
+    query = QUERY_BAKERY(lambda s: s.query(Scan.id, Scan.scan_dt, Scan.desc).\
+      order_by(Scan.id))
+    # FIXME in the future, consider keeping scan_dt as datetime.date
+    return [(id, str(scan_dt), desc) for (id, scan_dt, desc) in
+      query(self._getSession())]
 
   # Get all data for prior scan with given ID.
   # arguments:
@@ -278,9 +836,11 @@ class SPDatabase(object):
   # returns: tuple of data if found or None if not found
   #   tuple format: (id, scan_dt, desc)
   def getScanData(self, scan_id):
-    scan = self.session.query(Scan).filter(Scan.id == scan_id).first()
+    query = QUERY_BAKERY(lambda s: s.query(Scan.id, Scan.scan_dt, Scan.desc).\
+      filter(Scan.id == bindparam('scan_id')))
+    scan = query(self._getSession()).params(scan_id=scan_id).first()
     if scan is not None:
-      return scan.asTuple()
+      return (scan[0], str(scan[1]), scan[2])
     else:
       return None
 
@@ -289,13 +849,18 @@ class SPDatabase(object):
   #   1) scan date
   #   2) description (optional)
   #   3) commit: if True, commit updates at end
+  #   4) doc_digest: (optional) digest of the SPDX document being imported,
+  #      from parsetools.getDocumentDigest()
   # returns: new ID for scan if successfully added to DB, or -1 otherwise
-  def addNewScan(self, scan_dt_str, desc="no description", commit=True):
+  def addNewScan(self, scan_dt_str, desc="no description", commit=True,
+    doc_digest=None):
     try:
+      if not self._checkFileShardsForNewScan():
+        return -1
       # FIXME in future, may require scan_dt as datetime.date object
       scan_dt_datetime = datetime.datetime.strptime(scan_dt_str, "%Y-%m-%d")
       scan_dt = scan_dt_datetime.date()
-      scan = Scan(scan_dt=scan_dt, desc=desc)
+      scan = Scan(scan_dt=scan_dt, desc=desc, doc_digest=doc_digest)
       self.session.add(scan)
       if commit:
         self.session.commit()
@@ -312,19 +877,19 @@ class SPDatabase(object):
   # arguments: N/A
   # returns: list of IDs from all categories in database
   def getCategoriesIDList(self):
-    cats = self.session.query(Category.id).order_by(Category.id)
-    return [cat.id for cat in cats]
+    query = QUERY_BAKERY(lambda s: s.query(Category.id).order_by(Category.id))
+    return [cat_id for (cat_id,) in query(self._getSession())]
 
   # Get all data for all known categories.
   # arguments: N/A
   # returns: list of data tuples from all categories in database
   #   tuple format: (id, name)
   def getCategoriesData(self):
-    cats = self.session.query(Category).order_by(Category.id)
-    catList = []
-    for cat in cats:
-      catList.append(cat.asTuple())
-    return catList
+    def loader():
+      query = QUERY_BAKERY(lambda s: s.query(Category.id, Category.name).\
+        order_by(Category.id))
+      return [tuple(cat) for cat in query(self._getSession())]
+    return list(self._getCached("categories", loader))
 
   # Get all data for known category with given ID.
   # arguments:
@@ -332,9 +897,11 @@ class SPDatabase(object):
   # returns: tuple of data if found or None if not found
   #   tuple format: (id, name)
   def getCategoryData(self, category_id):
-    cat = self.session.query(Category).filter(Category.id == category_id).first()
+    query = QUERY_BAKERY(lambda s: s.query(Category.id, Category.name).\
+      filter(Category.id == bindparam('category_id')))
+    cat = query(self._getSession()).params(category_id=category_id).first()
     if cat is not None:
-      return cat.asTuple()
+      return tuple(cat)
     else:
       return None
 
@@ -351,6 +918,7 @@ class SPDatabase(object):
       else:
         cat = Category(id=id, name=name)
       self.session.add(cat)
+      self.invalidateCache()
       if commit:
         self.session.commit()
       else:
@@ -366,19 +934,19 @@ class SPDatabase(object):
   # arguments: N/A
   # returns: list of IDs from all licenses in database
   def getLicensesIDList(self):
-    lics = self.session.query(License.id).order_by(License.id)
-    return [lic.id for lic in lics]
+    query = QUERY_BAKERY(lambda s: s.query(License.id).order_by(License.id))
+    return [lic_id for (lic_id,) in query(self._getSession())]
 
   # Get all data for all known licenses.
   # arguments: N/A
   # returns: list of data tuples from all licenses in database
   #   tuple format: (id, short_name, category_id)
   def getLicensesData(self):
-    lics = self.session.query(License).order_by(License.id)
-    licList = []
-    for lic in lics:
-      licList.append(lic.asTuple())
-    return licList
+    def loader():
+      query = QUERY_BAKERY(lambda s: s.query(License.id, License.short_name,
+        License.category_id).order_by(License.id))
+      return [tuple(lic) for lic in query(self._getSession())]
+    return list(self._getCached("licenses", loader))
 
   # Get all data for known license with given ID.
   # arguments:
@@ -386,9 +954,11 @@ class SPDatabase(object):
   # returns: tuple of data if found or None if not found
   #   tuple format: (id, short_name, category_id)
   def getLicenseData(self, license_id):
-    lic = self.session.query(License).filter(License.id == license_id).first()
+    query = QUERY_BAKERY(lambda s: s.query(License.id, License.short_name,
+      License.category_id).filter(License.id == bindparam('license_id')))
+    lic = query(self._getSession()).params(license_id=license_id).first()
     if lic is not None:
-      return lic.asTuple()
+      return tuple(lic)
     else:
       return None
 
@@ -406,6 +976,7 @@ class SPDatabase(object):
       else:
         lic = License(id=id, short_name=short_name, category_id=category_id)
       self.session.add(lic)
+      self.invalidateCache()
       if commit:
         self.session.commit()
       else:
@@ -421,19 +992,21 @@ class SPDatabase(object):
   # arguments: N/A
   # returns: list of IDs from all conversions in database
   def getConversionsIDList(self):
-    convs = self.session.query(Conversion.id).order_by(Conversion.id)
-    return [conv.id for conv in convs]
+    query = QUERY_BAKERY(lambda s: s.query(Conversion.id).\
+      order_by(Conversion.id))
+    return [conv_id for (conv_id,) in query(self._getSession())]
 
   # Get all data for all known conversions.
   # arguments: N/A
   # returns: list of data tuples from all conversions in database
   #   tuple format: (id, old_text, new_license_id)
   def getConversionsData(self):
-    convs = self.session.query(Conversion).order_by(Conversion.id)
-    convList = []
-    for conv in convs:
-      convList.append(conv.asTuple())
-    return convList
+    def loader():
+      query = QUERY_BAKERY(lambda s: s.query(Conversion.id,
+        Conversion.old_text, Conversion.new_license_id).\
+        order_by(Conversion.id))
+      return [tuple(conv) for conv in query(self._getSession())]
+    return list(self._getCached("conversions", loader))
 
   # Get all data for known conversions with given ID.
   # arguments:
@@ -441,9 +1014,12 @@ class SPDatabase(object):
   # returns: tuple of data if found or None if not found
   #   tuple format: (id, old_text, new_license_id)
   def getConversionData(self, conversion_id):
-    conv = self.session.query(Conversion).filter(Conversion.id == conversion_id).first()
+    query = QUERY_BAKERY(lambda s: s.query(Conversion.id,
+      Conversion.old_text, Conversion.new_license_id).\
+      filter(Conversion.id == bindparam('conversion_id')))
+    conv = query(self._getSession()).params(conversion_id=conversion_id).first()
     if conv is not None:
-      return conv.asTuple()
+      return tuple(conv)
     else:
       return None
 
@@ -461,6 +1037,7 @@ class SPDatabase(object):
       else:
         conv = Conversion(id=id, old_text=old_text, new_license_id=new_license_id)
       self.session.add(conv)
+      self.invalidateCache()
       if commit:
         self.session.commit()
       else:
@@ -478,9 +1055,12 @@ class SPDatabase(object):
   # returns: tuple of data if found or None if not found
   #   tuple format: (id, scan_id, filename, license_id, sha1, md5, sha256)
   def getFileData(self, file_id):
-    file = self.session.query(File).filter(File.id == file_id).first()
+    query = QUERY_BAKERY(lambda s: s.query(File.id, File.scan_id,
+      File.filename, File.license_id, File.sha1, File.md5, File.sha256).\
+      filter(File.id == bindparam('file_id')))
+    file = query(self._getSession()).params(file_id=file_id).first()
     if file is not None:
-      return file.asTuple()
+      return tuple(file)
     else:
       return None
 
@@ -491,17 +1071,32 @@ class SPDatabase(object):
   # returns: tuple of data if found or None if not found
   #   tuple format: (id, scan_id, filename, license_id, sha1, md5, sha256)
   def getFileInstanceData(self, scan_id, filename):
-    file = self.session.query(File).filter(
-      and_(
-        File.filename == filename,
-        File.scan_id == scan_id
-      )
-    ).first()
+    f = self._getScanFilesEntity(scan_id)
+    file = self.session.query(
+      f.id, f.scan_id, f.filename, f.license_id, f.sha1, f.md5, f.sha256
+    ).filter(f.filename == filename).first()
     if file is not None:
-      return file.asTuple()
+      return tuple(file)
     else:
       return None
 
+  # Get the File objects for a scan's files, with each file's license and
+  # the license's category loaded in the same query, so that they can be
+  # used without a further query per file. For a delta scan, each object is
+  # the stored row the file was taken from, so its scan_id may be that of
+  # an earlier scan in the chain. Objects are loaded STREAM_BATCH_SIZE at a
+  # time as the results are iterated.
+  # arguments:
+  #   1) ID of scan
+  # returns: query yielding File objects, sorted by filename
+  def getFileObjectsForScan(self, scan_id):
+    effective = self._selectScanFiles(scan_id).alias('effective_files')
+    return self.session.query(File).\
+      options(joinedload(File.license).joinedload(License.category)).\
+      filter(File.id.in_(select([effective.c.id]))).\
+      order_by(File.filename).\
+      yield_per(STREAM_BATCH_SIZE)
+
   # Add new file to database.
   # arguments:
   #   1) ID of scan
@@ -517,19 +1112,37 @@ class SPDatabase(object):
   def addNewFile(self, scan_id, filename, license_id, sha1,
     md5="", sha256="", commit=True):
     try:
-      file = File(scan_id=scan_id, filename=filename, license_id=license_id,
-        sha1=sha1, md5=md5, sha256=sha256)
-      self.session.add(file)
+      self._unaliasScan(scan_id)
+      (extension, is_git, is_vendor, depth) = getPathAttributes(filename)
+      files = self._getFilesTable([scan_id])
+      result = self.session.connection().execute(files.insert().values(
+        scan_id=scan_id, filename=filename, license_id=license_id,
+        sha1=sha1, md5=md5, sha256=sha256, extension=extension,
+        is_git=is_git, is_vendor=is_vendor, depth=depth))
+      file_id = result.inserted_primary_key[0]
+      self._indexNewFiles(file_id - 1)
+      # rather than rebuilding them for every file, drop the scan's
+      # directory counts and hashes and path filter; queries use the scan's
+      # files instead until they are rebuilt
+      self._clearDirectoryCounts(scan_id)
+      self._clearDirectoryHashes(scan_id)
+      self._clearScanBloom(scan_id)
+      self._updatePathHistory(scan_id, filename)
       if commit:
         self.session.commit()
-      else:
-        self.session.flush()
-      return file.id
+      return file_id
     except Exception as e:
       print(f'Error adding new file {filename}: {str(e)}')
       return -1
 
   # Add bulk list of new files to database.
+  # If the "delta_keyframe_interval" config value is set to a number greater
+  # than zero, the scan may be stored as a delta against the prior scan:
+  # only files that were added or changed are stored, along with markers for
+  # files that were removed. Every delta_keyframe_interval scans, a full
+  # "keyframe" scan is stored instead, so that a scan never needs to be
+  # reconstructed from more than that many scans. The read functions below
+  # reconstruct delta scans transparently.
   # arguments:
   #   1) scan ID
   #   2) list of tuples in format:
@@ -541,18 +1154,30 @@ class SPDatabase(object):
   #      be added prior to adding a file that references them
   def addBulkNewFiles(self, scan_id, file_tuples, commit=True):
     try:
-      files = []
-      for ft in file_tuples:
-        file = File(
-          scan_id=scan_id,
-          filename=ft[0],
-          license_id=ft[1],
-          sha1=ft[2],
-          md5=ft[3],
-          sha256=ft[4],
-        )
-        files.append(file)
-      self.session.bulk_save_objects(files)
+      self._unaliasScan(scan_id)
+      last_file_id = self._getLastFileID()
+      parent_scan_id = self._getDeltaParentForScan(scan_id)
+      if parent_scan_id is not None:
+        self._addBulkNewFilesAsDelta(scan_id, parent_scan_id, file_tuples)
+      elif file_tuples:
+        rows = []
+        for ft in file_tuples:
+          (extension, is_git, is_vendor, depth) = getPathAttributes(ft[0])
+          rows.append({
+            'scan_id': scan_id,
+            'filename': ft[0],
+            'license_id': ft[1],
+            'sha1': ft[2],
+            'md5': ft[3],
+            'sha256': ft[4],
+            'extension': extension,
+            'is_git': is_git,
+            'is_vendor': is_vendor,
+            'depth': depth,
+          })
+        files = self._getFilesTable([scan_id])
+        self.session.connection().execute(files.insert(), rows)
+      self._buildScanDerivedData(scan_id, last_file_id)
       if commit:
         self.session.commit()
       else:
@@ -562,104 +1187,2883 @@ class SPDatabase(object):
       print(f'Error adding bulk new files for scan {scan_id}: {str(e)}')
       return False
 
-  ########## COMBO DATA FUNCTIONS ##########
+  # Get the highest ID currently in use in the files table.
+  # arguments: N/A
+  # returns: highest file ID, or 0 if there are no files
+  def _getLastFileID(self):
+    self.session.flush()
+    last_file_id = self.session.query(func.max(File.id)).scalar()
+    return last_file_id if last_file_id is not None else 0
 
-  # Get file and license info, by category, for all files for a given scan.
+  # Index a scan's newly-inserted files, and build the data derived from
+  # them, after they have been added in bulk.
   # arguments:
   #   1) ID of scan
-  #   2) (optional) if True, exclude files in any /.git/ subdirectory
-  # returns: dict of category =>
-  #    (category_name, {filename => license}, {license => count})
-  #   or None if error
-  def getCategoryFilesForScan(self, scan_id, exclude_git=False):
-    query = self.session.query(
-      Category.id, Category.name, File.filename, License.short_name
-    ).join(License).join(File)
-    query = query.filter(File.scan_id == scan_id)
-    if exclude_git:
-      query = query.filter(~(File.filename.contains('/.git/')))
-    query = query.order_by(Category.id, License.short_name, File.filename)
+  #   2) ID of last file inserted before the new files
+  # returns: N/A; raises exception on error
+  def _buildScanDerivedData(self, scan_id, last_file_id):
+    self._indexNewFiles(last_file_id)
+    self._buildDirectoryCounts(scan_id)
+    self._buildDirectoryHashes(scan_id)
+    self._buildScanBloom(scan_id)
+    self._updatePathHistory(scan_id)
 
-    cats = {}
-    for q in query:
-      # scan through, creating categories and data structure as needed
-      cat_id = q[0]
-      cat_name = q[1]
-      filename = q[2]
-      license = q[3]
+  # Add newly-inserted files to the files_fts path index, if the database
+  # has one. Indexing in one statement after the files are inserted is much
+  # faster than indexing each row from a trigger.
+  # arguments:
+  #   1) ID of last file inserted before the new files
+  # returns: N/A; raises exception on error
+  def _indexNewFiles(self, last_file_id):
+    if not self._hasFilesFTS():
+      return
+    self.session.execute("INSERT INTO files_fts(rowid, filename) " +
+      "SELECT id, filename FROM files WHERE id > :last_file_id",
+      {"last_file_id": last_file_id})
 
-      cat = cats.get(cat_id, None)
-      if cat is None:
-        # create tuple of category name, filename => license dict, and
-        # license => count stats dict
-        cats[cat_id] = (cat_name, {}, {})
-        cat = cats.get(cat_id)
+  ########## DELTA SCAN FUNCTIONS ##########
 
-      # add filename and license to this category's list
-      cat[1][filename] = license
+  # Get the chain of scans whose stored file rows make up a given scan: the
+  # scan itself, then the scan it is stored as a delta against (if any), and
+  # so on back to a full keyframe scan.
+  # arguments:
+  #   1) ID of scan
+  # returns: list of scan IDs, starting with the given scan
+  def _getScanChain(self, scan_id):
+    chain = []
+    current_id = scan_id
+    while current_id is not None and current_id not in chain:
+      chain.append(current_id)
+      current_id = self.session.query(Scan.parent_scan_id).\
+        filter(Scan.id == current_id).scalar()
+    return chain
 
-      # insert or increment license count
-      ccount = cat[2].get(license, 0)
-      cat[2][license] = ccount + 1
+  # Get a select statement for the effective file rows of a scan. For a full
+  # scan, these are just the scan's own rows. For a delta scan, each filename
+  # is taken from the nearest scan in its chain that has a row for it, and
+  # filenames whose nearest row is a removal marker are left out.
+  # arguments:
+  #   1) ID of scan
+  # returns: select statement with the same columns as the files table, with
+  #   scan_id set to the requested scan
+  def _selectScanFiles(self, scan_id):
+    chain = self._getScanChain(scan_id)
+    return selectScanChainFiles(self._getFilesTable(chain), scan_id, chain)
 
-    return cats
+  # Get an aliased File entity over the effective file rows of a scan, for
+  # use in ORM queries in place of File.
+  # arguments:
+  #   1) ID of scan
+  # returns: aliased File entity
+  def _getScanFilesEntity(self, scan_id):
+    return aliased(File, self._selectScanFiles(scan_id).alias(),
+      adapt_on_names=True)
 
-  # Get filename and corresponding license for all files for a given scan.
+  # Determine whether a scan's files should be stored as a delta, and if so,
+  # against which scan.
   # arguments:
   #   1) ID of scan
-  #   2) (optional) if True, exclude files in any /.git/ subdirectory
-  # returns: dict of filename => license, or None if error
-  def getLicenseAndFilesForScan(self, scan_id, exclude_git=False):
-    query = self.session.query(File.filename, License.short_name).\
-      join(License).\
-      filter(File.scan_id == scan_id)
-    if exclude_git:
-      query = query.filter(~(File.filename.contains('/.git/')))
-    query = query.order_by(File.filename)
+  # returns: ID of parent scan to store a delta against, or None if the
+  #   scan's files should be stored in full
+  def _getDeltaParentForScan(self, scan_id):
+    interval_str = self.getConfigForKey("delta_keyframe_interval")
+    try:
+      interval = int(interval_str)
+    except (TypeError, ValueError):
+      return None
+    if interval <= 0:
+      return None
 
-    files = {}
-    for q in query:
-      filename = q[0]
-      license = q[1]
-      files[filename] = license
-    return files
+    # if this scan already has a parent, keep adding to it as a delta
+    scan = self.session.query(Scan).filter(Scan.id == scan_id).first()
+    if scan is None:
+      return None
+    if scan.parent_scan_id is not None:
+      return scan.parent_scan_id
+    # but if it already has files stored in full, don't change that
+    has_files = self.session.query(File.id).\
+      filter(File.scan_id == scan_id).first()
+    if has_files is not None:
+      return None
 
-  ########## CONFIG DATA FUNCTIONS ##########
+    # otherwise, use the most recent prior scan, unless its chain is
+    # already long enough that this one should be a keyframe
+    parent_scan_id = self.session.query(func.max(Scan.id)).\
+      filter(Scan.id < scan_id).scalar()
+    if parent_scan_id is None:
+      return None
+    if len(self._getScanChain(parent_scan_id)) >= interval:
+      return None
+    scan.parent_scan_id = parent_scan_id
+    self.session.flush()
+    return parent_scan_id
 
-  # Get all key/value pairs from the config table, including those specific
-  # to spdxSummarizer (e.g. "magic", "version", etc.)
-  # arguments: N/A
-  # returns: a dict with all of the key/value pairs
-  def getConfigData(self):
-    configs = self.session.query(Config)
-    configDict = {}
-    for config in configs:
-      configDict[config.key] = config.value
-    return configDict
+  # Store a scan's files as a delta against its parent scan. The new file
+  # list is loaded into a temporary table, and the added, changed and
+  # removed rows are then computed with joins against the parent scan's
+  # effective rows, so that neither scan needs to be held in memory.
+  # arguments:
+  #   1) ID of scan
+  #   2) ID of parent scan
+  #   3) list of file tuples, as for addBulkNewFiles()
+  # returns: N/A; raises exception on error
+  def _addBulkNewFilesAsDelta(self, scan_id, parent_scan_id, file_tuples):
+    files = self._getFilesTable([scan_id])
+    pending = Table('pending_files', MetaData(),
+      Column('filename', String(), primary_key=True),
+      Column('license_id', Integer()),
+      Column('sha1', String()),
+      Column('md5', String()),
+      Column('sha256', String()),
+      Column('extension', String()),
+      Column('is_git', Boolean()),
+      Column('is_vendor', Boolean()),
+      Column('depth', Integer()),
+      prefixes=['TEMPORARY'],
+    )
+    conn = self.session.connection()
+    pending.drop(conn, checkfirst=True)
+    pending.create(conn)
+    try:
+      if file_tuples:
+        rows = []
+        for ft in file_tuples:
+          (extension, is_git, is_vendor, depth) = getPathAttributes(ft[0])
+          rows.append({'filename': ft[0], 'license_id': ft[1],
+            'sha1': ft[2], 'md5': ft[3], 'sha256': ft[4],
+            'extension': extension, 'is_git': is_git,
+            'is_vendor': is_vendor, 'depth': depth})
+        conn.execute(pending.insert(), rows)
 
-  # Get all key/value pairs from the config table, _excluding_ those specific
-  # to spdxSummarizer (e.g. "magic", "version", etc.)
-  # arguments: N/A
-  # returns: a dict with all of the key/value pairs
-  def getConfigurableConfigData(self):
-    configDict = self.getConfigData()
-    for k in self.internal_configs:
-      try:
-        del configDict[k]
-      except KeyError:
-        pass
-    return configDict
+      # any earlier removal markers in this scan are replaced by new rows
+      conn.execute(files.delete().where(and_(
+        files.c.scan_id == scan_id,
+        files.c.removed == True,
+        files.c.filename.in_(select([pending.c.filename]))
+      )))
 
-  # Get a value for a specific config key.
+      # added and changed files
+      parent = self._selectScanFiles(parent_scan_id).alias('parent_files')
+      changed = or_(
+        parent.c.id == None,
+        parent.c.license_id != pending.c.license_id,
+        func.coalesce(parent.c.sha1, '') != func.coalesce(pending.c.sha1, ''),
+        func.coalesce(parent.c.md5, '') != func.coalesce(pending.c.md5, ''),
+        func.coalesce(parent.c.sha256, '') != func.coalesce(pending.c.sha256, ''),
+      )
+      added = select(
+        [literal(scan_id, Integer())] +
+        [pending.c[name] for name in FILE_DATA_COLUMNS] +
+        [literal(False)]
+      ).select_from(
+        pending.outerjoin(parent, parent.c.filename == pending.c.filename)
+      ).where(changed)
+      conn.execute(files.insert().from_select(
+        ['scan_id'] + FILE_DATA_COLUMNS + ['removed'], added))
+
+      # removed files: in the parent, but not in the new file list
+      parent = self._selectScanFiles(parent_scan_id).alias('parent_files')
+      removed = select(
+        [literal(scan_id, Integer())] +
+        [parent.c[name] for name in FILE_DATA_COLUMNS] +
+        [literal(True)]
+      ).where(~exists().where(pending.c.filename == parent.c.filename))
+      conn.execute(files.insert().from_select(
+        ['scan_id'] + FILE_DATA_COLUMNS + ['removed'], removed))
+    finally:
+      pending.drop(conn)
+
+  ########## SCAN ALIAS FUNCTIONS ##########
+
+  # When the same content is imported again, the new scan is recorded as an
+  # alias of the existing scan rather than storing its files again. An alias
+  # is stored like a delta scan with no changes: its parent_scan_id is the
+  # existing scan, so the functions reading its files see the existing
+  # scan's files. Its alias_of_scan_id is also set, so it can be told apart
+  # from a delta scan. If the existing scan is deleted, or files are added to
+  # the alias, the alias's files are first stored in full.
+
+  # Find the scan imported from an SPDX document.
   # arguments:
-  #   1) key string
-  # returns: value for key if found, or None otherwise
-  def getConfigForKey(self, key):
-    config = self.session.query(Config).filter(Config.key == key).first()
+  #   1) digest of document, from parsetools.getDocumentDigest()
+  # returns: ID of scan, or None if not found or error; if the scan found is
+  #   an alias, returns the ID of the scan it is an alias of
+  def getScanForDocumentDigest(self, doc_digest):
+    try:
+      found = self.session.query(Scan.id, Scan.alias_of_scan_id).\
+        filter(Scan.doc_digest == doc_digest).order_by(Scan.id).first()
+      if found is None:
+        return None
+      return found[1] if found[1] is not None else found[0]
+    except Exception as e:
+      print(f'Error finding scan for document digest {doc_digest}: {str(e)}')
+      return None
+
+  # Find a scan with the given content digest, i.e. the same files, with
+  # the same licenses and SHA1s.
+  # arguments:
+  #   1) content digest, from getContentDigest()
+  # returns: ID of scan, or None if not found or error; if the scan found is
+  #   an alias, returns the ID of the scan it is an alias of
+  def getScanForContentDigest(self, content_digest):
+    try:
+      found = self.session.query(Scan.id, Scan.alias_of_scan_id).\
+        filter(Scan.content_digest == content_digest).order_by(Scan.id).\
+        first()
+      # scans without a content digest yet are checked by computing their
+      # fingerprints, in case one of them is an earlier match
+      query = self.session.query(Scan.id, Scan.alias_of_scan_id).\
+        filter(Scan.content_digest == None).order_by(Scan.id)
+      if found is not None:
+        query = query.filter(Scan.id < found[0])
+      for missing in query.all():
+        if self._getMissingContentDigest(missing[0]) == content_digest:
+          found = missing
+          break
+      if found is None:
+        return None
+      return found[1] if found[1] is not None else found[0]
+    except Exception as e:
+      print(f'Error finding scan for content digest {content_digest}: {str(e)}')
+      return None
+
+  # Find a scan with the same content as a list of files, snippets and
+  # relationships about to be imported: the same files, with the same
+  # licenses and SHA1s, and the same snippets, elements and relationships.
+  # arguments:
+  #   1) list of file tuples, in the format used by addBulkNewFiles()
+  #   2) (optional) list of snippet tuples, in the format used by
+  #      addBulkNewSnippets()
+  #   3) (optional) list of element tuples, in the format used by
+  #      addBulkNewRelationships()
+  #   4) (optional) list of relationship tuples, in the format used by
+  #      addBulkNewRelationships()
+  # returns: ID of scan, or None if not found or error
+  def getScanWithSameContent(self, file_tuples, snippet_tuples=[],
+    element_tuples=[], relationship_tuples=[]):
+    scan_id = self.getScanForContentDigest(getContentDigest(file_tuples))
+    if scan_id is None:
+      return None
+    if self.getSnippetsForScan(scan_id) != \
+      sorted(snippet_tuples, key=nullsFirstSortKey):
+      return None
+    if self.getElementsForScan(scan_id) != \
+      sorted(element_tuples, key=nullsFirstSortKey):
+      return None
+    if self.getRelationshipsForScan(scan_id) != sorted(relationship_tuples):
+      return None
+    return scan_id
+
+  # Get the scan that a scan is an alias of.
+  # arguments:
+  #   1) ID of scan
+  # returns: ID of scan it is an alias of, or None if it isn't an alias
+  def getScanAliasOf(self, scan_id):
+    return self.session.query(Scan.alias_of_scan_id).\
+      filter(Scan.id == scan_id).scalar()
+
+  # Add a new scan as an alias of an existing scan, with the same files.
+  # arguments:
+  #   1) ID of existing scan; if it is an alias itself, the new scan is
+  #      an alias of the scan it is an alias of
+  #   2) scan date
+  #   3) description (optional)
+  #   4) doc_digest: (optional) digest of the SPDX document being imported
+  #   5) commit: if True, commit updates at end
+  # returns: new ID for scan if successfully added to DB, or -1 otherwise
+  def addScanAlias(self, alias_of_scan_id, scan_dt_str, desc="no description",
+    doc_digest=None, commit=True):
+    original_id = self.getScanAliasOf(alias_of_scan_id) or alias_of_scan_id
+    if self.getScanData(original_id) is None:
+      print(f"Error: no scan with ID {alias_of_scan_id}")
+      return -1
+    scan_id = self.addNewScan(scan_dt_str, desc, False, doc_digest)
+    if scan_id == -1:
+      return -1
     try:
-      return config.value
-    except AttributeError:
+      scan = self.session.query(Scan).filter(Scan.id == scan_id).first()
+      scan.parent_scan_id = original_id
+      scan.alias_of_scan_id = original_id
+      self._buildScanDerivedData(scan_id, self._getLastFileID())
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return scan_id
+    except Exception as e:
+      print(f'Error adding scan {desc} as alias of scan {original_id}: {str(e)}')
+      return -1
+
+  # If a scan is an alias, store its files in full so that files can be
+  # added to it.
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _unaliasScan(self, scan_id):
+    if self.getScanAliasOf(scan_id) is not None:
+      self._materializeScan(scan_id)
+      self.session.expire_all()
+
+  # Get the content digest for a scan that doesn't have one stored yet,
+  # i.e. a scan imported before they existed, or after files have been added
+  # one at a time with addNewFile().
+  # arguments:
+  #   1) ID of scan
+  # returns: content digest, or None if the scan has no files; raises
+  #   exception on error
+  def _getMissingContentDigest(self, scan_id):
+    # directory hashes may already exist, for scans imported with 0.2.9
+    content_digest = self._getRootDirectoryHash(scan_id)
+    if content_digest == EMPTY_SCAN_FINGERPRINT:
       return None
+    return content_digest
+
+  # Fill in the content digests for scans that don't have one yet, so that
+  # getScanForContentDigest() doesn't need to compute them.
+  # arguments:
+  #   1) commit: if True, commit updates at end
+  # returns: True if successful, False otherwise
+  def fillContentDigests(self, commit=True):
+    try:
+      missing = self.session.query(Scan.id).\
+        filter(Scan.content_digest == None).all()
+      for (scan_id,) in missing:
+        content_digest = self._getMissingContentDigest(scan_id)
+        if content_digest is not None:
+          self.session.connection().execute(Scan.__table__.update().\
+            where(Scan.__table__.c.id == scan_id).\
+            values(content_digest=content_digest))
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error filling in content digests: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  ########## SCAN DELETION FUNCTIONS ##########
+
+  # Store a delta scan's files in full, so that it no longer depends on the
+  # scans in its chain. Its effective file rows are unchanged.
+  # arguments:
+  #   1) ID of delta scan
+  # returns: N/A; raises exception on error
+  def _materializeScan(self, scan_id):
+    files = self._getFilesTable([scan_id])
+    conn = self.session.connection()
+    old_max_id = conn.execute(select([func.max(files.c.id)]).\
+      where(files.c.scan_id == scan_id)).scalar()
+    last_file_id = self._getLastFileID()
+    effective = self._selectScanFiles(scan_id).alias('effective_files')
+    full = select(
+      [literal(scan_id, Integer())] +
+      [effective.c[name] for name in FILE_DATA_COLUMNS] +
+      [literal(False)]
+    )
+    conn.execute(files.insert().from_select(
+      ['scan_id'] + FILE_DATA_COLUMNS + ['removed'], full))
+    self._indexNewFiles(last_file_id)
+    if old_max_id is not None:
+      self._deleteInChunks(files, and_(files.c.scan_id == scan_id,
+        files.c.id <= old_max_id))
+    # an alias uses the snippets, relationships and other document data of
+    # the scan it is an alias of
+    alias_of_scan_id = self.getScanAliasOf(scan_id)
+    if alias_of_scan_id is not None:
+      for name in SCAN_DOCUMENT_TABLES:
+        t = Base.metadata.tables[name]
+        columns = [c.name for c in t.c if c.name not in ('id', 'scan_id')]
+        conn.execute(t.insert().from_select(['scan_id'] + columns,
+          select([literal(scan_id, Integer())] + [t.c[c] for c in columns]).\
+          where(t.c.scan_id == alias_of_scan_id)))
+    conn.execute(Scan.__table__.update().\
+      where(Scan.__table__.c.id == scan_id).values(parent_scan_id=None,
+      alias_of_scan_id=None))
+
+  # Delete matching rows from a table, DELETE_CHUNK_SIZE rows at a time, so
+  # that no single statement has to touch every row of a large scan.
+  # arguments:
+  #   1) table to delete from
+  #   2) where clause for rows to delete
+  # returns: number of rows deleted; raises exception on error
+  def _deleteInChunks(self, table, whereclause):
+    conn = self.session.connection()
+    rowid = literal_column('rowid')
+    total = 0
+    while True:
+      chunk = select([rowid]).select_from(table).where(whereclause).\
+        limit(DELETE_CHUNK_SIZE)
+      result = conn.execute(table.delete().where(rowid.in_(chunk)))
+      if result.rowcount <= 0:
+        return total
+      total += result.rowcount
+
+  # Delete a scan, along with its files and any data derived from them.
+  # Any delta scans stored against this scan are first stored in full.
+  # arguments:
+  #   1) ID of scan
+  #   2) commit: if True, commit updates at end
+  # returns: True if deleted, False otherwise
+  def deleteScan(self, scan_id, commit=True):
+    scan = self.session.query(Scan).filter(Scan.id == scan_id).first()
+    if scan is None:
+      print(f"Error: no scan with ID {scan_id}")
+      return False
+    try:
+      children = self.session.query(Scan.id).\
+        filter(Scan.parent_scan_id == scan_id).order_by(Scan.id)
+      for (child_id,) in children.all():
+        self._materializeScan(child_id)
+
+      prev_scan_id = self._getAdjacentScanWithFiles(scan_id, -1)
+      next_scan_id = self._getAdjacentScanWithFiles(scan_id, 1)
+      files = self._getFilesTable([scan_id])
+      self._deleteInChunks(files, files.c.scan_id == scan_id)
+      for name in SCAN_DOCUMENT_TABLES + SCAN_DERIVED_TABLES:
+        table = Base.metadata.tables[name]
+        self._deleteInChunks(table, table.c.scan_id == scan_id)
+      # the next scan's history now follows on from the previous scan
+      if next_scan_id is not None and self._hasPathHistory():
+        self._buildPathHistory(next_scan_id, prev_scan_id)
+      self._clearAdjacentScans()
+      self.session.expire_all()
+      self.session.delete(scan)
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error deleting scan {scan_id}: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  # Determine which scans a retention policy would delete. The most recent
+  # keep_last scans are kept, and if keep_per_quarter is True, so is the
+  # most recent scan from each calendar quarter.
+  # arguments:
+  #   1) keep_last: number of most recent scans to keep
+  #   2) (optional) keep_per_quarter: if True, also keep one scan per quarter
+  # returns: list of IDs of scans to delete
+  def getScansToPrune(self, keep_last, keep_per_quarter=True):
+    scans = self.session.query(Scan.id, Scan.scan_dt).\
+      order_by(Scan.scan_dt.desc(), Scan.id.desc()).all()
+    keep = set(scan_id for (scan_id, scan_dt) in scans[:max(keep_last, 0)])
+    if keep_per_quarter:
+      quarters = set()
+      for (scan_id, scan_dt) in scans:
+        quarter = (scan_dt.year, (scan_dt.month - 1) // 3)
+        if quarter not in quarters:
+          quarters.add(quarter)
+          keep.add(scan_id)
+    return sorted(scan_id for (scan_id, scan_dt) in scans
+      if scan_id not in keep)
+
+  # Apply a retention policy, deleting all scans that it doesn't keep. See
+  # getScansToPrune() for the policy. Space used by the deleted scans can
+  # then be returned to the filesystem with reclaimSpace().
+  # arguments:
+  #   1) keep_last: number of most recent scans to keep
+  #   2) (optional) keep_per_quarter: if True, also keep one scan per quarter
+  #   3) (optional) commit: if True, commit updates at end
+  # returns: list of IDs of deleted scans, or None if error
+  def pruneScans(self, keep_last, keep_per_quarter=True, commit=True):
+    scan_ids = self.getScansToPrune(keep_last, keep_per_quarter)
+    # delete newest first, so that delta scans are deleted before the scans
+    # they depend on, rather than being stored in full
+    for scan_id in reversed(scan_ids):
+      if not self.deleteScan(scan_id, False):
+        print(f"Error: couldn't delete scan {scan_id}; rolling back.")
+        self.rollbackChanges()
+        return None
+    if commit:
+      self.session.commit()
+    return scan_ids
+
+  # Return unused pages in the database file, and any attached files
+  # shards, to the filesystem. New databases use SQLite's incremental
+  # auto-vacuum mode, so this is quick. Older databases are switched to that
+  # mode the first time this is called, which requires a full VACUUM.
+  # Any pending changes are committed first.
+  # arguments:
+  #   1) (optional) max_pages: maximum number of pages to free from each
+  #      database file, or None to free all unused pages
+  # returns: number of pages freed, or -1 if error
+  def reclaimSpace(self, max_pages=None):
+    try:
+      self.session.commit()
+      conn = self.session.connection()
+      schemas = ["main"] + self._getAttachedFileShards(conn)
+      def countPages():
+        return sum(conn.execute(f"PRAGMA {schema}.page_count").scalar()
+          for schema in schemas)
+      pages_before = countPages()
+      for schema in schemas:
+        if conn.execute(f"PRAGMA {schema}.auto_vacuum").scalar() != 2:
+          conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+          conn.execute(f"VACUUM {schema}")
+        else:
+          # incremental_vacuum frees one page each time it is stepped, and
+          # execute() only steps it once, so run it as a script instead
+          pragma = f"PRAGMA {schema}.incremental_vacuum"
+          if max_pages is not None:
+            pragma += f"({int(max_pages)})"
+          conn.connection.executescript(pragma)
+      pages_after = countPages()
+      self.session.commit()
+      return pages_before - pages_after
+    except Exception as e:
+      print(f'Error reclaiming space: {str(e)}')
+      self.rollbackChanges()
+      return -1
+
+  ########## FILES SHARD FUNCTIONS ##########
+
+  # In the optional sharded layout, each scan's files are stored in a
+  # separate "files shard" database file next to the main database, which
+  # holds the files for a fixed range of scan IDs; everything else stays in
+  # the main database. The shards are attached to each new connection,
+  # along with a temporary "files" view over all of them, which takes the
+  # place of the main database's files table in queries. Functions that
+  # read or write one scan's files use that scan's shard directly.
+  #
+  # SQLite limits how many databases can be attached to a connection
+  # (usually 10), and one is kept free for scan bundles, so the number of
+  # scans per shard needs to be chosen so that all shards can be attached.
+  # addNewScan() refuses to add a scan that would need more shards than
+  # that, rather than leaving some shards' files out of queries.
+  #
+  # The files_fts full-text index is only kept for the main database's files
+  # table, so searchFiles() matches paths in the shards without it.
+
+  # Get the number of scans stored in each files shard.
+  # arguments: N/A
+  # returns: number of scans, or None if the database isn't sharded
+  def _getFileShardSize(self):
+    shard_size = self.getConfigForKey(SHARD_SIZE_CONFIG_KEY)
+    if shard_size is None:
+      return None
+    return int(shard_size)
+
+  # Get the index of the files shard holding a scan's files.
+  # arguments:
+  #   1) ID of scan
+  #   2) number of scans in each shard
+  # returns: shard index
+  def _getFileShardIndex(self, scan_id, shard_size):
+    return getFileShardIndex(scan_id, shard_size)
+
+  # Get the path to a files shard's database file.
+  # arguments:
+  #   1) shard index
+  # returns: path to shard file
+  def _getFileShardFilename(self, shard_index):
+    return getFileShardFilename(self.dbFilename, shard_index)
+
+  # Get the files table in a files shard. It has the same columns and
+  # indexes as the main database's files table, without the foreign keys,
+  # and file IDs are assigned with AUTOINCREMENT so that they can start
+  # from the shard's own range.
+  # arguments:
+  #   1) shard index
+  # returns: Table
+  def _getFileShardTable(self, shard_index):
+    table = self.shardTables.get(shard_index, None)
+    if table is None:
+      metadata = MetaData(schema=f"{SHARD_SCHEMA_PREFIX}{shard_index}")
+      columns = []
+      for c in File.__table__.c:
+        columns.append(Column(c.name, c.type.copy(),
+          primary_key=c.primary_key, nullable=c.nullable,
+          default=c.default.arg if c.default is not None else None,
+          server_default=c.server_default.arg
+            if c.server_default is not None else None))
+      table = Table('files', metadata, *columns, sqlite_autoincrement=True)
+      for index in File.__table__.indexes:
+        Index(index.name, *[table.c[c.name] for c in index.columns])
+      self.shardTables[shard_index] = table
+    return table
+
+  # Get the table holding the files for one or more scans: the files table,
+  # or for a sharded database, the files table of the shard holding all of
+  # the scans, or the view over all shards if they are in different shards.
+  # arguments:
+  #   1) list of scan IDs
+  # returns: Table
+  def _getFilesTable(self, scan_ids):
+    shard_size = self._getFileShardSize()
+    if shard_size is None:
+      return File.__table__
+    shard_indexes = set(self._getFileShardIndex(scan_id, shard_size)
+      for scan_id in scan_ids)
+    if len(shard_indexes) != 1:
+      return File.__table__
+    return self._getFileShardTable(shard_indexes.pop())
+
+  # Get the maximum number of files shards that can be attached to a
+  # connection: SQLite's limit on attached databases, less one kept free
+  # for scan bundles.
+  # arguments:
+  #   1) DBAPI connection
+  # returns: number of shards
+  def _getMaxFileShards(self, dbapi_conn):
+    return dbapi_conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - 1
+
+  # Get the files shards that need to be attached to a connection: those
+  # holding the given scans' files, and the one for the next new scan.
+  # arguments:
+  #   1) list of scan IDs
+  #   2) number of scans in each shard
+  # returns: sorted list of shard indexes
+  def _getNeededFileShards(self, scan_ids, shard_size):
+    next_scan_id = max(scan_ids, default=0) + 1
+    return sorted(set(self._getFileShardIndex(scan_id, shard_size)
+      for scan_id in scan_ids + [next_scan_id]))
+
+  # Check that a new scan can be added without needing more files shards
+  # than can be attached; does nothing if the database isn't sharded.
+  # arguments: N/A
+  # returns: True if the scan can be added, False otherwise
+  def _checkFileShardsForNewScan(self):
+    shard_size = self._getFileShardSize()
+    if shard_size is None:
+      return True
+    scan_ids = [scan_id for (scan_id,) in self.session.query(Scan.id)]
+    new_scan_id = max(scan_ids, default=0) + 1
+    shard_indexes = self._getNeededFileShards(scan_ids + [new_scan_id],
+      shard_size)
+    max_shards = self._getMaxFileShards(self.session.connection().connection)
+    if len(shard_indexes) > max_shards:
+      print(f"Error: adding scan {new_scan_id} would need {len(shard_indexes)} files shards, but only {max_shards} can be attached")
+      return False
+    return True
+
+  # Get the schema names of the files shards attached to a connection.
+  # arguments:
+  #   1) connection
+  # returns: list of schema names
+  def _getAttachedFileShards(self, conn):
+    return [row[1] for row in conn.execute("PRAGMA database_list")
+      if row[1].startswith(SHARD_SCHEMA_PREFIX)]
+
+  # Attach the files shards to a new DBAPI connection, and create the files
+  # view over them. The shards for all existing scans are attached, along
+  # with the shard for the next new scan, which is created if needed. Called
+  # from the engine's "connect" event; does nothing if the database isn't
+  # sharded.
+  # arguments:
+  #   1) DBAPI connection
+  #   2) connection record (unused)
+  # returns: N/A; raises exception if there are more shards than can be
+  #   attached, which addNewScan() normally prevents
+  def _attachFileShards(self, dbapi_conn, connection_record):
+    try:
+      row = dbapi_conn.execute("SELECT value FROM config WHERE key = ?",
+        (SHARD_SIZE_CONFIG_KEY,)).fetchone()
+    except sqlite3.Error:
+      # not yet initialized
+      return
+    if row is None:
+      return
+    shard_size = int(row[0])
+    scan_ids = [scan_id for (scan_id,) in dbapi_conn.execute(
+      "SELECT id FROM scans")]
+    shard_indexes = self._getNeededFileShards(scan_ids, shard_size)
+    max_shards = self._getMaxFileShards(dbapi_conn)
+    if len(shard_indexes) > max_shards:
+      raise RuntimeError(f"{len(shard_indexes)} files shards, but only {max_shards} can be attached")
+
+    dialect = self.engine.dialect
+    schemas = []
+    for shard_index in shard_indexes:
+      schema = f"{SHARD_SCHEMA_PREFIX}{shard_index}"
+      dbapi_conn.execute(f"ATTACH DATABASE ? AS {schema}",
+        (self._getFileShardFilename(shard_index),))
+      schemas.append(schema)
+      has_table = dbapi_conn.execute(f"SELECT count(*) FROM " +
+        f"{schema}.sqlite_master WHERE name = 'files'").fetchone()[0]
+      if not has_table:
+        table = self._getFileShardTable(shard_index)
+        dbapi_conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+        dbapi_conn.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in table.indexes:
+          dbapi_conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+        dbapi_conn.execute(f"INSERT INTO {schema}.sqlite_sequence " +
+          "(name, seq) VALUES ('files', ?)",
+          (shard_index * SHARD_FILE_ID_SPAN,))
+        dbapi_conn.commit()
+
+    columns = ", ".join(c.name for c in File.__table__.c)
+    dbapi_conn.execute("CREATE TEMP VIEW files AS " + " UNION ALL ".join(
+      f"SELECT {columns} FROM {schema}.files" for schema in schemas))
+
+  # Switch a new database to the sharded layout. This must be done before
+  # any scans are added, and can't be undone.
+  # arguments:
+  #   1) scans_per_shard: number of scans whose files are stored in each
+  #      files shard
+  # returns: True if enabled, False otherwise
+  def enableFileShards(self, scans_per_shard):
+    if self.dbFilename is None or self.dbFilename == ":memory:":
+      print("Error: files shards can only be used with a database file")
+      return False
+    if int(scans_per_shard) < 1:
+      print("Error: each files shard must hold at least one scan")
+      return False
+    if self.getScansIDList():
+      print("Error: files shards must be enabled before any scans are added")
+      return False
+    try:
+      if self._getMaxFileShards(self.session.connection().connection) < 1:
+        print("Error: SQLite can't attach any files shards")
+        return False
+      self.session.add(Config(key=SHARD_SIZE_CONFIG_KEY,
+        value=str(int(scans_per_shard))))
+      self.invalidateCache()
+      # the shards are attached when the next connection is opened
+      self.session.commit()
+      return True
+    except Exception as e:
+      print(f'Error enabling files shards: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  # Get the files shards for the database's scans.
+  # arguments: N/A
+  # returns: list of tuples, sorted by shard index, in format:
+  #   (shard index, first scan ID, last scan ID, shard filename)
+  #   or an empty list if the database isn't sharded
+  def getFileShards(self):
+    shard_size = self._getFileShardSize()
+    if shard_size is None:
+      return []
+    shard_indexes = sorted(set(self._getFileShardIndex(scan_id, shard_size)
+      for scan_id in self.getScansIDList()))
+    return [(shard_index, shard_index * shard_size + 1,
+      (shard_index + 1) * shard_size, self._getFileShardFilename(shard_index))
+      for shard_index in shard_indexes]
+
+  # Delete all scans in a files shard, and delete the shard's file. The
+  # shard's files table is emptied in one statement and its file removed,
+  # rather than deleting the files one at a time. Any delta scans in later
+  # shards that are stored against scans in this shard are first stored in
+  # full. Any pending changes are committed.
+  # arguments:
+  #   1) shard index
+  # returns: list of IDs of deleted scans, or None if error
+  def dropFileShard(self, shard_index):
+    shard_size = self._getFileShardSize()
+    if shard_size is None:
+      print("Error: database doesn't use files shards")
+      return None
+    first_scan_id = shard_index * shard_size + 1
+    last_scan_id = (shard_index + 1) * shard_size
+    in_shard = Scan.id.between(first_scan_id, last_scan_id)
+    try:
+      parent = aliased(Scan)
+      dependents = self.session.query(Scan.id).\
+        join(parent, parent.id == Scan.parent_scan_id).\
+        filter(~in_shard).\
+        filter(parent.id.between(first_scan_id, last_scan_id)).\
+        order_by(Scan.id)
+      for (scan_id,) in dependents.all():
+        self._materializeScan(scan_id)
+
+      conn = self.session.connection()
+      conn.execute(self._getFileShardTable(shard_index).delete())
+      scan_ids = [scan_id for (scan_id,) in
+        self.session.query(Scan.id).filter(in_shard).order_by(Scan.id)]
+      # delete newest first, so that no delta scans need to be stored in full
+      for scan_id in reversed(scan_ids):
+        if not self.deleteScan(scan_id, False):
+          raise RuntimeError(f"couldn't delete scan {scan_id}")
+      self.session.commit()
+
+      # the shard is attached again when the next connection is opened,
+      # if it still holds the next new scan
+      shard_filename = self._getFileShardFilename(shard_index)
+      if os.path.exists(shard_filename):
+        os.remove(shard_filename)
+      return scan_ids
+    except Exception as e:
+      print(f'Error dropping files shard {shard_index}: {str(e)}')
+      self.rollbackChanges()
+      return None
+
+  ########## SCAN BUNDLE FUNCTIONS ##########
+
+  # A scan bundle is a small SQLite file holding one scan's files, snippets,
+  # SPDX elements and relationships, along with the licenses they use and
+  # the categories and conversions for those licenses, so that the scan can
+  # be moved to another database without importing and triaging the
+  # original SPDX file again. Bundles are written and read by attaching them
+  # to the database connection, so that rows are copied in a few
+  # INSERT ... SELECT statements.
+
+  # Get the tables in a scan bundle.
+  # arguments: N/A
+  # returns: dict of name => Table, in the BUNDLE_SCHEMA schema
+  def _getBundleTables(self):
+    metadata = MetaData(schema=BUNDLE_SCHEMA)
+    return {
+      'info': Table('bundle_info', metadata,
+        Column('key', String(), primary_key=True),
+        Column('value', String()),
+      ),
+      'categories': Table('categories', metadata,
+        Column('id', Integer(), primary_key=True),
+        Column('name', String()),
+      ),
+      'licenses': Table('licenses', metadata,
+        Column('id', Integer(), primary_key=True),
+        Column('short_name', String()),
+        Column('category_id', Integer()),
+      ),
+      'conversions': Table('conversions', metadata,
+        Column('id', Integer(), primary_key=True),
+        Column('old_text', String()),
+        Column('new_license_id', Integer()),
+      ),
+      'files': Table('files', metadata,
+        Column('filename', String()),
+        Column('license_id', Integer()),
+        Column('sha1', String()),
+        Column('md5', String()),
+        Column('sha256', String()),
+        Column('extension', String()),
+        Column('is_git', Boolean(create_constraint=False)),
+        Column('is_vendor', Boolean(create_constraint=False)),
+        Column('depth', Integer()),
+      ),
+      'snippets': Table('snippets', metadata,
+        Column('filename', String()),
+        Column('spdx_id', String()),
+        Column('byte_start', Integer()),
+        Column('byte_end', Integer()),
+        Column('line_start', Integer()),
+        Column('line_end', Integer()),
+        Column('license_id', Integer()),
+      ),
+      'elements': Table('spdx_elements', metadata,
+        Column('spdx_id', String()),
+        Column('element_type', String()),
+        Column('name', String()),
+        Column('license_id', Integer()),
+      ),
+      'relationships': Table('relationships', metadata,
+        Column('from_spdx_id', String()),
+        Column('relationship_type', String()),
+        Column('to_spdx_id', String()),
+      ),
+    }
+
+  # Attach a bundle file to the session's connection. Any pending changes
+  # are committed first, because SQLite can't attach a database inside a
+  # transaction.
+  # arguments:
+  #   1) bundle_filename: path to bundle file
+  # returns: the session's connection
+  def _attachBundle(self, bundle_filename):
+    self.session.commit()
+    conn = self.session.connection()
+    conn.execute(f"ATTACH DATABASE ? AS {BUNDLE_SCHEMA}", (bundle_filename,))
+    return conn
+
+  # Detach the bundle file, if it is still attached. Committing releases
+  # the session's connection, so depending on the connection pool, the
+  # connection used next may not have it attached.
+  # arguments: N/A
+  # returns: N/A
+  def _detachBundle(self):
+    conn = self.session.connection()
+    names = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if BUNDLE_SCHEMA in names:
+      conn.execute(f"DETACH DATABASE {BUNDLE_SCHEMA}")
+
+  # Export a scan to a bundle file.
+  # WARNING: will delete the specified bundle file if it already exists
+  # arguments:
+  #   1) ID of scan
+  #   2) bundle_filename: path to bundle file to be created
+  # returns: True if exported, False otherwise
+  def exportScanBundle(self, scan_id, bundle_filename):
+    scan = self.getScanData(scan_id)
+    if scan is None:
+      print(f"Error: no scan with ID {scan_id}")
+      return False
+    try:
+      if os.path.exists(bundle_filename):
+        os.remove(bundle_filename)
+      bundle = self._getBundleTables()
+      conn = self._attachBundle(bundle_filename)
+      try:
+        bundle['info'].metadata.create_all(conn)
+        conn.execute(bundle['info'].insert(), [
+          {'key': 'magic', 'value': BUNDLE_MAGIC},
+          {'key': 'format_version', 'value': BUNDLE_FORMAT_VERSION},
+          {'key': 'spdxSummarizer_version', 'value': SPVERSION},
+          {'key': 'scan_dt', 'value': scan[1]},
+          {'key': 'desc', 'value': scan[2]},
+        ])
+
+        effective = self._selectScanFiles(scan_id).alias('effective_files')
+        conn.execute(bundle['files'].insert().from_select(FILE_DATA_COLUMNS,
+          select([effective.c[name] for name in FILE_DATA_COLUMNS]).\
+          order_by(effective.c.filename)))
+        # an alias scan's document data is that of the scan it's an alias of
+        doc_scan_id = self._getDocumentScanID(scan_id)
+        for (name, datatype) in [('snippets', Snippet),
+          ('elements', SPDXElement), ('relationships', Relationship)]:
+          source = datatype.__table__
+          columns = [c.name for c in bundle[name].columns]
+          conn.execute(bundle[name].insert().from_select(columns,
+            select([source.c[c] for c in columns]).\
+            where(source.c.scan_id == doc_scan_id).order_by(source.c.id)))
+
+        licenses = License.__table__
+        conn.execute(bundle['licenses'].insert().from_select(
+          ['id', 'short_name', 'category_id'],
+          select([licenses.c.id, licenses.c.short_name,
+            licenses.c.category_id]).\
+          where(or_(
+            licenses.c.id.in_(select([bundle['files'].c.license_id])),
+            licenses.c.id.in_(select([bundle['snippets'].c.license_id])),
+            licenses.c.id.in_(select([bundle['elements'].c.license_id]))))))
+        categories = Category.__table__
+        conn.execute(bundle['categories'].insert().from_select(
+          ['id', 'name'],
+          select([categories.c.id, categories.c.name]).\
+          where(categories.c.id.in_(
+            select([bundle['licenses'].c.category_id]).distinct()))))
+        conversions = Conversion.__table__
+        conn.execute(bundle['conversions'].insert().from_select(
+          ['id', 'old_text', 'new_license_id'],
+          select([conversions.c.id, conversions.c.old_text,
+            conversions.c.new_license_id]).\
+          where(conversions.c.new_license_id.in_(
+            select([bundle['licenses'].c.id])))))
+        self.session.commit()
+      finally:
+        self._detachBundle()
+      return True
+    except Exception as e:
+      print(f"Couldn't export scan {scan_id} to bundle {bundle_filename}: {str(e)}")
+      self.rollbackChanges()
+      return False
+
+  # Import a scan from a bundle file created by exportScanBundle(), as a
+  # new scan. Categories, licenses and conversions are matched to existing
+  # ones by name, and any that are missing are added; existing conversions
+  # are kept. The import fails if anything in the bundle uses a license
+  # that the bundle doesn't include, or whose category it doesn't include.
+  # The new scan is stored in full, not as a delta.
+  # Any pending changes are committed first.
+  # arguments:
+  #   1) bundle_filename: path to bundle file
+  # returns: new scan ID if imported, or -1 otherwise
+  def importScanBundle(self, bundle_filename):
+    if not os.path.exists(bundle_filename):
+      print(f"No file found at {bundle_filename}.")
+      return -1
+    try:
+      bundle = self._getBundleTables()
+      conn = self._attachBundle(bundle_filename)
+      try:
+        b_info = bundle['info']
+        info = {row[0]: row[1] for row in
+          conn.execute(select([b_info.c.key, b_info.c.value]))}
+        if info.get('magic') != BUNDLE_MAGIC:
+          print(f"Error: {bundle_filename} isn't an spdxSummarizer scan bundle")
+          return -1
+        if info.get('format_version') not in BUNDLE_IMPORT_VERSIONS:
+          print(f"Error: unsupported bundle format version {info.get('format_version')}")
+          return -1
+
+        scan_id = self._importBundleRows(conn, bundle, info)
+        self.session.commit()
+        self.invalidateCache()
+        return scan_id
+      finally:
+        self.rollbackChanges()
+        self._detachBundle()
+    except Exception as e:
+      print(f"Couldn't import scan from bundle {bundle_filename}: {str(e)}")
+      self.rollbackChanges()
+      return -1
+
+  # Copy an attached bundle's rows into the database, remapping the bundle's
+  # IDs to this database's IDs by joining on names.
+  # arguments:
+  #   1) connection with the bundle attached
+  #   2) dict of bundle tables from _getBundleTables()
+  #   3) dict of bundle_info key => value
+  # returns: new scan ID; raises exception on error
+  def _importBundleRows(self, conn, bundle, info):
+    b_cats = bundle['categories']
+    b_lics = bundle['licenses']
+    b_convs = bundle['conversions']
+    b_files = bundle['files']
+    categories = Category.__table__
+    licenses = License.__table__
+    conversions = Conversion.__table__
+
+    conn.execute(categories.insert().from_select(['name'],
+      select([b_cats.c.name]).\
+      where(~b_cats.c.name.in_(select([categories.c.name])))))
+    # if names are duplicated in this database, use the lowest ID
+    cat_ids = select([func.min(categories.c.id).label('id'),
+      categories.c.name]).group_by(categories.c.name).alias('category_ids')
+
+    conn.execute(licenses.insert().from_select(['short_name', 'category_id'],
+      select([b_lics.c.short_name, cat_ids.c.id]).\
+      select_from(b_lics.join(b_cats, b_cats.c.id == b_lics.c.category_id).\
+        join(cat_ids, cat_ids.c.name == b_cats.c.name)).\
+      where(~b_lics.c.short_name.in_(select([licenses.c.short_name])))))
+    lic_ids = select([func.min(licenses.c.id).label('id'),
+      licenses.c.short_name]).group_by(licenses.c.short_name).\
+      alias('license_ids')
+    # map of bundle license ID => license ID in this database
+    lic_map = select([b_lics.c.id.label('bundle_id'),
+      lic_ids.c.id.label('id')]).\
+      select_from(b_lics.join(lic_ids,
+        lic_ids.c.short_name == b_lics.c.short_name)).alias('license_map')
+    self._checkBundleLicenses(conn, bundle, info, lic_map)
+
+    conn.execute(conversions.insert().from_select(
+      ['old_text', 'new_license_id'],
+      select([b_convs.c.old_text, lic_map.c.id]).\
+      select_from(b_convs.join(lic_map,
+        lic_map.c.bundle_id == b_convs.c.new_license_id)).\
+      where(~b_convs.c.old_text.in_(select([conversions.c.old_text])))))
+
+    scan_id = self.addNewScan(info.get('scan_dt'), info.get('desc'), False)
+    if scan_id == -1:
+      raise RuntimeError("couldn't create new scan")
+    last_file_id = self._getLastFileID()
+    conn.execute(self._getFilesTable([scan_id]).insert().from_select(
+      ['scan_id'] + FILE_DATA_COLUMNS,
+      select([literal(scan_id, Integer())] +
+        [lic_map.c.id if name == 'license_id' else b_files.c[name]
+          for name in FILE_DATA_COLUMNS]).\
+      select_from(b_files.outerjoin(lic_map,
+        lic_map.c.bundle_id == b_files.c.license_id))))
+    self._buildScanDerivedData(scan_id, last_file_id)
+    if info.get('format_version') != "1":
+      self._importBundleDocumentRows(conn, bundle, scan_id, lic_map)
+    return scan_id
+
+  # Check that every license used by an attached bundle's files, snippets
+  # and elements can be mapped to a license in this database, i.e. that the
+  # bundle includes the license and its category.
+  # arguments:
+  #   1) connection with the bundle attached
+  #   2) dict of bundle tables from _getBundleTables()
+  #   3) dict of bundle_info key => value
+  #   4) license map subquery, of bundle license ID => license ID
+  # returns: N/A; raises exception naming the licenses that can't be mapped
+  def _checkBundleLicenses(self, conn, bundle, info, lic_map):
+    tables = [bundle['files']]
+    if info.get('format_version') != "1":
+      tables += [bundle['snippets'], bundle['elements']]
+    used = set()
+    for t in tables:
+      used.update(row[0] for row in conn.execute(
+        select([t.c.license_id]).where(t.c.license_id != None).distinct()))
+    mapped = {row[0] for row in conn.execute(select([lic_map.c.bundle_id]))}
+    unmapped = sorted(used - mapped)
+    if unmapped:
+      b_lics = bundle['licenses']
+      names = dict(conn.execute(select([b_lics.c.id, b_lics.c.short_name]).\
+        where(b_lics.c.id.in_(unmapped))).fetchall())
+      missing = ", ".join(names.get(lic_id, f"ID {lic_id}")
+        for lic_id in unmapped)
+      raise RuntimeError(f"bundle uses licenses that couldn't be matched or added: {missing}")
+
+  # Copy an attached bundle's snippets, SPDX elements and relationships into
+  # a newly-imported scan, remapping their license IDs.
+  # arguments:
+  #   1) connection with the bundle attached
+  #   2) dict of bundle tables from _getBundleTables()
+  #   3) ID of new scan
+  #   4) license map subquery, of bundle license ID => license ID
+  # returns: N/A; raises exception on error
+  def _importBundleDocumentRows(self, conn, bundle, scan_id, lic_map):
+    ids = dict(conn.execute(select([lic_map.c.bundle_id, lic_map.c.id])).\
+      fetchall())
+    b_sn = bundle['snippets']
+    snippet_tuples = [tuple(row[:6]) + (ids.get(row[6]),) for row in
+      conn.execute(select([c for c in b_sn.columns]))]
+    b_el = bundle['elements']
+    element_tuples = [tuple(row[:3]) + (ids.get(row[3]),) for row in
+      conn.execute(select([c for c in b_el.columns]))]
+    b_rel = bundle['relationships']
+    relationship_tuples = [tuple(row) for row in
+      conn.execute(select([c for c in b_rel.columns]))]
+    if not self.addBulkNewSnippets(scan_id, snippet_tuples, False):
+      raise RuntimeError("couldn't add snippets")
+    if not self.addBulkNewRelationships(scan_id, element_tuples,
+      relationship_tuples, False):
+      raise RuntimeError("couldn't add SPDX elements and relationships")
+
+  ########## COMBO DATA FUNCTIONS ##########
+
+  # Get file and license info, by category, for all files for a given scan.
+  # arguments:
+  #   1) ID of scan
+  #   2) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: dict of category =>
+  #    (category_name, {filename => license}, {license => count})
+  #   or None if error
+  def getCategoryFilesForScan(self, scan_id, exclude_git=False):
+    f = self._getScanFilesEntity(scan_id)
+    query = self.session.query(
+      Category.id, Category.name, f.filename, License.short_name
+    ).select_from(f).\
+      join(License, f.license_id == License.id).\
+      join(Category, License.category_id == Category.id)
+    if exclude_git:
+      query = query.filter(f.is_git == False)
+    query = query.order_by(Category.id, License.short_name, f.filename)
+
+    cats = {}
+    for q in query:
+      # scan through, creating categories and data structure as needed
+      cat_id = q[0]
+      cat_name = q[1]
+      filename = q[2]
+      license = q[3]
+
+      cat = cats.get(cat_id, None)
+      if cat is None:
+        # create tuple of category name, filename => license dict, and
+        # license => count stats dict
+        cats[cat_id] = (cat_name, {}, {})
+        cat = cats.get(cat_id)
+
+      # add filename and license to this category's list
+      cat[1][filename] = license
+
+      # insert or increment license count
+      ccount = cat[2].get(license, 0)
+      cat[2][license] = ccount + 1
+
+    return cats
+
+  # Get filename and corresponding license for all files for a given scan.
+  # arguments:
+  #   1) ID of scan
+  #   2) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: dict of filename => license, or None if error
+  def getLicenseAndFilesForScan(self, scan_id, exclude_git=False):
+    f = self._getScanFilesEntity(scan_id)
+    query = self.session.query(f.filename, License.short_name).\
+      join(License, f.license_id == License.id)
+    if exclude_git:
+      query = query.filter(f.is_git == False)
+    query = query.order_by(f.filename)
+
+    files = {}
+    for q in query:
+      filename = q[0]
+      license = q[1]
+      files[filename] = license
+    return files
+
+  # Check whether a scan has any files with a license, without loading
+  # them all as getLicenseAndFilesForScan() does.
+  # arguments:
+  #   1) ID of scan
+  #   2) (optional) if True, ignore files in any /.git/ subdirectory
+  # returns: True if the scan has at least one such file, False otherwise
+  def hasLicenseAndFilesForScan(self, scan_id, exclude_git=False):
+    f = self._getScanFilesEntity(scan_id)
+    query = self.session.query(f.id).\
+      join(License, f.license_id == License.id)
+    if exclude_git:
+      query = query.filter(f.is_git == False)
+    return query.first() is not None
+
+  # Get the files in a scan with a given license whose stored path
+  # attributes match the given filters.
+  # arguments:
+  #   1) ID of scan
+  #   2) license short name
+  #   3) (optional) extensions: list of extensions including the dot (e.g.
+  #      [".png", ".jpg"]); if given, only match files with these extensions
+  #   4) (optional) is_vendor: if True or False, only match files that are
+  #      or aren't in a "vendor/" directory
+  #   5) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: sorted list of filenames
+  def getFilenamesByAttributes(self, scan_id, license_name, extensions=None,
+    is_vendor=None, exclude_git=False):
+    f = self._getScanFilesEntity(scan_id)
+    query = self.session.query(f.filename).\
+      join(License, f.license_id == License.id).\
+      filter(License.short_name == license_name)
+    if extensions is not None:
+      query = query.filter(f.extension.in_(extensions))
+    if is_vendor is not None:
+      query = query.filter(f.is_vendor == is_vendor)
+    if exclude_git:
+      query = query.filter(f.is_git == False)
+    query = query.order_by(f.filename)
+    return [q[0] for q in query]
+
+  # Get full file records, including scan, license and category names, for
+  # one or more scans. Results are streamed back from the database in
+  # batches, rather than being loaded into memory all at once.
+  # arguments:
+  #   1) (optional) list of scan IDs; if None, get records for all scans
+  # returns: iterator of tuples, sorted by scan ID and filename, in format:
+  #   (scan_id, scan_dt, desc, filename, license, category, sha1, md5, sha256)
+  def getFileRecordsForScans(self, scan_ids=None):
+    scans = self.session.query(Scan.id, Scan.scan_dt, Scan.desc)
+    if scan_ids is not None:
+      scans = scans.filter(Scan.id.in_(scan_ids))
+    scans = scans.order_by(Scan.id).all()
+
+    for (scan_id, scan_dt, desc) in scans:
+      f = self._getScanFilesEntity(scan_id)
+      query = self.session.query(
+        f.filename, License.short_name, Category.name, f.sha1, f.md5, f.sha256
+      ).select_from(f).\
+        join(License, f.license_id == License.id).\
+        join(Category, License.category_id == Category.id).\
+        order_by(f.filename)
+
+      for q in query.yield_per(STREAM_BATCH_SIZE):
+        yield (scan_id, str(scan_dt), desc, q[0], q[1], q[2], q[3], q[4], q[5])
+
+  ########## COMPARISON DATA FUNCTIONS ##########
+
+  # Get files that are in both scans, but where the license has changed
+  # between the first and second scan. Only files in directories whose
+  # hashes differ between the scans are compared. Results are streamed back
+  # from the database in batches, rather than being loaded into memory all
+  # at once.
+  # arguments:
+  #   1) ID of first scan
+  #   2) ID of second scan
+  #   3) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: iterator of tuples, sorted by filename, in format:
+  #   (filename, first scan license, second scan license)
+  def getChangedLicensesForScans(self, first_scan_id, second_scan_id,
+    exclude_git=False):
+    first_file = self._getScanFilesEntity(first_scan_id)
+    second_file = self._getScanFilesEntity(second_scan_id)
+    first_lic = aliased(License)
+    second_lic = aliased(License)
+
+    changed_dirs = self._getChangedDirectories(first_scan_id, second_scan_id,
+      COMPARISON_PRUNE_MAX_DIRECTORIES, files_only=True)
+    if changed_dirs == []:
+      return
+
+    query = self.session.query(
+      first_file.filename, first_lic.short_name, second_lic.short_name
+    ).select_from(first_file).\
+      join(second_file,
+        second_file.filename == self._joinFilename(first_file)).\
+      join(first_lic, first_file.license_id == first_lic.id).\
+      join(second_lic, second_file.license_id == second_lic.id).\
+      filter(first_lic.short_name != second_lic.short_name)
+    if exclude_git:
+      query = query.filter(first_file.is_git == False)
+
+    for q in self._runPerDirectory(query, first_file, changed_dirs):
+      yield (q[0], q[1], q[2])
+
+  # Get files that are in one scan but not in another. Only files in
+  # directories whose hashes differ between the scans are compared. Results
+  # are streamed back from the database in batches, rather than being loaded
+  # into memory all at once.
+  # arguments:
+  #   1) ID of scan to pull files from
+  #   2) ID of other scan, whose files should be left out
+  #   3) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: iterator of tuples, sorted by filename, in format:
+  #   (filename, license)
+  def getFilesOnlyInScan(self, scan_id, other_scan_id, exclude_git=False):
+    f = self._getScanFilesEntity(scan_id)
+    other_file = self._getScanFilesEntity(other_scan_id)
+    changed_dirs = self._getChangedDirectories(scan_id, other_scan_id,
+      COMPARISON_PRUNE_MAX_DIRECTORIES, files_only=True)
+    if changed_dirs == []:
+      return
+
+    query = self.session.query(f.filename, License.short_name).\
+      select_from(f).\
+      join(License, f.license_id == License.id).\
+      outerjoin(other_file, other_file.filename == self._joinFilename(f)).\
+      filter(other_file.id == None)
+    if exclude_git:
+      query = query.filter(f.is_git == False)
+
+    for q in self._runPerDirectory(query, f, changed_dirs):
+      yield (q[0], q[1])
+
+  ########## SNIPPET FUNCTIONS ##########
+
+  # Snippets are ranges of bytes (and optionally lines) within a file, with
+  # their own concluded license. They are stored against their scan and
+  # file path; an alias scan has no snippets of its own, and uses those of
+  # the scan it is an alias of. Queries for the snippets overlapping a range
+  # use the snippets_rtree index where available.
+
+  # Add bulk list of new snippets to database.
+  # arguments:
+  #   1) scan ID
+  #   2) list of tuples in format:
+  #      (filename, SPDX ID, byte start, byte end, line start, line end,
+  #      ID of license)
+  #      Ranges include both ends; line start and end may be None.
+  #   3) commit: if True, commit updates at end
+  # returns: True if successfully added to DB, False otherwise
+  def addBulkNewSnippets(self, scan_id, snippet_tuples, commit=True):
+    try:
+      self._unaliasScan(scan_id)
+      rows = [{
+        'scan_id': scan_id,
+        'filename': st[0],
+        'file_key': getFileKey(st[0]),
+        'spdx_id': st[1],
+        'byte_start': st[2],
+        'byte_end': st[3],
+        'line_start': st[4],
+        'line_end': st[5],
+        'license_id': st[6],
+      } for st in snippet_tuples]
+      # inserting each file's snippets together, in order, keeps nearby
+      # snippets in the same snippets_rtree nodes, so range queries read
+      # fewer nodes
+      rows.sort(key=lambda r: (r['file_key'], r['filename'], r['byte_start']))
+      if rows:
+        self.session.connection().execute(Snippet.__table__.insert(), rows)
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error adding bulk new snippets for scan {scan_id}: {str(e)}')
+      return False
+
+  # Get the scan whose snippets, relationships and other document data are
+  # used for a scan, i.e. the scan it is an alias of, if any.
+  # arguments:
+  #   1) ID of scan
+  # returns: ID of scan
+  def _getDocumentScanID(self, scan_id):
+    alias_of_scan_id = self.getScanAliasOf(scan_id)
+    return alias_of_scan_id if alias_of_scan_id is not None else scan_id
+
+  # Check whether the database has the snippets_rtree index.
+  # arguments: N/A
+  # returns: True if it does, False if not
+  def _hasSnippetsRtree(self):
+    def loader():
+      sql = "SELECT count(*) FROM sqlite_master WHERE name = 'snippets_rtree'"
+      return self.session.execute(sql).scalar() > 0
+    return self._getCached("snippets_rtree", loader)
+
+  # Get all snippets for a scan.
+  # arguments:
+  #   1) ID of scan
+  # returns: list of tuples, sorted, in the format used by
+  #   addBulkNewSnippets(), or None if error
+  def getSnippetsForScan(self, scan_id):
+    try:
+      sn = Snippet.__table__
+      query = select([sn.c.filename, sn.c.spdx_id, sn.c.byte_start,
+        sn.c.byte_end, sn.c.line_start, sn.c.line_end, sn.c.license_id]).\
+        where(sn.c.scan_id == self._getDocumentScanID(scan_id))
+      return sorted((tuple(row) for row in
+        self.session.connection().execute(query)), key=nullsFirstSortKey)
+    except Exception as e:
+      print(f'Error getting snippets for scan {scan_id}: {str(e)}')
+      return None
+
+  # Get all snippets for a file in a scan.
+  # arguments:
+  #   1) ID of scan
+  #   2) filename
+  # returns: list of tuples, sorted by byte range, in format:
+  #   (SPDX ID, byte start, byte end, line start, line end, license), or
+  #   None if error
+  def getSnippetsForFile(self, scan_id, filename):
+    try:
+      sn = Snippet.__table__
+      query = select([sn.c.spdx_id, sn.c.byte_start, sn.c.byte_end,
+        sn.c.line_start, sn.c.line_end, License.short_name]).\
+        select_from(sn.join(License, sn.c.license_id == License.id)).\
+        where(sn.c.scan_id == self._getDocumentScanID(scan_id)).\
+        where(sn.c.filename == filename).\
+        order_by(sn.c.byte_start, sn.c.byte_end, sn.c.spdx_id)
+      return [tuple(row) for row in self.session.connection().execute(query)]
+    except Exception as e:
+      print(f'Error getting snippets for {filename} in scan {scan_id}: {str(e)}')
+      return None
+
+  # Get the licenses of the snippets in a file that overlap a range of
+  # bytes or lines, e.g. the licenses that apply to bytes 1000-2000.
+  # arguments:
+  #   1) ID of scan
+  #   2) filename
+  #   3) start of range
+  #   4) end of range, included in the range
+  #   5) (optional) if True, the range is of lines rather than bytes;
+  #      snippets without a line range are left out
+  # returns: sorted list of license names, or None if error
+  def getSnippetLicensesForRange(self, scan_id, filename, start, end,
+    lines=False):
+    try:
+      sn = Snippet.__table__
+      scan_id = self._getDocumentScanID(scan_id)
+      if self._hasSnippetsRtree():
+        rt = SNIPPETS_RTREE
+        file_key = getFileKey(filename)
+        if lines:
+          overlaps = and_(rt.c.min_line <= end, rt.c.max_line >= start,
+            rt.c.max_line > 0)
+        else:
+          overlaps = and_(rt.c.min_byte <= end, rt.c.max_byte >= start)
+        query = select([License.short_name]).\
+          select_from(rt.join(sn, sn.c.id == rt.c.id).\
+            join(License, sn.c.license_id == License.id)).\
+          where(rt.c.min_scan_id <= scan_id).\
+          where(rt.c.max_scan_id >= scan_id).\
+          where(rt.c.min_file_key <= file_key).\
+          where(rt.c.max_file_key >= file_key).\
+          where(overlaps).\
+          where(sn.c.filename == filename)
+      else:
+        if lines:
+          overlaps = and_(sn.c.line_start <= end, sn.c.line_end >= start)
+        else:
+          overlaps = and_(sn.c.byte_start <= end, sn.c.byte_end >= start)
+        query = select([License.short_name]).\
+          select_from(sn.join(License, sn.c.license_id == License.id)).\
+          where(sn.c.scan_id == scan_id).\
+          where(sn.c.filename == filename).\
+          where(overlaps)
+      return sorted(set(lic for (lic,) in
+        self.session.connection().execute(query)))
+    except Exception as e:
+      print(f'Error getting snippet licenses for {filename} in scan {scan_id}: {str(e)}')
+      return None
+
+  # Get the number of snippets with each license in a scan, by category.
+  # arguments:
+  #   1) ID of scan
+  # returns: dict of category ID => (category name, {license => count}),
+  #   or None if error
+  def getSnippetCategoryCountsForScan(self, scan_id):
+    try:
+      sn = Snippet.__table__
+      query = select([Category.id, Category.name, License.short_name,
+        func.count(sn.c.id)]).\
+        select_from(sn.join(License, sn.c.license_id == License.id).\
+          join(Category, License.category_id == Category.id)).\
+        where(sn.c.scan_id == self._getDocumentScanID(scan_id)).\
+        group_by(Category.id, Category.name, License.short_name).\
+        order_by(Category.id, License.short_name)
+      cats = {}
+      for (cat_id, cat_name, license, count) in \
+        self.session.connection().execute(query):
+        cats.setdefault(cat_id, (cat_name, {}))[1][license] = count
+      return cats
+    except Exception as e:
+      print(f'Error getting snippet license counts for scan {scan_id}: {str(e)}')
+      return None
+
+  ########## RELATIONSHIP FUNCTIONS ##########
+
+  # Relationships between a scan's SPDX elements (its document, packages and
+  # files) are stored as given, along with their transitive closure over the
+  # types in CLOSURE_RELATIONSHIP_TYPES, so that e.g. every file reachable
+  # from a package can be found with one query rather than by walking the
+  # graph. Elements are stored so that SPDX IDs can be resolved to names,
+  # filenames and licenses.
+
+  # Add bulk lists of new SPDX elements and relationships to database, and
+  # rebuild the scan's relationship closure.
+  # arguments:
+  #   1) scan ID
+  #   2) list of element tuples in format:
+  #      (SPDX ID, element type, name, ID of license)
+  #      The element type is "DOCUMENT", "PACKAGE" or "FILE"; the name of a
+  #      file is its filename, and only files have a license ID.
+  #   3) list of relationship tuples in format:
+  #      (from SPDX ID, relationship type, to SPDX ID)
+  #   4) commit: if True, commit updates at end
+  # returns: True if successfully added to DB, False otherwise
+  def addBulkNewRelationships(self, scan_id, element_tuples,
+    relationship_tuples, commit=True):
+    try:
+      self._unaliasScan(scan_id)
+      conn = self.session.connection()
+      if element_tuples:
+        conn.execute(SPDXElement.__table__.insert(), [{
+          'scan_id': scan_id,
+          'spdx_id': et[0],
+          'element_type': et[1],
+          'name': et[2],
+          'license_id': et[3],
+        } for et in element_tuples])
+      if relationship_tuples:
+        conn.execute(Relationship.__table__.insert(), [{
+          'scan_id': scan_id,
+          'from_spdx_id': rt[0],
+          'relationship_type': rt[1],
+          'to_spdx_id': rt[2],
+        } for rt in relationship_tuples])
+        self._buildRelationshipClosure(scan_id)
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error adding bulk new relationships for scan {scan_id}: {str(e)}')
+      return False
+
+  # Add a single new relationship to database, updating the scan's
+  # relationship closure for just the pairs of elements it connects.
+  # arguments:
+  #   1) scan ID
+  #   2) from SPDX ID
+  #   3) relationship type
+  #   4) to SPDX ID
+  #   5) commit: if True, commit updates at end
+  # returns: True if successfully added to DB, False otherwise
+  def addRelationship(self, scan_id, from_spdx_id, relationship_type,
+    to_spdx_id, commit=True):
+    try:
+      self._unaliasScan(scan_id)
+      conn = self.session.connection()
+      conn.execute(Relationship.__table__.insert().values(scan_id=scan_id,
+        from_spdx_id=from_spdx_id, relationship_type=relationship_type,
+        to_spdx_id=to_spdx_id))
+      edge = getClosureEdge((from_spdx_id, relationship_type, to_spdx_id))
+      if edge is not None:
+        self._addClosureEdge(scan_id, edge[0], edge[1])
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error adding relationship for scan {scan_id}: {str(e)}')
+      return False
+
+  # Rebuild the relationship closure for a scan from its relationships.
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _buildRelationshipClosure(self, scan_id):
+    conn = self.session.connection()
+    rc = RelationshipClosure.__table__
+    rel = Relationship.__table__
+    conn.execute(rc.delete().where(rc.c.scan_id == scan_id))
+    query = select([rel.c.from_spdx_id, rel.c.relationship_type,
+      rel.c.to_spdx_id]).where(rel.c.scan_id == scan_id)
+    rows = [{
+      'scan_id': scan_id,
+      'ancestor_spdx_id': ancestor,
+      'descendant_spdx_id': descendant,
+      'depth': depth,
+    } for (ancestor, descendant, depth) in
+      getRelationshipClosure(conn.execute(query).fetchall())]
+    if rows:
+      conn.execute(rc.insert(), rows)
+
+  # Add the pairs of elements connected by a new edge to a scan's
+  # relationship closure: every ancestor of the edge's first element (and
+  # the element itself) now reaches every descendant of its second element
+  # (and the element itself). Pairs already in the closure keep the shorter
+  # of their old and new depths.
+  # arguments:
+  #   1) ID of scan
+  #   2) ancestor SPDX ID
+  #   3) descendant SPDX ID
+  # returns: N/A; raises exception on error
+  def _addClosureEdge(self, scan_id, ancestor_spdx_id, descendant_spdx_id):
+    conn = self.session.connection()
+    rc = RelationshipClosure.__table__
+    ancestors = {ancestor_spdx_id: 0}
+    for (spdx_id, depth) in conn.execute(select([rc.c.ancestor_spdx_id,
+      rc.c.depth]).where(rc.c.scan_id == scan_id).\
+      where(rc.c.descendant_spdx_id == ancestor_spdx_id)):
+      ancestors[spdx_id] = depth
+    descendants = {descendant_spdx_id: 0}
+    for (spdx_id, depth) in conn.execute(select([rc.c.descendant_spdx_id,
+      rc.c.depth]).where(rc.c.scan_id == scan_id).\
+      where(rc.c.ancestor_spdx_id == descendant_spdx_id)):
+      descendants[spdx_id] = depth
+    rows = [{
+      'scan_id': scan_id,
+      'ancestor': a,
+      'descendant': d,
+      'depth': a_depth + 1 + d_depth,
+    } for (a, a_depth) in ancestors.items()
+      for (d, d_depth) in descendants.items() if a != d]
+    # upserts need SQLite 3.24 or later
+    sql = """INSERT INTO relationship_closure
+      (scan_id, ancestor_spdx_id, descendant_spdx_id, depth)
+      VALUES (:scan_id, :ancestor, :descendant, :depth)
+      ON CONFLICT (scan_id, ancestor_spdx_id, descendant_spdx_id)
+      DO UPDATE SET depth = min(depth, excluded.depth)"""
+    if rows:
+      conn.execute(text(sql), rows)
+
+  # Get all SPDX elements for a scan.
+  # arguments:
+  #   1) ID of scan
+  # returns: sorted list of tuples, in the format used by
+  #   addBulkNewRelationships(), or None if error
+  def getElementsForScan(self, scan_id):
+    try:
+      el = SPDXElement.__table__
+      query = select([el.c.spdx_id, el.c.element_type, el.c.name,
+        el.c.license_id]).\
+        where(el.c.scan_id == self._getDocumentScanID(scan_id))
+      return sorted((tuple(row) for row in
+        self.session.connection().execute(query)), key=nullsFirstSortKey)
+    except Exception as e:
+      print(f'Error getting SPDX elements for scan {scan_id}: {str(e)}')
+      return None
+
+  # Get all relationships for a scan.
+  # arguments:
+  #   1) ID of scan
+  # returns: sorted list of tuples, in the format used by
+  #   addBulkNewRelationships(), or None if error
+  def getRelationshipsForScan(self, scan_id):
+    try:
+      rel = Relationship.__table__
+      query = select([rel.c.from_spdx_id, rel.c.relationship_type,
+        rel.c.to_spdx_id]).\
+        where(rel.c.scan_id == self._getDocumentScanID(scan_id))
+      return sorted(tuple(row) for row in
+        self.session.connection().execute(query))
+    except Exception as e:
+      print(f'Error getting relationships for scan {scan_id}: {str(e)}')
+      return None
+
+  # Get the relationships to and from an SPDX element in a scan.
+  # arguments:
+  #   1) ID of scan
+  #   2) SPDX ID of element
+  # returns: sorted list of tuples, in the format used by
+  #   addBulkNewRelationships(), or None if error
+  def getRelationshipsForElement(self, scan_id, spdx_id):
+    try:
+      rel = Relationship.__table__
+      query = select([rel.c.from_spdx_id, rel.c.relationship_type,
+        rel.c.to_spdx_id]).\
+        where(rel.c.scan_id == self._getDocumentScanID(scan_id)).\
+        where(or_(rel.c.from_spdx_id == spdx_id, rel.c.to_spdx_id == spdx_id))
+      return sorted(tuple(row) for row in
+        self.session.connection().execute(query))
+    except Exception as e:
+      print(f'Error getting relationships for {spdx_id} in scan {scan_id}: {str(e)}')
+      return None
+
+  # Get the SPDX elements that can be reached from an element, e.g. the
+  # files and packages a package contains or depends on, or that can reach
+  # an element, e.g. the packages containing a file.
+  # arguments:
+  #   1) ID of scan
+  #   2) SPDX ID of element
+  #   3) (optional) if True, get the elements that reach this one instead
+  # returns: list of tuples, sorted by depth and SPDX ID, in format:
+  #   (SPDX ID, element type, name, depth)
+  #   The element type and name are None for SPDX IDs that aren't elements
+  #   of the scan, e.g. in other documents. Returns None if error.
+  def _getClosureElements(self, scan_id, spdx_id, ancestors=False):
+    try:
+      scan_id = self._getDocumentScanID(scan_id)
+      rc = RelationshipClosure.__table__
+      el = SPDXElement.__table__
+      if ancestors:
+        (match, other) = (rc.c.descendant_spdx_id, rc.c.ancestor_spdx_id)
+      else:
+        (match, other) = (rc.c.ancestor_spdx_id, rc.c.descendant_spdx_id)
+      query = select([other, el.c.element_type, el.c.name, rc.c.depth]).\
+        select_from(rc.outerjoin(el, and_(el.c.scan_id == rc.c.scan_id,
+          el.c.spdx_id == other))).\
+        where(rc.c.scan_id == scan_id).\
+        where(match == spdx_id).\
+        order_by(rc.c.depth, other)
+      return [tuple(row) for row in self.session.connection().execute(query)]
+    except Exception as e:
+      print(f'Error getting related elements for {spdx_id} in scan {scan_id}: {str(e)}')
+      return None
+
+  # Get the SPDX elements that can be reached from an element, following
+  # the relationship types in CLOSURE_RELATIONSHIP_TYPES.
+  # arguments:
+  #   1) ID of scan
+  #   2) SPDX ID of element
+  # returns: see _getClosureElements()
+  def getReachableElements(self, scan_id, spdx_id):
+    return self._getClosureElements(scan_id, spdx_id)
+
+  # Get the SPDX elements that an element can be reached from, e.g. the
+  # packages and document containing a file.
+  # arguments:
+  #   1) ID of scan
+  #   2) SPDX ID of element
+  # returns: see _getClosureElements()
+  def getContainingElements(self, scan_id, spdx_id):
+    return self._getClosureElements(scan_id, spdx_id, True)
+
+  # Get every file that can be reached from an SPDX element, e.g. all files
+  # in a package and the packages it depends on, with their licenses.
+  # arguments:
+  #   1) ID of scan
+  #   2) SPDX ID of element
+  # returns: list of tuples, sorted by filename, in format:
+  #   (filename, license), or None if error
+  def getReachableFilesForElement(self, scan_id, spdx_id):
+    try:
+      scan_id = self._getDocumentScanID(scan_id)
+      rc = RelationshipClosure.__table__
+      el = SPDXElement.__table__
+      # written as a subquery rather than a join, so that SQLite looks up
+      # the element's descendants first, rather than reading all of the
+      # scan's elements
+      descendants = select([rc.c.descendant_spdx_id]).\
+        where(rc.c.scan_id == scan_id).\
+        where(rc.c.ancestor_spdx_id == spdx_id)
+      query = select([el.c.name, License.short_name]).\
+        select_from(el.join(License, el.c.license_id == License.id)).\
+        where(el.c.scan_id == scan_id).\
+        where(el.c.spdx_id.in_(descendants)).\
+        where(el.c.element_type == "FILE").\
+        order_by(el.c.name)
+      return [tuple(row) for row in self.session.connection().execute(query)]
+    except Exception as e:
+      print(f'Error getting reachable files for {spdx_id} in scan {scan_id}: {str(e)}')
+      return None
+
+  ########## SEARCH FUNCTIONS ##########
+
+  # Check whether the database has the files_fts full-text index over file
+  # paths. It is left out if the SQLite library didn't support it when the
+  # database was created or migrated.
+  # arguments: N/A
+  # returns: True if the index exists, False otherwise
+  def _hasFilesFTS(self):
+    # the index is over the main database's files table, which isn't used
+    # in the sharded layout
+    if self._getFileShardSize() is not None:
+      return False
+    def loader():
+      sql = "SELECT count(*) FROM sqlite_master WHERE name = 'files_fts'"
+      return self.session.execute(sql).scalar() > 0
+    return self._getCached("files_fts", loader)
+
+  # Search for files by path, across all scans or a given list of scans.
+  # The pattern is a GLOB pattern (e.g. "*/openssl/*"), matched against the
+  # full path and case-sensitive; a pattern without any of the wildcards
+  # "*", "?" or "[" matches any path containing it. Searches use the
+  # files_fts index where available.
+  # The matching file rows for every scan are read in one statement. A
+  # filename's effective row in a delta or alias scan is the one from the
+  # nearest scan in its chain, and every row for that filename also matches
+  # the pattern, so those scans are resolved from the same rows, without
+  # querying each scan separately.
+  # arguments:
+  #   1) pattern to search for
+  #   2) (optional) list of scan IDs to search; if None, search all scans
+  # returns: list of tuples, sorted by scan ID and filename, in format:
+  #   (scan ID, filename, license)
+  def searchFiles(self, pattern, scan_ids=None):
+    if not any(c in pattern for c in "*?["):
+      pattern = f"*{pattern}*"
+
+    # follow each scan's parents to get its chain, as _getScanChain() does
+    parents = dict(self.session.query(Scan.id, Scan.parent_scan_id))
+    if scan_ids is None:
+      scan_ids = list(parents.keys())
+    chains = {}
+    for scan_id in scan_ids:
+      if scan_id not in parents:
+        continue
+      chain = []
+      current_id = scan_id
+      while current_id is not None and current_id not in chain:
+        chain.append(current_id)
+        current_id = parents.get(current_id, None)
+      chains[scan_id] = chain
+    needed_ids = set(sid for chain in chains.values() for sid in chain)
+    if not needed_ids:
+      return []
+
+    files = File.__table__
+    if self._hasFilesFTS():
+      fts = Table('files_fts', MetaData(),
+        Column('rowid', Integer()),
+        Column('filename', String()),
+      )
+      matching_ids = select([fts.c.rowid]).\
+        where(fts.c.filename.op('GLOB')(pattern))
+      matching = files.c.id.in_(matching_ids)
+    else:
+      matching = files.c.filename.op('GLOB')(pattern)
+    query = select([files.c.scan_id, files.c.filename, files.c.removed,
+      License.short_name]).\
+      select_from(files.outerjoin(License,
+        files.c.license_id == License.id)).\
+      where(matching)
+    if len(needed_ids) < len(parents):
+      query = query.where(files.c.scan_id.in_(needed_ids))
+
+    # dict of scan ID => {filename => (removed, license)}
+    rows = {}
+    for (scan_id, filename, removed, license) in \
+      self.session.connection().execute(query):
+      rows.setdefault(scan_id, {})[filename] = (removed, license)
+
+    results = []
+    for scan_id, chain in chains.items():
+      # apply the oldest scan's rows first, so nearer scans' rows win
+      effective = {}
+      for chain_scan_id in reversed(chain):
+        effective.update(rows.get(chain_scan_id, {}))
+      for filename, (removed, license) in effective.items():
+        if not removed and license is not None:
+          results.append((scan_id, filename, license))
+    return sorted(results)
+
+  ########## DIRECTORY COUNT FUNCTIONS ##########
+
+  # Normalize a directory argument to the form stored in dir_license_counts:
+  # "" for the top level, or a path ending in "/".
+  # arguments:
+  #   1) directory path, with or without trailing slash
+  # returns: normalized directory path
+  def _normalizeDirectory(self, directory):
+    if directory and not directory.endswith("/"):
+      directory += "/"
+    return directory
+
+  # Delete a scan's directory license counts.
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _clearDirectoryCounts(self, scan_id):
+    dlc = DirLicenseCount.__table__
+    self.session.connection().execute(
+      dlc.delete().where(dlc.c.scan_id == scan_id))
+
+  # Build a scan's directory license counts: for each directory, and each
+  # license found in it, the number of files with that license in the
+  # directory and all of its descendants. The scan's files are read in one
+  # pass sorted by filename, so every directory's files are contiguous; a
+  # stack holds the counts for the directories containing the current file,
+  # and each directory's counts are written out and added to its parent's
+  # once the pass moves past it.
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _buildDirectoryCounts(self, scan_id):
+    dlc = DirLicenseCount.__table__
+    conn = self.session.connection()
+    self._clearDirectoryCounts(scan_id)
+
+    rows = []
+    # list of (directory, {license ID => count}) for the open directories
+    stack = []
+    def closeDirectory():
+      directory, counts = stack.pop()
+      for license_id, count in counts.items():
+        rows.append({'scan_id': scan_id, 'directory': directory,
+          'depth': len(stack), 'license_id': license_id,
+          'file_count': count})
+        if stack:
+          parent_counts = stack[-1][1]
+          parent_counts[license_id] = parent_counts.get(license_id, 0) + count
+
+    f = self._selectScanFiles(scan_id).alias('scan_files')
+    query = select([f.c.filename, f.c.license_id]).order_by(f.c.filename)
+    for (filename, license_id) in conn.execute(query):
+      directories = [""] + [filename[:i+1]
+        for i, c in enumerate(filename) if c == "/"]
+      common = 0
+      while (common < len(stack) and common < len(directories) and
+        stack[common][0] == directories[common]):
+        common += 1
+      while len(stack) > common:
+        closeDirectory()
+      for directory in directories[common:]:
+        stack.append((directory, {}))
+      counts = stack[-1][1]
+      counts[license_id] = counts.get(license_id, 0) + 1
+
+      if len(rows) >= STREAM_BATCH_SIZE:
+        conn.execute(dlc.insert(), rows)
+        rows = []
+    while stack:
+      closeDirectory()
+    if rows:
+      conn.execute(dlc.insert(), rows)
+
+  # Check whether a scan's directory license counts have been built. They
+  # are built on import, but not for scans imported before they existed, or
+  # after files have been added one at a time with addNewFile(); until
+  # rebuildDirectoryCounts() is run for those, the counts are taken from
+  # the scan's files instead.
+  # arguments:
+  #   1) ID of scan
+  # returns: True if the scan has counts, False otherwise
+  def _hasDirectoryCounts(self, scan_id):
+    return self.session.query(DirLicenseCount.id).\
+      filter(DirLicenseCount.scan_id == scan_id).first() is not None
+
+  # Get a query for the filenames and license names of a scan's files in a
+  # directory and its descendants, for use when its directory license
+  # counts haven't been built.
+  # arguments:
+  #   1) ID of scan
+  #   2) normalized directory path
+  # returns: query of (filename, license) rows
+  def _queryFilesUnderDirectory(self, scan_id, directory):
+    f = self._getScanFilesEntity(scan_id)
+    query = self.session.query(f.filename, License.short_name).\
+      select_from(f).\
+      join(License, f.license_id == License.id)
+    # every path under the prefix sorts in this range, so that the
+    # (scan_id, filename) index can be used
+    if directory:
+      query = query.filter(f.filename > directory).\
+        filter(f.filename < directory[:-1] + "0")
+    return query
+
+  # Rebuild the directory license counts for a list of scans.
+  # arguments:
+  #   1) (optional) list of scan IDs; if None, rebuilds them for all scans
+  #   2) commit: if True, commit updates at end
+  # returns: True if successful, False otherwise
+  def rebuildDirectoryCounts(self, scan_ids=None, commit=True):
+    try:
+      for scan_id in self._getExistingScanIDs(scan_ids):
+        self._buildDirectoryCounts(scan_id)
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error rebuilding directory counts: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  # Get license counts for all files in a directory and its descendants.
+  # arguments:
+  #   1) ID of scan
+  #   2) (optional) directory path, e.g. "drivers/net/"; if omitted, get
+  #      counts for the whole scan
+  # returns: dict of license => file count, or None if error
+  def getDirectoryLicenseCounts(self, scan_id, directory=""):
+    try:
+      directory = self._normalizeDirectory(directory)
+      if not self._hasDirectoryCounts(scan_id):
+        results = {}
+        for (filename, license) in \
+          self._queryFilesUnderDirectory(scan_id, directory):
+          results[license] = results.get(license, 0) + 1
+        return results
+      query = self.session.query(License.short_name,
+        DirLicenseCount.file_count).\
+        join(DirLicenseCount, DirLicenseCount.license_id == License.id).\
+        filter(DirLicenseCount.scan_id == scan_id).\
+        filter(DirLicenseCount.directory == directory)
+      return {q[0]: q[1] for q in query}
+    except Exception as e:
+      print(f'Error getting directory counts for scan {scan_id}: {str(e)}')
+      return None
+
+  # Get license counts for the subdirectories of a directory, down to a
+  # given number of levels, each including all of its own descendants.
+  # arguments:
+  #   1) ID of scan
+  #   2) (optional) directory path, e.g. "drivers/"; if omitted, start from
+  #      the top level of the scan
+  #   3) (optional) depth: number of levels of subdirectories to include
+  # returns: dict of directory => {license => file count}, or None if error
+  def getSubdirectoryLicenseCounts(self, scan_id, directory="", depth=1):
+    try:
+      directory = self._normalizeDirectory(directory)
+      base_depth = directory.count("/")
+      if not self._hasDirectoryCounts(scan_id):
+        results = {}
+        for (filename, license) in \
+          self._queryFilesUnderDirectory(scan_id, directory):
+          directories = [""] + [filename[:i+1]
+            for i, c in enumerate(filename) if c == "/"]
+          for subdir in directories[base_depth+1:base_depth+depth+1]:
+            counts = results.setdefault(subdir, {})
+            counts[license] = counts.get(license, 0) + 1
+        return {subdir: results[subdir] for subdir in sorted(results)}
+      query = self.session.query(DirLicenseCount.directory,
+        License.short_name, DirLicenseCount.file_count).\
+        join(License, DirLicenseCount.license_id == License.id).\
+        filter(DirLicenseCount.scan_id == scan_id).\
+        filter(DirLicenseCount.depth > base_depth).\
+        filter(DirLicenseCount.depth <= base_depth + depth).\
+        order_by(DirLicenseCount.directory)
+      # every directory under the prefix sorts in this range, so that the
+      # (scan_id, directory) index can be used
+      if directory:
+        query = query.filter(DirLicenseCount.directory > directory).\
+          filter(DirLicenseCount.directory < directory[:-1] + "0")
+      results = {}
+      for (subdir, license, count) in query:
+        results.setdefault(subdir, {})[license] = count
+      return results
+    except Exception as e:
+      print(f'Error getting subdirectory counts for scan {scan_id}: {str(e)}')
+      return None
+
+  ########## DIRECTORY HASH FUNCTIONS ##########
+
+  # Each directory in a scan has a Merkle hash over its contents: its files'
+  # names, license IDs and SHA1s, and its subdirectories' names and hashes,
+  # in sorted order. Two scans are identical if their top-level hashes are
+  # equal, and a comparison between two scans only needs to look at the
+  # files in directories whose hashes differ. MD5 and SHA256 values aren't
+  # included, and license IDs are specific to a database, so hashes can
+  # only be compared between scans in the same database.
+
+  # Delete a scan's directory hashes, along with its content digest.
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _clearDirectoryHashes(self, scan_id):
+    dh = DirHash.__table__
+    conn = self.session.connection()
+    conn.execute(dh.delete().where(dh.c.scan_id == scan_id))
+    conn.execute(Scan.__table__.update().\
+      where(Scan.__table__.c.id == scan_id).values(content_digest=None))
+
+  # Check whether a scan's directory hashes have been built. They are built
+  # on import, but not for scans imported before they existed, or after
+  # files have been added one at a time with addNewFile(); until
+  # rebuildDirectoryHashes() is run for those, the hashes are computed from
+  # the scan's files each time they are needed.
+  # arguments:
+  #   1) ID of scan
+  # returns: True if the scan has hashes, False otherwise
+  def _hasDirectoryHashes(self, scan_id):
+    return self.session.query(DirHash.id).\
+      filter(DirHash.scan_id == scan_id).first() is not None
+
+  # Compute a scan's directory hashes from its files; see hashDirectories().
+  # arguments:
+  #   1) ID of scan
+  # returns: iterator of (directory, parent directory, depth, hash,
+  #   files hash) tuples; raises exception on error
+  def _computeDirectoryHashes(self, scan_id):
+    f = self._selectScanFiles(scan_id).alias('scan_files')
+    query = select([f.c.filename, f.c.license_id, f.c.sha1]).\
+      order_by(f.c.filename, f.c.license_id, f.c.sha1)
+    return hashDirectories(self.session.connection().execute(query))
+
+  # Get a scan's directory hashes, from dir_hashes if they have been built
+  # or computed from its files otherwise.
+  # arguments:
+  #   1) ID of scan
+  # returns: dict of directory => (hash, files hash); raises exception on
+  #   error
+  def _getDirectoryHashMap(self, scan_id):
+    if not self._hasDirectoryHashes(scan_id):
+      return {directory: (dir_hash, files_hash)
+        for (directory, parent, depth, dir_hash, files_hash) in
+        self._computeDirectoryHashes(scan_id)}
+    dh = DirHash.__table__
+    query = select([dh.c.directory, dh.c.hash, dh.c.files_hash]).\
+      where(dh.c.scan_id == scan_id)
+    return {directory: (dir_hash, files_hash) for
+      (directory, dir_hash, files_hash) in
+      self.session.connection().execute(query)}
+
+  # Get the hash of a scan's top-level directory, from its directory hashes
+  # if they have been built or computed from its files otherwise.
+  # arguments:
+  #   1) ID of scan
+  # returns: hash string; raises exception on error
+  def _getRootDirectoryHash(self, scan_id):
+    if not self._hasDirectoryHashes(scan_id):
+      for (directory, parent, depth, dir_hash, files_hash) in \
+        self._computeDirectoryHashes(scan_id):
+        if directory == "":
+          return dir_hash
+      return EMPTY_SCAN_FINGERPRINT
+    dh = DirHash.__table__
+    root_hash = self.session.connection().execute(select([dh.c.hash]).\
+      where(dh.c.scan_id == scan_id).where(dh.c.directory == "")).scalar()
+    if root_hash is None:
+      return EMPTY_SCAN_FINGERPRINT
+    return root_hash
+
+  # Build a scan's directory hashes; see hashDirectories().
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _buildDirectoryHashes(self, scan_id):
+    dh = DirHash.__table__
+    conn = self.session.connection()
+    self._clearDirectoryHashes(scan_id)
+
+    rows = []
+    for (directory, parent, depth, dir_hash, files_hash) in \
+      self._computeDirectoryHashes(scan_id):
+      rows.append({'scan_id': scan_id, 'directory': directory,
+        'parent_directory': parent, 'depth': depth, 'hash': dir_hash,
+        'files_hash': files_hash})
+      if len(rows) >= STREAM_BATCH_SIZE:
+        conn.execute(dh.insert(), rows)
+        rows = []
+    if rows:
+      conn.execute(dh.insert(), rows)
+    # a scan's content digest is its fingerprint
+    conn.execute(Scan.__table__.update().\
+      where(Scan.__table__.c.id == scan_id).\
+      values(content_digest=self._getRootDirectoryHash(scan_id)))
+
+  # Rebuild the directory hashes, and with them the content digests, for a
+  # list of scans.
+  # arguments:
+  #   1) (optional) list of scan IDs; if None, rebuilds them for all scans
+  #   2) commit: if True, commit updates at end
+  # returns: True if successful, False otherwise
+  def rebuildDirectoryHashes(self, scan_ids=None, commit=True):
+    try:
+      for scan_id in self._getExistingScanIDs(scan_ids):
+        self._buildDirectoryHashes(scan_id)
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error rebuilding directory hashes: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  # Get the directories whose contents differ between two scans, including
+  # directories that are only in one of them. Hashes are compared from the
+  # top level down, and only the subdirectories of directories that differ
+  # are looked at, so the work done is proportional to the number of
+  # changed directories rather than the size of the scans.
+  # arguments:
+  #   1) ID of first scan
+  #   2) ID of second scan
+  #   3) (optional) max_directories: stop and return None once more than
+  #      this many changed directories have been found
+  #   4) (optional) files_only: if True, only return the directories
+  #      directly containing a file that was added, removed or changed
+  # returns: sorted list of directories; raises exception on error
+  def _getChangedDirectories(self, first_scan_id, second_scan_id,
+    max_directories=None, files_only=False):
+    # a directory that is missing from a scan has no files in it
+    missing = (None, EMPTY_SCAN_FINGERPRINT)
+    if not (self._hasDirectoryHashes(first_scan_id) and
+      self._hasDirectoryHashes(second_scan_id)):
+      # without stored hashes for both scans, compare all of their
+      # directories in memory; a directory can only differ if its parent
+      # does, so this finds the same ones
+      first = self._getDirectoryHashMap(first_scan_id)
+      second = self._getDirectoryHashMap(second_scan_id)
+      changed = []
+      for directory in set(first) | set(second):
+        first_h = first.get(directory, missing)
+        second_h = second.get(directory, missing)
+        if first_h[0] != second_h[0] and \
+          (not files_only or first_h[1] != second_h[1]):
+          changed.append(directory)
+      if max_directories is not None and len(changed) > max_directories:
+        return None
+      return sorted(changed)
+
+    dh = DirHash.__table__
+    conn = self.session.connection()
+
+    changed = []
+    # directories whose subdirectories are compared next; None stands for
+    # the parent of the top level
+    parents = [None]
+    while parents:
+      if parents == [None]:
+        condition = dh.c.parent_directory == None
+      else:
+        condition = dh.c.parent_directory.in_(parents)
+      query = select([dh.c.directory, dh.c.scan_id, dh.c.hash,
+        dh.c.files_hash]).\
+        where(dh.c.scan_id.in_([first_scan_id, second_scan_id])).\
+        where(condition)
+      hashes = {}
+      for (directory, scan_id, dir_hash, files_hash) in conn.execute(query):
+        hashes.setdefault(directory, {})[scan_id] = (dir_hash, files_hash)
+      parents = []
+      for directory, h in hashes.items():
+        first = h.get(first_scan_id, missing)
+        second = h.get(second_scan_id, missing)
+        if first[0] != second[0]:
+          parents.append(directory)
+          if not files_only or first[1] != second[1]:
+            changed.append(directory)
+      if max_directories is not None and len(changed) > max_directories:
+        return None
+    return sorted(changed)
+
+  # Get a condition selecting the files directly in a directory, i.e. not
+  # in its subdirectories. Other than for the top level, the condition is a
+  # range of filenames, so that the (scan_id, filename) index can be used.
+  # arguments:
+  #   1) File entity, as from _getScanFilesEntity()
+  #   2) directory, in the form stored in dir_hashes
+  # returns: SQL condition
+  def _filesInDirectory(self, f, directory):
+    if directory == "":
+      return f.depth == 0
+    return and_(f.filename > directory, f.filename < directory[:-1] + "0",
+      f.depth == directory.count("/"))
+
+  # Get a file entity's filename for use in a join condition against
+  # another scan's files. It is made into an expression, so that SQLite
+  # doesn't copy a _filesInDirectory() range on it over to the other scan's
+  # filename column; otherwise, it looks up each file in the other scan by
+  # scanning that whole range rather than by filename.
+  # arguments:
+  #   1) File entity, as from _getScanFilesEntity()
+  # returns: SQL expression
+  def _joinFilename(self, f):
+    return f.filename.concat("")
+
+  # Run a comparison query whose first column is a filename, either over
+  # all files or once for each of a list of changed directories. SQLite
+  # can't use an index for a condition matching any of several directories,
+  # so a query per directory is much faster when few directories changed.
+  # arguments:
+  #   1) query
+  #   2) File entity whose files the query should be limited to
+  #   3) list of directories, or None to run the query over all files
+  # returns: iterator of result rows, sorted by filename
+  def _runPerDirectory(self, query, f, directories):
+    if directories is None:
+      return query.order_by(f.filename).yield_per(STREAM_BATCH_SIZE)
+    rows = []
+    for directory in directories:
+      rows.extend(query.filter(self._filesInDirectory(f, directory)))
+    return sorted(rows, key=lambda row: row[0])
+
+  # Get a fingerprint for a scan's contents, i.e. the hash of its top-level
+  # directory. Scans with the same fingerprint have the same files, with the
+  # same licenses and SHA1s.
+  # arguments:
+  #   1) ID of scan
+  # returns: fingerprint string, or None if error
+  def getScanFingerprint(self, scan_id):
+    try:
+      return self._getRootDirectoryHash(scan_id)
+    except Exception as e:
+      print(f'Error getting fingerprint for scan {scan_id}: {str(e)}')
+      return None
+
+  # Check whether two scans have the same files, with the same licenses and
+  # SHA1s, by comparing their fingerprints.
+  # arguments:
+  #   1) ID of first scan
+  #   2) ID of second scan
+  # returns: True if identical, False if not, or None if error
+  def areScansIdentical(self, first_scan_id, second_scan_id):
+    first = self.getScanFingerprint(first_scan_id)
+    second = self.getScanFingerprint(second_scan_id)
+    if first is None or second is None:
+      return None
+    return first == second
+
+  # Get the directories whose contents differ between two scans: those
+  # directly containing a file that was added, removed or changed, and all
+  # of their parent directories.
+  # arguments:
+  #   1) ID of first scan
+  #   2) ID of second scan
+  # returns: sorted list of directories, or None if error
+  def getChangedDirectories(self, first_scan_id, second_scan_id):
+    try:
+      return self._getChangedDirectories(first_scan_id, second_scan_id)
+    except Exception as e:
+      print(f'Error comparing directories for scans {first_scan_id} and {second_scan_id}: {str(e)}')
+      return None
+
+  ########## PATH MEMBERSHIP FUNCTIONS ##########
+
+  # Each scan has a Bloom filter over its file paths, which can tell for
+  # certain that a path is not in the scan. To find which scans contain a
+  # path, the filters for all scans are checked in memory first, and only
+  # the scans whose filters might contain the path are queried. The filters
+  # are loaded from the scan_blooms table once, and then cached.
+
+  # Delete a scan's path filter.
+  # arguments:
+  #   1) ID of scan
+  # returns: N/A; raises exception on error
+  def _clearScanBloom(self, scan_id):
+    sb = ScanBloom.__table__
+    self.session.connection().execute(
+      sb.delete().where(sb.c.scan_id == scan_id))
+    with self._cacheLock():
+      self.cache.pop(("scan_bloom", scan_id), None)
+
+  # Build a scan's path filter, over the paths of its effective files.
+  # arguments:
+  #   1) ID of scan
+  # returns: SPBloomFilter; raises exception on error
+  def _buildScanBloom(self, scan_id):
+    conn = self.session.connection()
+    self._clearScanBloom(scan_id)
+    f = self._selectScanFiles(scan_id).alias('scan_files')
+    paths = [filename for (filename,) in conn.execute(select([f.c.filename]))]
+    bloom = SPBloomFilter.fromPaths(paths)
+    conn.execute(ScanBloom.__table__.insert().values(scan_id=scan_id,
+      num_paths=len(paths), num_bits=bloom.num_bits,
+      num_hashes=bloom.num_hashes, bits=bloom.getBytes()))
+    return bloom
+
+  # Rebuild the path filters for a list of scans.
+  # arguments:
+  #   1) (optional) list of scan IDs; if None, rebuilds them for all scans
+  #   2) commit: if True, commit updates at end
+  # returns: True if successful, False otherwise
+  def rebuildScanBlooms(self, scan_ids=None, commit=True):
+    try:
+      for scan_id in self._getExistingScanIDs(scan_ids):
+        self._buildScanBloom(scan_id)
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error rebuilding path filters: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  # Get the path filters for a list of scans, from the cache if possible.
+  # Scans imported before the filters existed, or with files added one at a
+  # time with addNewFile(), don't have one until rebuildScanBlooms() is run.
+  # arguments:
+  #   1) list of IDs of existing scans
+  # returns: dict of scan ID => SPBloomFilter, or None if the scan has no
+  #   filter; raises exception on error
+  def _getScanBlooms(self, scan_ids):
+    blooms = {}
+    missing = []
+    with self._cacheLock():
+      generation = self.cacheGeneration
+      for scan_id in scan_ids:
+        entry = self.cache.get(("scan_bloom", scan_id), None)
+        if entry is not None and entry[0] == generation:
+          blooms[scan_id] = entry[1]
+        else:
+          missing.append(scan_id)
+    if not missing:
+      return blooms
+
+    sb = ScanBloom.__table__
+    query = select([sb.c.scan_id, sb.c.num_bits, sb.c.num_hashes,
+      sb.c.bits]).where(sb.c.scan_id.in_(missing))
+    for (scan_id, num_bits, num_hashes, bits) in \
+      self.session.connection().execute(query):
+      blooms[scan_id] = SPBloomFilter(num_bits, num_hashes, bits)
+    with self._cacheLock():
+      for scan_id in missing:
+        blooms.setdefault(scan_id, None)
+        self.cache[("scan_bloom", scan_id)] = (generation, blooms[scan_id])
+    return blooms
+
+  # Check whether a path might be in a scan, using the scan's path filter,
+  # or with a query if the scan doesn't have one.
+  # arguments:
+  #   1) ID of scan
+  #   2) SPBloomFilter for the scan, or None
+  #   3) path
+  #   4) path hashes, from getPathHashes()
+  # returns: True if the path might be in the scan, False if it isn't;
+  #   raises exception on error
+  def _mightPathBeInScan(self, scan_id, bloom, filename, hashes):
+    if bloom is None:
+      return self._isPathInScan(scan_id, filename)
+    return bloom.mightContainHashes(hashes)
+
+  # Check with a query whether a path is in a scan.
+  # arguments:
+  #   1) ID of scan
+  #   2) path
+  # returns: True if the scan has a file with the path, False otherwise;
+  #   raises exception on error
+  def _isPathInScan(self, scan_id, filename):
+    f = self._selectScanFiles(scan_id).alias('scan_files')
+    query = select([f.c.id]).where(f.c.filename == filename).limit(1)
+    return self.session.connection().execute(query).first() is not None
+
+  # Get the existing scans out of a list of scan IDs.
+  # arguments:
+  #   1) list of scan IDs, or None for all scans
+  # returns: sorted list of scan IDs
+  def _getExistingScanIDs(self, scan_ids):
+    all_scan_ids = self.getScansIDList()
+    if scan_ids is None:
+      return all_scan_ids
+    wanted = set(scan_ids)
+    return [scan_id for scan_id in all_scan_ids if scan_id in wanted]
+
+  # Get the scans that might contain a path, using only their path filters,
+  # other than for scans without one, which are queried. This can include a
+  # few scans that don't actually contain the path, but never leaves out one
+  # that does.
+  # arguments:
+  #   1) path
+  #   2) (optional) list of scan IDs to check; if None, checks all scans
+  # returns: sorted list of scan IDs, or None if error
+  def getCandidateScansForPath(self, filename, scan_ids=None):
+    try:
+      scan_ids = self._getExistingScanIDs(scan_ids)
+      blooms = self._getScanBlooms(scan_ids)
+      hashes = getPathHashes(filename)
+      return [scan_id for scan_id in scan_ids
+        if self._mightPathBeInScan(scan_id, blooms[scan_id], filename, hashes)]
+    except Exception as e:
+      print(f'Error checking scans for path {filename}: {str(e)}')
+      return None
+
+  # Get the scans containing each of a list of paths.
+  # arguments:
+  #   1) list of paths
+  #   2) (optional) list of scan IDs to check; if None, checks all scans
+  # returns: dict of path => sorted list of IDs of scans containing it, or
+  #   None if error
+  def getScansContainingPaths(self, filenames, scan_ids=None):
+    try:
+      scan_ids = self._getExistingScanIDs(scan_ids)
+      blooms = self._getScanBlooms(scan_ids)
+      results = {}
+      for filename in filenames:
+        hashes = getPathHashes(filename)
+        results[filename] = [scan_id for scan_id in scan_ids
+          if (blooms[scan_id] is None or
+          blooms[scan_id].mightContainHashes(hashes)) and
+          self._isPathInScan(scan_id, filename)]
+      return results
+    except Exception as e:
+      print(f'Error finding scans containing paths: {str(e)}')
+      return None
+
+  # Get the scans containing a path.
+  # arguments:
+  #   1) path
+  #   2) (optional) list of scan IDs to check; if None, checks all scans
+  # returns: sorted list of scan IDs, or None if error
+  def getScansContainingPath(self, filename, scan_ids=None):
+    results = self.getScansContainingPaths([filename], scan_ids)
+    if results is None:
+      return None
+    return results[filename]
+
+  # Check whether a path is new in a scan, i.e. it is in the scan but not in
+  # any earlier scan.
+  # arguments:
+  #   1) path
+  #   2) ID of scan
+  # returns: True if new, False if not, or None if error
+  def isPathNewInScan(self, filename, scan_id):
+    earlier_scan_ids = [s for s in self.getScansIDList() if s <= scan_id]
+    found = self.getScansContainingPath(filename, earlier_scan_ids)
+    if found is None:
+      return None
+    return found == [scan_id]
+
+  ########## PATH HISTORY FUNCTIONS ##########
+
+  # The path_history table is a change log for every path across all scans,
+  # in scan ID order: a path has a row for a scan only where it was added,
+  # removed, or had a different license or SHA1 than in the previous scan
+  # with files. Scans with no files (e.g. ones that haven't been imported
+  # yet) are skipped. Because each scan's rows depend only on it and the
+  # scan before it, adding or deleting a scan only requires the rows for
+  # that scan and the one after it to be rebuilt.
+
+  # Check whether a scan has any files.
+  # arguments:
+  #   1) ID of scan
+  # returns: True if it has at least one file, False otherwise
+  def _scanHasFiles(self, scan_id):
+    f = self._getScanFilesEntity(scan_id)
+    return self.session.query(f.id).first() is not None
+
+  # Find the nearest scan before or after a given scan that has files.
+  # arguments:
+  #   1) ID of scan
+  #   2) direction: -1 to look at earlier scans, 1 to look at later ones
+  # returns: ID of scan, or None if there isn't one
+  def _getAdjacentScanWithFiles(self, scan_id, direction):
+    query = self.session.query(Scan.id)
+    if direction < 0:
+      query = query.filter(Scan.id < scan_id).order_by(Scan.id.desc())
+    else:
+      query = query.filter(Scan.id > scan_id).order_by(Scan.id)
+    for (other_id,) in query.all():
+      if self._scanHasFiles(other_id):
+        return other_id
+    return None
+
+  # Get the nearest scans before and after a given scan that have files.
+  # Finding them checks each scan in turn, so they are cached; adding files
+  # to a scan that already has some doesn't change them, and anything else
+  # that changes which scans have files calls _clearAdjacentScans().
+  # arguments:
+  #   1) ID of scan
+  # returns: tuple of (ID of previous scan, ID of next scan), either of
+  #   which may be None
+  def _getAdjacentScansWithFiles(self, scan_id):
+    return self._getCached(("adjacent_scans", scan_id),
+      lambda: (self._getAdjacentScanWithFiles(scan_id, -1),
+        self._getAdjacentScanWithFiles(scan_id, 1)))
+
+  # Drop the cached adjacent scans for all scans.
+  # arguments: N/A
+  # returns: N/A
+  def _clearAdjacentScans(self):
+    with self._cacheLock():
+      for key in list(self.cache):
+        if isinstance(key, tuple) and key[0] == "adjacent_scans":
+          self.cache.pop(key, None)
+
+  # Check whether there are any rows in the path history.
+  # arguments: N/A
+  # returns: True if path_history has any rows, False otherwise
+  def _hasPathHistory(self):
+    return self.session.query(PathHistory.id).first() is not None
+
+  # Check whether any scan has files.
+  # arguments:
+  #   1) (optional) ID of scan to leave out
+  # returns: True if a scan has files, False otherwise
+  def _anyScanHasFiles(self, exclude_scan_id=None):
+    return any(self._scanHasFiles(scan_id)
+      for scan_id in self.getScansIDList() if scan_id != exclude_scan_id)
+
+  # Make sure the path history has been built before it is queried. It is
+  # maintained as files are added, so it is only missing for databases with
+  # scans imported before it existed, until rebuildPathHistory() is run.
+  # The first scan with files always has rows, so the history is missing if
+  # it has no rows but there are files.
+  # arguments: N/A
+  # returns: N/A; raises exception if it hasn't been built
+  def _checkPathHistory(self):
+    if not self._hasPathHistory() and self._anyScanHasFiles():
+      raise RuntimeError("path history hasn't been built; " +
+        "run rebuildPathHistory() first")
+
+  # Build a scan's path history rows, by comparing its files against those
+  # of the previous scan with files.
+  # arguments:
+  #   1) ID of scan
+  #   2) ID of previous scan with files, or None if it is the first
+  # returns: N/A; raises exception on error
+  def _buildPathHistory(self, scan_id, prev_scan_id):
+    ph = PathHistory.__table__
+    conn = self.session.connection()
+    conn.execute(ph.delete().where(ph.c.scan_id == scan_id))
+
+    columns = ['filename', 'scan_id', 'license_id', 'sha1']
+    cur = self._selectScanFiles(scan_id).alias('cur_files')
+    added_or_changed = select([cur.c.filename, literal(scan_id, Integer()),
+      cur.c.license_id, cur.c.sha1])
+    if prev_scan_id is not None:
+      prev = self._selectScanFiles(prev_scan_id).alias('prev_files')
+      added_or_changed = added_or_changed.\
+        select_from(cur.outerjoin(prev, prev.c.filename == cur.c.filename)).\
+        where(or_(
+          prev.c.id == None,
+          prev.c.license_id != cur.c.license_id,
+          func.coalesce(prev.c.sha1, '') != func.coalesce(cur.c.sha1, '')
+        ))
+    conn.execute(ph.insert().from_select(columns, added_or_changed))
+
+    if prev_scan_id is not None:
+      removed = select([prev.c.filename, literal(scan_id, Integer()),
+        null(), null()]).\
+        where(~exists().where(cur.c.filename == prev.c.filename))
+      conn.execute(ph.insert().from_select(columns, removed))
+
+  # Look up a path's license and SHA1 in a scan, by checking each scan in
+  # its delta chain for a row with the path in turn. For a single path, this
+  # is much cheaper than building a query over the scan's effective files.
+  # arguments:
+  #   1) ID of scan
+  #   2) filename
+  # returns: tuple of (license ID, SHA1), or None if the path isn't in the
+  #   scan; raises exception on error
+  def _getPathInScan(self, scan_id, filename):
+    conn = self.session.connection()
+    for chain_scan_id in self._getScanChain(scan_id):
+      files = self._getFilesTable([chain_scan_id])
+      row = conn.execute(select([files.c.license_id, files.c.sha1,
+        files.c.removed]).\
+        where(files.c.scan_id == chain_scan_id).\
+        where(files.c.filename == filename).limit(1)).first()
+      if row is not None:
+        return None if row[2] else (row[0], row[1])
+    return None
+
+  # Rebuild a single path's history row for a scan, by comparing it against
+  # the previous scan with files, in the same way as _buildPathHistory().
+  # arguments:
+  #   1) ID of scan
+  #   2) ID of previous scan with files, or None if it is the first
+  #   3) filename
+  # returns: N/A; raises exception on error
+  def _buildPathHistoryForPath(self, scan_id, prev_scan_id, filename):
+    ph = PathHistory.__table__
+    conn = self.session.connection()
+    conn.execute(ph.delete().where(ph.c.scan_id == scan_id).\
+      where(ph.c.filename == filename))
+
+    cur = self._getPathInScan(scan_id, filename)
+    prev = None
+    if prev_scan_id is not None:
+      prev = self._getPathInScan(prev_scan_id, filename)
+    if cur is not None:
+      if prev is None or prev[0] != cur[0] or \
+        (prev[1] or '') != (cur[1] or ''):
+        conn.execute(ph.insert().values(filename=filename, scan_id=scan_id,
+          license_id=cur[0], sha1=cur[1]))
+    elif prev is not None:
+      conn.execute(ph.insert().values(filename=filename, scan_id=scan_id,
+        license_id=None, sha1=None))
+
+  # Update the path history after files have been added to a scan. The
+  # scan's own rows and those of the next scan with files are rebuilt. If
+  # the history hasn't been built yet for the other scans, nothing is done
+  # here; see _checkPathHistory().
+  # arguments:
+  #   1) ID of scan
+  #   2) (optional) filename: if given, only this path was added
+  # returns: N/A; raises exception on error
+  def _updatePathHistory(self, scan_id, filename=None):
+    if not self._hasPathHistory():
+      if self._anyScanHasFiles(scan_id):
+        return
+      # this is the first scan with files, so all of its paths are added
+      filename = None
+    if filename is not None:
+      # if this is the scan's first file, the scan didn't take part in the
+      # history before, so all of its paths and the next scan's change
+      f = self._getScanFilesEntity(scan_id)
+      if self.session.query(f.id).filter(f.filename != filename).first() is None:
+        filename = None
+    if filename is None:
+      # the scan may not have had files before, so it may now be adjacent
+      # to other scans
+      self._clearAdjacentScans()
+    (prev_scan_id, next_scan_id) = self._getAdjacentScansWithFiles(scan_id)
+    if filename is None:
+      self._buildPathHistory(scan_id, prev_scan_id)
+      if next_scan_id is not None:
+        self._buildPathHistory(next_scan_id, scan_id)
+    else:
+      self._buildPathHistoryForPath(scan_id, prev_scan_id, filename)
+      if next_scan_id is not None:
+        self._buildPathHistoryForPath(next_scan_id, scan_id, filename)
+
+  # Rebuild the path history for all scans.
+  # arguments:
+  #   1) commit: if True, commit updates at end
+  # returns: True if successful, False otherwise
+  def rebuildPathHistory(self, commit=True):
+    try:
+      self.session.connection().execute(PathHistory.__table__.delete())
+      prev_scan_id = None
+      for scan_id in self.getScansIDList():
+        if self._scanHasFiles(scan_id):
+          self._buildPathHistory(scan_id, prev_scan_id)
+          prev_scan_id = scan_id
+      if commit:
+        self.session.commit()
+      else:
+        self.session.flush()
+      return True
+    except Exception as e:
+      print(f'Error rebuilding path history: {str(e)}')
+      self.rollbackChanges()
+      return False
+
+  # Get a query for path history rows, with license names, ordered by path
+  # and then by scan.
+  # arguments: N/A
+  # returns: query of (filename, scan ID, license, SHA1) rows
+  def _queryPathHistory(self):
+    return self.session.query(PathHistory.filename, PathHistory.scan_id,
+      License.short_name, PathHistory.sha1).\
+      outerjoin(License, PathHistory.license_id == License.id).\
+      order_by(PathHistory.filename, PathHistory.scan_id)
+
+  # Get the timeline of a path across all scans: one entry for each scan
+  # where it was added, removed, or had a different license or SHA1 than in
+  # the previous scan with files.
+  # arguments:
+  #   1) filename
+  # returns: list of (scan ID, license, SHA1) tuples in scan order, where
+  #   license and SHA1 are None if the path was removed in that scan; or
+  #   None if error
+  def getPathHistory(self, filename):
+    try:
+      self._checkPathHistory()
+      query = self._queryPathHistory().\
+        filter(PathHistory.filename == filename)
+      return [(q[1], q[2], q[3]) for q in query]
+    except Exception as e:
+      print(f'Error getting path history for {filename}: {str(e)}')
+      return None
+
+  # Get the timelines of all paths in a directory and its descendants, in
+  # one query. See getPathHistory() for the format of each timeline.
+  # arguments:
+  #   1) (optional) directory path, e.g. "drivers/net/"; if omitted, get
+  #      timelines for every path
+  # returns: dict of filename => list of (scan ID, license, SHA1) tuples, or
+  #   None if error
+  def getSubtreePathHistory(self, directory=""):
+    try:
+      self._checkPathHistory()
+      results = {}
+      for (filename, scan_id, license, sha1) in \
+        self._querySubtreePathHistory(directory):
+        results.setdefault(filename, []).append((scan_id, license, sha1))
+      return results
+    except Exception as e:
+      print(f'Error getting path history for {directory}: {str(e)}')
+      return None
+
+  # Get a query for the path history rows of all paths in a directory and
+  # its descendants, in the order used by _queryPathHistory().
+  # arguments:
+  #   1) directory path; "" for every path
+  # returns: query of (filename, scan ID, license, SHA1) rows, loaded
+  #   STREAM_BATCH_SIZE at a time
+  def _querySubtreePathHistory(self, directory):
+    directory = self._normalizeDirectory(directory)
+    query = self._queryPathHistory()
+    # every path under the prefix sorts in this range, so that the
+    # (filename, scan_id) index can be used
+    if directory:
+      query = query.filter(PathHistory.filename > directory).\
+        filter(PathHistory.filename < directory[:-1] + "0")
+    return query.yield_per(STREAM_BATCH_SIZE)
+
+  # Get the first scan in which a path was present.
+  # arguments:
+  #   1) filename
+  # returns: scan ID, or None if the path isn't in any scan or if error
+  def getPathFirstSeen(self, filename):
+    try:
+      self._checkPathHistory()
+      return self.session.query(func.min(PathHistory.scan_id)).\
+        filter(PathHistory.filename == filename).\
+        filter(PathHistory.license_id != None).scalar()
+    except Exception as e:
+      print(f'Error getting first scan for {filename}: {str(e)}')
+      return None
+
+  # Get the last scan in which a path was added, removed, or had its
+  # license or SHA1 change.
+  # arguments:
+  #   1) filename
+  # returns: scan ID, or None if the path isn't in any scan or if error
+  def getPathLastChanged(self, filename):
+    try:
+      self._checkPathHistory()
+      return self.session.query(func.max(PathHistory.scan_id)).\
+        filter(PathHistory.filename == filename).scalar()
+    except Exception as e:
+      print(f'Error getting last change for {filename}: {str(e)}')
+      return None
+
+  # Find paths whose license "flapped": changed to a different license and
+  # then later back to one it had before. Removals and SHA1-only changes
+  # are ignored.
+  # arguments:
+  #   1) (optional) directory path; if omitted, check every path
+  # returns: dict of filename => list of its licenses, in scan order with
+  #   repeats collapsed; or None if error
+  def getFlappedPaths(self, directory=""):
+    try:
+      self._checkPathHistory()
+      results = {}
+      current_filename = None
+      licenses = []
+      def checkPath():
+        if len(set(licenses)) < len(licenses):
+          results[current_filename] = licenses
+      for (filename, scan_id, license, sha1) in \
+        self._querySubtreePathHistory(directory):
+        if filename != current_filename:
+          checkPath()
+          current_filename = filename
+          licenses = []
+        if license is not None and (not licenses or licenses[-1] != license):
+          licenses.append(license)
+      checkPath()
+      return results
+    except Exception as e:
+      print(f'Error getting flapped paths for {directory}: {str(e)}')
+      return None
+
+  ########## CONFIG DATA FUNCTIONS ##########
+
+  # Get all key/value pairs from the config table, including those specific
+  # to spdxSummarizer (e.g. "magic", "version", etc.)
+  # arguments: N/A
+  # returns: a dict with all of the key/value pairs
+  def getConfigData(self):
+    return dict(self._getCachedConfigData())
+
+  # Get the cached dict of all key/value pairs from the config table. The
+  # returned dict must not be modified.
+  # arguments: N/A
+  # returns: a dict with all of the key/value pairs
+  def _getCachedConfigData(self):
+    def loader():
+      query = QUERY_BAKERY(lambda s: s.query(Config.key, Config.value))
+      return {key: value for (key, value) in query(self._getSession())}
+    return self._getCached("config", loader)
+
+  # Get all key/value pairs from the config table, _excluding_ those specific
+  # to spdxSummarizer (e.g. "magic", "version", etc.)
+  # arguments: N/A
+  # returns: a dict with all of the key/value pairs
+  def getConfigurableConfigData(self):
+    configDict = self.getConfigData()
+    for k in self.internal_configs:
+      try:
+        del configDict[k]
+      except KeyError:
+        pass
+    return configDict
+
+  # Get a value for a specific config key.
+  # arguments:
+  #   1) key string
+  # returns: value for key if found, or None otherwise
+  def getConfigForKey(self, key):
+    return self._getCachedConfigData().get(key, None)
 
   # Set or update a config value.
   # Note: May not update core spdxSummarizer config values (magic, version or
@@ -681,6 +4085,7 @@ class SPDatabase(object):
       except AttributeError:
         config = Config(key=key, value=value)
         self.session.add(config)
+      self.invalidateCache()
       if commit:
         self.session.commit()
       else:
@@ -0,0 +1,473 @@
+# federation.py
+#
+# This module contains the SPFederation class, for running read-only
+# queries across many spdxSummarizer databases at once, such as one
+# database per product.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, func, literal, select, \
+  union_all, Table, Column, Integer, String, Boolean, MetaData
+
+from spdxSummarizer.dbtools import getFileShardFilename, getFileShardIndex, \
+  selectScanChainFiles, SHARD_SIZE_CONFIG_KEY
+from spdxSummarizer.spconfig import (compareVersionToCurrent,
+  compareVersionToLastDatabaseChange)
+
+# number of databases SQLite allows to be attached to one connection, if
+# the sqlite3 module can't tell us (SQLITE_MAX_ATTACHED's default)
+DEFAULT_MAX_ATTACHED = 10
+
+# number of worker threads running queries on the groups of databases
+DEFAULT_MAX_WORKERS = 4
+
+# Get the maximum number of databases that can be attached to a connection.
+# arguments: N/A
+# returns: number of databases
+def getMaxAttached():
+  conn = sqlite3.connect(":memory:")
+  try:
+    if hasattr(conn, "getlimit"):
+      return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    return DEFAULT_MAX_ATTACHED
+  finally:
+    conn.close()
+
+# The databases are split into groups of no more than max_attached, and each
+# group is attached to the connections of its own in-memory engine. A query
+# is run as one UNION ALL statement for each group, with the groups' queries
+# run in parallel on a pool of worker threads; each thread has its own
+# connection for each engine. The connections are set to query_only, so the
+# databases can't be changed through the federation.
+#
+# IDs for scans, licenses and categories are different in each database, so
+# each database's rows are joined to its own licenses and categories, and
+# results are returned using license and category names.
+#
+# For a database using the sharded layout, its files shards are attached
+# along with it, and count towards its group's limit; a temporary view over
+# them takes the place of its files table.
+class SPFederation(object):
+  def __init__(self, db_filenames, max_attached=None,
+    max_workers=DEFAULT_MAX_WORKERS):
+    super(SPFederation, self).__init__()
+    self.db_filenames = list(db_filenames)
+    self.max_attached = max_attached or getMaxAttached()
+    self.max_workers = max_workers
+    # list of lists of (schema name, database filename) for each group
+    self.groups = []
+    # schema name => database filename
+    self.schemas = {}
+    # engine for each group
+    self.engines = []
+    # database filename => list of files shard filenames, for sharded
+    # databases
+    self.shards = {}
+    self.executor = None
+
+  ########## OPENING AND CLOSING ##########
+
+  # Set up the groups of databases, and check that each one is an
+  # spdxSummarizer database that doesn't need to be migrated.
+  # arguments: N/A
+  # returns: True if all databases can be used, False otherwise
+  def open(self):
+    for db_filename in self.db_filenames:
+      if not os.path.exists(db_filename):
+        print(f"No file found at {db_filename}.")
+        return False
+
+    self.shards = {}
+    self._createGroups()
+    self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    try:
+      configs = self._runQuery(self._selectConfig)
+    except Exception as e:
+      print(f"Error opening databases: {str(e)}")
+      self.close()
+      return False
+    ok = True
+    versions = {}
+    for (db_filename, key, value) in configs:
+      versions.setdefault(db_filename, {})[key] = value
+    for db_filename in self.db_filenames:
+      config = versions.get(db_filename, {})
+      if config.get("magic") != "spdxSummarizer":
+        print(f"Couldn't load magic number from {db_filename}.")
+        ok = False
+      elif compareVersionToLastDatabaseChange(config.get("version")) < 0:
+        print(f"{db_filename} needs to be migrated before it can be used.")
+        ok = False
+      elif compareVersionToCurrent(config.get("version")) > 0:
+        print(f"{db_filename} is from a newer version of spdxSummarizer.")
+        ok = False
+    if ok:
+      ok = self._findShards(versions)
+    if not ok:
+      self.close()
+      return False
+    if self.shards:
+      # regroup, now that the sharded databases' shards are known
+      for engine in self.engines:
+        engine.dispose()
+      self._createGroups()
+    return True
+
+  # Close all connections and stop the worker threads.
+  # arguments: N/A
+  # returns: N/A
+  def close(self):
+    if self.executor is not None:
+      self.executor.shutdown()
+      self.executor = None
+    for engine in self.engines:
+      engine.dispose()
+    self.engines = []
+    self.groups = []
+    self.schemas = {}
+    self.shards = {}
+
+  # Split the databases into groups, each with no more than max_attached
+  # databases and files shards, and create each group's engine.
+  # arguments: N/A
+  # returns: N/A
+  def _createGroups(self):
+    self.groups = []
+    self.schemas = {}
+    group = []
+    num_attached = 0
+    for i, db_filename in enumerate(self.db_filenames):
+      weight = 1 + len(self.shards.get(db_filename, []))
+      if group and num_attached + weight > self.max_attached:
+        self.groups.append(group)
+        group = []
+        num_attached = 0
+      schema = f"db{i}"
+      group.append((schema, db_filename))
+      self.schemas[schema] = db_filename
+      num_attached += weight
+    if group:
+      self.groups.append(group)
+    self.engines = [self._createGroupEngine(group) for group in self.groups]
+
+  # Find the files shards of the databases using the sharded layout: those
+  # holding the files of the databases' existing scans.
+  # arguments:
+  #   1) dict of database filename => {config key => value}, including the
+  #      files shard size for sharded databases
+  # returns: True if every database can be attached along with its shards,
+  #   False otherwise
+  def _findShards(self, configs):
+    shard_sizes = {}
+    for db_filename, config in configs.items():
+      if config.get(SHARD_SIZE_CONFIG_KEY) is not None:
+        shard_sizes[db_filename] = int(config[SHARD_SIZE_CONFIG_KEY])
+    if not shard_sizes:
+      return True
+
+    def selectScanIDs(schema, db_filename):
+      if db_filename not in shard_sizes:
+        return None
+      scans = self._getScansTable(schema)
+      return select([literal(db_filename), scans.c.id])
+    try:
+      rows = self._runQuery(selectScanIDs)
+    except Exception as e:
+      print(f"Error finding files shards: {str(e)}")
+      return False
+    shard_indexes = {db_filename: set() for db_filename in shard_sizes}
+    for (db_filename, scan_id) in rows:
+      shard_indexes[db_filename].add(
+        getFileShardIndex(scan_id, shard_sizes[db_filename]))
+
+    ok = True
+    for db_filename, indexes in shard_indexes.items():
+      shard_filenames = [getFileShardFilename(db_filename, shard_index)
+        for shard_index in sorted(indexes)]
+      for shard_filename in shard_filenames:
+        if not os.path.exists(shard_filename):
+          print(f"No files shard found at {shard_filename}.")
+          ok = False
+      if 1 + len(shard_filenames) > self.max_attached:
+        print(f"{db_filename} has {len(shard_filenames)} files shards, but only {self.max_attached - 1} can be attached along with it.")
+        ok = False
+      self.shards[db_filename] = shard_filenames
+    return ok
+
+  ########## QUERY FUNCTIONS ##########
+
+  # Get the latest scan in each database, i.e. the scan with the highest ID.
+  # arguments: N/A
+  # returns: dict of database filename => (scan ID, scan date, description)
+  #   for databases with any scans, or None if error
+  def getLatestScans(self):
+    try:
+      return {r[0]: (r[1], r[2], r[3]) for r in
+        self._runQuery(self._selectLatestScans)}
+    except Exception as e:
+      print(f"Error getting latest scans: {str(e)}")
+      return None
+
+  # Get all files with a given license in the latest scan of every database.
+  # arguments:
+  #   1) license name
+  #   2) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: sorted list of (database filename, scan ID, filename), or None
+  #   if error
+  def getFilesWithLicense(self, license_name, exclude_git=True):
+    def selectFiles(schema, db_filename, chain):
+      files, licenses, categories = self._getTables(schema)
+      f = selectScanChainFiles(files, chain[0], chain).alias()
+      sel = select([literal(db_filename), f.c.scan_id, f.c.filename]).\
+        select_from(f.join(licenses, licenses.c.id == f.c.license_id)).\
+        where(licenses.c.short_name == license_name)
+      if exclude_git:
+        sel = sel.where(f.c.is_git == False)
+      return sel
+    try:
+      return sorted(self._runQuery(self._latestScanQuery(selectFiles)))
+    except Exception as e:
+      print(f"Error getting files with license {license_name}: {str(e)}")
+      return None
+
+  # Get the number of files with each license in the latest scan of every
+  # database.
+  # arguments:
+  #   1) (optional) if True, exclude files in any /.git/ subdirectory
+  # returns: dict of license => {database filename => count}, or None if
+  #   error
+  def getLicenseCounts(self, exclude_git=True):
+    def selectCounts(schema, db_filename, chain):
+      files, licenses, categories = self._getTables(schema)
+      f = selectScanChainFiles(files, chain[0], chain).alias()
+      sel = select([literal(db_filename), licenses.c.short_name,
+        func.count()]).\
+        select_from(f.join(licenses, licenses.c.id == f.c.license_id))
+      if exclude_git:
+        sel = sel.where(f.c.is_git == False)
+      return sel.group_by(licenses.c.short_name)
+    try:
+      results = {}
+      for (db_filename, license, count) in \
+        self._runQuery(self._latestScanQuery(selectCounts)):
+        results.setdefault(license, {})[db_filename] = count
+      return results
+    except Exception as e:
+      print(f"Error getting license counts: {str(e)}")
+      return None
+
+  # Get the category each license is in, in each database. Licenses can be
+  # categorized differently in different databases; any license with more
+  # than one category here is one of those.
+  # arguments: N/A
+  # returns: dict of license => {category => sorted list of database
+  #   filenames}, or None if error
+  def getLicenseCategories(self):
+    def selectCategories(schema, db_filename):
+      files, licenses, categories = self._getTables(schema)
+      return select([literal(db_filename), licenses.c.short_name,
+        categories.c.name]).\
+        select_from(licenses.join(categories,
+          categories.c.id == licenses.c.category_id))
+    try:
+      results = {}
+      for (db_filename, license, category) in \
+        sorted(self._runQuery(selectCategories)):
+        dbs = results.setdefault(license, {}).setdefault(category, [])
+        if db_filename not in dbs:
+          dbs.append(db_filename)
+      return results
+    except Exception as e:
+      print(f"Error getting license categories: {str(e)}")
+      return None
+
+  ########## HELPER FUNCTIONS ##########
+
+  # Create the engine for a group of databases. Every connection it opens
+  # has the group's databases and their files shards attached, and is set
+  # to query_only.
+  # arguments:
+  #   1) list of (schema name, database filename)
+  # returns: engine
+  def _createGroupEngine(self, group):
+    # each worker thread gets its own connection; they are only closed from
+    # another thread, by close()
+    engine = create_engine("sqlite://",
+      connect_args={"check_same_thread": False})
+    @event.listens_for(engine, "connect")
+    def attachDatabases(dbapi_conn, connection_record):
+      for (schema, db_filename) in group:
+        dbapi_conn.execute(f"ATTACH DATABASE ? AS {schema}", (db_filename,))
+        shard_schemas = []
+        for i, shard_filename in enumerate(self.shards.get(db_filename, [])):
+          shard_schema = f"{schema}_shard{i}"
+          dbapi_conn.execute(f"ATTACH DATABASE ? AS {shard_schema}",
+            (shard_filename,))
+          shard_schemas.append(shard_schema)
+        if db_filename in self.shards:
+          columns = ", ".join(c.name for c in self._getTables(schema)[0].c)
+          selects = [f"SELECT {columns} FROM {shard_schema}.files"
+            for shard_schema in shard_schemas]
+          if not selects:
+            selects = [f"SELECT {columns} FROM {schema}.files"]
+          dbapi_conn.execute(f"CREATE TEMP VIEW {schema}_files AS " +
+            " UNION ALL ".join(selects))
+      dbapi_conn.execute("PRAGMA query_only = ON")
+    return engine
+
+  # Get the tables needed for federated queries, in an attached database.
+  # For a sharded database, the files table is the view over its shards.
+  # arguments:
+  #   1) schema name of attached database
+  # returns: tuple of (files, licenses, categories) tables
+  def _getTables(self, schema):
+    metadata = MetaData(schema=schema)
+    files_columns = [
+      Column('id', Integer(), primary_key=True),
+      Column('scan_id', Integer()),
+      Column('filename', String()),
+      Column('license_id', Integer()),
+      Column('is_git', Boolean(create_constraint=False)),
+      Column('removed', Boolean(create_constraint=False)),
+    ]
+    if self._isSharded(schema):
+      files = Table(f'{schema}_files', MetaData(), *files_columns)
+    else:
+      files = Table('files', metadata, *files_columns)
+    licenses = Table('licenses', metadata,
+      Column('id', Integer(), primary_key=True),
+      Column('short_name', String()),
+      Column('category_id', Integer()),
+    )
+    categories = Table('categories', metadata,
+      Column('id', Integer(), primary_key=True),
+      Column('name', String()),
+    )
+    return (files, licenses, categories)
+
+  # Check whether an attached database uses the sharded layout.
+  # arguments:
+  #   1) schema name of attached database
+  # returns: True if sharded, False otherwise
+  def _isSharded(self, schema):
+    return self.schemas[schema] in self.shards
+
+  # Get the scans table in an attached database.
+  # arguments:
+  #   1) schema name of attached database
+  # returns: Table
+  def _getScansTable(self, schema):
+    return Table('scans', MetaData(schema=schema),
+      Column('id', Integer(), primary_key=True),
+      Column('scan_dt', String()),
+      Column('desc', String()),
+      Column('parent_scan_id', Integer()),
+    )
+
+  # Get a select statement for the config values needed to check that an
+  # attached database can be used, and whether it is sharded.
+  # arguments:
+  #   1) schema name of attached database
+  #   2) database filename
+  # returns: select statement for (database filename, key, value) rows
+  def _selectConfig(self, schema, db_filename):
+    config = Table('config', MetaData(schema=schema),
+      Column('key', String(), primary_key=True),
+      Column('value', String()),
+    )
+    return select([literal(db_filename), config.c.key, config.c.value]).\
+      where(config.c.key.in_(["magic", "version", SHARD_SIZE_CONFIG_KEY]))
+
+  # Get a select statement for the latest scan in an attached database, i.e.
+  # the scan with the highest ID. Delta and alias scans may not have any
+  # file rows of their own, so this looks at the scans table rather than at
+  # the files.
+  # arguments:
+  #   1) schema name of attached database
+  #   2) database filename
+  # returns: select statement for a (database filename, scan ID, scan date,
+  #   description) row, if the database has any scans
+  def _selectLatestScans(self, schema, db_filename):
+    scans = self._getScansTable(schema)
+    return select([literal(db_filename), scans.c.id, scans.c.scan_dt,
+      scans.c.desc]).\
+      where(scans.c.id == select([func.max(scans.c.id)]).as_scalar())
+
+  # Run a query on every database in every group, and combine the results.
+  # arguments:
+  #   1) function taking (schema name, database filename) and returning a
+  #      select statement for that database; the statements for each group
+  #      are combined with UNION ALL
+  # returns: list of result rows; raises exception on error
+  def _runQuery(self, selectForDB):
+    def runGroup(engine, group):
+      with engine.connect() as conn:
+        selects = [selectForDB(schema, db_filename)
+          for (schema, db_filename) in group]
+        selects = [sel for sel in selects if sel is not None]
+        if not selects:
+          return []
+        if len(selects) == 1:
+          return [tuple(row) for row in conn.execute(selects[0])]
+        return [tuple(row) for row in conn.execute(union_all(*selects))]
+
+    futures = [self.executor.submit(runGroup, engine, group)
+      for engine, group in zip(self.engines, self.groups)]
+    rows = []
+    for future in futures:
+      rows.extend(future.result())
+    return rows
+
+  # Turn a function that builds a select statement for one scan of one
+  # database into one that can be passed to _runQuery(), for each database's
+  # latest scan. The latest scans and their delta chains are looked up first.
+  # arguments:
+  #   1) function taking (schema name, database filename, chain of scan IDs
+  #      starting with the latest scan) and returning a select statement
+  # returns: function for _runQuery(); raises exception on error
+  def _latestScanQuery(self, selectForScan):
+    chains = {}
+    # an alias scan's parent is the scan it is an alias of, so its chain
+    # leads to the scan holding its files
+    def selectChains(schema, db_filename):
+      scans = self._getScansTable(schema)
+      return select([literal(db_filename), scans.c.id,
+        scans.c.parent_scan_id])
+    parents = {}
+    latest = {}
+    for (db_filename, scan_id, parent_scan_id) in self._runQuery(selectChains):
+      parents.setdefault(db_filename, {})[scan_id] = parent_scan_id
+      latest[db_filename] = max(latest.get(db_filename, scan_id), scan_id)
+    for db_filename, scan_id in latest.items():
+      chain = []
+      current_id = scan_id
+      while current_id is not None and current_id not in chain:
+        chain.append(current_id)
+        current_id = parents[db_filename].get(current_id, None)
+      chains[db_filename] = chain
+
+    def selectForDB(schema, db_filename):
+      chain = chains.get(db_filename, None)
+      if chain is None:
+        return None
+      return selectForScan(schema, db_filename, chain)
+    return selectForDB
@@ -0,0 +1,314 @@
+# instrumentation.py
+#
+# This module contains the SPQueryInstrumentation class, for recording which
+# SPDatabase functions issue which queries, and how long they take.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import functools
+import inspect
+import json
+import threading
+import time
+
+from sqlalchemy import event
+
+# name used for statements issued outside of any SPDatabase function
+NO_METHOD = "(none)"
+
+class SPMethodStats(object):
+  def __init__(self):
+    super(SPMethodStats, self).__init__()
+    # number of times the function was called
+    self.calls = 0
+    # number of those calls that raised an exception
+    self.errors = 0
+    # number of SQL statements issued while it was the innermost function
+    self.statements = 0
+    # rows inserted, updated or deleted by those statements
+    self.rows_affected = 0
+    # rows (or dict entries) returned or yielded by the function
+    self.rows_returned = 0
+    # wall time spent in the function, including nested SPDatabase calls
+    self.seconds = 0.0
+    # wall time spent executing its statements
+    self.statement_seconds = 0.0
+
+  def asDict(self):
+    return {
+      "calls": self.calls,
+      "errors": self.errors,
+      "statements": self.statements,
+      "rows_affected": self.rows_affected,
+      "rows_returned": self.rows_returned,
+      "seconds": self.seconds,
+      "statement_seconds": self.statement_seconds,
+    }
+
+class SPQueryInstrumentation(object):
+  def __init__(self, db, slow_query_seconds=0.5):
+    super(SPQueryInstrumentation, self).__init__()
+    self.db = db
+    # statements taking at least this long are added to the slow query log
+    self.slow_query_seconds = slow_query_seconds
+    # dict of function name => SPMethodStats
+    self.methodStats = {}
+    # list of dicts describing each slow query, with its query plan
+    self.slowQueries = []
+    self.enabled = False
+    self._engine = None
+    self._local = threading.local()
+    self._lock = threading.Lock()
+
+  ########## ENABLING AND DISABLING ##########
+
+  # Start recording: hook the database engine's cursor execution events,
+  # and wrap the SPDatabase's public functions so that statements can be
+  # attributed to them.
+  # arguments: N/A
+  # returns: True if enabled, False if the database isn't open
+  def enable(self):
+    if self.enabled:
+      return True
+    if self.db.engine is None:
+      print("Error: can't enable instrumentation before database is opened")
+      return False
+
+    self._engine = self.db.engine
+    event.listen(self._engine, "before_cursor_execute",
+      self._beforeCursorExecute)
+    event.listen(self._engine, "after_cursor_execute",
+      self._afterCursorExecute)
+
+    for name, func in inspect.getmembers(type(self.db), inspect.isfunction):
+      if name.startswith("_"):
+        continue
+      if name in ("enableInstrumentation", "disableInstrumentation"):
+        continue
+      setattr(self.db, name, self._wrapMethod(name, getattr(self.db, name)))
+
+    self.enabled = True
+    return True
+
+  # Stop recording, removing the event hooks and function wrappers. The
+  # statistics recorded so far are kept.
+  # arguments: N/A
+  # returns: N/A
+  def disable(self):
+    if not self.enabled:
+      return
+    event.remove(self._engine, "before_cursor_execute",
+      self._beforeCursorExecute)
+    event.remove(self._engine, "after_cursor_execute",
+      self._afterCursorExecute)
+    self._engine = None
+
+    for name, func in inspect.getmembers(type(self.db), inspect.isfunction):
+      if name in self.db.__dict__:
+        delattr(self.db, name)
+
+    self.enabled = False
+
+  ########## RESULTS ##########
+
+  # Get the recorded statistics.
+  # arguments: N/A
+  # returns: dict with "methods" => {function name => stats dict} and
+  #   "slow_queries" => list of slow query dicts
+  def getStats(self):
+    with self._lock:
+      methods = {name: stats.asDict()
+        for name, stats in sorted(self.methodStats.items())}
+      slow_queries = list(self.slowQueries)
+    return {"methods": methods, "slow_queries": slow_queries}
+
+  # Write the recorded statistics to a JSON file.
+  # arguments:
+  #   1) json_filename: filename for JSON output file to be created
+  # returns: True if successfully written, False otherwise
+  def writeStatsJSON(self, json_filename):
+    try:
+      with open(json_filename, 'w') as fout:
+        json.dump(self.getStats(), fout, indent=2)
+      return True
+    except Exception as e:
+      print(f"Couldn't write instrumentation data to {json_filename}: {str(e)}")
+      return False
+
+  ########## HELPER FUNCTIONS ##########
+
+  # Get the stack of SPDatabase function names being run by this thread,
+  # innermost last.
+  # arguments: N/A
+  # returns: list of function names
+  def _getMethodStack(self):
+    stack = getattr(self._local, "stack", None)
+    if stack is None:
+      stack = []
+      self._local.stack = stack
+    return stack
+
+  # Get the statistics for a function, creating them if needed. The caller
+  # must hold the lock.
+  # arguments:
+  #   1) function name
+  # returns: SPMethodStats
+  def _getStats(self, name):
+    stats = self.methodStats.get(name, None)
+    if stats is None:
+      stats = SPMethodStats()
+      self.methodStats[name] = stats
+    return stats
+
+  # Record a finished call to a function.
+  # arguments:
+  #   1) function name
+  #   2) wall time spent in the call
+  #   3) number of rows (or dict entries) returned or yielded
+  #   4) (optional) True if the call raised an exception
+  # returns: N/A
+  def _recordCall(self, name, seconds, rows_returned, error=False):
+    with self._lock:
+      stats = self._getStats(name)
+      stats.calls += 1
+      stats.seconds += seconds
+      stats.rows_returned += rows_returned
+      if error:
+        stats.errors += 1
+
+  # Wrap an SPDatabase function so that statements issued while it runs
+  # are attributed to it. Generator functions (such as the comparison
+  # functions) are timed across their whole iteration. Calls that raise an
+  # exception are recorded too, and counted as errors.
+  # arguments:
+  #   1) function name
+  #   2) bound SPDatabase function
+  # returns: wrapped function
+  def _wrapMethod(self, name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+      stack = self._getMethodStack()
+      stack.append(name)
+      start = time.perf_counter()
+      error = True
+      try:
+        result = method(*args, **kwargs)
+        error = False
+      finally:
+        stack.pop()
+        if error:
+          self._recordCall(name, time.perf_counter() - start, 0, True)
+      if inspect.isgenerator(result):
+        return self._wrapGenerator(name, result, time.perf_counter() - start)
+      rows_returned = 0
+      if isinstance(result, (list, dict, tuple, set)):
+        rows_returned = len(result)
+      self._recordCall(name, time.perf_counter() - start, rows_returned)
+      return result
+    return wrapper
+
+  # Iterate over a generator returned by an SPDatabase function, attributing
+  # statements to the function while each item is produced. The call is
+  # recorded once iteration finishes, raises or is abandoned.
+  # arguments:
+  #   1) function name
+  #   2) generator
+  #   3) wall time already spent creating the generator
+  # returns: generator yielding the same items
+  def _wrapGenerator(self, name, gen, seconds):
+    stack = self._getMethodStack()
+    count = 0
+    error = False
+    try:
+      while True:
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+          item = next(gen)
+        except StopIteration:
+          break
+        except Exception:
+          error = True
+          raise
+        finally:
+          stack.pop()
+          seconds += time.perf_counter() - start
+        count += 1
+        yield item
+    finally:
+      self._recordCall(name, seconds, count, error)
+
+  # Event hook run before each statement: note when it started. Connections
+  # can be nested, so start times are kept as a stack.
+  # arguments: as for SQLAlchemy's before_cursor_execute event
+  # returns: N/A
+  def _beforeCursorExecute(self, conn, cursor, statement, parameters,
+    context, executemany):
+    conn.info.setdefault("sp_query_start", []).append(time.perf_counter())
+
+  # Event hook run after each statement: attribute it, and any rows it
+  # affected, to the innermost SPDatabase function being run, and log it if
+  # it was slow.
+  # arguments: as for SQLAlchemy's after_cursor_execute event
+  # returns: N/A
+  def _afterCursorExecute(self, conn, cursor, statement, parameters,
+    context, executemany):
+    seconds = time.perf_counter() - conn.info["sp_query_start"].pop()
+    stack = self._getMethodStack()
+    name = stack[-1] if stack else NO_METHOD
+
+    with self._lock:
+      stats = self._getStats(name)
+      stats.statements += 1
+      stats.statement_seconds += seconds
+      if cursor.rowcount is not None and cursor.rowcount > 0:
+        stats.rows_affected += cursor.rowcount
+
+    if seconds >= self.slow_query_seconds:
+      entry = {
+        "method": name,
+        "statement": statement,
+        "parameters": None if executemany else [str(p) for p in parameters],
+        "seconds": seconds,
+        "query_plan": self._explainQueryPlan(cursor, statement, parameters,
+          executemany),
+      }
+      with self._lock:
+        self.slowQueries.append(entry)
+
+  # Get the SQLite query plan for a statement, using the same DBAPI
+  # connection so that SQLAlchemy events aren't triggered again.
+  # arguments:
+  #   1) DBAPI cursor that ran the statement
+  #   2) SQL statement
+  #   3) statement parameters
+  #   4) True if the statement was run with executemany()
+  # returns: list of query plan lines, or None if there is no plan
+  def _explainQueryPlan(self, cursor, statement, parameters, executemany):
+    if executemany:
+      return None
+    first_word = statement.lstrip().split(None, 1)[0].upper()
+    if first_word not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+      return None
+    try:
+      plan_cursor = cursor.connection.cursor()
+      plan_cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+      plan = [row[-1] for row in plan_cursor.fetchall()]
+      plan_cursor.close()
+      return plan
+    except Exception as e:
+      return [f"Couldn't get query plan: {str(e)}"]
@@ -58,6 +58,41 @@ class FTLicenseStore:
     self.licenses = {}
     self.conversions = {}
     self.categories = {}
+    # indexes for looking up licenses by short name and conversions by old
+    # text; if more than one has the same name or text, the one with the
+    # lowest ID is used
+    self.licenseIDsByName = {}
+    self.conversionIDsByText = {}
+    # highest IDs in use, kept up to date as items are loaded and created
+    self.highestCategoryID = 0
+    self.highestLicenseID = 0
+    self.highestConversionID = 0
+
+  # Add a license to the store in memory, along with its index entry.
+  # arguments:
+  #   1) FTLicense
+  # returns: N/A
+  def _addLicense(self, lic):
+    self.licenses[lic.id] = lic
+    self.licenseIDsByName.setdefault(lic.short_name, lic.id)
+    self.highestLicenseID = max(self.highestLicenseID, lic.id)
+
+  # Add a conversion to the store in memory, along with its index entry.
+  # arguments:
+  #   1) FTConversion
+  # returns: N/A
+  def _addConversion(self, conv):
+    self.conversions[conv.id] = conv
+    self.conversionIDsByText.setdefault(conv.old_text, conv.id)
+    self.highestConversionID = max(self.highestConversionID, conv.id)
+
+  # Add a category to the store in memory.
+  # arguments:
+  #   1) FTCategory
+  # returns: N/A
+  def _addCategory(self, cat):
+    self.categories[cat.id] = cat
+    self.highestCategoryID = max(self.highestCategoryID, cat.id)
 
   # Load all known licenses from the database, replacing the list currently 
   # in memory
@@ -73,9 +108,11 @@ class FTLicenseStore:
 
     # clear old license data in memory and replace with database results
     self.licenses = {}
+    self.licenseIDsByName = {}
+    self.highestLicenseID = 0
     for (id, short_name, category_id) in lics:
-      lic = FTLicense(id, short_name, category_id, False)
-      self.licenses[id] = lic
+      self._addLicense(FTLicense(id, short_name, category_id, False))
+    return True
 
   # Load all known conversions from the database, replacing the list currently 
   # in memory
@@ -91,9 +128,11 @@ class FTLicenseStore:
 
     # clear old conversion data in memory and replace with database results
     self.conversions = {}
+    self.conversionIDsByText = {}
+    self.highestConversionID = 0
     for (id, old_text, new_license_id) in convs:
-      conv = FTConversion(id, old_text, new_license_id, False)
-      self.conversions[id] = conv
+      self._addConversion(FTConversion(id, old_text, new_license_id, False))
+    return True
 
   # Load all known categories from the database, replacing the list currently 
   # in memory
@@ -109,9 +148,10 @@ class FTLicenseStore:
 
     # clear old category data in memory and replace with database results
     self.categories = {}
+    self.highestCategoryID = 0
     for (id, name) in cats:
-      cat = FTCategory(id, name, False)
-      self.categories[id] = cat
+      self._addCategory(FTCategory(id, name, False))
+    return True
 
   # Load all known categories, licenses and conversions from the database,
   # replacing the list currently in memory
@@ -140,11 +180,7 @@ class FTLicenseStore:
       print("Database not loaded")
       return -1
 
-    for lic_id, lic in self.licenses.items():
-      if lic.short_name == short_name:
-        return lic_id
-
-    return -1
+    return self.licenseIDsByName.get(short_name, -1)
 
   # get the license object with this ID
   # DOES NOT check the database -- just checks what's in memory
@@ -169,11 +205,7 @@ class FTLicenseStore:
       print("Database not loaded")
       return -1
 
-    for conv_id, conv in self.conversions.items():
-      if conv.old_text == old_text:
-        return conv_id
-
-    return -1
+    return self.conversionIDsByText.get(old_text, -1)
 
   # get the conversion object with this ID
   # DOES NOT check the database -- just checks what's in memory
@@ -194,11 +226,7 @@ class FTLicenseStore:
     if not self.db:
       print("Database not loaded")
       return None
-    max_id = 0
-    for id, x in self.categories.items():
-      if (id > max_id):
-        max_id = id
-    return max_id
+    return self.highestCategoryID
 
   # get the highest ID currently in use for any license
   # arguments: N/A
@@ -207,11 +235,7 @@ class FTLicenseStore:
     if not self.db:
       print("Database not loaded")
       return None
-    max_id = 0
-    for id, x in self.licenses.items():
-      if (id > max_id):
-        max_id = id
-    return max_id
+    return self.highestLicenseID
 
   # get the highest ID currently in use for any conversion
   # arguments: N/A
@@ -220,11 +244,7 @@ class FTLicenseStore:
     if not self.db:
       print("Database not loaded")
       return None
-    max_id = 0
-    for id, x in self.conversions.items():
-      if (id > max_id):
-        max_id = id
-    return max_id
+    return self.highestConversionID
 
   # Create new conversion in memory, so that it can be added to database
   # when ready to import
@@ -235,14 +255,13 @@ class FTLicenseStore:
   # returns: temporary new Conversion ID if created, or None if error
   def createConversionInStore(self, old_text, new_license_id):
     max_id = self.getHighestConversionID()
-    if not max_id:
+    if max_id is None:
       print("Couldn't get highest conversion ID")
       return None
     conv_id = max_id + 1
     # create new Conversion and mark as modified, since we need to
     # save it out to the database later
-    conv = FTConversion(conv_id, old_text, new_license_id, True)
-    self.conversions[conv_id] = conv
+    self._addConversion(FTConversion(conv_id, old_text, new_license_id, True))
     return conv_id
 
   # Create new category in memory, so that it can be added to database
@@ -253,14 +272,13 @@ class FTLicenseStore:
   # returns: temporary new Category ID if created, or None if error
   def createCategoryInStore(self, name):
     max_id = self.getHighestCategoryID()
-    if not max_id:
+    if max_id is None:
       print("Couldn't get highest category ID")
       return None
     cat_id = max_id + 1
     # create new Category and mark as modified, since we need to
     # save it out to the database later
-    cat = FTCategory(cat_id, name, True)
-    self.categories[cat_id] = cat
+    self._addCategory(FTCategory(cat_id, name, True))
     return cat_id
 
   # Create new license in memory, so that it can be added to database
@@ -272,14 +290,13 @@ class FTLicenseStore:
   # returns: temporary new License ID if created, or None if error
   def createLicenseInStore(self, short_name, category_id):
     max_id = self.getHighestLicenseID()
-    if not max_id:
+    if max_id is None:
       print("Couldn't get highest license ID")
       return None
     lic_id = max_id + 1
     # create new License and mark as modified, since we need to
     # save it out to the database later
-    lic = FTLicense(lic_id, short_name, category_id, True)
-    self.licenses[lic_id] = lic
+    self._addLicense(FTLicense(lic_id, short_name, category_id, True))
     return lic_id
 
   # Save all modified items out to database.
@@ -326,6 +343,36 @@ class FTLicenseStore:
 
   ########## APPLYING CONVERSIONS AND LICENSES ##########
 
+  # Resolve a list of license texts to licenses in memory: a text with a
+  # conversion maps to the conversion's license, and otherwise a text maps
+  # to the license with that short name, if any.
+  # DOES NOT check the database -- just checks what's in memory
+  # arguments:
+  #   1) list of license texts
+  # returns: dict of {license text => tuple of (license ID, license name)};
+  #   texts that don't resolve to a license map to (-1, text)
+  def resolveMany(self, texts):
+    resolved = {}
+    if not self.db:
+      print("Database not loaded")
+      return resolved
+    for text in texts:
+      if text in resolved:
+        continue
+      lic = None
+      conv_id = self.conversionIDsByText.get(text, None)
+      if conv_id is not None:
+        lic = self.licenses.get(self.conversions[conv_id].new_license_id, None)
+      if lic is None:
+        lic_id = self.licenseIDsByName.get(text, None)
+        if lic_id is not None:
+          lic = self.licenses[lic_id]
+      if lic is None:
+        resolved[text] = (-1, text)
+      else:
+        resolved[text] = (lic.id, lic.short_name)
+    return resolved
+
   # Given a list of licenses, apply known conversions and license IDs,
   # and return a data struct that indicates which ones are still pending.
   # arguments:
@@ -347,22 +394,15 @@ class FTLicenseStore:
       new_lic = lic.replace("LicenseRef-", "")
       ldict[lic] = (-1, new_lic)
 
-    # 2) implement existing conversions
-    for old_text, (new_id, new_license_text) in ldict.items():
-      conv_id = self.getIDForConversion(new_license_text)
-      if (conv_id != -1):
-        conv = self.getConversion(conv_id)
-        lic = self.getLicense(conv.new_license_id)
-        ldict[old_text] = (lic.id, lic.short_name)
-
-    # 3) now fill in license ID #'s for all known pending licenses
+    # 2) implement existing conversions, and then fill in license ID #'s
+    # for all known pending licenses, in one pass over the indexes
+    resolved = self.resolveMany(
+      [new_license_text for (new_id, new_license_text) in ldict.values()])
     for old_text, (new_id, new_license_text) in ldict.items():
-      if new_id == -1:
-        lic_id = self.getIDForLicense(new_license_text)
-        if lic_id != -1:
-          ldict[old_text] = (lic_id, new_license_text)
+      ldict[old_text] = resolved.get(new_license_text,
+        (new_id, new_license_text))
 
-    # 4) check to see if there are any licenses that we don't know yet
+    # 3) check to see if there are any licenses that we don't know yet
     lpending = {}
     for old_text, (new_id, new_license_text) in ldict.items():
       if new_id == -1:
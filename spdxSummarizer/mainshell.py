@@ -20,12 +20,16 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import signal
 import sys
+import time
 import readline
 
 from spdxSummarizer.dbtools import SPDatabase
-from spdxSummarizer.parsetools import parseSPDXReport, removePrefixes
+from spdxSummarizer.parsetools import parseSPDXDocument, removePrefixes, \
+  getDocumentDigest, getSnippetTuple, getRelationshipTuples
 from spdxSummarizer.licenses import FTLicenseStore
+from spdxSummarizer.querycontrol import SPQueryControl
 from spdxSummarizer.reports import (outputCSVFull, outputExcelFull,
   outputExcelComparison)
 from spdxSummarizer.spconfig import (isDBTooOld, isDBTooNew, SPVERSION,
@@ -84,6 +88,28 @@ class spdxSummarizer:
     print()
     return self.shellPromptForInput(choices)
 
+  # Helper function to run a long-running report or query, which can be
+  # cancelled with Ctrl-C. Cancelling stops the running query and rolls
+  # back any uncommitted changes, and returns to the caller rather than
+  # exiting the shell.
+  # arguments:
+  #   1) function to call
+  #   2) any other arguments are passed to the function
+  # returns: function's return value, or None if it was cancelled
+  def shellRunCancellable(self, func, *args):
+    control = SPQueryControl()
+    def onInterrupt(signum, frame):
+      print()
+      print("Cancelling...")
+      control.cancel()
+
+    print("(Press Ctrl-C to cancel.)")
+    previous = signal.signal(signal.SIGINT, onInterrupt)
+    try:
+      return self.db.runCancellable(control, func, *args)
+    finally:
+      signal.signal(signal.SIGINT, previous)
+
   ########## DATABASE SHELL FUNCTIONS ##########
 
   # helper shell functions
@@ -394,15 +420,25 @@ Do you want to review and categorize these licenses now?
     self.licstore.loadConversionsFromDB()
     self.licstore.loadCategoriesFromDB()
 
+    # if this document has already been imported, don't parse it again
+    doc_digest = getDocumentDigest(report_filename)
+    if doc_digest is None:
+      return False
+    existing_scan_id = self.db.getScanForDocumentDigest(doc_digest)
+    if existing_scan_id is not None:
+      print()
+      print(f"This SPDX report has already been imported as scan {existing_scan_id}.")
+      return self._shellAddScanAlias(existing_scan_id, doc_digest)
+
     # try loading the SPDX report from this path
-    fds = parseSPDXReport(report_filename)
+    (fds, sds, eds, rds) = parseSPDXDocument(report_filename)
     if fds == None or fds == []:
       print(f"Got invalid result when trying to parse SPDX report from {report_filename}")
       return False
 
     # if we get here, then we were able to parse the report
     print()
-    print(f"Successfully parsed report; found {len(fds)} file records.")
+    print(f"Successfully parsed report; found {len(fds)} file records, {len(sds)} snippet records and {len(rds)} relationships.")
 
     # now do the following (some in parsetools):
 
@@ -413,12 +449,42 @@ Do you want to review and categorize these licenses now?
 
     # go to subfunction to apply conversions, parse license strings
     # and add new ones
-    lics = [fd.license for fd in fds]
+    lics = [fd.license for fd in fds] + [sd.license for sd in sds]
     ldict = self.shellImportLicenses(lics)
     if not ldict:
       print(f"Error when importing and converting license strings.")
       return False
 
+    # build list of file tuples, which we'll submit in bulk below
+    file_tuples = []
+    for fd in fds:
+      # look up the license ID from ldict, NOT from licstore
+      lt = ldict.get(fd.license, None)
+      if lt == None:
+        print(f"Error: couldn't get matched license for {fd.filename}; rolling back and canceling import.")
+        self.db.rollbackChanges()
+        return False
+      file_tuple = (fd.filename, lt[0], fd.sha1, fd.md5, fd.sha256)
+      file_tuples.append(file_tuple)
+    snippet_tuples = []
+    for sd in sds:
+      lt = ldict.get(sd.license, None)
+      if lt == None:
+        print(f"Error: couldn't get matched license for snippet {sd.spdx_id}; rolling back and canceling import.")
+        self.db.rollbackChanges()
+        return False
+      snippet_tuples.append(getSnippetTuple(sd, lt[0]))
+    (element_tuples, relationship_tuples) = getRelationshipTuples(fds, eds,
+      rds, {lic: lt[0] for (lic, lt) in ldict.items() if lt is not None})
+
+    # check whether the same content has already been imported
+    existing_scan_id = self.db.getScanWithSameContent(file_tuples,
+      snippet_tuples, element_tuples, relationship_tuples)
+    if existing_scan_id is not None:
+      print()
+      print(f"Scan {existing_scan_id} already has the same files, licenses, checksums, snippets and relationships as this SPDX report.")
+      return self._shellAddScanAlias(existing_scan_id, doc_digest)
+
     # we're ready to go ahead and confirm about importing the scan
     print('''
   Are you ready to import the scan results into the spdxSummarizer database?
@@ -442,37 +508,69 @@ Do you want to review and categorize these licenses now?
     print()
 
     # add scan to database; tell it not to commit yet
-    scan_id = self.db.addNewScan(scan_dt, desc, False)
+    scan_id = self.db.addNewScan(scan_dt, desc, False, doc_digest)
     if scan_id == -1:
       print("Error: couldn't create new scan record in database.")
       return False
     print(f"Created new scan with database ID {scan_id}.")
 
-    # now, cycle through and add files
-    file_tuples = []
-    for fd in fds:
-      # look up the license ID from ldict, NOT from licstore
-      lt = ldict.get(fd.license, None)
-      if lt == None:
-        print(f"Error: couldn't get matched license for {fd.filename}; rolling back and canceling import.")
-        self.db.rollbackChanges()
-        return False
-      # now we've got the right license ID, so add to list of file tuples
-      # which we'll submit in bulk below
-      file_tuple = (fd.filename, lt[0], fd.sha1, fd.md5, fd.sha256)
-      file_tuples.append(file_tuple)
-
-    # submit list of file tuples in bulk to add to database
-    retval = self.db.addBulkNewFiles(scan_id, file_tuples, True)
+    # submit lists of file, snippet and relationship tuples in bulk to add
+    # to database
+    retval = self.db.addBulkNewFiles(scan_id, file_tuples, False)
     if not retval:
       print(f"Error: couldn't add files for scan {scan_id} to database; rolling back and canceling import.")
       self.db.rollbackChanges()
       return False
+    retval = self.db.addBulkNewSnippets(scan_id, snippet_tuples, False)
+    if not retval:
+      print(f"Error: couldn't add snippets for scan {scan_id} to database; rolling back and canceling import.")
+      self.db.rollbackChanges()
+      return False
+    retval = self.db.addBulkNewRelationships(scan_id, element_tuples,
+      relationship_tuples, True)
+    if not retval:
+      print(f"Error: couldn't add relationships for scan {scan_id} to database; rolling back and canceling import.")
+      self.db.rollbackChanges()
+      return False
 
     # and we're done!
     print(f"Saved {len(file_tuples)} files to database for scan {scan_id}.")
     return True
 
+  # Record a scan whose content has already been imported as an alias of
+  # the existing scan, rather than saving its files again.
+  # arguments:
+  #   1) ID of existing scan with the same content
+  #   2) digest of SPDX document being imported
+  # returns: True if added the scan, False otherwise
+  def _shellAddScanAlias(self, existing_scan_id, doc_digest):
+    print(f'''
+  The new scan will be recorded as an alias of scan {existing_scan_id}, without
+  saving its files again.
+
+  1) Yes, record the alias scan
+  2) No, return to main menu
+    ''')
+    choice = self.shellPromptForInput([1, 2])
+    if choice == 2:
+      print('Not importing results; exiting scan import.')
+      self.db.rollbackChanges()
+      return False
+
+    print('Enter date of scan (in format YYYY-MM-DD):')
+    scan_dt = input(prompt)
+    print('Enter brief description of scan:')
+    desc = input(prompt)
+
+    scan_id = self.db.addScanAlias(existing_scan_id, scan_dt, desc,
+      doc_digest)
+    if scan_id == -1:
+      print("Error: couldn't create new scan record in database.")
+      self.db.rollbackChanges()
+      return False
+    print(f"Created new scan with database ID {scan_id}, as an alias of scan {existing_scan_id}.")
+    return True
+
   # Initial scan request.  Ask the user to tell us where to find the SPDX
   # tag:value file for the initial scan.
   # arguments: N/A
@@ -530,7 +628,8 @@ Do you want to review and categorize these licenses now?
     # get output CSV filename
     print("Enter filename for CSV file to be generated:")
     csv_filename = input(prompt)
-    return outputCSVFull(self.db, choice, csv_filename)
+    return self.shellRunCancellable(outputCSVFull, self.db, choice,
+      csv_filename)
 
 
   # Prompts for Excel full report generator - path and license for all files
@@ -545,7 +644,8 @@ Do you want to review and categorize these licenses now?
     # get output XLSX filename
     print("Enter filename for XLSX full file to be generated:")
     xlsx_filename = input(prompt)
-    return outputExcelFull(self.db, choice, xlsx_filename)
+    return self.shellRunCancellable(outputExcelFull, self.db, choice,
+      xlsx_filename)
 
 
   # Prompts for Excel report generator - compare two scans
@@ -578,9 +678,94 @@ Do you want to review and categorize these licenses now?
     print()
     print("Enter filename for XLSX comparison file to be generated:")
     xlsx_filename = input(prompt)
-    return outputExcelComparison(self.db, first_scan_id, second_scan_id,
-      xlsx_filename)
+    return self.shellRunCancellable(outputExcelComparison, self.db,
+      first_scan_id, second_scan_id, xlsx_filename)
 
+  ########## SEARCH SHELL FUNCTIONS ##########
+
+  # Prompts for searching for files by path across all scans
+  # arguments: N/A
+  # returns: True if any files were found, False otherwise
+  def shellSearchFiles(self):
+    print()
+    print('Enter path or pattern to search for (e.g. "openssl" or "*/openssl/*"):')
+    pattern = input(prompt)
+    if not pattern:
+      return False
+
+    start = time.perf_counter()
+    results = self.shellRunCancellable(self.db.searchFiles, pattern)
+    if results is None:
+      return False
+    ms = (time.perf_counter() - start) * 1000
+
+    current_scan_id = None
+    for (scan_id, filename, license) in results:
+      if scan_id != current_scan_id:
+        (scan_id, scan_dt, desc) = self.db.getScanData(scan_id)
+        print()
+        print(f'  Scan {scan_id}) {scan_dt} - {desc}')
+        current_scan_id = scan_id
+      print(f'    {filename} => {license}')
+    scan_count = len(set(r[0] for r in results))
+    print()
+    print(f"Found {len(results)} files in {scan_count} scans ({ms:.0f} ms).")
+    return len(results) > 0
+
+  ########## MAINTENANCE SHELL FUNCTIONS ##########
+
+  # Prompts for deleting old scans under a retention policy, and returning
+  # the freed space to the filesystem
+  # arguments: N/A
+  # returns: True if deleted any scans, False otherwise
+  def shellPruneScans(self):
+    print()
+    print("Enter number of most recent scans to keep:")
+    while True:
+      try:
+        keep_last = int(input(prompt))
+        if keep_last >= 0:
+          break
+      except ValueError:
+        pass
+      print("Please enter a number (0 or more).")
+
+    print(f'''
+  Also keep the most recent scan from each calendar quarter?
+
+  1) Yes
+  2) No
+  ''')
+    keep_per_quarter = (self.shellPromptForInput([1, 2]) == 1)
+
+    scan_ids = self.db.getScansToPrune(keep_last, keep_per_quarter)
+    if not scan_ids:
+      print()
+      print("No scans to delete.")
+      return False
+
+    print()
+    print("The following scans will be deleted:")
+    for scan_id in scan_ids:
+      (scan_id, scan_dt, desc) = self.db.getScanData(scan_id)
+      print(f'   {scan_id}) {scan_dt} - {desc}')
+    print(f'''
+  Delete these {len(scan_ids)} scans?
+
+  1) Yes, delete them
+  2) No, do not delete them
+  ''')
+    choice = self.shellPromptForInput([1, 2])
+    if choice != 1:
+      return False
+
+    deleted = self.db.pruneScans(keep_last, keep_per_quarter)
+    if deleted is None:
+      return False
+    pages = self.db.reclaimSpace()
+    if pages >= 0:
+      print(f"Freed {pages} database pages.")
+    return True
 
   ########## MAIN SHELL FUNCTION ##########
 
@@ -588,13 +773,32 @@ Do you want to review and categorize these licenses now?
   # through this function.
   # arguments:
   #   1) path to SQLite DB (passed as command line argument from main)
+  #   2) (optional) path to JSON file for query instrumentation data; if
+  #      given, instrumentation is enabled and written out on exit
   # returns: N/A
-  def shellMainLoop(self, db_filename):
+  def shellMainLoop(self, db_filename, stats_filename=None):
     # try to load the database, or to create it if needed
     retval = self.shellLoadDatabase(db_filename)
     if not retval:
       return
 
+    if stats_filename is None:
+      self._shellMainLoop(db_filename)
+      return
+
+    self.db.enableInstrumentation()
+    try:
+      self._shellMainLoop(db_filename)
+    finally:
+      if self.db.instrumentation is not None:
+        if self.db.instrumentation.writeStatsJSON(stats_filename):
+          print(f"Wrote query instrumentation data to {stats_filename}.")
+
+  # Main menu loop, run after the database has been loaded.
+  # arguments:
+  #   1) path to SQLite DB
+  # returns: N/A
+  def _shellMainLoop(self, db_filename):
     # at intro, check whether there are any existing scans
     scan_ids = self.db.getScansIDList()
     if not scan_ids:
@@ -630,9 +834,15 @@ spdxSummarizer database: {db_filename}
     4) Generate Excel report comparing two scans
     5) Generate CSV file listing
 
+  SEARCH:
+    6) Search for files by path
+
+  MAINTENANCE:
+    7) Delete old scans
+
     X) Exit
     ''')
-      choice = self.shellPromptForInput([1, 2, 3, 4, 5, "X", "x"])
+      choice = self.shellPromptForInput([1, 2, 3, 4, 5, 6, 7, "X", "x"])
       if choice == 1:
         retval = self.shellConfigure()
         print()
@@ -673,6 +883,19 @@ spdxSummarizer database: {db_filename}
           print("Didn't generate CSV file listing.")
         print()
 
+      elif choice == 6:
+        self.shellSearchFiles()
+        print()
+
+      elif choice == 7:
+        retval = self.shellPruneScans()
+        print()
+        if retval:
+          print('Deleted old scans.')
+        else:
+          print("Didn't delete any scans.")
+        print()
+
       elif choice == "X" or choice == "x":
         running = False
 
@@ -683,10 +906,11 @@ spdxSummarizer database: {db_filename}
 ########## initial entry point ##########
 
 if __name__ == "__main__":
-  if len(sys.argv) == 2:
+  if len(sys.argv) in (2, 3):
     toolkit = spdxSummarizer()
     db_filename = sys.argv[1]
-    toolkit.shellMainLoop(db_filename)
+    stats_filename = sys.argv[2] if len(sys.argv) == 3 else None
+    toolkit.shellMainLoop(db_filename, stats_filename)
     print("Exiting.")
   else:
-    print(f"Usage: {sys.argv[0]} dbfile")
+    print(f"Usage: {sys.argv[0]} dbfile [instrumentation.json]")
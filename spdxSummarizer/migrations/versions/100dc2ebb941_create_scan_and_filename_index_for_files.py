@@ -0,0 +1,78 @@
+# Database migration scripts are generated using the default script.py.mako
+# template from Alembic, which is provided by the upstream author under the
+# MIT license:
+#
+# Copyright (C) 2009-2017 by Michael Bayer.
+# Alembic is a trademark of Michael Bayer.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Modifications to the template are provided under the Apache 2.0 license:
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0 AND MIT
+
+
+"""Create scan and filename index for files
+
+Revision ID: 100dc2ebb941
+Revises: 74cb878fa7a4
+Create Date: 2026-10-18 20:51:12.104318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# import version setting function from parent directory
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from versioning import set_version
+
+# Fill in old and new version
+NEW_VERSION = "0.2.3"
+OLD_VERSION = "0.2.2"
+
+# revision identifiers, used by Alembic.
+revision = '100dc2ebb941'
+down_revision = '74cb878fa7a4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+  # upgrade to 0.2.3
+  op.create_index('ix_files_scan_id_filename', 'files', ['scan_id', 'filename'])
+  set_version(op, NEW_VERSION)
+
+def downgrade():
+  # downgrade to 0.2.2
+  op.drop_index('ix_files_scan_id_filename', 'files')
+  set_version(op, OLD_VERSION)
@@ -0,0 +1,88 @@
+# Database migration scripts are generated using the default script.py.mako
+# template from Alembic, which is provided by the upstream author under the
+# MIT license:
+#
+# Copyright (C) 2009-2017 by Michael Bayer.
+# Alembic is a trademark of Michael Bayer.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Modifications to the template are provided under the Apache 2.0 license:
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0 AND MIT
+
+
+"""Create scan path filters table
+
+Revision ID: 3f8a51c2d6e9
+Revises: b2d0a17d714f
+Create Date: 2026-10-19 14:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from versioning import set_version
+
+NEW_VERSION = "0.2.10"
+OLD_VERSION = "0.2.9"
+
+revision = '3f8a51c2d6e9'
+down_revision = 'b2d0a17d714f'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+  # upgrade to 0.2.10
+  # filters for existing scans are built by SPDatabase the first time they
+  # are needed
+  op.create_table(
+    'scan_blooms',
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('scan_id', sa.Integer, sa.ForeignKey('scans.id')),
+    sa.Column('num_paths', sa.Integer),
+    sa.Column('num_bits', sa.Integer),
+    sa.Column('num_hashes', sa.Integer),
+    sa.Column('bits', sa.LargeBinary),
+  )
+  op.create_index('ix_scan_blooms_scan_id', 'scan_blooms', ['scan_id'],
+    unique=True)
+  set_version(op, NEW_VERSION)
+
+def downgrade():
+  # downgrade to 0.2.9
+  op.drop_index('ix_scan_blooms_scan_id', table_name='scan_blooms')
+  op.drop_table('scan_blooms')
+  set_version(op, OLD_VERSION)
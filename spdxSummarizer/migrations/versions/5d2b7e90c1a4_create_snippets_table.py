@@ -0,0 +1,112 @@
+# Database migration scripts are generated using the default script.py.mako
+# template from Alembic, which is provided by the upstream author under the
+# MIT license:
+#
+# Copyright (C) 2009-2017 by Michael Bayer.
+# Alembic is a trademark of Michael Bayer.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Modifications to the template are provided under the Apache 2.0 license:
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0 AND MIT
+
+
+
+"""Create snippets table
+
+Revision ID: 5d2b7e90c1a4
+Revises: 8e4c0b9a7f21
+Create Date: 2026-10-19 19:12:44.605183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from versioning import set_version
+
+NEW_VERSION = "0.2.12"
+OLD_VERSION = "0.2.11"
+
+revision = '5d2b7e90c1a4'
+down_revision = '8e4c0b9a7f21'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+  # upgrade to 0.2.12
+  op.create_table(
+    'snippets',
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('scan_id', sa.Integer, sa.ForeignKey('scans.id')),
+    sa.Column('filename', sa.String),
+    sa.Column('file_key', sa.Integer),
+    sa.Column('spdx_id', sa.String),
+    sa.Column('byte_start', sa.Integer),
+    sa.Column('byte_end', sa.Integer),
+    sa.Column('line_start', sa.Integer),
+    sa.Column('line_end', sa.Integer),
+    sa.Column('license_id', sa.Integer, sa.ForeignKey('licenses.id')),
+  )
+  op.create_index('ix_snippets_scan_id_filename', 'snippets',
+    ['scan_id', 'filename'])
+  # if this SQLite library doesn't have the R*Tree module, leave the index
+  # out; range queries will fall back to reading each file's snippets
+  try:
+    op.execute("""CREATE VIRTUAL TABLE snippets_rtree USING rtree_i32(id,
+      min_scan_id, max_scan_id, min_file_key, max_file_key,
+      min_byte, max_byte, min_line, max_line)""")
+  except OperationalError:
+    set_version(op, NEW_VERSION)
+    return
+  op.execute("""CREATE TRIGGER snippets_rtree_insert AFTER INSERT ON snippets BEGIN
+    INSERT INTO snippets_rtree VALUES (new.id, new.scan_id, new.scan_id,
+      new.file_key, new.file_key, new.byte_start, new.byte_end,
+      coalesce(new.line_start, 0), coalesce(new.line_end, 0));
+  END""")
+  op.execute("""CREATE TRIGGER snippets_rtree_delete AFTER DELETE ON snippets BEGIN
+    DELETE FROM snippets_rtree WHERE id = old.id;
+  END""")
+  set_version(op, NEW_VERSION)
+
+def downgrade():
+  # downgrade to 0.2.11
+  op.execute("DROP TRIGGER IF EXISTS snippets_rtree_delete")
+  op.execute("DROP TRIGGER IF EXISTS snippets_rtree_insert")
+  op.execute("DROP TABLE IF EXISTS snippets_rtree")
+  op.drop_index('ix_snippets_scan_id_filename', table_name='snippets')
+  op.drop_table('snippets')
+  set_version(op, OLD_VERSION)
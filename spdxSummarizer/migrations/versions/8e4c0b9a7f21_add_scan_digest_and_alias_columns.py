@@ -0,0 +1,87 @@
+# Database migration scripts are generated using the default script.py.mako
+# template from Alembic, which is provided by the upstream author under the
+# MIT license:
+#
+# Copyright (C) 2009-2017 by Michael Bayer.
+# Alembic is a trademark of Michael Bayer.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Modifications to the template are provided under the Apache 2.0 license:
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0 AND MIT
+
+
+"""Add scan digest and alias columns
+
+Revision ID: 8e4c0b9a7f21
+Revises: 3f8a51c2d6e9
+Create Date: 2026-10-19 16:41:08.930572
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from versioning import set_version
+
+NEW_VERSION = "0.2.11"
+OLD_VERSION = "0.2.10"
+
+revision = '8e4c0b9a7f21'
+down_revision = '3f8a51c2d6e9'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+  # upgrade to 0.2.11
+  # as with parent_scan_id, the foreign key constraint is left off here;
+  # content digests for existing scans are filled in by SPDatabase the first
+  # time they are needed
+  op.add_column('scans', sa.Column('doc_digest', sa.String))
+  op.add_column('scans', sa.Column('content_digest', sa.String))
+  op.add_column('scans', sa.Column('alias_of_scan_id', sa.Integer))
+  op.create_index('ix_scans_doc_digest', 'scans', ['doc_digest'])
+  op.create_index('ix_scans_content_digest', 'scans', ['content_digest'])
+  set_version(op, NEW_VERSION)
+
+def downgrade():
+  # downgrade to 0.2.10
+  op.drop_index('ix_scans_content_digest', table_name='scans')
+  op.drop_index('ix_scans_doc_digest', table_name='scans')
+  with op.batch_alter_table('scans') as batch_op:
+    batch_op.drop_column('alias_of_scan_id')
+    batch_op.drop_column('content_digest')
+    batch_op.drop_column('doc_digest')
+  set_version(op, OLD_VERSION)
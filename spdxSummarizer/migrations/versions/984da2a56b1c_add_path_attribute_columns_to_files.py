@@ -0,0 +1,137 @@
+# Database migration scripts are generated using the default script.py.mako
+# template from Alembic, which is provided by the upstream author under the
+# MIT license:
+#
+# Copyright (C) 2009-2017 by Michael Bayer.
+# Alembic is a trademark of Michael Bayer.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Modifications to the template are provided under the Apache 2.0 license:
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0 AND MIT
+
+
+"""Add path attribute columns to files
+
+Revision ID: 984da2a56b1c
+Revises: 300ee0539635
+Create Date: 2026-10-19 00:12:48.226190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from versioning import set_version
+
+NEW_VERSION = "0.2.7"
+OLD_VERSION = "0.2.6"
+
+revision = '984da2a56b1c'
+down_revision = '300ee0539635'
+branch_labels = None
+depends_on = None
+
+# number of file rows to backfill at a time
+BATCH_SIZE = 10000
+
+# same as analysis.getPathAttributes() at the time of this migration
+def get_path_attributes(filename):
+  extension = os.path.splitext(filename)[1]
+  is_git = "/.git/" in filename
+  is_vendor = "vendor/" in filename
+  depth = filename.count("/")
+  return (extension, is_git, is_vendor, depth)
+
+def upgrade():
+  # upgrade to 0.2.7
+  op.add_column('files', sa.Column('extension', sa.String))
+  op.add_column('files', sa.Column('is_git',
+    sa.Boolean(create_constraint=False), nullable=False, server_default='0'))
+  op.add_column('files', sa.Column('is_vendor',
+    sa.Boolean(create_constraint=False), nullable=False, server_default='0'))
+  op.add_column('files', sa.Column('depth', sa.Integer))
+
+  # backfill attributes for existing files, in batches by ID
+  conn = op.get_bind()
+  last_id = 0
+  while True:
+    rows = conn.execute(sa.text(
+      "SELECT id, filename FROM files WHERE id > :last_id ORDER BY id LIMIT :n"),
+      last_id=last_id, n=BATCH_SIZE).fetchall()
+    if not rows:
+      break
+    updates = []
+    for (id, filename) in rows:
+      (extension, is_git, is_vendor, depth) = get_path_attributes(filename or "")
+      updates.append({'file_id': id, 'extension': extension,
+        'is_git': is_git, 'is_vendor': is_vendor, 'depth': depth})
+    conn.execute(sa.text(
+      "UPDATE files SET extension = :extension, is_git = :is_git, " +
+      "is_vendor = :is_vendor, depth = :depth WHERE id = :file_id"), updates)
+    last_id = rows[-1][0]
+
+  op.create_index('ix_files_scan_id_is_git_extension', 'files',
+    ['scan_id', 'is_git', 'extension'])
+  op.create_index('ix_files_scan_id_is_git_is_vendor', 'files',
+    ['scan_id', 'is_git', 'is_vendor'])
+  set_version(op, NEW_VERSION)
+
+def downgrade():
+  # downgrade to 0.2.6
+  op.drop_index('ix_files_scan_id_is_git_is_vendor', table_name='files')
+  op.drop_index('ix_files_scan_id_is_git_extension', table_name='files')
+  with op.batch_alter_table('files') as batch_op:
+    batch_op.drop_column('depth')
+    batch_op.drop_column('is_vendor')
+    batch_op.drop_column('is_git')
+    batch_op.drop_column('extension')
+
+  # copying the files table drops its triggers, so recreate the ones that
+  # keep the files_fts index in sync, if the database has it
+  conn = op.get_bind()
+  has_fts = conn.execute(sa.text(
+    "SELECT count(*) FROM sqlite_master WHERE name = 'files_fts'")).scalar()
+  if has_fts:
+    op.execute("""CREATE TRIGGER files_fts_delete AFTER DELETE ON files BEGIN
+      INSERT INTO files_fts(files_fts, rowid, filename)
+        VALUES ('delete', old.id, old.filename);
+    END""")
+    op.execute("""CREATE TRIGGER files_fts_update AFTER UPDATE OF filename ON files BEGIN
+      INSERT INTO files_fts(files_fts, rowid, filename)
+        VALUES ('delete', old.id, old.filename);
+      INSERT INTO files_fts(rowid, filename) VALUES (new.id, new.filename);
+    END""")
+  set_version(op, OLD_VERSION)
@@ -0,0 +1,124 @@
+# Database migration scripts are generated using the default script.py.mako
+# template from Alembic, which is provided by the upstream author under the
+# MIT license:
+#
+# Copyright (C) 2009-2017 by Michael Bayer.
+# Alembic is a trademark of Michael Bayer.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Modifications to the template are provided under the Apache 2.0 license:
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0 AND MIT
+
+
+
+"""Create relationship tables
+
+Revision ID: a91f3c6e2b58
+Revises: 5d2b7e90c1a4
+Create Date: 2026-10-19 21:37:05.218940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from versioning import set_version
+
+NEW_VERSION = "0.2.13"
+OLD_VERSION = "0.2.12"
+
+revision = 'a91f3c6e2b58'
+down_revision = '5d2b7e90c1a4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+  # upgrade to 0.2.13
+  # relationships weren't kept for scans imported before this version, so
+  # these tables start out empty
+  op.create_table(
+    'spdx_elements',
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('scan_id', sa.Integer, sa.ForeignKey('scans.id')),
+    sa.Column('spdx_id', sa.String),
+    sa.Column('element_type', sa.String),
+    sa.Column('name', sa.String),
+    sa.Column('license_id', sa.Integer, sa.ForeignKey('licenses.id')),
+  )
+  op.create_index('ix_spdx_elements_scan_id_spdx_id', 'spdx_elements',
+    ['scan_id', 'spdx_id'])
+  op.create_table(
+    'relationships',
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('scan_id', sa.Integer, sa.ForeignKey('scans.id')),
+    sa.Column('from_spdx_id', sa.String),
+    sa.Column('relationship_type', sa.String),
+    sa.Column('to_spdx_id', sa.String),
+  )
+  op.create_index('ix_relationships_scan_id_from_spdx_id', 'relationships',
+    ['scan_id', 'from_spdx_id'])
+  op.create_index('ix_relationships_scan_id_to_spdx_id', 'relationships',
+    ['scan_id', 'to_spdx_id'])
+  op.create_table(
+    'relationship_closure',
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('scan_id', sa.Integer, sa.ForeignKey('scans.id')),
+    sa.Column('ancestor_spdx_id', sa.String),
+    sa.Column('descendant_spdx_id', sa.String),
+    sa.Column('depth', sa.Integer),
+  )
+  op.create_index('ix_relationship_closure_scan_id_ancestor_descendant',
+    'relationship_closure',
+    ['scan_id', 'ancestor_spdx_id', 'descendant_spdx_id'], unique=True)
+  op.create_index('ix_relationship_closure_scan_id_descendant',
+    'relationship_closure', ['scan_id', 'descendant_spdx_id'])
+  set_version(op, NEW_VERSION)
+
+def downgrade():
+  # downgrade to 0.2.12
+  op.drop_index('ix_relationship_closure_scan_id_descendant',
+    table_name='relationship_closure')
+  op.drop_index('ix_relationship_closure_scan_id_ancestor_descendant',
+    table_name='relationship_closure')
+  op.drop_table('relationship_closure')
+  op.drop_index('ix_relationships_scan_id_to_spdx_id',
+    table_name='relationships')
+  op.drop_index('ix_relationships_scan_id_from_spdx_id',
+    table_name='relationships')
+  op.drop_table('relationships')
+  op.drop_index('ix_spdx_elements_scan_id_spdx_id', table_name='spdx_elements')
+  op.drop_table('spdx_elements')
+  set_version(op, OLD_VERSION)
@@ -19,6 +19,7 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
 import os
 import sys
 from operator import attrgetter
@@ -29,6 +30,7 @@ from spdxSummarizer.tvFileLoader import TVFileLoader
 class FileData(object):
   def __init__(self):
     self.filename = ""
+    self.spdx_id = ""
     self.license = ""
     self.sha1 = ""
     self.md5 = ""
@@ -37,14 +39,124 @@ class FileData(object):
   def __str__(self):
     return f"FileData: {self.filename}, {self.license}"
 
+class SnippetData(object):
+  def __init__(self):
+    self.spdx_id = ""
+    # SPDX ID of the file the snippet is from, and once the document has
+    # been parsed, that file's FileData
+    self.file_spdx_id = ""
+    self.fd = None
+    self.license = ""
+    # byte and line ranges, including both ends; the line range is None if
+    # not given
+    self.byte_range = None
+    self.line_range = None
+
+  def __str__(self):
+    return f"SnippetData: {self.spdx_id}, {self.license}"
+
+class ElementData(object):
+  def __init__(self, element_type):
+    self.spdx_id = ""
+    # "DOCUMENT" or "PACKAGE"; files are FileData records
+    self.element_type = element_type
+    self.name = ""
+
+  def __str__(self):
+    return f"ElementData: {self.element_type} {self.spdx_id}, {self.name}"
+
+class RelationshipData(object):
+  def __init__(self, from_spdx_id, relationship_type, to_spdx_id):
+    self.from_spdx_id = from_spdx_id
+    self.relationship_type = relationship_type
+    self.to_spdx_id = to_spdx_id
+
+  def __str__(self):
+    return f"RelationshipData: {self.from_spdx_id} {self.relationship_type} {self.to_spdx_id}"
+
+# Get the tuple for a snippet used by SPDatabase.addBulkNewSnippets(). This
+# should be called after removePrefixes(), so that the snippet's filename
+# matches its file's.
+# arguments:
+#    * sd: SnippetData record produced by parseSPDXDocument()
+#    * license_id: ID of the snippet's license in the database
+# returns: tuple of (filename, SPDX ID, byte start, byte end, line start,
+#   line end, license ID)
+def getSnippetTuple(sd, license_id):
+  (line_start, line_end) = sd.line_range or (None, None)
+  return (sd.fd.filename, sd.spdx_id, sd.byte_range[0], sd.byte_range[1],
+    line_start, line_end, license_id)
+
+# Get the element and relationship tuples used by
+# SPDatabase.addBulkNewRelationships(). Elements are only needed to resolve
+# relationships, so none are returned for a document without relationships.
+# This should be called after removePrefixes(), so that the elements for
+# files have the same filenames as the files.
+# arguments:
+#    * fds: list of FileData records produced by parseSPDXDocument()
+#    * eds: list of ElementData records produced by parseSPDXDocument()
+#    * rds: list of RelationshipData records produced by parseSPDXDocument()
+#    * license_ids: dict of license string => ID of license in the database,
+#      for each file's license
+# returns: tuple of (list of element tuples, list of relationship tuples)
+def getRelationshipTuples(fds, eds, rds, license_ids):
+  if not rds:
+    return ([], [])
+  element_tuples = [(ed.spdx_id, ed.element_type, ed.name, None)
+    for ed in eds]
+  element_tuples += [(fd.spdx_id, "FILE", fd.filename,
+    license_ids[fd.license]) for fd in fds if fd.spdx_id]
+  relationship_tuples = [(rd.from_spdx_id, rd.relationship_type,
+    rd.to_spdx_id) for rd in rds]
+  return (element_tuples, relationship_tuples)
+
+# Parse a "start:end" range value from a snippet range tag.
+# arguments:
+#    * val: range value
+# returns: tuple of (start, end) integers, or None if it can't be parsed
+def parseRange(val):
+  sp = val.split(":")
+  if len(sp) != 2:
+    return None
+  try:
+    (start, end) = (int(sp[0].strip()), int(sp[1].strip()))
+  except ValueError:
+    return None
+  if start > end:
+    return None
+  return (start, end)
+
 # Parse an SPDX tag:value report and return a list of FileData for each
 # parsed record found.
 # arguments:
 #    * report_filename: file path for SPDX tag:value report
 # returns: list of FileData records, or null list if error or none found
 def parseSPDXReport(report_filename):
+  (fds, sds, eds, rds) = parseSPDXDocument(report_filename)
+  return fds
+
+# Parse an SPDX tag:value report and return the FileData for each parsed
+# file record, the SnippetData for each parsed snippet record, the
+# ElementData for the document and each package, and the RelationshipData
+# for each relationship. Snippets whose file isn't in the report, or whose
+# byte range is missing or can't be parsed, are left out.
+# arguments:
+#    * report_filename: file path for SPDX tag:value report
+# returns: tuple of (list of FileData records, list of SnippetData
+#   records, list of ElementData records, list of RelationshipData
+#   records); lists are empty if error or none found
+def parseSPDXDocument(report_filename):
   fds = []
+  sds = []
+  eds = []
+  rds = []
+  doc_ed = ElementData("DOCUMENT")
   current_fd = None
+  current_sd = None
+  current_ed = None
+  # most recent package, and the files listed after each package
+  last_package_ed = None
+  package_fds = []
 
   try:
     with open(report_filename, 'r') as f:
@@ -56,22 +168,100 @@ def parseSPDXReport(report_filename):
 
       if tvList is None:
         print(f"Error: failed to load tag/value pairs from {report_filename}")
-        return []
+        return ([], [], [], [])
 
       # Now, walk through tag/value pair list. A "FileName" tag designates a
-      # new file, and should trigger saving the prior fd and starting the
-      # next one.
+      # new file, a "SnippetSPDXID" tag a new snippet and a "PackageName"
+      # tag a new package; each should trigger saving the prior fd, sd or
+      # ed and starting the next one.
       for (tag, val) in tvList:
-        if tag == "FileName":
+        if tag == "Relationship":
+          # relationships can appear anywhere, and don't end the current
+          # record
+          sp = val.split()
+          if len(sp) != 3:
+            print(f"Error: couldn't parse relationship in tag {tag}, value {val}")
+            continue
+          rds.append(RelationshipData(sp[0], sp[1], sp[2]))
+
+        elif tag == "FileName":
           # start of data on a new file
 
-          # finish and save old FileData if one was in process
+          # finish and save old record if one was in process
           if current_fd is not None:
             fds.append(current_fd)
+          if current_sd is not None:
+            sds.append(current_sd)
+            current_sd = None
+          if current_ed is not None:
+            eds.append(current_ed)
+            current_ed = None
 
           # start a new FileData and save the filename
           current_fd = FileData()
           current_fd.filename = val
+          if last_package_ed is not None:
+            package_fds.append((last_package_ed, current_fd))
+
+        elif tag == "SnippetSPDXID":
+          # start of data on a new snippet
+          if current_fd is not None:
+            fds.append(current_fd)
+            current_fd = None
+          if current_sd is not None:
+            sds.append(current_sd)
+          if current_ed is not None:
+            eds.append(current_ed)
+            current_ed = None
+
+          current_sd = SnippetData()
+          current_sd.spdx_id = val
+
+        elif tag == "PackageName":
+          # start of data on a new package
+          if current_fd is not None:
+            fds.append(current_fd)
+            current_fd = None
+          if current_sd is not None:
+            sds.append(current_sd)
+            current_sd = None
+          if current_ed is not None:
+            eds.append(current_ed)
+
+          current_ed = ElementData("PACKAGE")
+          current_ed.name = val
+          last_package_ed = current_ed
+
+        elif current_sd is not None:
+          if tag == "SnippetFromFileSPDXID":
+            current_sd.file_spdx_id = val
+          elif tag == "SnippetLicenseConcluded":
+            current_sd.license = val
+          elif tag == "SnippetByteRange":
+            current_sd.byte_range = parseRange(val)
+            if current_sd.byte_range is None:
+              print(f"Error: couldn't parse byte range in tag {tag}, value {val} for {current_sd.spdx_id}")
+          elif tag == "SnippetLineRange":
+            current_sd.line_range = parseRange(val)
+            if current_sd.line_range is None:
+              print(f"Error: couldn't parse line range in tag {tag}, value {val} for {current_sd.spdx_id}")
+
+        elif current_ed is not None:
+          # the first SPDXID after a PackageName is the package's
+          if tag == "SPDXID" and not current_ed.spdx_id:
+            current_ed.spdx_id = val
+
+        elif tag == "SPDXID":
+          # the first SPDXID after a FileName is the file's, and the first
+          # one before any file is the document's
+          if current_fd is not None:
+            if not current_fd.spdx_id:
+              current_fd.spdx_id = val
+          elif not doc_ed.spdx_id:
+            doc_ed.spdx_id = val
+
+        elif tag == "DocumentName":
+          doc_ed.name = val
 
         elif tag == "LicenseConcluded":
           current_fd.license = val
@@ -96,17 +286,60 @@ def parseSPDXReport(report_filename):
 
         # we're ignoring other tags for the time being
 
-      # when we get to the end, finish and save the final FileData that was
+      # when we get to the end, finish and save the final record that was
       # in process
       if current_fd is not None:
         fds.append(current_fd)
+      if current_sd is not None:
+        sds.append(current_sd)
+      if current_ed is not None:
+        eds.append(current_ed)
+      if doc_ed.spdx_id:
+        eds.insert(0, doc_ed)
+
+      # in tag:value documents, files listed after a package are contained
+      # by it, whether or not there is a CONTAINS relationship for them
+      contains = set((rd.from_spdx_id, rd.to_spdx_id) for rd in rds
+        if rd.relationship_type == "CONTAINS")
+      for (ed, fd) in package_fds:
+        if ed.spdx_id and fd.spdx_id and \
+           (ed.spdx_id, fd.spdx_id) not in contains:
+          rds.append(RelationshipData(ed.spdx_id, "CONTAINS", fd.spdx_id))
 
-      # and return all FileData objects
-      return fds
+      # link snippets to their files
+      fds_by_id = {fd.spdx_id: fd for fd in fds if fd.spdx_id}
+      linked_sds = []
+      for sd in sds:
+        sd.fd = fds_by_id.get(sd.file_spdx_id, None)
+        if sd.fd is None:
+          print(f"Error: couldn't find file {sd.file_spdx_id} for snippet {sd.spdx_id}")
+        elif sd.byte_range is None:
+          print(f"Error: no valid byte range for snippet {sd.spdx_id}")
+        else:
+          linked_sds.append(sd)
+
+      # and return all of the records
+      return (fds, linked_sds, eds, rds)
 
   except (IOError, OSError, FileNotFoundError) as e:
     print(f"Error opening or reading file: {str(e)}")
-    return []
+    return ([], [], [], [])
+
+# Get a digest of an SPDX document's contents, to recognize a document
+# that has already been imported.
+# arguments:
+#    * report_filename: file path for SPDX document
+# returns: SHA256 hex digest string, or None if error
+def getDocumentDigest(report_filename):
+  try:
+    digest = hashlib.sha256()
+    with open(report_filename, 'rb') as f:
+      for block in iter(lambda: f.read(65536), b''):
+        digest.update(block)
+    return digest.hexdigest()
+  except (IOError, OSError) as e:
+    print(f"Error opening or reading file: {str(e)}")
+    return None
 
 # Remove common prefix from a list of FileData objects.
 # arguments:
@@ -0,0 +1,228 @@
+# pipeline.py
+#
+# This module runs spdxSummarizer non-interactively: it imports one SPDX
+# tag:value report into a new in-memory database, generates reports from it,
+# and optionally saves the database to disk at the end. It is intended for
+# CI jobs, where the database would otherwise be thrown away.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import datetime
+
+from spdxSummarizer.dbtools import SPDatabase
+from spdxSummarizer.parsetools import parseSPDXDocument, removePrefixes, \
+  getDocumentDigest, getSnippetTuple, getRelationshipTuples
+from spdxSummarizer.licenses import FTLicenseStore
+from spdxSummarizer.reports import outputCSVFull, outputExcelFull
+
+# license strings that aren't known to the database are added as new
+# licenses in this category, so that they can be reviewed later
+REVIEW_CATEGORY_NAME = "Requires manual review"
+
+# Map a report's license strings to license IDs without prompting: known
+# licenses and conversions are applied as usual, and any other license
+# string is added as a new license in the REVIEW_CATEGORY_NAME category,
+# which is created if the config file didn't define it.
+# arguments:
+#   1) licstore: FTLicenseStore, already loaded from the database
+#   2) lics: list of license text names
+# returns: licenses dict as in FTLicenseStore.runExistingConversionsAndLicenses,
+#   or None if error
+def mapLicensesForPipeline(licstore, lics):
+  licenses = licstore.runExistingConversionsAndLicenses(lics)
+  ldict = licenses["ldict"]
+  lpending = licenses["lpending"]
+  if not lpending:
+    return ldict
+
+  review_cat_id = None
+  for cat_id, ftcat in licstore.categories.items():
+    if ftcat.name == REVIEW_CATEGORY_NAME:
+      review_cat_id = cat_id
+  if review_cat_id is None:
+    review_cat_id = licstore.createCategoryInStore(REVIEW_CATEGORY_NAME)
+    if not review_cat_id:
+      print(f"Error: couldn't create category {REVIEW_CATEGORY_NAME}")
+      return None
+
+  # several license strings may convert to the same new license name
+  new_lic_ids = {}
+  for old_text, new_lic_name in lpending.items():
+    lic_id = new_lic_ids.get(new_lic_name, None)
+    if lic_id is None:
+      lic_id = licstore.createLicenseInStore(new_lic_name, review_cat_id)
+      if not lic_id:
+        print(f"Error: couldn't create new license {new_lic_name}")
+        return None
+      new_lic_ids[new_lic_name] = lic_id
+      print(f"Added {new_lic_name} as new license for manual review.")
+    ldict[old_text] = (lic_id, new_lic_name)
+
+  if not licstore.saveAllModifiedToDatabase():
+    return None
+  return ldict
+
+# Import an SPDX tag:value report as a new scan. If the report, or a report
+# with the same content, has already been imported, the new scan is an
+# alias of the existing scan.
+# arguments:
+#   1) db: SPDatabase
+#   2) report_filename: path to SPDX tag:value file
+#   3) scan_dt_str: date of scan, in format YYYY-MM-DD
+#   4) desc: brief description of scan
+# returns: new scan ID if imported, or -1 otherwise
+def importReportForPipeline(db, report_filename, scan_dt_str, desc):
+  licstore = FTLicenseStore(db)
+  licstore.loadCategoriesFromDB()
+  licstore.loadLicensesFromDB()
+  licstore.loadConversionsFromDB()
+
+  # if this document has already been imported, don't parse it again
+  doc_digest = getDocumentDigest(report_filename)
+  if doc_digest is None:
+    return -1
+  existing_scan_id = db.getScanForDocumentDigest(doc_digest)
+  if existing_scan_id is not None:
+    return addScanAliasForPipeline(db, existing_scan_id, scan_dt_str, desc,
+      doc_digest)
+
+  (fds, sds, eds, rds) = parseSPDXDocument(report_filename)
+  if fds == None or fds == []:
+    print(f"Got invalid result when trying to parse SPDX report from {report_filename}")
+    return -1
+  removePrefixes(fds)
+
+  ldict = mapLicensesForPipeline(licstore,
+    [fd.license for fd in fds] + [sd.license for sd in sds])
+  if not ldict:
+    print(f"Error when importing and converting license strings.")
+    db.rollbackChanges()
+    return -1
+
+  file_tuples = [(fd.filename, ldict[fd.license][0], fd.sha1, fd.md5,
+    fd.sha256) for fd in fds]
+  snippet_tuples = [getSnippetTuple(sd, ldict[sd.license][0]) for sd in sds]
+  (element_tuples, relationship_tuples) = getRelationshipTuples(fds, eds, rds,
+    {lic: lt[0] for (lic, lt) in ldict.items()})
+  existing_scan_id = db.getScanWithSameContent(file_tuples, snippet_tuples,
+    element_tuples, relationship_tuples)
+  if existing_scan_id is not None:
+    return addScanAliasForPipeline(db, existing_scan_id, scan_dt_str, desc,
+      doc_digest)
+
+  scan_id = db.addNewScan(scan_dt_str, desc, False, doc_digest)
+  if scan_id == -1:
+    print("Error: couldn't create new scan record in database.")
+    db.rollbackChanges()
+    return -1
+  if not db.addBulkNewFiles(scan_id, file_tuples, False):
+    print(f"Error: couldn't add files for scan {scan_id} to database.")
+    db.rollbackChanges()
+    return -1
+  if not db.addBulkNewSnippets(scan_id, snippet_tuples, False):
+    print(f"Error: couldn't add snippets for scan {scan_id} to database.")
+    db.rollbackChanges()
+    return -1
+  if not db.addBulkNewRelationships(scan_id, element_tuples,
+    relationship_tuples, True):
+    print(f"Error: couldn't add relationships for scan {scan_id} to database.")
+    db.rollbackChanges()
+    return -1
+  print(f"Saved {len(file_tuples)} files to database for scan {scan_id}.")
+  return scan_id
+
+# Record a report with the same content as an existing scan as an alias of
+# that scan, rather than importing its files again.
+# arguments:
+#   1) db: SPDatabase
+#   2) existing_scan_id: ID of scan with the same content
+#   3) scan_dt_str: date of scan, in format YYYY-MM-DD
+#   4) desc: brief description of scan
+#   5) doc_digest: digest of the report
+# returns: new scan ID if added, or -1 otherwise
+def addScanAliasForPipeline(db, existing_scan_id, scan_dt_str, desc,
+  doc_digest):
+  scan_id = db.addScanAlias(existing_scan_id, scan_dt_str, desc, doc_digest)
+  if scan_id == -1:
+    print(f"Error: couldn't add scan as alias of scan {existing_scan_id}.")
+    db.rollbackChanges()
+    return -1
+  print(f"Report has the same content as scan {existing_scan_id}; saved as alias scan {scan_id}.")
+  return scan_id
+
+# Run the whole pipeline: create an in-memory database from a config file,
+# import a report into it, write the requested reports, and optionally save
+# the database to a file.
+# arguments:
+#   1) report_filename: path to SPDX tag:value file
+#   2) config_filename: path to JSON config file for the new database
+#   3) (optional) scan_dt_str: date of scan, in format YYYY-MM-DD; defaults
+#      to today
+#   4) (optional) desc: brief description of scan
+#   5) (optional) csv_filename: if given, write a CSV file listing here
+#   6) (optional) xlsx_filename: if given, write an Excel full report here
+#   7) (optional) db_filename: if given, save the database here at the end
+# returns: True if all steps succeeded, False otherwise
+def runPipeline(report_filename, config_filename, scan_dt_str=None,
+  desc="pipeline import", csv_filename=None, xlsx_filename=None,
+  db_filename=None):
+  if scan_dt_str is None:
+    scan_dt_str = datetime.date.today().isoformat()
+
+  db = SPDatabase()
+  try:
+    if not db.createDatabase(":memory:"):
+      return False
+    if not db.initializeDatabaseTables(config_filename):
+      print(f"Error: couldn't initialize database from {config_filename}")
+      return False
+
+    scan_id = importReportForPipeline(db, report_filename, scan_dt_str, desc)
+    if scan_id == -1:
+      return False
+
+    if csv_filename and not outputCSVFull(db, scan_id, csv_filename):
+      return False
+    if xlsx_filename and not outputExcelFull(db, scan_id, xlsx_filename):
+      return False
+    if db_filename and not db.backupDatabase(db_filename):
+      return False
+    return True
+  finally:
+    db.closeDatabase()
+
+########## initial entry point ##########
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Import an SPDX report into " +
+    "an in-memory spdxSummarizer database and generate reports from it.")
+  parser.add_argument("report", help="SPDX tag:value file to import")
+  parser.add_argument("--config", default="spdxSummarizer/config.json",
+    help="config file for the new database")
+  parser.add_argument("--date", help="date of scan (YYYY-MM-DD); " +
+    "defaults to today")
+  parser.add_argument("--desc", default="pipeline import",
+    help="brief description of scan")
+  parser.add_argument("--csv", help="write CSV file listing to this file")
+  parser.add_argument("--xlsx", help="write Excel full report to this file")
+  parser.add_argument("--db", help="save the database to this file")
+  args = parser.parse_args()
+  if not runPipeline(args.report, args.config, args.date, args.desc,
+    args.csv, args.xlsx, args.db):
+    print("Pipeline failed.")
+    raise SystemExit(1)
@@ -0,0 +1,100 @@
+# querycontrol.py
+#
+# This module contains the SPQueryControl class, for cancelling long-running
+# SPDatabase queries, or stopping them after a deadline, using SQLite's
+# progress handler.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+
+# number of SQLite virtual machine instructions between calls to the
+# progress handler; small enough that a cancellation takes effect within a
+# few milliseconds, large enough that the handler doesn't slow queries down
+QUERY_PROGRESS_STEPS = 10000
+
+# minimum number of seconds between calls to an SPQueryControl's
+# progress callback
+QUERY_PROGRESS_REPORT_SECONDS = 1.0
+
+class SPQueryControl(object):
+  # arguments:
+  #   1) (optional) timeout: number of seconds after which queries are
+  #      stopped, or None for no deadline
+  #   2) (optional) on_progress: function called with this SPQueryControl,
+  #      at most once every QUERY_PROGRESS_REPORT_SECONDS while queries
+  #      are running
+  def __init__(self, timeout=None, on_progress=None):
+    super(SPQueryControl, self).__init__()
+    self.started = time.monotonic()
+    self.deadline = None
+    if timeout is not None:
+      self.deadline = self.started + timeout
+    self.on_progress = on_progress
+    self.lastReported = self.started
+    # set by cancel(), possibly from another thread or a signal handler
+    self.cancelled = False
+    # set when the deadline has passed while a query was running
+    self.timedOut = False
+    # set when a query has actually been stopped
+    self.interrupted = False
+    # approximate number of SQLite virtual machine instructions run so far
+    # by queries under this control; SQLite doesn't report rows processed
+    # to the progress handler, so this is the measure of progress
+    self.steps = 0
+
+  # Ask for the running query, and any later queries under this control,
+  # to be stopped. Takes effect the next time SQLite calls the progress
+  # handler; it is safe to call from another thread or a signal handler.
+  # arguments: N/A
+  # returns: N/A
+  def cancel(self):
+    self.cancelled = True
+
+  # Get the number of seconds since this SPQueryControl was created.
+  # arguments: N/A
+  # returns: float
+  def getElapsedSeconds(self):
+    return time.monotonic() - self.started
+
+  # Get a description of why queries were stopped.
+  # arguments: N/A
+  # returns: string, or None if queries weren't stopped
+  def getReason(self):
+    if not self.interrupted:
+      return None
+    if self.timedOut:
+      return "timed out"
+    return "cancelled"
+
+  # Progress handler, called by SQLite every QUERY_PROGRESS_STEPS
+  # instructions while a query is running.
+  # arguments: N/A
+  # returns: nonzero to stop the query, 0 to let it continue
+  def onProgress(self):
+    self.steps += QUERY_PROGRESS_STEPS
+    now = time.monotonic()
+    if self.deadline is not None and now >= self.deadline:
+      self.timedOut = True
+    if self.cancelled or self.timedOut:
+      self.interrupted = True
+      return 1
+    if self.on_progress is not None and \
+       now - self.lastReported >= QUERY_PROGRESS_REPORT_SECONDS:
+      self.lastReported = now
+      self.on_progress(self)
+    return 0
@@ -40,11 +40,11 @@ def outputCSVFull(db, scan_id, csv_filename):
     return False
 
   # analyze and split out files with no license found
-  retval = analyzeFileExtensionsForFlatDict(db, records)
+  retval = analyzeFileExtensionsForFlatDict(db, records, scan_id)
   if not retval:
     print(f"Error when trying to analyze for ignored file extensions.")
     # don't exit, keep going as-is
-  retval = analyzeVendorFilesForFlatDict(db, records)
+  retval = analyzeVendorFilesForFlatDict(db, records, scan_id)
   if not retval:
     print(f"Error when trying to analyze for vendor files.")
     # don't exit, keep going as-is
@@ -87,15 +87,23 @@ def outputExcelFull(db, scan_id, xlsx_filename):
     return False
 
   # analyze and split out files with no license found
-  retval = analyzeFileExtensions(db, cats)
+  retval = analyzeFileExtensions(db, cats, scan_id)
   if not retval:
     print(f"Error when trying to analyze for ignored file extensions.")
     # don't exit, keep going as-is
-  retval = analyzeVendorFiles(db, cats)
+  retval = analyzeVendorFiles(db, cats, scan_id)
   if not retval:
     print(f"Error when trying to analyze for vendor files.")
     # don't exit, keep going as-is
 
+  # get snippet license counts by category; these are only shown if the
+  # scan has any snippets
+  snippet_cats = db.getSnippetCategoryCountsForScan(scan_id)
+  if snippet_cats is None:
+    print(f"Error when trying to get snippet license counts.")
+    # don't exit, keep going without snippets
+    snippet_cats = {}
+
   try:
     with Workbook(xlsx_filename) as workbook:
       # prepare formats
@@ -114,12 +122,27 @@ def outputExcelFull(db, scan_id, xlsx_filename):
       statsSheet.set_column(0, 0, 2)
       statsSheet.set_column(1, 1, 58)
       statsSheet.set_column(2, 2, 10)
+      if snippet_cats:
+        statsSheet.write(0, 3, "# of snippets", bold)
+        statsSheet.set_column(3, 3, 14)
+
+      # add categories that only have snippets, in category ID order
+      cat_ids = list(cats.keys())
+      for cat_id in sorted(snippet_cats.keys()):
+        if cat_id not in cats:
+          cat_ids.append(cat_id)
 
       total = 0
+      snippet_total = 0
       row = 2
-      for cat_id, cat_data in cats.items():
-        cat_name = cat_data[0]
-        cat_stats = cat_data[2]
+      for cat_id in cat_ids:
+        if cat_id in cats:
+          cat_name = cats[cat_id][0]
+          cat_stats = cats[cat_id][2]
+        else:
+          cat_name = snippet_cats[cat_id][0]
+          cat_stats = {}
+        snippet_stats = snippet_cats.get(cat_id, (cat_name, {}))[1]
 
         # print category name in bold in column A
         statsSheet.write(row, 0, cat_name + ":", bold)
@@ -127,16 +150,32 @@ def outputExcelFull(db, scan_id, xlsx_filename):
 
         # now, loop through licenses in this category,
         # outputting name in col B and count in col C
+        # and snippet count in col D
         for lic_name, lic_count in cat_stats.items():
           statsSheet.write(row, 1, lic_name, normal)
           statsSheet.write(row, 2, lic_count, normal)
           total = total + lic_count
+          if snippet_cats:
+            snippet_count = snippet_stats.get(lic_name, 0)
+            statsSheet.write(row, 3, snippet_count, normal)
+            snippet_total = snippet_total + snippet_count
+          row = row + 1
+        # then licenses only found in snippets
+        for lic_name, snippet_count in snippet_stats.items():
+          if lic_name in cat_stats:
+            continue
+          statsSheet.write(row, 1, lic_name, normal)
+          statsSheet.write(row, 2, 0, normal)
+          statsSheet.write(row, 3, snippet_count, normal)
+          snippet_total = snippet_total + snippet_count
           row = row + 1
 
       # at the end, skip another row, then output the total
       row = row + 1
       statsSheet.write(row, 0, "TOTAL", bold)
       statsSheet.write(row, 2, total, bold)
+      if snippet_cats:
+        statsSheet.write(row, 3, snippet_total, bold)
 
       ##### CATEGORY PAGES #####
 
@@ -187,34 +226,21 @@ def outputExcelFull(db, scan_id, xlsx_filename):
 #   4) xlsx_filename: filename for XLSX output file to be created
 # returns: True if successfully created report, False otherwise
 def outputExcelComparison(db, first_scan_id, second_scan_id, xlsx_filename):
-  # get dicts of filename => license for each scan; exclude /.git/ files
-  first_files = db.getLicenseAndFilesForScan(first_scan_id, True)
-  if not first_files:
+  # make sure both scans have files before generating anything; exclude
+  # /.git/ files
+  if not db.hasLicenseAndFilesForScan(first_scan_id, True):
     print(f"Couldn't get scan results for scan {first_scan_id}")
     return False
-  second_files = db.getLicenseAndFilesForScan(second_scan_id, True)
-  if not second_files:
+  if not db.hasLicenseAndFilesForScan(second_scan_id, True):
     print(f"Couldn't get scan results for scan {second_scan_id}")
     return False
 
-  # pull out just the filenames
-  first_filenames = set(first_files.keys())
-  second_filenames = set(second_files.keys())
-
-  # compare sets and convert to sorted lists:
-  in_first_only = sorted(list(first_filenames.difference(second_filenames)))
-  in_second_only = sorted(list(second_filenames.difference(first_filenames)))
-  in_both = sorted(list(first_filenames.intersection(second_filenames)))
-
-  # now, get those in both where license has changed
-  # create list of tuples (filename, first_lic, second_lic) where changed
-  changed_lics = []
-  for filename in in_both:
-    first_license = first_files[filename]
-    second_license = second_files[filename]
-    if first_license != second_license:
-      t = (filename, first_license, second_license)
-      changed_lics.append(t)
+  # the comparisons themselves are run as joins in the database, and are
+  # streamed back in sorted order; exclude /.git/ files
+  changed_lics = db.getChangedLicensesForScans(first_scan_id, second_scan_id,
+    True)
+  in_first_only = db.getFilesOnlyInScan(first_scan_id, second_scan_id, True)
+  in_second_only = db.getFilesOnlyInScan(second_scan_id, first_scan_id, True)
 
   # now, start generating the report
   try:
@@ -262,8 +288,7 @@ def outputExcelComparison(db, first_scan_id, second_scan_id, xlsx_filename):
       # now, loop through files and licenses in this list,
       # outputting filename in col A and license in col B
       row = 1
-      for filename in in_first_only:
-        license = first_files[filename]
+      for filename, license in in_first_only:
         firstonlySheet.write(row, 0, filename, normal)
         firstonlySheet.write(row, 1, license, normal)
         row = row + 1
@@ -281,8 +306,7 @@ def outputExcelComparison(db, first_scan_id, second_scan_id, xlsx_filename):
       # now, loop through files and licenses in this list,
       # outputting filename in col A and license in col B
       row = 1
-      for filename in in_second_only:
-        license = second_files[filename]
+      for filename, license in in_second_only:
         secondonlySheet.write(row, 0, filename, normal)
         secondonlySheet.write(row, 1, license, normal)
         row = row + 1
@@ -19,12 +19,12 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # current version of spdxSummarizer
-SPVERSION = "0.2.2"
+SPVERSION = "0.2.13"
 
 # latest version in which database migrations are required
 # e.g. if a DB version is newer than this, then it doesn't require
 # a migration, even if it's older than the current SPVERSION
-SPVERSION_LAST_DB_CHANGE = "0.2.2"
+SPVERSION_LAST_DB_CHANGE = "0.2.13"
 
 # Get a version tuple from a version string
 # arguments:
@@ -0,0 +1,129 @@
+# tests/test_asyncdb.py
+#
+# Contains unit tests for the functionality in asyncdb.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from spdxSummarizer.asyncdb import AsyncSPDatabase
+
+class AsyncDatabaseTestSuite(unittest.TestCase):
+  """spdxSummarizer asyncio database access test suite."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.db_filename = os.path.join(self.tmpdir, "async.db")
+    self.loop = asyncio.new_event_loop()
+    self.db = AsyncSPDatabase()
+    self.runAsync(self.db.createDatabase(self.db_filename))
+    self.runAsync(self.db.initializeDatabaseTables("tests/test_config.json"))
+
+  def tearDown(self):
+    self.runAsync(self.db.shutdown())
+    self.loop.close()
+    shutil.rmtree(self.tmpdir)
+
+  def runAsync(self, coro):
+    return self.loop.run_until_complete(coro)
+
+  def makeFileTuples(self, count, lic_id=1):
+    return [(f"/dir{i // 100}/file{i}.c", lic_id, f"sha1-{i}", "", "")
+      for i in range(count)]
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_reads_and_writes_are_awaitable(self):
+    scan_id = self.runAsync(self.db.addNewScan("2017-01-01", "async scan"))
+    self.assertEqual(scan_id, 1)
+    self.assertTrue(self.runAsync(self.db.addBulkNewFiles(scan_id,
+      self.makeFileTuples(10))))
+    self.assertEqual(self.runAsync(self.db.getScansIDList()), [1])
+    lics = self.runAsync(self.db.getLicenseAndFilesForScan(scan_id))
+    self.assertEqual(len(lics), 10)
+
+  def test_database_is_in_wal_mode(self):
+    mode = self.db.reader.engine.execute("PRAGMA journal_mode").scalar()
+    self.assertEqual(mode, "wal")
+
+  def test_reads_run_concurrently_with_import(self):
+    scan_id = self.runAsync(self.db.addNewScan("2017-01-01", "first scan"))
+
+    async def readWhileImporting():
+      import_task = asyncio.ensure_future(self.db.addBulkNewFiles(scan_id,
+        self.makeFileTuples(20000)))
+      reads = 0
+      while not import_task.done():
+        scan_ids = await self.db.getScansIDList()
+        self.assertEqual(scan_ids, [1])
+        reads += 1
+      return (await import_task, reads)
+
+    retval, reads = self.runAsync(readWhileImporting())
+    self.assertTrue(retval)
+    self.assertGreater(reads, 1)
+    lics = self.runAsync(self.db.getLicenseAndFilesForScan(scan_id))
+    self.assertEqual(len(lics), 20000)
+
+  def test_reader_sees_reference_data_changes(self):
+    self.assertEqual(self.runAsync(self.db.getConfigForKey("project")),
+      "Test project")
+    self.runAsync(self.db.setConfigValue("project", "Renamed project"))
+    self.assertEqual(self.runAsync(self.db.getConfigForKey("project")),
+      "Renamed project")
+
+  def test_generator_functions_return_lists(self):
+    scan1 = self.runAsync(self.db.addNewScan("2017-01-01", "first scan"))
+    self.runAsync(self.db.addBulkNewFiles(scan1,
+      [("/a.c", 1, "sha1-a", "", "")]))
+    scan2 = self.runAsync(self.db.addNewScan("2017-02-02", "second scan"))
+    self.runAsync(self.db.addBulkNewFiles(scan2,
+      [("/a.c", 4, "sha1-a2", "", "")]))
+    changed = self.runAsync(self.db.getChangedLicensesForScans(scan1, scan2))
+    self.assertEqual(changed, [("/a.c", "Apache-2.0", "GPL-2.0")])
+
+  def test_reads_of_missing_derived_data_do_not_write(self):
+    scan_id = self.runAsync(self.db.addNewScan("2017-01-01", "first scan"))
+    self.runAsync(self.db.addNewFile(scan_id, "/a/b.c", 1, "sha1-b"))
+    self.assertEqual(self.runAsync(self.db.getDirectoryLicenseCounts(scan_id,
+      "/a/")), {"Apache-2.0": 1})
+    self.assertNotEqual(self.runAsync(self.db.getScanFingerprint(scan_id)),
+      None)
+    self.assertEqual(self.runAsync(self.db.getScansContainingPath("/a/b.c")),
+      [scan_id])
+    self.assertEqual(self.db.writer.engine.execute(
+      "SELECT count(*) FROM dir_license_counts").scalar(), 0)
+    self.assertEqual(self.db.writer.engine.execute(
+      "SELECT count(*) FROM dir_hashes").scalar(), 0)
+
+  def test_in_memory_database_uses_writer_for_reads(self):
+    db = AsyncSPDatabase()
+    self.assertTrue(self.runAsync(db.createDatabase(":memory:")))
+    self.runAsync(db.initializeDatabaseTables("tests/test_config.json"))
+    self.assertIsNone(db.reader)
+    self.assertTrue(self.runAsync(db.isInitialized()))
+    self.runAsync(db.shutdown())
+
+  def test_unknown_function_raises_attribute_error(self):
+    with self.assertRaises(AttributeError):
+      self.db.notARealFunction
+    with self.assertRaises(AttributeError):
+      self.db._getScanChain
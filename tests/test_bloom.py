@@ -0,0 +1,56 @@
+# tests/test_bloom.py
+#
+# Contains unit tests for the functionality in bloom.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import unittest
+
+from spdxSummarizer.bloom import SPBloomFilter, getPathHashes
+
+class BloomFilterTestSuite(unittest.TestCase):
+  """spdxSummarizer path Bloom filter test suite."""
+
+  def setUp(self):
+    self.paths = [f"/src/dir{i % 20}/file{i}.c" for i in range(1000)]
+    self.bloom = SPBloomFilter.fromPaths(self.paths)
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_contains_all_added_paths(self):
+    for path in self.paths:
+      self.assertTrue(self.bloom.mightContain(path))
+
+  def test_false_positive_rate_is_low(self):
+    others = [f"/other/dir{i % 20}/file{i}.c" for i in range(10000)]
+    false_positives = sum(1 for p in others if self.bloom.mightContain(p))
+    self.assertLess(false_positives, 300)
+
+  def test_empty_filter_contains_nothing(self):
+    bloom = SPBloomFilter.fromPaths([])
+    self.assertFalse(bloom.mightContain(""))
+    self.assertFalse(bloom.mightContain("/src/dir0/file0.c"))
+
+  def test_can_restore_from_bytes(self):
+    restored = SPBloomFilter(self.bloom.num_bits, self.bloom.num_hashes,
+      self.bloom.getBytes())
+    hashes = getPathHashes("/src/dir3/file3.c")
+    self.assertTrue(restored.mightContainHashes(hashes))
+    self.assertEqual(restored.getBytes(), self.bloom.getBytes())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,128 @@
+# tests/test_columnar.py
+#
+# Contains unit tests for the functionality in columnar.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from spdxSummarizer import columnar, dbtools
+
+@unittest.skipIf(columnar.pa is None, "pyarrow is not installed")
+class ColumnarTestSuite(unittest.TestCase):
+  """spdxSummarizer columnar export and import test suite."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.db = self.createDatabase()
+    scan1 = self.db.addNewScan("2017-01-01", "test scan 1")
+    self.db.addBulkNewFiles(scan1, [
+      ("/a/one.c", 1, "sha1-one", "md5-one", ""),
+      ("/a/two.c", 4, "sha1-two", "", ""),
+    ])
+    scan2 = self.db.addNewScan("2017-02-02", "test scan 2")
+    self.db.addBulkNewFiles(scan2, [
+      ("/a/one.c", 5, "sha1-one-v2", "", ""),
+      ("/b/three.c", 8, "sha1-three", "", ""),
+    ])
+
+  def tearDown(self):
+    self.db.closeDatabase()
+    shutil.rmtree(self.tmpdir)
+
+  def createDatabase(self):
+    db = dbtools.SPDatabase()
+    db.createDatabase(":memory:")
+    db.initializeDatabaseTables("tests/test_config.json")
+    return db
+
+  def assertRoundTrip(self, export_func, import_func, filename):
+    path = os.path.join(self.tmpdir, filename)
+    self.assertTrue(export_func(self.db, path))
+
+    new_db = self.createDatabase()
+    new_scan_ids = import_func(new_db, path)
+    self.assertEqual(new_scan_ids, [1, 2])
+    for scan_id in new_scan_ids:
+      self.assertEqual(new_db.getLicenseAndFilesForScan(scan_id),
+        self.db.getLicenseAndFilesForScan(scan_id))
+      self.assertEqual(new_db.getScanData(scan_id),
+        self.db.getScanData(scan_id))
+    new_db.closeDatabase()
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_parquet_round_trip(self):
+    self.assertRoundTrip(columnar.exportScansToParquet,
+      columnar.importScansFromParquet, "scans.parquet")
+
+  def test_arrow_round_trip(self):
+    self.assertRoundTrip(columnar.exportScansToArrow,
+      columnar.importScansFromArrow, "scans.arrow")
+
+  def test_can_export_single_scan(self):
+    path = os.path.join(self.tmpdir, "scan2.parquet")
+    self.assertTrue(columnar.exportScansToParquet(self.db, path, [2]))
+    table = columnar.pa.parquet.read_table(path)
+    self.assertEqual(table.num_rows, 2)
+    self.assertEqual(table.column("scan_id").to_pylist(), [2, 2])
+    self.assertEqual(table.column("filename").to_pylist(),
+      ["/a/one.c", "/b/three.c"])
+
+  def test_round_trip_keeps_missing_scan_description(self):
+    path = os.path.join(self.tmpdir, "scans.parquet")
+    scan3 = self.db.addNewScan("2017-03-03", None)
+    self.db.addBulkNewFiles(scan3, [("/c/four.c", 1, "sha1-four", "", "")])
+    self.assertTrue(columnar.exportScansToParquet(self.db, path))
+
+    new_db = self.createDatabase()
+    new_scan_ids = columnar.importScansFromParquet(new_db, path)
+    self.assertEqual(new_db.getScanData(new_scan_ids[-1]),
+      (new_scan_ids[-1], "2017-03-03", None))
+    self.assertEqual(new_db.getScanData(new_scan_ids[0]),
+      self.db.getScanData(1))
+    new_db.closeDatabase()
+
+  def test_license_and_category_columns_are_dictionary_encoded(self):
+    path = os.path.join(self.tmpdir, "scans.arrow")
+    self.assertTrue(columnar.exportScansToArrow(self.db, path))
+    with columnar.pa.ipc.open_file(path) as reader:
+      schema = reader.schema
+    self.assertTrue(columnar.pa.types.is_dictionary(schema.field("license").type))
+    self.assertTrue(columnar.pa.types.is_dictionary(schema.field("category").type))
+
+  def test_import_adds_unknown_license_to_matching_category(self):
+    path = os.path.join(self.tmpdir, "scans.parquet")
+    self.db.addNewLicense("BSD-3-Clause", 4)
+    scan3 = self.db.addNewScan("2017-03-03", "test scan 3")
+    self.db.addBulkNewFiles(scan3, [("/c/bsd.c", 10, "sha1-bsd", "", "")])
+    self.assertTrue(columnar.exportScansToParquet(self.db, path, [scan3]))
+
+    new_db = self.createDatabase()
+    new_scan_ids = columnar.importScansFromParquet(new_db, path)
+    self.assertEqual(new_db.getLicenseAndFilesForScan(new_scan_ids[0]),
+      {"/c/bsd.c": "BSD-3-Clause"})
+    self.assertEqual(new_db.getLicenseData(10), (10, "BSD-3-Clause", 4))
+    new_db.closeDatabase()
+
+########## MAIN ENTRY POINT ##########
+
+if __name__ == "__main__":
+  unittest.main()
@@ -18,12 +18,20 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
 
 from datetime import date
 
+from sqlalchemy import event
+
 from spdxSummarizer import dbtools
-from spdxSummarizer.datatypes import Scan
+from spdxSummarizer.datatypes import Scan, File, DirLicenseCount, DirHash, \
+  ScanBloom, PathHistory, Snippet, Relationship, RelationshipClosure
 
 class DBToolsTestSuite(unittest.TestCase):
   """spdxSummarizer database tools test suite."""
@@ -39,6 +47,7 @@ class DBToolsTestSuite(unittest.TestCase):
 
     # also import some basic scans and files
     self.insertSampleScanData()
+    self.insertSampleFileData()
 
   def tearDown(self):
     self.db.closeDatabase()
@@ -54,6 +63,26 @@ class DBToolsTestSuite(unittest.TestCase):
     self.db.session.bulk_save_objects(scans)
     self.db.session.commit()
 
+  def insertSampleFileData(self):
+    # license IDs: 1 => Apache-2.0, 4 => GPL-2.0, 5 => MIT,
+    # 8 => No license found
+    scan1_files = [
+      ("/a/one.c", 1, "sha1-one", "", ""),
+      ("/a/two.c", 4, "sha1-two", "", ""),
+      ("/b/.git/config", 8, "sha1-git", "", ""),
+      ("/b/three.c", 5, "sha1-three", "", ""),
+      ("/c/old.c", 1, "sha1-old", "", ""),
+    ]
+    scan2_files = [
+      ("/a/one.c", 1, "sha1-one", "", ""),
+      ("/a/two.c", 5, "sha1-two-v2", "", ""),
+      ("/b/.git/config", 1, "sha1-git-v2", "", ""),
+      ("/b/three.c", 5, "sha1-three", "", ""),
+      ("/d/new.c", 4, "sha1-new", "", ""),
+    ]
+    self.db.addBulkNewFiles(1, scan1_files)
+    self.db.addBulkNewFiles(2, scan2_files)
+
   ########## TESTS BELOW HERE ##########
 
   def test_smoke(self):
@@ -363,6 +392,1224 @@ class DBToolsTestSuite(unittest.TestCase):
       self.assertGreater(id, last_id)
       last_id = id
 
+  ##### Scan comparison data
+
+  def test_can_get_changed_licenses_between_scans(self):
+    changed = list(self.db.getChangedLicensesForScans(1, 2))
+    self.assertEqual(changed, [
+      ("/a/two.c", "GPL-2.0", "MIT"),
+      ("/b/.git/config", "No license found", "Apache-2.0"),
+    ])
+
+  def test_changed_licenses_can_exclude_git_files(self):
+    changed = list(self.db.getChangedLicensesForScans(1, 2, True))
+    self.assertEqual(changed, [("/a/two.c", "GPL-2.0", "MIT")])
+
+  def test_can_get_files_only_in_each_scan(self):
+    first_only = list(self.db.getFilesOnlyInScan(1, 2, True))
+    self.assertEqual(first_only, [("/c/old.c", "Apache-2.0")])
+    second_only = list(self.db.getFilesOnlyInScan(2, 1, True))
+    self.assertEqual(second_only, [("/d/new.c", "GPL-2.0")])
+
+  def test_files_only_in_scan_are_sorted_by_filename(self):
+    # scan 3 has no files, so everything in scan 1 is "only in scan 1"
+    first_only = [t[0] for t in self.db.getFilesOnlyInScan(1, 3)]
+    self.assertEqual(len(first_only), 5)
+    self.assertEqual(first_only, sorted(first_only))
+
+  def test_can_check_whether_scan_has_files_to_compare(self):
+    self.assertTrue(self.db.hasLicenseAndFilesForScan(1, True))
+    self.assertFalse(self.db.hasLicenseAndFilesForScan(3))
+    self.assertFalse(self.db.hasLicenseAndFilesForScan(99))
+    self.db.addBulkNewFiles(3, [("/e/.git/HEAD", 1, "sha1-head", "", "")])
+    self.assertTrue(self.db.hasLicenseAndFilesForScan(3))
+    self.assertFalse(self.db.hasLicenseAndFilesForScan(3, True))
+
+  ##### Delta scan storage
+
+  def addScanCopy(self, source_scan_id):
+    # add a new scan containing the same files as an existing scan
+    scan_id = self.db.addNewScan("2018-01-01")
+    file_tuples = []
+    for (filename, license) in self.db.getLicenseAndFilesForScan(source_scan_id).items():
+      fd = self.db.getFileInstanceData(source_scan_id, filename)
+      file_tuples.append((filename, fd[3], fd[4], fd[5], fd[6]))
+    self.db.addBulkNewFiles(scan_id, file_tuples)
+    return scan_id
+
+  def countStoredFiles(self, scan_id):
+    return self.db.session.query(File).filter(File.scan_id == scan_id).count()
+
+  def test_scans_are_stored_in_full_by_default(self):
+    scan_id = self.addScanCopy(1)
+    self.assertEqual(self.countStoredFiles(scan_id), 5)
+    self.assertEqual(self.db.getScanData(scan_id)[0], scan_id)
+
+  def test_delta_scan_stores_only_changes(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    # two changed, one added and one removed
+    self.assertEqual(self.countStoredFiles(second_id), 4)
+    self.assertEqual(self.db.getLicenseAndFilesForScan(second_id),
+      self.db.getLicenseAndFilesForScan(2))
+    self.assertEqual(self.db.getCategoryFilesForScan(second_id, True),
+      self.db.getCategoryFilesForScan(2, True))
+
+  def test_delta_scan_file_instance_is_reconstructed(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    fd = self.db.getFileInstanceData(second_id, "/a/one.c")
+    self.assertEqual(fd[1:], (second_id, "/a/one.c", 1, "sha1-one", "", ""))
+    self.assertIsNone(self.db.getFileInstanceData(second_id, "/c/old.c"))
+
+  def test_delta_scans_compare_like_full_scans(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    self.assertEqual(
+      list(self.db.getChangedLicensesForScans(first_id, second_id)),
+      list(self.db.getChangedLicensesForScans(1, 2)))
+    self.assertEqual(list(self.db.getFilesOnlyInScan(first_id, second_id)),
+      [("/c/old.c", "Apache-2.0")])
+    self.assertEqual(list(self.db.getFilesOnlyInScan(second_id, first_id)),
+      [("/d/new.c", "GPL-2.0")])
+
+  def test_delta_chain_is_bounded_by_keyframes(self):
+    self.db.setConfigValue("delta_keyframe_interval", "2")
+    # scan 9 is a delta against scan 8, which has no files
+    first_id = self.addScanCopy(1)
+    self.assertEqual(self.db.session.query(Scan.parent_scan_id).\
+      filter(Scan.id == first_id).scalar(), 8)
+    # so scan 10 is stored in full as a keyframe
+    second_id = self.addScanCopy(2)
+    self.assertIsNone(self.db.session.query(Scan.parent_scan_id).\
+      filter(Scan.id == second_id).scalar())
+    self.assertEqual(self.countStoredFiles(second_id), 5)
+
+  ##### Scan deletion and pruning
+
+  def test_can_delete_scan_and_its_files(self):
+    self.assertTrue(self.db.deleteScan(1))
+    self.assertIsNone(self.db.getScanData(1))
+    self.assertEqual(self.countStoredFiles(1), 0)
+    self.assertEqual(self.countStoredFiles(2), 5)
+    self.assertEqual(self.db.getScansIDList(), [2, 3, 8])
+
+  def test_cannot_delete_missing_scan(self):
+    self.assertFalse(self.db.deleteScan(17))
+
+  def test_failed_delete_invalidates_cache(self):
+    self.db.addNewLicense("Pending-1.0", 1, False)
+    self.assertEqual(self.db.getLicensesData()[-1][1], "Pending-1.0")
+    # make deleting the scan's derived data fail partway through
+    self.db.session.execute("DROP TABLE path_history")
+    self.assertFalse(self.db.deleteScan(1))
+    self.assertNotEqual(self.db.getLicensesData()[-1][1], "Pending-1.0")
+    self.assertIsNotNone(self.db.getScanData(1))
+
+  def test_deleting_delta_parent_keeps_child_files(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    self.assertEqual(self.countStoredFiles(second_id), 4)
+    self.assertTrue(self.db.deleteScan(first_id))
+    self.assertIsNone(self.db.session.query(Scan.parent_scan_id).\
+      filter(Scan.id == second_id).scalar())
+    self.assertEqual(self.countStoredFiles(second_id), 5)
+    self.assertEqual(self.db.getLicenseAndFilesForScan(second_id),
+      self.db.getLicenseAndFilesForScan(2))
+
+  def test_can_get_scans_to_prune(self):
+    # scans 1, 2 and 3 are in 2017 Q1; scan 8 is in 2017 Q3
+    self.assertEqual(self.db.getScansToPrune(1), [1, 2])
+    self.assertEqual(self.db.getScansToPrune(1, False), [1, 2, 3])
+    self.assertEqual(self.db.getScansToPrune(3, False), [1])
+    self.assertEqual(self.db.getScansToPrune(0, False), [1, 2, 3, 8])
+
+  def test_can_prune_scans(self):
+    self.assertEqual(self.db.pruneScans(1), [1, 2])
+    self.assertEqual(self.db.getScansIDList(), [3, 8])
+    self.assertEqual(self.countStoredFiles(1), 0)
+    self.assertEqual(self.countStoredFiles(2), 0)
+
+  def test_reclaim_space_after_deleting_scan(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = dbtools.SPDatabase()
+      db.createDatabase(os.path.join(tmpdir, "reclaim.db"))
+      db.initializeDatabaseTables("tests/test_config.json")
+      self.assertEqual(db.session.execute("PRAGMA auto_vacuum").scalar(), 2)
+      scan_id = db.addNewScan("2017-01-01")
+      db.addBulkNewFiles(scan_id, [(f"/dir/file{i}.c", 1, f"sha1-{i}", "", "")
+        for i in range(5000)])
+      self.assertTrue(db.deleteScan(scan_id))
+      self.assertGreater(db.reclaimSpace(), 0)
+      self.assertEqual(db.session.execute("PRAGMA freelist_count").scalar(), 0)
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  ##### Path search
+
+  def test_can_search_files_across_scans(self):
+    self.assertEqual(self.db.searchFiles("*/a/*"), [
+      (1, "/a/one.c", "Apache-2.0"),
+      (1, "/a/two.c", "GPL-2.0"),
+      (2, "/a/one.c", "Apache-2.0"),
+      (2, "/a/two.c", "MIT"),
+    ])
+
+  def test_search_without_wildcards_matches_substring(self):
+    self.assertEqual(self.db.searchFiles("three"), [
+      (1, "/b/three.c", "MIT"),
+      (2, "/b/three.c", "MIT"),
+    ])
+
+  def test_can_search_files_in_selected_scans(self):
+    self.assertEqual(self.db.searchFiles("*.c", [2, 3]), [
+      (2, "/a/one.c", "Apache-2.0"),
+      (2, "/a/two.c", "MIT"),
+      (2, "/b/three.c", "MIT"),
+      (2, "/d/new.c", "GPL-2.0"),
+    ])
+
+  def test_search_index_is_kept_in_sync(self):
+    self.db.addNewFile(3, "/e/found.c", 1, "sha1-found")
+    self.assertEqual(self.db.searchFiles("found"),
+      [(3, "/e/found.c", "Apache-2.0")])
+    self.db.deleteScan(3)
+    self.assertEqual(self.db.searchFiles("found"), [])
+
+  def test_search_finds_files_in_delta_scans(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    # /a/one.c is unchanged, so it is only stored in the first scan
+    self.assertEqual(self.db.searchFiles("one.c", [first_id, second_id]), [
+      (first_id, "/a/one.c", "Apache-2.0"),
+      (second_id, "/a/one.c", "Apache-2.0"),
+    ])
+    self.assertEqual(self.db.searchFiles("old.c", [second_id]), [])
+
+  def test_search_statement_count_does_not_grow_with_scans(self):
+    self.db.searchFiles("one.c")
+    count = self.countQueries(lambda: self.db.searchFiles("one.c"))
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    new_ids = [self.addScanCopy(2) for i in range(4)]
+    alias_id = self.db.addScanAlias(new_ids[-1], "2017-09-09")
+    self.db.searchFiles("one.c")
+    self.assertEqual(self.countQueries(lambda: self.db.searchFiles("one.c")),
+      count)
+    self.assertEqual(self.db.searchFiles("one.c"),
+      [(scan_id, "/a/one.c", "Apache-2.0")
+        for scan_id in [1, 2] + new_ids + [alias_id]])
+
+  def test_search_works_without_index(self):
+    for name in ["files_fts_delete", "files_fts_update"]:
+      self.db.session.execute(f"DROP TRIGGER {name}")
+    self.db.session.execute("DROP TABLE files_fts")
+    self.db.invalidateCache()
+    self.assertEqual(self.db.searchFiles("three", [1]),
+      [(1, "/b/three.c", "MIT")])
+
+  ##### Directory license counts
+
+  def test_can_get_license_counts_for_whole_scan(self):
+    self.assertEqual(self.db.getDirectoryLicenseCounts(1), {
+      "Apache-2.0": 2, "GPL-2.0": 1, "MIT": 1, "No license found": 1,
+    })
+
+  def test_can_get_license_counts_for_directory(self):
+    expected = {"MIT": 1, "No license found": 1}
+    self.assertEqual(self.db.getDirectoryLicenseCounts(1, "/b/"), expected)
+    self.assertEqual(self.db.getDirectoryLicenseCounts(1, "/b"), expected)
+    self.assertEqual(self.db.getDirectoryLicenseCounts(1, "/b/.git"),
+      {"No license found": 1})
+    self.assertEqual(self.db.getDirectoryLicenseCounts(1, "/nope"), {})
+
+  def test_can_get_license_counts_for_subdirectories(self):
+    self.assertEqual(self.db.getSubdirectoryLicenseCounts(2, "/"), {
+      "/a/": {"Apache-2.0": 1, "MIT": 1},
+      "/b/": {"Apache-2.0": 1, "MIT": 1},
+      "/d/": {"GPL-2.0": 1},
+    })
+    self.assertEqual(self.db.getSubdirectoryLicenseCounts(2, "/b", 2),
+      {"/b/.git/": {"Apache-2.0": 1}})
+    self.assertEqual(list(self.db.getSubdirectoryLicenseCounts(2, "", 3)),
+      ["/", "/a/", "/b/", "/b/.git/", "/d/"])
+
+  def test_directory_counts_for_delta_scans_match_full_scans(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    self.assertEqual(self.db.getSubdirectoryLicenseCounts(second_id, "", 3),
+      self.db.getSubdirectoryLicenseCounts(2, "", 3))
+
+  def test_directory_counts_fall_back_to_files_when_missing(self):
+    self.db.addNewFile(3, "/e/f/new.c", 4, "sha1-new")
+    self.db.addNewFile(3, "/e/other.c", 4, "sha1-other")
+    self.assertEqual(self.db.getDirectoryLicenseCounts(3, "/e/"),
+      {"GPL-2.0": 2})
+    self.assertEqual(self.db.getSubdirectoryLicenseCounts(3, "/", 2), {
+      "/e/": {"GPL-2.0": 2}, "/e/f/": {"GPL-2.0": 1},
+    })
+    # reading them doesn't build them
+    self.assertEqual(self.db.session.query(DirLicenseCount).\
+      filter(DirLicenseCount.scan_id == 3).count(), 0)
+
+  def test_can_rebuild_directory_counts(self):
+    self.db.addNewFile(3, "/e/f/new.c", 4, "sha1-new")
+    self.db.addNewFile(3, "/e/other.c", 4, "sha1-other")
+    fallback = self.db.getSubdirectoryLicenseCounts(3, "", 3)
+    self.assertTrue(self.db.rebuildDirectoryCounts([3]))
+    self.assertNotEqual(self.db.session.query(DirLicenseCount).\
+      filter(DirLicenseCount.scan_id == 3).count(), 0)
+    self.assertEqual(self.db.getSubdirectoryLicenseCounts(3, "", 3), fallback)
+    self.assertEqual(self.db.getDirectoryLicenseCounts(3, "/e/"),
+      {"GPL-2.0": 2})
+
+  def test_directory_counts_are_deleted_with_scan(self):
+    self.db.deleteScan(1)
+    self.assertEqual(self.db.session.query(DirLicenseCount).\
+      filter(DirLicenseCount.scan_id == 1).count(), 0)
+
+  ##### Directory hashes
+
+  def test_copied_scan_is_identical(self):
+    copy_id = self.addScanCopy(1)
+    self.assertTrue(self.db.areScansIdentical(1, copy_id))
+    self.assertFalse(self.db.areScansIdentical(1, 2))
+    self.assertEqual(self.db.getChangedDirectories(1, copy_id), [])
+    self.assertEqual(list(self.db.getChangedLicensesForScans(1, copy_id)), [])
+
+  def test_empty_scan_has_empty_fingerprint(self):
+    self.assertEqual(self.db.getScanFingerprint(3),
+      dbtools.EMPTY_SCAN_FINGERPRINT)
+    self.assertTrue(self.db.areScansIdentical(3, 8))
+
+  def test_can_get_changed_directories(self):
+    self.assertEqual(self.db.getChangedDirectories(1, 2),
+      ["", "/", "/a/", "/b/", "/b/.git/", "/c/", "/d/"])
+
+  def test_fingerprints_for_delta_scans_match_full_scans(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    self.assertEqual(self.db.getScanFingerprint(second_id),
+      self.db.getScanFingerprint(2))
+
+  def test_comparisons_match_when_not_pruned(self):
+    pruned = (list(self.db.getChangedLicensesForScans(1, 2)),
+      list(self.db.getFilesOnlyInScan(1, 2)))
+    old_max = dbtools.COMPARISON_PRUNE_MAX_DIRECTORIES
+    dbtools.COMPARISON_PRUNE_MAX_DIRECTORIES = 0
+    try:
+      self.assertEqual((list(self.db.getChangedLicensesForScans(1, 2)),
+        list(self.db.getFilesOnlyInScan(1, 2))), pruned)
+    finally:
+      dbtools.COMPARISON_PRUNE_MAX_DIRECTORIES = old_max
+
+  def test_directory_hashes_fall_back_to_files_after_adding_file(self):
+    copy_id = self.addScanCopy(1)
+    self.assertTrue(self.db.areScansIdentical(1, copy_id))
+    self.db.addNewFile(copy_id, "/a/extra.c", 4, "sha1-extra")
+    self.assertFalse(self.db.areScansIdentical(1, copy_id))
+    self.assertEqual(self.db.getChangedDirectories(1, copy_id),
+      ["", "/", "/a/"])
+    self.assertEqual(list(self.db.getFilesOnlyInScan(copy_id, 1)),
+      [("/a/extra.c", "GPL-2.0")])
+    # reading them doesn't build them
+    self.assertEqual(self.db.session.query(DirHash).\
+      filter(DirHash.scan_id == copy_id).count(), 0)
+
+  def test_can_rebuild_directory_hashes(self):
+    copy_id = self.addScanCopy(1)
+    self.db.addNewFile(copy_id, "/a/extra.c", 4, "sha1-extra")
+    fingerprint = self.db.getScanFingerprint(copy_id)
+    self.assertTrue(self.db.rebuildDirectoryHashes([copy_id]))
+    self.assertNotEqual(self.db.session.query(DirHash).\
+      filter(DirHash.scan_id == copy_id).count(), 0)
+    self.assertEqual(self.db.getScanFingerprint(copy_id), fingerprint)
+    self.assertEqual(self.db.getChangedDirectories(1, copy_id),
+      ["", "/", "/a/"])
+
+  def test_directory_hashes_are_deleted_with_scan(self):
+    self.db.deleteScan(1)
+    self.assertEqual(self.db.session.query(DirHash).\
+      filter(DirHash.scan_id == 1).count(), 0)
+
+  ##### Scan aliases
+
+  def getScanFileTuples(self, scan_id):
+    file_tuples = []
+    for filename in self.db.getLicenseAndFilesForScan(scan_id):
+      fd = self.db.getFileInstanceData(scan_id, filename)
+      file_tuples.append((filename, fd[3], fd[4], fd[5], fd[6]))
+    return file_tuples
+
+  def test_content_digest_matches_fingerprint(self):
+    self.assertEqual(dbtools.getContentDigest(self.getScanFileTuples(1)),
+      self.db.getScanFingerprint(1))
+    self.assertEqual(dbtools.getContentDigest([]),
+      dbtools.EMPTY_SCAN_FINGERPRINT)
+
+  def test_can_find_scan_by_content_digest(self):
+    digest = dbtools.getContentDigest(self.getScanFileTuples(2))
+    self.assertEqual(self.db.getScanForContentDigest(digest), 2)
+    self.assertIsNone(self.db.getScanForContentDigest("nope"))
+
+  def clearContentDigest(self, scan_id):
+    scan = self.db.session.query(Scan).filter(Scan.id == scan_id).first()
+    scan.content_digest = None
+    self.db.session.commit()
+
+  def getContentDigest(self, scan_id):
+    return self.db.session.query(Scan.content_digest).\
+      filter(Scan.id == scan_id).scalar()
+
+  def test_finding_scan_without_content_digest_does_not_fill_it(self):
+    self.clearContentDigest(2)
+    digest = dbtools.getContentDigest(self.getScanFileTuples(2))
+    self.assertEqual(self.db.getScanForContentDigest(digest), 2)
+    self.assertIsNone(self.getContentDigest(2))
+
+  def test_can_fill_content_digests(self):
+    self.clearContentDigest(2)
+    self.assertTrue(self.db.fillContentDigests())
+    digest = dbtools.getContentDigest(self.getScanFileTuples(2))
+    self.assertEqual(self.getContentDigest(2), digest)
+    # scans without files are left without one
+    self.assertIsNone(self.getContentDigest(3))
+    self.assertEqual(self.db.getScanForContentDigest(digest), 2)
+
+  def test_can_find_scan_by_document_digest(self):
+    scan_id = self.db.addNewScan("2018-01-01", "doc scan", True, "abc123")
+    self.assertEqual(self.db.getScanForDocumentDigest("abc123"), scan_id)
+    self.assertIsNone(self.db.getScanForDocumentDigest("def456"))
+
+  def test_alias_has_same_files_without_storing_them(self):
+    alias_id = self.db.addScanAlias(1, "2018-01-01", "alias", "abc123")
+    self.assertEqual(self.countStoredFiles(alias_id), 0)
+    self.assertEqual(self.db.getScanAliasOf(alias_id), 1)
+    self.assertIsNone(self.db.getScanAliasOf(1))
+    self.assertEqual(self.db.getLicenseAndFilesForScan(alias_id),
+      self.db.getLicenseAndFilesForScan(1))
+    self.assertTrue(self.db.areScansIdentical(1, alias_id))
+    # an alias of the alias, or a scan found through it, is an alias of 1
+    self.assertEqual(self.db.getScanForDocumentDigest("abc123"), 1)
+    second_alias_id = self.db.addScanAlias(alias_id, "2018-02-01")
+    self.assertEqual(self.db.getScanAliasOf(second_alias_id), 1)
+
+  def test_cannot_add_alias_of_missing_scan(self):
+    self.assertEqual(self.db.addScanAlias(17, "2018-01-01"), -1)
+
+  def test_alias_is_stored_in_full_when_scan_deleted(self):
+    alias_id = self.db.addScanAlias(1, "2018-01-01", "alias")
+    files = self.db.getLicenseAndFilesForScan(1)
+    self.assertTrue(self.db.deleteScan(1))
+    self.assertIsNone(self.db.getScanAliasOf(alias_id))
+    self.assertEqual(self.countStoredFiles(alias_id), 5)
+    self.assertEqual(self.db.getLicenseAndFilesForScan(alias_id), files)
+
+  def test_adding_files_to_alias_stores_it_in_full(self):
+    alias_id = self.db.addScanAlias(1, "2018-01-01", "alias")
+    self.db.addNewFile(alias_id, "/a/extra.c", 4, "sha1-extra")
+    self.assertIsNone(self.db.getScanAliasOf(alias_id))
+    self.assertEqual(self.countStoredFiles(alias_id), 6)
+    self.assertEqual(self.countStoredFiles(1), 5)
+    self.assertFalse(self.db.areScansIdentical(1, alias_id))
+
+  ##### Snippets
+
+  def insertSampleSnippets(self):
+    # license IDs: 1 => Apache-2.0, 4 => GPL-2.0, 5 => MIT
+    return self.db.addBulkNewSnippets(1, [
+      ("/a/one.c", "SPDXRef-Snippet1", 100, 199, 5, 9, 4),
+      ("/a/one.c", "SPDXRef-Snippet2", 150, 299, 8, 14, 5),
+      ("/a/one.c", "SPDXRef-Snippet3", 1000, 1999, None, None, 5),
+      ("/b/three.c", "SPDXRef-Snippet4", 0, 99, 1, 4, 1),
+    ])
+
+  def test_can_add_and_get_snippets(self):
+    self.assertTrue(self.insertSampleSnippets())
+    self.assertEqual(self.db.getSnippetsForFile(1, "/a/one.c"), [
+      ("SPDXRef-Snippet1", 100, 199, 5, 9, "GPL-2.0"),
+      ("SPDXRef-Snippet2", 150, 299, 8, 14, "MIT"),
+      ("SPDXRef-Snippet3", 1000, 1999, None, None, "MIT"),
+    ])
+    self.assertEqual(len(self.db.getSnippetsForScan(1)), 4)
+    self.assertEqual(self.db.getSnippetsForScan(2), [])
+
+  def test_can_get_snippet_licenses_for_byte_range(self):
+    self.insertSampleSnippets()
+    get = self.db.getSnippetLicensesForRange
+    self.assertEqual(get(1, "/a/one.c", 0, 99), [])
+    self.assertEqual(get(1, "/a/one.c", 0, 100), ["GPL-2.0"])
+    self.assertEqual(get(1, "/a/one.c", 160, 170), ["GPL-2.0", "MIT"])
+    self.assertEqual(get(1, "/a/one.c", 200, 1000), ["MIT"])
+    self.assertEqual(get(1, "/b/three.c", 0, 10), ["Apache-2.0"])
+    self.assertEqual(get(2, "/a/one.c", 0, 5000), [])
+
+  def test_can_get_snippet_licenses_for_line_range(self):
+    self.insertSampleSnippets()
+    get = self.db.getSnippetLicensesForRange
+    self.assertEqual(get(1, "/a/one.c", 1, 4, True), [])
+    self.assertEqual(get(1, "/a/one.c", 9, 9, True), ["GPL-2.0", "MIT"])
+    # snippets without line ranges aren't found by line
+    self.assertEqual(get(1, "/a/one.c", 15, 100, True), [])
+
+  def test_snippet_range_queries_work_without_rtree(self):
+    self.insertSampleSnippets()
+    self.db.session.execute("DROP TRIGGER snippets_rtree_insert")
+    self.db.session.execute("DROP TRIGGER snippets_rtree_delete")
+    self.db.session.execute("DROP TABLE snippets_rtree")
+    self.db.invalidateCache()
+    get = self.db.getSnippetLicensesForRange
+    self.assertEqual(get(1, "/a/one.c", 160, 170), ["GPL-2.0", "MIT"])
+    self.assertEqual(get(1, "/a/one.c", 9, 9, True), ["GPL-2.0", "MIT"])
+    self.assertEqual(get(1, "/a/one.c", 15, 100, True), [])
+
+  def test_can_get_snippet_category_counts(self):
+    self.insertSampleSnippets()
+    self.assertEqual(self.db.getSnippetCategoryCountsForScan(1), {
+      1: ("Project licenses", {"Apache-2.0": 1}),
+      3: ("Copyleft", {"GPL-2.0": 1}),
+      4: ("Attribution", {"MIT": 2}),
+    })
+    self.assertEqual(self.db.getSnippetCategoryCountsForScan(2), {})
+
+  def test_snippets_are_deleted_with_scan(self):
+    self.insertSampleSnippets()
+    self.db.deleteScan(1)
+    self.assertEqual(self.db.session.query(Snippet).count(), 0)
+    self.assertEqual(self.db.session.execute(
+      "SELECT count(*) FROM snippets_rtree").scalar(), 0)
+
+  def test_alias_uses_and_keeps_snippets_of_original(self):
+    self.insertSampleSnippets()
+    snippets = self.db.getSnippetsForScan(1)
+    alias_id = self.db.addScanAlias(1, "2018-01-01", "alias")
+    self.assertEqual(self.db.getSnippetsForScan(alias_id), snippets)
+    self.assertEqual(self.db.getSnippetLicensesForRange(alias_id,
+      "/b/three.c", 0, 10), ["Apache-2.0"])
+    self.assertTrue(self.db.deleteScan(1))
+    self.assertEqual(self.db.getSnippetsForScan(alias_id), snippets)
+    self.assertEqual(self.db.getSnippetLicensesForRange(alias_id,
+      "/b/three.c", 0, 10), ["Apache-2.0"])
+
+  def test_same_content_requires_same_snippets(self):
+    file_tuples = self.getScanFileTuples(1)
+    self.assertEqual(self.db.getScanWithSameContent(file_tuples), 1)
+    self.insertSampleSnippets()
+    self.assertIsNone(self.db.getScanWithSameContent(file_tuples))
+    snippet_tuples = self.db.getSnippetsForScan(1)
+    self.assertEqual(self.db.getScanWithSameContent(file_tuples,
+      snippet_tuples), 1)
+
+  ##### Relationships
+
+  # license IDs: 1 => Apache-2.0, 4 => GPL-2.0, 5 => MIT
+  SAMPLE_ELEMENTS = [
+    ("SPDXRef-DOCUMENT", "DOCUMENT", "test doc", None),
+    ("SPDXRef-A", "PACKAGE", "package A", None),
+    ("SPDXRef-B", "PACKAGE", "package B", None),
+    ("SPDXRef-F1", "FILE", "/a/one.c", 1),
+    ("SPDXRef-F2", "FILE", "/a/two.c", 4),
+    ("SPDXRef-F3", "FILE", "/b/three.c", 5),
+    ("SPDXRef-F4", "FILE", "/c/old.c", 1),
+  ]
+  SAMPLE_RELATIONSHIPS = [
+    ("SPDXRef-DOCUMENT", "DESCRIBES", "SPDXRef-A"),
+    ("SPDXRef-A", "CONTAINS", "SPDXRef-F1"),
+    ("SPDXRef-A", "CONTAINS", "SPDXRef-F2"),
+    ("SPDXRef-A", "DEPENDS_ON", "SPDXRef-B"),
+    ("SPDXRef-F3", "CONTAINED_BY", "SPDXRef-B"),
+    # a cycle back to A
+    ("SPDXRef-B", "DYNAMIC_LINK", "SPDXRef-A"),
+    # not followed by the closure
+    ("SPDXRef-A", "OTHER", "SPDXRef-F4"),
+  ]
+
+  def insertSampleRelationships(self):
+    return self.db.addBulkNewRelationships(1, self.SAMPLE_ELEMENTS,
+      self.SAMPLE_RELATIONSHIPS)
+
+  def getClosureRows(self, scan_id):
+    return sorted(rc.asTuple()[2:] for rc in
+      self.db.session.query(RelationshipClosure).\
+      filter(RelationshipClosure.scan_id == scan_id))
+
+  def test_can_add_and_get_relationships(self):
+    self.assertTrue(self.insertSampleRelationships())
+    self.assertEqual(self.db.getElementsForScan(1),
+      sorted(self.SAMPLE_ELEMENTS))
+    self.assertEqual(self.db.getRelationshipsForScan(1),
+      sorted(self.SAMPLE_RELATIONSHIPS))
+    self.assertEqual(self.db.getRelationshipsForElement(1, "SPDXRef-B"), [
+      ("SPDXRef-A", "DEPENDS_ON", "SPDXRef-B"),
+      ("SPDXRef-B", "DYNAMIC_LINK", "SPDXRef-A"),
+      ("SPDXRef-F3", "CONTAINED_BY", "SPDXRef-B"),
+    ])
+    self.assertEqual(self.db.getRelationshipsForScan(2), [])
+
+  def test_can_get_reachable_files_and_licenses(self):
+    self.insertSampleRelationships()
+    expected = [
+      ("/a/one.c", "Apache-2.0"),
+      ("/a/two.c", "GPL-2.0"),
+      ("/b/three.c", "MIT"),
+    ]
+    self.assertEqual(self.db.getReachableFilesForElement(1, "SPDXRef-A"),
+      expected)
+    self.assertEqual(self.db.getReachableFilesForElement(1,
+      "SPDXRef-DOCUMENT"), expected)
+    self.assertEqual(self.db.getReachableFilesForElement(1, "SPDXRef-F1"), [])
+
+  def test_can_get_reachable_and_containing_elements(self):
+    self.insertSampleRelationships()
+    self.assertEqual(self.db.getReachableElements(1, "SPDXRef-B"), [
+      ("SPDXRef-A", "PACKAGE", "package A", 1),
+      ("SPDXRef-F3", "FILE", "/b/three.c", 1),
+      ("SPDXRef-F1", "FILE", "/a/one.c", 2),
+      ("SPDXRef-F2", "FILE", "/a/two.c", 2),
+    ])
+    self.assertEqual(self.db.getContainingElements(1, "SPDXRef-F3"), [
+      ("SPDXRef-B", "PACKAGE", "package B", 1),
+      ("SPDXRef-A", "PACKAGE", "package A", 2),
+      ("SPDXRef-DOCUMENT", "DOCUMENT", "test doc", 3),
+    ])
+
+  def test_adding_relationships_one_at_a_time_gives_same_closure(self):
+    self.insertSampleRelationships()
+    expected = self.getClosureRows(1)
+    self.db.addBulkNewRelationships(2, self.SAMPLE_ELEMENTS, [])
+    for rt in reversed(self.SAMPLE_RELATIONSHIPS):
+      self.assertTrue(self.db.addRelationship(2, rt[0], rt[1], rt[2]))
+    self.assertEqual(self.getClosureRows(2), expected)
+    # a shortcut shortens the depth of existing pairs
+    self.db.addRelationship(2, "SPDXRef-DOCUMENT", "CONTAINS", "SPDXRef-F3")
+    self.assertEqual(self.db.getContainingElements(2, "SPDXRef-F3")[1],
+      ("SPDXRef-DOCUMENT", "DOCUMENT", "test doc", 1))
+
+  def test_relationships_are_deleted_with_scan(self):
+    self.insertSampleRelationships()
+    self.db.deleteScan(1)
+    self.assertEqual(self.db.session.query(Relationship).count(), 0)
+    self.assertEqual(self.db.session.query(RelationshipClosure).count(), 0)
+
+  def test_alias_uses_and_keeps_relationships_of_original(self):
+    self.insertSampleRelationships()
+    files = self.db.getReachableFilesForElement(1, "SPDXRef-A")
+    alias_id = self.db.addScanAlias(1, "2018-01-01", "alias")
+    self.assertEqual(self.db.getReachableFilesForElement(alias_id,
+      "SPDXRef-A"), files)
+    self.assertTrue(self.db.deleteScan(1))
+    self.assertEqual(self.db.getReachableFilesForElement(alias_id,
+      "SPDXRef-A"), files)
+    self.assertEqual(self.db.getRelationshipsForScan(alias_id),
+      sorted(self.SAMPLE_RELATIONSHIPS))
+
+  def test_same_content_requires_same_relationships(self):
+    file_tuples = self.getScanFileTuples(1)
+    self.insertSampleRelationships()
+    self.assertIsNone(self.db.getScanWithSameContent(file_tuples))
+    self.assertEqual(self.db.getScanWithSameContent(file_tuples, [],
+      self.SAMPLE_ELEMENTS, self.SAMPLE_RELATIONSHIPS), 1)
+
+  ##### Path membership
+
+  def test_can_get_scans_containing_path(self):
+    self.assertEqual(self.db.getScansContainingPath("/a/one.c"), [1, 2])
+    self.assertEqual(self.db.getScansContainingPath("/c/old.c"), [1])
+    self.assertEqual(self.db.getScansContainingPath("/d/new.c", [1, 3]), [])
+    self.assertEqual(self.db.getScansContainingPath("/nope"), [])
+
+  def test_candidate_scans_include_all_scans_containing_path(self):
+    candidates = self.db.getCandidateScansForPath("/a/two.c")
+    self.assertIn(1, candidates)
+    self.assertIn(2, candidates)
+    # scans 3 and 8 have no files, and no filters, so they are queried
+    self.assertNotIn(3, candidates)
+    self.assertNotIn(8, candidates)
+
+  def test_can_get_scans_containing_several_paths(self):
+    self.assertEqual(self.db.getScansContainingPaths(["/c/old.c", "/d/new.c"]),
+      {"/c/old.c": [1], "/d/new.c": [2]})
+
+  def test_can_check_whether_path_is_new_in_scan(self):
+    self.assertTrue(self.db.isPathNewInScan("/d/new.c", 2))
+    self.assertFalse(self.db.isPathNewInScan("/a/one.c", 2))
+    self.assertFalse(self.db.isPathNewInScan("/c/old.c", 2))
+
+  def test_path_filters_for_delta_scans_match_full_scans(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    first_id = self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    self.assertLess(self.countStoredFiles(second_id), 5)
+    self.assertEqual(self.db.getScansContainingPath("/c/old.c"),
+      [1, first_id])
+    self.assertEqual(self.db.getScansContainingPath("/d/new.c"),
+      [2, second_id])
+
+  def test_scans_without_path_filters_are_queried(self):
+    self.assertEqual(self.db.getScansContainingPath("/a/extra.c"), [])
+    self.db.addNewFile(1, "/a/extra.c", 4, "sha1-extra")
+    self.assertEqual(self.db.getCandidateScansForPath("/a/extra.c"), [1])
+    self.assertEqual(self.db.getScansContainingPath("/a/extra.c"), [1])
+    # reading them doesn't build them
+    self.assertEqual(self.db.session.query(ScanBloom).\
+      filter(ScanBloom.scan_id == 1).count(), 0)
+
+  def test_can_rebuild_path_filters(self):
+    self.db.addNewFile(1, "/a/extra.c", 4, "sha1-extra")
+    self.assertTrue(self.db.rebuildScanBlooms([1]))
+    self.assertEqual(self.db.session.query(ScanBloom).\
+      filter(ScanBloom.scan_id == 1).count(), 1)
+    self.assertIn(1, self.db.getCandidateScansForPath("/a/extra.c"))
+    self.assertEqual(self.db.getScansContainingPath("/a/extra.c"), [1])
+
+  def test_path_filters_are_deleted_with_scan(self):
+    self.db.deleteScan(1)
+    self.assertEqual(self.db.session.query(ScanBloom).\
+      filter(ScanBloom.scan_id == 1).count(), 0)
+    self.assertEqual(self.db.getScansContainingPath("/a/one.c"), [2])
+
+  ##### Path history
+
+  def test_can_get_path_history(self):
+    self.assertEqual(self.db.getPathHistory("/a/two.c"),
+      [(1, "GPL-2.0", "sha1-two"), (2, "MIT", "sha1-two-v2")])
+    self.assertEqual(self.db.getPathHistory("/a/one.c"),
+      [(1, "Apache-2.0", "sha1-one")])
+    self.assertEqual(self.db.getPathHistory("/c/old.c"),
+      [(1, "Apache-2.0", "sha1-old"), (2, None, None)])
+    self.assertEqual(self.db.getPathHistory("/nope"), [])
+
+  def test_can_get_path_history_for_subtree(self):
+    self.assertEqual(self.db.getSubtreePathHistory("/b"), {
+      "/b/.git/config": [(1, "No license found", "sha1-git"),
+        (2, "Apache-2.0", "sha1-git-v2")],
+      "/b/three.c": [(1, "MIT", "sha1-three")],
+    })
+    self.assertEqual(len(self.db.getSubtreePathHistory()), 6)
+
+  def test_can_get_path_first_seen_and_last_changed(self):
+    self.assertEqual(self.db.getPathFirstSeen("/a/one.c"), 1)
+    self.assertEqual(self.db.getPathFirstSeen("/d/new.c"), 2)
+    self.assertIsNone(self.db.getPathFirstSeen("/nope"))
+    self.assertEqual(self.db.getPathLastChanged("/a/one.c"), 1)
+    self.assertEqual(self.db.getPathLastChanged("/c/old.c"), 2)
+
+  def test_can_get_flapped_paths(self):
+    self.assertEqual(self.db.getFlappedPaths(), {})
+    self.addScanCopy(1)
+    self.assertEqual(self.db.getFlappedPaths(), {
+      "/a/two.c": ["GPL-2.0", "MIT", "GPL-2.0"],
+      "/b/.git/config": ["No license found", "Apache-2.0", "No license found"],
+    })
+    self.assertEqual(list(self.db.getFlappedPaths("/a/")), ["/a/two.c"])
+
+  def test_path_history_is_kept_in_sync(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    self.addScanCopy(1)
+    self.addScanCopy(2)
+    self.db.addNewFile(3, "/a/one.c", 4, "sha1-one-v3")
+    self.db.addNewFile(3, "/e/new.c", 4, "sha1-e")
+    self.db.deleteScan(2)
+    history = self.db.getSubtreePathHistory()
+    self.assertEqual(history["/a/one.c"], [(1, "Apache-2.0", "sha1-one"),
+      (3, "GPL-2.0", "sha1-one-v3"), (9, "Apache-2.0", "sha1-one")])
+    self.assertTrue(self.db.rebuildPathHistory())
+    self.assertEqual(self.db.getSubtreePathHistory(), history)
+
+  def test_path_history_must_be_rebuilt_when_missing(self):
+    self.db.session.query(PathHistory).delete()
+    self.db.session.commit()
+    self.assertIsNone(self.db.getPathHistory("/a/one.c"))
+    self.assertIsNone(self.db.getSubtreePathHistory())
+    self.assertIsNone(self.db.getFlappedPaths())
+    # reading it doesn't build it, and adding files doesn't either
+    self.db.addNewFile(3, "/e/new.c", 4, "sha1-e")
+    self.assertEqual(self.db.session.query(PathHistory).count(), 0)
+    self.assertTrue(self.db.rebuildPathHistory())
+    self.assertEqual(self.db.getPathHistory("/a/one.c"),
+      [(1, "Apache-2.0", "sha1-one"), (3, None, None)])
+    self.assertEqual(self.db.getPathHistory("/e/new.c"),
+      [(3, "GPL-2.0", "sha1-e")])
+
+  ##### Scan bundles
+
+  def test_can_export_and_import_scan_bundle(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      bundle_filename = os.path.join(tmpdir, "scan2.bundle")
+      lic_id = self.db.addNewLicense("Custom-1.0", 5)
+      self.db.addNewConversion("LicenseRef-Custom", lic_id)
+      self.db.addNewFile(2, "/e/custom.c", lic_id, "sha1-custom")
+      self.assertTrue(self.db.exportScanBundle(2, bundle_filename))
+
+      other = dbtools.SPDatabase()
+      other.createDatabase(":memory:")
+      other.initializeDatabaseTables("tests/test_config.json")
+      other.addNewLicense("Other-1.0", 1)
+      self.assertEqual(other.importScanBundle(bundle_filename), 1)
+      self.assertEqual(other.getScansData(), [(1, "2017-02-02", "test scan 2")])
+      self.assertEqual(other.getLicenseAndFilesForScan(1),
+        self.db.getLicenseAndFilesForScan(2))
+      self.assertEqual(other.getLicenseData(lic_id + 1), (lic_id + 1,
+        "Custom-1.0", 5))
+      self.assertEqual(other.getConversionsData()[-1][1:],
+        ("LicenseRef-Custom", lic_id + 1))
+      self.assertEqual(other.getDirectoryLicenseCounts(1, "/a/"),
+        {"Apache-2.0": 1, "MIT": 1})
+
+      # importing again reuses the licenses and conversions added above
+      num_licenses = len(other.getLicensesData())
+      self.assertEqual(other.importScanBundle(bundle_filename), 2)
+      self.assertEqual(len(other.getLicensesData()), num_licenses)
+      self.assertEqual(len(other.getConversionsData()),
+        len(self.db.getConversionsData()))
+      other.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_scan_bundle_includes_snippets_and_relationships(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      bundle_filename = os.path.join(tmpdir, "scan1.bundle")
+      self.assertTrue(self.insertSampleSnippets())
+      self.assertTrue(self.insertSampleRelationships())
+      # a license only used by a snippet is still included
+      lic_id = self.db.addNewLicense("Snippet-1.0", 5)
+      self.assertTrue(self.db.addBulkNewSnippets(1, [
+        ("/c/old.c", "SPDXRef-Snippet5", 0, 9, None, None, lic_id),
+      ]))
+      self.assertTrue(self.db.exportScanBundle(1, bundle_filename))
+
+      other = dbtools.SPDatabase()
+      other.createDatabase(":memory:")
+      other.initializeDatabaseTables("tests/test_config.json")
+      self.assertEqual(other.importScanBundle(bundle_filename), 1)
+      self.assertEqual(other.getLicenseData(lic_id), (lic_id,
+        "Snippet-1.0", 5))
+      self.assertEqual(other.getSnippetsForScan(1),
+        self.db.getSnippetsForScan(1))
+      self.assertEqual(other.getElementsForScan(1),
+        self.db.getElementsForScan(1))
+      self.assertEqual(other.getRelationshipsForScan(1),
+        self.db.getRelationshipsForScan(1))
+      self.assertEqual(other.getSnippetLicensesForRange(1, "/a/one.c", 6, 8,
+        True), self.db.getSnippetLicensesForRange(1, "/a/one.c", 6, 8, True))
+      other.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_cannot_import_bundle_with_unmappable_licenses(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      bundle_filename = os.path.join(tmpdir, "scan2.bundle")
+      lic_id = self.db.addNewLicense("Custom-1.0", 5)
+      self.db.addNewFile(2, "/e/custom.c", lic_id, "sha1-custom")
+      self.assertTrue(self.db.exportScanBundle(2, bundle_filename))
+      # drop the category of the license used by /e/custom.c
+      conn = sqlite3.connect(bundle_filename)
+      conn.execute("DELETE FROM categories WHERE id = 5")
+      conn.commit()
+      conn.close()
+
+      other = dbtools.SPDatabase()
+      other.createDatabase(":memory:")
+      other.initializeDatabaseTables("tests/test_config.json")
+      num_licenses = len(other.getLicensesData())
+      self.assertEqual(other.importScanBundle(bundle_filename), -1)
+      self.assertEqual(other.getScansIDList(), [])
+      self.assertEqual(len(other.getLicensesData()), num_licenses)
+      other.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_cannot_export_missing_scan_to_bundle(self):
+    self.assertFalse(self.db.exportScanBundle(99, "/tmp/nope.bundle"))
+
+  def test_cannot_import_non_bundle_file(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db_filename = os.path.join(tmpdir, "not-a-bundle.db")
+      db = dbtools.SPDatabase()
+      db.createDatabase(db_filename)
+      db.closeDatabase()
+      self.assertEqual(self.db.importScanBundle(db_filename), -1)
+      self.assertEqual(self.db.importScanBundle(
+        os.path.join(tmpdir, "nope.bundle")), -1)
+      self.assertEqual(self.db.getScansIDList(), [1, 2, 3, 8])
+    finally:
+      shutil.rmtree(tmpdir)
+
+  ##### Files shards
+
+  def createShardedDatabase(self, tmpdir, scans_per_shard, num_scans):
+    db = dbtools.SPDatabase()
+    db.createDatabase(os.path.join(tmpdir, "sharded.db"))
+    db.initializeDatabaseTables("tests/test_config.json")
+    self.assertTrue(db.enableFileShards(scans_per_shard))
+    for i in range(num_scans):
+      scan_id = db.addNewScan(f"2017-0{i + 1}-01", f"scan {i + 1}")
+      db.addBulkNewFiles(scan_id, [
+        ("/a/one.c", (1, 4)[i % 2], f"sha1-one-{i % 2}", "", ""),
+        ("/b/two.c", 5, "sha1-two", "", ""),
+      ])
+    return db
+
+  def test_sharded_database_stores_files_in_shard_files(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = self.createShardedDatabase(tmpdir, 2, 3)
+      self.assertEqual([(s[0], s[1], s[2]) for s in db.getFileShards()],
+        [(0, 1, 2), (1, 3, 4)])
+      for shard in db.getFileShards():
+        self.assertTrue(os.path.exists(shard[3]))
+      self.assertEqual(db.session.execute(
+        "SELECT count(*) FROM main.files").scalar(), 0)
+      self.assertEqual(db.session.execute(
+        "SELECT count(*) FROM files_shard_1.files").scalar(), 2)
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_sharded_database_queries_route_to_shards(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = self.createShardedDatabase(tmpdir, 2, 3)
+      self.assertEqual(list(db.getChangedLicensesForScans(2, 3)),
+        [("/a/one.c", "GPL-2.0", "Apache-2.0")])
+      self.assertEqual(db.getLicenseAndFilesForScan(3),
+        {"/a/one.c": "Apache-2.0", "/b/two.c": "MIT"})
+      self.assertEqual([r[0] for r in db.searchFiles("two.c")], [1, 2, 3])
+      file_id = db.addNewFile(3, "/c/three.c", 1, "sha1-three")
+      self.assertEqual(db.getFileData(file_id)[1:3], (3, "/c/three.c"))
+      db.closeDatabase()
+
+      db = dbtools.SPDatabase()
+      db.openDatabase(os.path.join(tmpdir, "sharded.db"))
+      self.assertEqual(len(db.getLicenseAndFilesForScan(3)), 3)
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_delta_scans_can_span_shards(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = dbtools.SPDatabase()
+      db.createDatabase(os.path.join(tmpdir, "sharded.db"))
+      db.initializeDatabaseTables("tests/test_config.json")
+      db.enableFileShards(1)
+      db.setConfigValue("delta_keyframe_interval", "5")
+      first_id = db.addNewScan("2017-01-01")
+      db.addBulkNewFiles(first_id, [("/a/one.c", 1, "sha1-one", "", ""),
+        ("/b/two.c", 5, "sha1-two", "", "")])
+      second_id = db.addNewScan("2017-02-01")
+      db.addBulkNewFiles(second_id, [("/a/one.c", 4, "sha1-one-v2", "", ""),
+        ("/b/two.c", 5, "sha1-two", "", "")])
+      self.assertEqual(db.session.execute(
+        "SELECT count(*) FROM files_shard_1.files").scalar(), 1)
+      self.assertEqual(db.getLicenseAndFilesForScan(second_id),
+        {"/a/one.c": "GPL-2.0", "/b/two.c": "MIT"})
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_can_drop_files_shard(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = self.createShardedDatabase(tmpdir, 2, 3)
+      shard_filename = db.getFileShards()[0][3]
+      self.assertEqual(db.dropFileShard(0), [1, 2])
+      self.assertFalse(os.path.exists(shard_filename))
+      self.assertEqual(db.getScansIDList(), [3])
+      self.assertEqual(len(db.getLicenseAndFilesForScan(3)), 2)
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_cannot_enable_shards_for_memory_database_or_existing_scans(self):
+    self.assertFalse(self.db.enableFileShards(2))
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = self.createShardedDatabase(tmpdir, 2, 1)
+      self.assertFalse(db.setConfigValue("files_shard_size", "4"))
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_cannot_add_scans_needing_too_many_shards(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = self.createShardedDatabase(tmpdir, 1, 1)
+      max_shards = db._getMaxFileShards(db.session.connection().connection)
+      # the shards for every scan, and for the next new scan, are attached
+      for i in range(max_shards - 2):
+        self.assertNotEqual(db.addNewScan("2017-01-01", f"scan {i + 2}"), -1)
+      self.assertEqual(db.addNewScan("2017-01-01", "one too many"), -1)
+      self.assertEqual(len(db.getScansIDList()), max_shards - 1)
+      # every shard is still attached
+      db.session.commit()
+      self.assertEqual(len(db._getAttachedFileShards(
+        db.session.connection())), max_shards)
+      self.assertEqual(db.getLicenseAndFilesForScan(1),
+        {"/a/one.c": "Apache-2.0", "/b/two.c": "MIT"})
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_sharded_database_searches_without_full_text_index(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = self.createShardedDatabase(tmpdir, 2, 3)
+      self.assertFalse(db._hasFilesFTS())
+      self.assertEqual(db.searchFiles("two"), [
+        (1, "/b/two.c", "MIT"),
+        (2, "/b/two.c", "MIT"),
+        (3, "/b/two.c", "MIT"),
+      ])
+      self.assertEqual(db.searchFiles("*/one.c", [2, 3]), [
+        (2, "/a/one.c", "GPL-2.0"),
+        (3, "/a/one.c", "Apache-2.0"),
+      ])
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  ##### Thread-safe mode
+
+  def test_thread_safe_mode_requires_database_file(self):
+    db = dbtools.SPDatabase(thread_safe=True)
+    self.assertFalse(db.createDatabase(":memory:"))
+
+  def test_cache_is_locked_in_thread_safe_mode(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = dbtools.SPDatabase(thread_safe=True)
+      db.createDatabase(os.path.join(tmpdir, "cache.db"))
+      db._getCached(("adjacent_scans", 1), lambda: (None, None))
+      # while another thread holds the cache lock, the cache can't be
+      # cleared or changed
+      with db.cacheLock:
+        threads = [threading.Thread(target=db.invalidateCache),
+          threading.Thread(target=db._clearAdjacentScans)]
+        for t in threads:
+          t.start()
+        for t in threads:
+          t.join(0.2)
+          self.assertTrue(t.is_alive())
+        self.assertIn(("adjacent_scans", 1), db.cache)
+      for t in threads:
+        t.join()
+      self.assertEqual(db.cache, {})
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_reads_from_many_threads_during_import(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = dbtools.SPDatabase(thread_safe=True)
+      db.createDatabase(os.path.join(tmpdir, "threads.db"))
+      db.initializeDatabaseTables("tests/test_config.json")
+      self.assertEqual(db.session.execute("PRAGMA journal_mode").scalar(),
+        "wal")
+      num_files = 2000
+      file_tuples = [(f"/dir{i % 10}/file{i}.c", (1, 4, 5)[i % 3],
+        f"sha1-{i}", "", "") for i in range(num_files)]
+      first_id = db.addNewScan("2017-01-01", "first scan")
+      db.addBulkNewFiles(first_id, file_tuples)
+      expected = db.getLicenseAndFilesForScan(first_id)
+
+      done = threading.Event()
+      errors = []
+      reads = []
+      def reader():
+        try:
+          count = 0
+          while not done.is_set():
+            self.assertEqual(db.getLicenseAndFilesForScan(first_id), expected)
+            self.assertEqual(len(db.getCategoriesData()), 7)
+            self.assertEqual(sum(db.getDirectoryLicenseCounts(first_id).
+              values()), num_files)
+            # an import is never seen part-way through
+            for scan_id in db.getScansIDList():
+              self.assertIn(len(db.getLicenseAndFilesForScan(scan_id)),
+                (0, num_files))
+            db.endThreadSession()
+            count += 1
+          reads.append(count)
+        except Exception as e:
+          errors.append(e)
+        finally:
+          db.endThreadSession()
+
+      threads = [threading.Thread(target=reader) for i in range(8)]
+      for t in threads:
+        t.start()
+      for i in range(3):
+        with db.transaction():
+          scan_id = db.addNewScan(f"2017-0{i + 2}-01", f"import {i}", False)
+          self.assertTrue(db.addBulkNewFiles(scan_id, file_tuples, False))
+      done.set()
+      for t in threads:
+        t.join()
+
+      self.assertEqual(errors, [])
+      self.assertEqual(len(reads), 8)
+      self.assertEqual(len(db.getScansIDList()), 4)
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_transaction_rolls_back_on_exception(self):
+    tmpdir = tempfile.mkdtemp()
+    try:
+      db = dbtools.SPDatabase(thread_safe=True)
+      db.createDatabase(os.path.join(tmpdir, "threads.db"))
+      db.initializeDatabaseTables("tests/test_config.json")
+      with self.assertRaises(RuntimeError):
+        with db.transaction():
+          db.addNewScan("2017-01-01", "rolled back", False)
+          raise RuntimeError("failed")
+      self.assertEqual(db.getScansIDList(), [])
+      db.closeDatabase()
+    finally:
+      shutil.rmtree(tmpdir)
+
+  ##### Path attributes
+
+  def test_path_attributes_are_stored_at_import(self):
+    f = self.db.session.query(File).\
+      filter(File.scan_id == 1, File.filename == "/b/.git/config").one()
+    self.assertEqual((f.extension, f.is_git, f.is_vendor, f.depth),
+      ("", True, False, 3))
+    self.db.addNewFile(3, "/x/vendor/lib.min.js", 8, "sha1-lib")
+    f = self.db.session.query(File).filter(File.scan_id == 3).one()
+    self.assertEqual((f.extension, f.is_git, f.is_vendor, f.depth),
+      (".js", False, True, 3))
+
+  def test_path_attributes_are_stored_for_delta_scans(self):
+    self.db.setConfigValue("delta_keyframe_interval", "5")
+    self.addScanCopy(1)
+    second_id = self.addScanCopy(2)
+    f = self.db.session.query(File).\
+      filter(File.scan_id == second_id, File.filename == "/d/new.c").one()
+    self.assertEqual((f.extension, f.is_git, f.is_vendor, f.depth),
+      (".c", False, False, 2))
+
+  def test_can_get_filenames_by_attributes(self):
+    scan_id = self.db.addNewScan("2018-01-01")
+    self.db.addBulkNewFiles(scan_id, [
+      ("/img/logo.png", 8, "sha1-logo", "", ""),
+      ("/vendor/dep.c", 8, "sha1-dep", "", ""),
+      ("/vendor/icon.png", 8, "sha1-icon", "", ""),
+      ("/.git/x/y.png", 8, "sha1-git", "", ""),
+      ("/src/main.c", 1, "sha1-main", "", ""),
+    ])
+    lic = "No license found"
+    self.assertEqual(self.db.getFilenamesByAttributes(scan_id, lic,
+      extensions=[".png"]), ["/.git/x/y.png", "/img/logo.png", "/vendor/icon.png"])
+    self.assertEqual(self.db.getFilenamesByAttributes(scan_id, lic,
+      extensions=[".png"], exclude_git=True), ["/img/logo.png", "/vendor/icon.png"])
+    self.assertEqual(self.db.getFilenamesByAttributes(scan_id, lic,
+      is_vendor=True), ["/vendor/dep.c", "/vendor/icon.png"])
+    self.assertEqual(self.db.getFilenamesByAttributes(scan_id, "Apache-2.0",
+      extensions=[".png"]), [])
+
+  ##### Reference data cache
+
+  def countQueries(self, func):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, params, context, many):
+      statements.append(statement)
+    event.listen(self.db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+      func()
+    finally:
+      event.remove(self.db.engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+  def test_repeated_config_lookups_are_cached(self):
+    self.db.getConfigForKey("project")
+    count = self.countQueries(lambda: [
+      self.db.getConfigForKey("project"),
+      self.db.getConfigForKey("desc"),
+      self.db.getConfigData(),
+    ])
+    self.assertEqual(count, 0)
+
+  def test_repeated_reference_data_loads_are_cached(self):
+    def load():
+      self.db.getCategoriesData()
+      self.db.getLicensesData()
+      self.db.getConversionsData()
+    load()
+    self.assertEqual(self.countQueries(load), 0)
+
+  def test_setting_config_value_invalidates_cache(self):
+    self.assertEqual(self.db.getConfigForKey("project"), "Test project")
+    self.db.setConfigValue("project", "Changed project")
+    self.assertEqual(self.db.getConfigForKey("project"), "Changed project")
+
+  def test_adding_license_invalidates_cache(self):
+    count_before = len(self.db.getLicensesData())
+    self.db.addNewLicense("BSD-3-Clause", 4)
+    self.assertEqual(len(self.db.getLicensesData()), count_before + 1)
+
+  def test_rollback_invalidates_cache(self):
+    self.db.addNewCategory("Rolled back", False)
+    self.assertEqual(len(self.db.getCategoriesData()), 8)
+    self.db.rollbackChanges()
+    self.assertEqual(len(self.db.getCategoriesData()), 7)
+
+  def test_lookups_do_not_load_orm_objects(self):
+    self.db.session.expunge_all()
+    self.assertEqual(self.db.getScanData(2), (2, "2017-02-02", "test scan 2"))
+    self.assertEqual(self.db.getLicenseData(5)[1], "MIT")
+    self.assertEqual(self.db.getScansIDList(), [1, 2, 3, 8])
+    self.assertEqual(self.db.getFileData(1)[2], "/a/one.c")
+    self.assertEqual(len(self.db.session.identity_map), 0)
+
+  def test_cached_data_cannot_be_modified_by_caller(self):
+    self.db.getConfigData()["project"] = "Modified"
+    self.db.getLicensesData().clear()
+    self.assertEqual(self.db.getConfigForKey("project"), "Test project")
+    self.assertEqual(len(self.db.getLicensesData()), 9)
+
+  ##### Relationship loading
+
+  def test_file_objects_for_scan_include_license_and_category(self):
+    files = list(self.db.getFileObjectsForScan(2))
+    self.assertEqual([f.filename for f in files], ["/a/one.c", "/a/two.c",
+      "/b/.git/config", "/b/three.c", "/d/new.c"])
+    count = self.countQueries(lambda: [repr(f) for f in files] +
+      [f.license.category.name for f in files])
+    self.assertEqual(count, 0)
+    self.assertEqual(files[1].license.short_name, "MIT")
+
+  def test_iterating_large_scan_uses_fixed_number_of_queries(self):
+    scan_id = self.db.addNewScan("2017-09-09", "large scan")
+    self.db.session.execute(File.__table__.insert(), [
+      {"filename": f"/big/file{i}.c", "scan_id": scan_id,
+        "license_id": (1, 4, 5, 8)[i % 4], "sha1": f"sha1-{i}", "md5": "",
+        "sha256": ""} for i in range(100000)])
+    self.db.session.commit()
+    num_files = [0]
+    def iterate(scan_id):
+      for f in self.db.getFileObjectsForScan(scan_id):
+        f.license.short_name, f.license.category.name
+        num_files[0] += 1
+    small_count = self.countQueries(lambda: iterate(1))
+    large_count = self.countQueries(lambda: iterate(scan_id))
+    self.assertEqual(num_files[0], 100005)
+    self.assertEqual(large_count, small_count)
+
   ##### FIXME add tests for Files
   ##### FIXME add tests for Conversions
   ##### FIXME add tests for Configs
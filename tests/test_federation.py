@@ -0,0 +1,190 @@
+# tests/test_federation.py
+#
+# Contains unit tests for the functionality in federation.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from spdxSummarizer.dbtools import SPDatabase
+from spdxSummarizer.federation import SPFederation
+
+class FederationTestSuite(unittest.TestCase):
+  """spdxSummarizer federated query test suite."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    # product A: two scans, the second stored as a delta
+    self.db_a = self.createProduct("a.db", [
+      [("/src/a.c", "GPL-2.0"), ("/src/old.c", "GPL-2.0")],
+      [("/src/a.c", "GPL-2.0"), ("/src/new.c", "MIT")],
+    ], delta_keyframe_interval="5")
+    # product B: a license that product A doesn't have, so that license
+    # IDs differ between the databases
+    self.db_b = self.createProduct("b.db", [
+      [("/b.c", "Custom-1.0"), ("/lib/gpl.c", "GPL-2.0"),
+        ("/.git/hooks/x", "GPL-2.0")],
+    ], custom_category=3)
+    # product C: GPL-2.0 recategorized
+    self.db_c = self.createProduct("c.db", [
+      [("/c.c", "Apache-2.0")],
+    ], gpl_category=5)
+    self.fed = SPFederation([self.db_a, self.db_b, self.db_c], max_attached=2)
+    self.assertTrue(self.fed.open())
+
+  def tearDown(self):
+    self.fed.close()
+    shutil.rmtree(self.tmpdir)
+
+  def createProduct(self, name, scans, delta_keyframe_interval="0",
+    custom_category=None, gpl_category=None, scans_per_shard=None,
+    alias_last_scan=False):
+    db_filename = os.path.join(self.tmpdir, name)
+    db = SPDatabase()
+    db.createDatabase(db_filename)
+    db.initializeDatabaseTables("tests/test_config.json")
+    if scans_per_shard is not None:
+      db.enableFileShards(scans_per_shard)
+    db.setConfigValue("delta_keyframe_interval", delta_keyframe_interval)
+    if custom_category is not None:
+      db.addNewLicense("Custom-1.0", custom_category)
+    if gpl_category is not None:
+      db.session.execute("UPDATE licenses SET category_id = :cat " +
+        "WHERE short_name = 'GPL-2.0'", {"cat": gpl_category})
+      db.commitChanges()
+    lic_ids = {short_name: id for (id, short_name, cat_id) in
+      db.getLicensesData()}
+    for i, files in enumerate(scans):
+      scan_id = db.addNewScan(f"2017-0{i+1}-01", f"{name} scan {i+1}")
+      db.addBulkNewFiles(scan_id, [(filename, lic_ids[lic], "sha1", "", "")
+        for (filename, lic) in files])
+    if alias_last_scan:
+      db.addScanAlias(scan_id, f"2017-0{len(scans)+1}-01",
+        f"{name} scan {len(scans)+1}")
+    db.closeDatabase()
+    return db_filename
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_databases_are_split_into_groups(self):
+    self.assertEqual(len(self.fed.groups), 2)
+    self.assertEqual(len(self.fed.engines), 2)
+
+  def test_can_get_latest_scans(self):
+    self.assertEqual(self.fed.getLatestScans(), {
+      self.db_a: (2, "2017-02-01", "a.db scan 2"),
+      self.db_b: (1, "2017-01-01", "b.db scan 1"),
+      self.db_c: (1, "2017-01-01", "c.db scan 1"),
+    })
+
+  def test_can_get_files_with_license_across_databases(self):
+    self.assertEqual(self.fed.getFilesWithLicense("GPL-2.0"), [
+      (self.db_a, 2, "/src/a.c"),
+      (self.db_b, 1, "/lib/gpl.c"),
+    ])
+    self.assertEqual(len(self.fed.getFilesWithLicense("GPL-2.0",
+      exclude_git=False)), 3)
+    self.assertEqual(self.fed.getFilesWithLicense("Custom-1.0"),
+      [(self.db_b, 1, "/b.c")])
+
+  def test_can_get_license_counts_across_databases(self):
+    self.assertEqual(self.fed.getLicenseCounts(), {
+      "GPL-2.0": {self.db_a: 1, self.db_b: 1},
+      "MIT": {self.db_a: 1},
+      "Custom-1.0": {self.db_b: 1},
+      "Apache-2.0": {self.db_c: 1},
+    })
+
+  def test_can_find_licenses_categorized_differently(self):
+    cats = self.fed.getLicenseCategories()
+    self.assertEqual(cats["GPL-2.0"], {
+      "Copyleft": [self.db_a, self.db_b],
+      "Other or Unknown": [self.db_c],
+    })
+    self.assertEqual(cats["Custom-1.0"], {"Copyleft": [self.db_b]})
+
+  def test_latest_scan_can_be_delta_with_no_stored_files(self):
+    db_d = self.createProduct("d.db", [
+      [("/d.c", "MIT")],
+      [("/d.c", "MIT")],
+    ], delta_keyframe_interval="5")
+    fed = SPFederation([db_d])
+    self.assertTrue(fed.open())
+    try:
+      self.assertEqual(fed.getLatestScans(),
+        {db_d: (2, "2017-02-01", "d.db scan 2")})
+      self.assertEqual(fed.getFilesWithLicense("MIT"), [(db_d, 2, "/d.c")])
+    finally:
+      fed.close()
+
+  def test_latest_scan_can_be_alias(self):
+    db_d = self.createProduct("d.db", [
+      [("/d.c", "MIT")],
+    ], alias_last_scan=True)
+    fed = SPFederation([db_d])
+    self.assertTrue(fed.open())
+    try:
+      self.assertEqual(fed.getLatestScans(),
+        {db_d: (2, "2017-02-01", "d.db scan 2")})
+      self.assertEqual(fed.getFilesWithLicense("MIT"), [(db_d, 2, "/d.c")])
+      self.assertEqual(fed.getLicenseCounts(), {"MIT": {db_d: 1}})
+    finally:
+      fed.close()
+
+  def test_can_query_sharded_databases(self):
+    db_d = self.createProduct("d.db", [
+      [("/d.c", "MIT"), ("/old.c", "GPL-2.0")],
+      [("/d.c", "MIT"), ("/new.c", "GPL-2.0")],
+    ], scans_per_shard=1)
+    fed = SPFederation([self.db_a, db_d], max_attached=3)
+    self.assertTrue(fed.open())
+    try:
+      # db_d and its two shards need a group of their own
+      self.assertEqual(len(fed.groups), 2)
+      self.assertEqual(fed.getLatestScans()[db_d],
+        (2, "2017-02-01", "d.db scan 2"))
+      self.assertEqual(fed.getFilesWithLicense("GPL-2.0"), [
+        (self.db_a, 2, "/src/a.c"),
+        (db_d, 2, "/new.c"),
+      ])
+    finally:
+      fed.close()
+
+  def test_cannot_open_sharded_database_with_too_many_shards(self):
+    db_d = self.createProduct("d.db", [
+      [("/d.c", "MIT")],
+      [("/d.c", "MIT")],
+    ], scans_per_shard=1)
+    fed = SPFederation([db_d], max_attached=2)
+    self.assertFalse(fed.open())
+
+  def test_databases_are_read_only(self):
+    engine = self.fed.engines[0]
+    with engine.connect() as conn:
+      with self.assertRaises(Exception):
+        conn.execute("DELETE FROM db0.files")
+
+  def test_cannot_open_missing_or_invalid_database(self):
+    fed = SPFederation([self.db_a, os.path.join(self.tmpdir, "nope.db")])
+    self.assertFalse(fed.open())
+    not_db = os.path.join(self.tmpdir, "empty.db")
+    open(not_db, 'w').close()
+    fed = SPFederation([self.db_a, not_db])
+    self.assertFalse(fed.open())
@@ -0,0 +1,163 @@
+# tests/test_instrumentation.py
+#
+# Contains unit tests for the functionality in instrumentation.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from spdxSummarizer import dbtools
+from spdxSummarizer.instrumentation import NO_METHOD
+
+class InstrumentationTestSuite(unittest.TestCase):
+  """spdxSummarizer query instrumentation test suite."""
+
+  def setUp(self):
+    self.db = dbtools.SPDatabase()
+    self.db.createDatabase(":memory:")
+    self.db.initializeDatabaseTables("tests/test_config.json")
+    scan1 = self.db.addNewScan("2017-01-01", "test scan 1")
+    self.db.addBulkNewFiles(scan1, [
+      ("/a/one.c", 1, "sha1-one", "", ""),
+      ("/a/two.c", 4, "sha1-two", "", ""),
+    ])
+    scan2 = self.db.addNewScan("2017-02-02", "test scan 2")
+    self.db.addBulkNewFiles(scan2, [
+      ("/a/one.c", 5, "sha1-one-v2", "", ""),
+      ("/b/three.c", 8, "sha1-three", "", ""),
+    ])
+
+  def tearDown(self):
+    self.db.closeDatabase()
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_cannot_enable_before_database_opened(self):
+    db = dbtools.SPDatabase()
+    self.assertIsNone(db.enableInstrumentation())
+
+  def test_records_statements_per_method(self):
+    instr = self.db.enableInstrumentation()
+    self.db.getScansIDList()
+    self.db.getScansIDList()
+    stats = instr.getStats()["methods"]["getScansIDList"]
+    self.assertEqual(stats["calls"], 2)
+    self.assertEqual(stats["statements"], 2)
+    self.assertEqual(stats["rows_returned"], 4)
+    self.assertGreater(stats["seconds"], 0)
+
+  def test_nested_calls_are_attributed_to_innermost_method(self):
+    instr = self.db.enableInstrumentation()
+    self.db.invalidateCache()
+    self.assertTrue(self.db.isInitialized())
+    methods = instr.getStats()["methods"]
+    self.assertEqual(methods["isInitialized"]["calls"], 1)
+    self.assertEqual(methods["isInitialized"]["statements"], 0)
+    self.assertEqual(methods["getConfigForKey"]["calls"], 1)
+    self.assertEqual(methods["getConfigForKey"]["statements"], 1)
+    self.assertNotIn(NO_METHOD, methods)
+
+  def test_records_rows_affected(self):
+    instr = self.db.enableInstrumentation()
+    self.db.addBulkNewFiles(1, [
+      ("/c/four.c", 1, "sha1-four", "", ""),
+      ("/c/five.c", 1, "sha1-five", "", ""),
+    ])
+    methods = instr.getStats()["methods"]
+    rows = sum(m["rows_affected"] for m in methods.values())
+    # besides the 2 new files, addBulkNewFiles() itself rewrites the data
+    # derived from the scan's files, so those rows are counted too (rows
+    # changed by triggers aren't):
+    #   - files_fts: 2 new files indexed, if the database has the index
+    #   - dir_license_counts: 6 deleted, 7 inserted
+    #   - dir_hashes: 3 deleted, 4 inserted, and the scan's content digest
+    #     updated twice
+    #   - scan_blooms: 1 deleted, 1 inserted
+    #   - path_history: scan 1's 2 rows replaced by 4, and scan 2's 3 rows
+    #     replaced by 5, since it follows scan 1
+    fts_rows = 2 if self.db._hasFilesFTS() else 0
+    self.assertEqual(rows, 2 + fts_rows + 13 + 9 + 2 + 14)
+
+  def test_records_rows_affected_for_updates(self):
+    instr = self.db.enableInstrumentation()
+    self.db.setConfigValue("project", "Changed project")
+    self.db.setConfigValue("desc", "Changed description")
+    stats = instr.getStats()["methods"]["setConfigValue"]
+    self.assertEqual(stats["rows_affected"], 2)
+
+  def test_generator_methods_are_timed_across_iteration(self):
+    instr = self.db.enableInstrumentation()
+    changed = list(self.db.getChangedLicensesForScans(1, 2))
+    self.assertEqual(len(changed), 1)
+    stats = instr.getStats()["methods"]["getChangedLicensesForScans"]
+    self.assertEqual(stats["calls"], 1)
+    self.assertEqual(stats["rows_returned"], 1)
+    self.assertGreaterEqual(stats["statements"], 1)
+
+  def test_records_calls_that_raise(self):
+    instr = self.db.enableInstrumentation()
+    self.db.getScansIDList()
+    with self.assertRaises(TypeError):
+      self.db.getScansIDList("unexpected argument")
+    stats = instr.getStats()["methods"]["getScansIDList"]
+    self.assertEqual(stats["calls"], 2)
+    self.assertEqual(stats["errors"], 1)
+
+  def test_records_generator_methods_that_raise(self):
+    instr = self.db.enableInstrumentation()
+    self.db.session.execute("ALTER TABLE files RENAME TO files_moved")
+    with self.assertRaises(Exception):
+      list(self.db.getChangedLicensesForScans(1, 2))
+    stats = instr.getStats()["methods"]["getChangedLicensesForScans"]
+    self.assertEqual(stats["calls"], 1)
+    self.assertEqual(stats["errors"], 1)
+
+  def test_slow_queries_are_logged_with_query_plan(self):
+    instr = self.db.enableInstrumentation(slow_query_seconds=0)
+    self.db.getLicenseAndFilesForScan(1)
+    slow = [q for q in instr.getStats()["slow_queries"]
+      if q["method"] == "getLicenseAndFilesForScan"]
+    self.assertTrue(slow)
+    self.assertTrue(slow[0]["statement"].lstrip().upper().startswith("SELECT"))
+    self.assertTrue(slow[0]["query_plan"])
+
+  def test_disable_removes_wrappers_and_keeps_stats(self):
+    instr = self.db.enableInstrumentation()
+    self.db.getScansIDList()
+    self.db.disableInstrumentation()
+    self.assertNotIn("getScansIDList", self.db.__dict__)
+    self.db.getScansIDList()
+    stats = instr.getStats()["methods"]["getScansIDList"]
+    self.assertEqual(stats["calls"], 1)
+
+  def test_can_write_stats_json(self):
+    instr = self.db.enableInstrumentation()
+    self.db.getScansData()
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir, "stats.json")
+      self.assertTrue(instr.writeStatsJSON(path))
+      with open(path, 'r') as f:
+        data = json.load(f)
+      self.assertEqual(data["methods"]["getScansData"]["calls"], 1)
+      self.assertEqual(data["slow_queries"], [])
+    finally:
+      shutil.rmtree(tmpdir)
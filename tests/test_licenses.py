@@ -0,0 +1,104 @@
+# tests/test_licenses.py
+#
+# Contains unit tests for the functionality in licenses.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import unittest
+
+from spdxSummarizer import dbtools
+from spdxSummarizer.licenses import FTLicenseStore
+
+class LicenseStoreTestSuite(unittest.TestCase):
+  """spdxSummarizer license store test suite."""
+
+  def setUp(self):
+    self.db = dbtools.SPDatabase()
+    self.db.createDatabase(":memory:")
+    self.db.initializeDatabaseTables("tests/test_config.json")
+    self.licstore = FTLicenseStore(self.db)
+    self.assertTrue(self.licstore.loadAllFromDB())
+
+  def tearDown(self):
+    self.db.closeDatabase()
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_can_look_up_licenses_and_conversions(self):
+    self.assertEqual(self.licstore.getIDForLicense("GPL-2.0"), 4)
+    self.assertEqual(self.licstore.getIDForLicense("nope"), -1)
+    conv_id = self.licstore.getIDForConversion("NOASSERTION")
+    self.assertNotEqual(conv_id, -1)
+    self.assertEqual(self.licstore.getConversion(conv_id).new_license_id, 8)
+    self.assertEqual(self.licstore.getIDForConversion("nope"), -1)
+
+  def test_highest_ids_match_loaded_data(self):
+    self.assertEqual(self.licstore.getHighestCategoryID(), 7)
+    self.assertEqual(self.licstore.getHighestLicenseID(),
+      max(self.licstore.licenses.keys()))
+    self.assertEqual(self.licstore.getHighestConversionID(),
+      max(self.licstore.conversions.keys()))
+
+  def test_created_items_are_indexed(self):
+    cat_id = self.licstore.createCategoryInStore("New category")
+    self.assertEqual(cat_id, 8)
+    lic_id = self.licstore.createLicenseInStore("New-1.0", cat_id)
+    self.assertEqual(self.licstore.getIDForLicense("New-1.0"), lic_id)
+    self.assertEqual(self.licstore.getHighestLicenseID(), lic_id)
+    conv_id = self.licstore.createConversionInStore("new 1.0", lic_id)
+    self.assertEqual(self.licstore.getIDForConversion("new 1.0"), conv_id)
+    self.assertEqual(self.licstore.getHighestConversionID(), conv_id)
+    self.assertEqual(self.licstore.resolveMany(["new 1.0"]),
+      {"new 1.0": (lic_id, "New-1.0")})
+
+  def test_can_create_items_in_empty_store(self):
+    licstore = FTLicenseStore(self.db)
+    self.assertEqual(licstore.createCategoryInStore("First"), 1)
+    self.assertEqual(licstore.createLicenseInStore("First-1.0", 1), 1)
+
+  def test_reloading_resets_indexes(self):
+    self.licstore.createLicenseInStore("New-1.0", 1)
+    self.assertTrue(self.licstore.loadLicensesFromDB())
+    self.assertEqual(self.licstore.getIDForLicense("New-1.0"), -1)
+    self.assertEqual(self.licstore.getHighestLicenseID(),
+      max(self.licstore.licenses.keys()))
+
+  def test_duplicate_names_use_lowest_id(self):
+    self.licstore.createLicenseInStore("GPL-2.0", 1)
+    self.assertEqual(self.licstore.getIDForLicense("GPL-2.0"), 4)
+
+  def test_can_resolve_many_texts(self):
+    resolved = self.licstore.resolveMany(["MIT", "NONE", "nope", "MIT"])
+    self.assertEqual(resolved, {
+      "MIT": (5, "MIT"),
+      "NONE": (8, "No license found"),
+      "nope": (-1, "nope"),
+    })
+
+  def test_runs_existing_conversions_and_licenses(self):
+    result = self.licstore.runExistingConversionsAndLicenses(
+      ["LicenseRef-MIT", "NOASSERTION", "Apache-2.0", "LicenseRef-Foo"])
+    self.assertEqual(result["ldict"], {
+      "LicenseRef-MIT": (5, "MIT"),
+      "NOASSERTION": (8, "No license found"),
+      "Apache-2.0": (1, "Apache-2.0"),
+      "LicenseRef-Foo": (-1, "Foo"),
+    })
+    self.assertEqual(result["lpending"], {"LicenseRef-Foo": "Foo"})
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,159 @@
+# tests/test_pipeline.py
+#
+# Contains unit tests for the functionality in pipeline.py.
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from spdxSummarizer.dbtools import SPDatabase
+from spdxSummarizer.pipeline import (runPipeline, importReportForPipeline,
+  REVIEW_CATEGORY_NAME)
+
+REPORT_FILENAME = "spdxSummarizer-2017-10-03.spdx"
+
+class PipelineTestSuite(unittest.TestCase):
+  """spdxSummarizer in-memory pipeline test suite."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def path(self, filename):
+    return os.path.join(self.tmpdir, filename)
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_can_run_pipeline_and_save_database(self):
+    self.assertTrue(runPipeline(REPORT_FILENAME, "tests/test_config.json",
+      "2017-10-03", "CI scan", csv_filename=self.path("scan.csv"),
+      db_filename=self.path("scan.db")))
+    with open(self.path("scan.csv"), 'r') as f:
+      self.assertEqual(len(f.readlines()), 31)
+
+    db = SPDatabase()
+    self.assertTrue(db.openDatabase(self.path("scan.db")))
+    self.assertEqual(db.getScansData(), [(1, "2017-10-03", "CI scan")])
+    self.assertEqual(len(db.getLicenseAndFilesForScan(1)), 30)
+    self.assertEqual(db.getConfigForKey("project"), "Test project")
+    db.closeDatabase()
+
+  def test_pipeline_does_not_create_database_unless_asked(self):
+    self.assertTrue(runPipeline(REPORT_FILENAME, "tests/test_config.json",
+      csv_filename=self.path("scan.csv")))
+    self.assertEqual(os.listdir(self.tmpdir), ["scan.csv"])
+
+  def test_unknown_licenses_are_added_for_review(self):
+    db = SPDatabase()
+    db.createDatabase(":memory:")
+    db.initializeDatabaseTables("tests/test_config.json")
+    scan_id = importReportForPipeline(db, REPORT_FILENAME, "2017-10-03", "")
+    self.assertEqual(scan_id, 1)
+    cats = db.getCategoryFilesForScan(scan_id)
+    review = [c for c in cats.values() if c[0] == REVIEW_CATEGORY_NAME]
+    self.assertEqual(len(review), 1)
+    self.assertEqual(review[0][2], {"Apache-2.0 AND MIT": 4})
+    db.closeDatabase()
+
+  def test_reimported_report_is_added_as_alias(self):
+    db = SPDatabase()
+    db.createDatabase(":memory:")
+    db.initializeDatabaseTables("tests/test_config.json")
+    first_id = importReportForPipeline(db, REPORT_FILENAME, "2017-10-03", "")
+    # same document
+    second_id = importReportForPipeline(db, REPORT_FILENAME, "2017-10-04", "")
+    # same content, in a different document
+    with open(REPORT_FILENAME, 'r') as f:
+      text = f.read()
+    with open(self.path("copy.spdx"), 'w') as f:
+      f.write("## re-exported\n" + text)
+    third_id = importReportForPipeline(db, self.path("copy.spdx"),
+      "2017-10-05", "")
+    self.assertEqual(db.getScansIDList(), [first_id, second_id, third_id])
+    self.assertEqual(db.getScanAliasOf(second_id), first_id)
+    self.assertEqual(db.getScanAliasOf(third_id), first_id)
+    self.assertEqual(db.getLicenseAndFilesForScan(third_id),
+      db.getLicenseAndFilesForScan(first_id))
+    db.closeDatabase()
+
+  def test_snippets_are_imported_with_files(self):
+    with open(REPORT_FILENAME, 'r') as f:
+      text = f.read()
+    with open(self.path("snippets.spdx"), 'w') as f:
+      f.write(text + """
+SnippetSPDXID: SPDXRef-Snippet1
+SnippetFromFileSPDXID: SPDXRef-item1699427
+SnippetByteRange: 100:199
+SnippetLineRange: 5:9
+SnippetLicenseConcluded: GPL-2.0
+""")
+    db = SPDatabase()
+    db.createDatabase(":memory:")
+    db.initializeDatabaseTables("tests/test_config.json")
+    first_id = importReportForPipeline(db, self.path("snippets.spdx"),
+      "2017-10-03", "")
+    snippets = db.getSnippetsForScan(first_id)
+    self.assertEqual(len(snippets), 1)
+    filename = snippets[0][0]
+    self.assertTrue(filename.endswith("spdxSummarizer.sh"))
+    self.assertEqual(db.getSnippetLicensesForRange(first_id, filename,
+      150, 150), ["GPL-2.0"])
+    self.assertEqual(db.getSnippetLicensesForRange(first_id, filename,
+      5, 5, True), ["GPL-2.0"])
+    # the same files without the snippet aren't the same content
+    second_id = importReportForPipeline(db, REPORT_FILENAME, "2017-10-04", "")
+    self.assertIsNone(db.getScanAliasOf(second_id))
+    self.assertEqual(db.getSnippetsForScan(second_id), [])
+    db.closeDatabase()
+
+  def test_files_after_package_are_contained_by_it(self):
+    db = SPDatabase()
+    db.createDatabase(":memory:")
+    db.initializeDatabaseTables("tests/test_config.json")
+    scan_id = importReportForPipeline(db, REPORT_FILENAME, "2017-10-03", "")
+    files = db.getReachableFilesForElement(scan_id, "SPDXRef-upload143")
+    self.assertEqual(len(files), 30)
+    self.assertEqual(dict(files), db.getLicenseAndFilesForScan(scan_id))
+    # the document describes the package, and so reaches its files too
+    self.assertEqual(db.getReachableFilesForElement(scan_id,
+      "SPDXRef-DOCUMENT"), files)
+    self.assertEqual(db.getContainingElements(scan_id,
+      "SPDXRef-item1699427"), [
+      ("SPDXRef-upload143", "PACKAGE", "spdxSummarizer.tar.gz", 1),
+      ("SPDXRef-DOCUMENT", "DOCUMENT", "/srv/fossology/repository/report", 2),
+    ])
+    db.closeDatabase()
+
+  def test_pipeline_fails_for_missing_report(self):
+    self.assertFalse(runPipeline(self.path("nope.spdx"),
+      "tests/test_config.json", db_filename=self.path("scan.db")))
+    self.assertFalse(os.path.exists(self.path("scan.db")))
+
+  def test_can_back_up_database(self):
+    db = SPDatabase()
+    db.createDatabase(":memory:")
+    db.initializeDatabaseTables("tests/test_config.json")
+    self.assertTrue(db.backupDatabase(self.path("backup.db")))
+    db.closeDatabase()
+    self.assertTrue(db.openDatabase(self.path("backup.db")))
+    self.assertTrue(db.isInitialized())
+    db.closeDatabase()
@@ -0,0 +1,135 @@
+# tests/test_querycontrol.py
+#
+# Contains unit tests for the functionality in querycontrol.py, and for
+# running cancellable queries with SPDatabase.runCancellable().
+#
+# Copyright (C) 2017 The Linux Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+import unittest
+
+from spdxSummarizer import dbtools, querycontrol
+from spdxSummarizer.querycontrol import SPQueryControl
+
+# a query that takes many seconds to run unless it is stopped
+SLOW_QUERY = """WITH RECURSIVE c(x) AS (
+  SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000)
+  SELECT count(*) FROM c"""
+
+class QueryControlTestSuite(unittest.TestCase):
+  """spdxSummarizer cancellable query test suite."""
+
+  def setUp(self):
+    self.db = dbtools.SPDatabase()
+    self.db.createDatabase(":memory:")
+    self.db.initializeDatabaseTables("tests/test_config.json")
+    scan1 = self.db.addNewScan("2017-01-01", "test scan 1")
+    self.db.addBulkNewFiles(scan1, [
+      ("/a/one.c", 1, "sha1-one", "", ""),
+      ("/a/two.c", 4, "sha1-two", "", ""),
+    ])
+    scan2 = self.db.addNewScan("2017-02-02", "test scan 2")
+    self.db.addBulkNewFiles(scan2, [
+      ("/a/one.c", 5, "sha1-one-v2", "", ""),
+      ("/b/three.c", 8, "sha1-three", "", ""),
+    ])
+
+  def tearDown(self):
+    self.db.closeDatabase()
+
+  def runSlowQuery(self):
+    return self.db.session.execute(SLOW_QUERY).scalar()
+
+  ########## TESTS BELOW HERE ##########
+
+  def test_cannot_run_before_database_opened(self):
+    db = dbtools.SPDatabase()
+    self.assertIsNone(db.runCancellable(SPQueryControl(), db.getScansIDList))
+
+  def test_returns_result_when_not_stopped(self):
+    control = SPQueryControl(timeout=60)
+    scan_ids = self.db.runCancellable(control, self.db.getScansIDList)
+    self.assertEqual(scan_ids, [1, 2])
+    self.assertFalse(control.interrupted)
+    self.assertIsNone(control.getReason())
+
+  def test_reads_generators_while_control_in_effect(self):
+    control = SPQueryControl()
+    changed = self.db.runCancellable(control,
+      self.db.getChangedLicensesForScans, 1, 2)
+    self.assertIsInstance(changed, list)
+    self.assertEqual(len(changed), 1)
+
+  def test_deadline_stops_query(self):
+    control = SPQueryControl(timeout=0.1)
+    start = time.monotonic()
+    result = self.db.runCancellable(control, self.runSlowQuery)
+    self.assertIsNone(result)
+    self.assertLess(time.monotonic() - start, 5)
+    self.assertTrue(control.timedOut)
+    self.assertTrue(control.interrupted)
+    self.assertEqual(control.getReason(), "timed out")
+    self.assertGreater(control.steps, 0)
+
+  def test_cancel_from_another_thread_stops_query(self):
+    control = SPQueryControl()
+    timer = threading.Timer(0.1, control.cancel)
+    timer.start()
+    result = self.db.runCancellable(control, self.runSlowQuery)
+    timer.join()
+    self.assertIsNone(result)
+    self.assertFalse(control.timedOut)
+    self.assertEqual(control.getReason(), "cancelled")
+
+  def test_stopped_query_rolls_back_changes(self):
+    def addScanThenRunSlowQuery():
+      self.db.addNewScan("2017-03-03", "uncommitted scan", False)
+      return self.runSlowQuery()
+    control = SPQueryControl(timeout=0.1)
+    self.assertIsNone(self.db.runCancellable(control,
+      addScanThenRunSlowQuery))
+    # database is still usable, without the uncommitted scan
+    self.assertEqual(self.db.getScansIDList(), [1, 2])
+    scan3 = self.db.addNewScan("2017-03-03", "test scan 3")
+    self.assertEqual(self.db.getScansIDList(), [1, 2, scan3])
+
+  def test_control_only_applies_during_call(self):
+    control = SPQueryControl()
+    self.db.runCancellable(control, self.db.getScansIDList)
+    self.assertIsNone(self.db.queryControls.control)
+    # cancelling afterwards doesn't affect other queries
+    control.cancel()
+    self.assertEqual(self.db.session.execute(
+      SLOW_QUERY.replace("100000000", "100000")).scalar(), 100000)
+    self.assertFalse(control.interrupted)
+
+  def test_reports_progress(self):
+    reports = []
+    saved = querycontrol.QUERY_PROGRESS_REPORT_SECONDS
+    querycontrol.QUERY_PROGRESS_REPORT_SECONDS = 0
+    try:
+      control = SPQueryControl(timeout=0.1,
+        on_progress=lambda c: reports.append(c.steps))
+      self.db.runCancellable(control, self.runSlowQuery)
+    finally:
+      querycontrol.QUERY_PROGRESS_REPORT_SECONDS = saved
+    self.assertGreater(len(reports), 1)
+    self.assertEqual(reports, sorted(reports))
+
+if __name__ == "__main__":
+  unittest.main()